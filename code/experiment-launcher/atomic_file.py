@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Replace files so readers see either the old or the new content.
+
+Files are written to a temporary file in the destination folder, then moved
+over the destination:
+
+    with atomic_write(path, 'w') as f:
+        json.dump(data, f)
+
+or, when something else writes the temporary file, replace_file(tmp, path).
+
+How the move is made:
+
+    Python 3        os.replace: atomic on POSIX and on Windows (same volume)
+    Python 2 POSIX  os.rename, which replaces the destination atomically
+    Python 2 Win    MoveFileExW(MOVEFILE_REPLACE_EXISTING): the destination is
+                    replaced in one call and never missing, but Windows does
+                    not document it as atomic
+    fallback        if MoveFileExW is unavailable or fails, the destination is
+                    removed and the file renamed; between the two a reader
+                    finds no file at all
+
+Python 2.7 compatible.
+"""
+
+import os
+import sys
+import tempfile
+import contextlib
+
+MOVEFILE_REPLACE_EXISTING = 0x1
+MOVEFILE_WRITE_THROUGH = 0x8
+
+
+def _move_file_ex(source, destination):
+    """MoveFileExW replacing the destination; False if the call is unavailable or fails."""
+    try:
+        import ctypes
+        move = ctypes.windll.kernel32.MoveFileExW
+    except (ImportError, AttributeError):
+        return False
+    if not isinstance(source, unicode):
+        source = source.decode(sys.getfilesystemencoding())
+    if not isinstance(destination, unicode):
+        destination = destination.decode(sys.getfilesystemencoding())
+    return bool(move(source, destination, MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH))
+
+
+def replace_file(source, destination):
+    """
+    Move source over destination (see the module docstring for the guarantees).
+
+    Args:
+        source (str): File to move, on the same volume as destination
+        destination (str): File to replace or create
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    elif sys.platform != 'win32':
+        os.rename(source, destination)
+    elif not _move_file_ex(source, destination):
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+def temporary_path(path):
+    """New empty temporary file next to path, ending in .tmp (backup_queue skips these)."""
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    os.close(fd)
+    return tmp_path
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Open a temporary file for writing and move it over path when the block succeeds.
+
+    If the block raises, the temporary file is removed and path is left as it was.
+
+    Args:
+        path (str): File to replace or create (its folder must exist)
+        mode (str): 'w' or 'wb'
+    """
+    tmp_path = temporary_path(path)
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        replace_file(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
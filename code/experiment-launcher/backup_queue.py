@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Verified background copies of session outputs with a persistent retry queue.
+
+save_output queues its copies (pkl to the SweepStim backup folder and the
+custom output path, optionally the Bonsai CSVs and the whole session folder)
+in backup_queue.json inside the session folder, and a BackupWorker thread
+performs them so the end of the session does not wait on a network share.
+
+Every copy goes to "<destination>.partial", is checked against the source's
+size and md5, and only then renamed into place. Failed copies are retried
+with exponential backoff; copies still pending when the launcher exits stay
+in the queue file and are finished by the resume command:
+
+    python backup_queue.py C:/ProgramData/AIBS_MPE/camstim/data/250101120000_mouse_bonsai
+
+Python 2.7 compatible.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import datetime
+import threading
+
+from atomic_file import atomic_write, replace_file
+from checksum_cache import file_digest
+
+QUEUE_NAME = 'backup_queue.json'
+
+
+def copy_verified(source, destination, source_digest=None):
+    """
+    Copy a file and verify the copy by size and md5 before putting it in place.
+
+    Args:
+        source (str): File to copy
+        destination (str): Target path (replaced if it exists)
+        source_digest (str, optional): Known md5 of the source
+
+    Returns:
+        tuple: (size, md5)
+    """
+    size = os.path.getsize(source)
+    digest = source_digest or file_digest(source)
+    folder = os.path.dirname(destination)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    partial = destination + '.partial'
+    shutil.copy2(source, partial)
+    try:
+        copied_size = os.path.getsize(partial)
+        if copied_size != size:
+            raise IOError("Size mismatch copying %s: %d != %d bytes" % (source, copied_size, size))
+        copied_digest = file_digest(partial)
+        if copied_digest != digest:
+            raise IOError("Checksum mismatch copying %s" % source)
+        replace_file(partial, destination)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return size, digest
+
+
+class BackupQueue(object):
+    """
+    Copy jobs of a session, persisted as JSON after every change.
+
+    Args:
+        path (str): Queue file (normally <session folder>/backup_queue.json)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = []
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.jobs = json.load(f).get('jobs', [])
+
+    def add(self, source, destination):
+        """Queue a file copy (a pending job for the same copy is not duplicated)."""
+        with self._lock:
+            for job in self.jobs:
+                if job['source'] == source and job['destination'] == destination and job['status'] == 'pending':
+                    return job
+            job = {'source': source, 'destination': destination, 'status': 'pending', 'attempts': 0,
+                   'error': None, 'bytes': None, 'md5': None, 'finished': None}
+            self.jobs.append(job)
+            self._save()
+        return job
+
+    def add_folder(self, folder, destination, exclude=()):
+        """
+        Queue a copy of every file under folder (except the queue itself) into destination.
+
+        Args:
+            folder (str): Folder to copy
+            destination (str): Folder receiving the copies
+            exclude (list): Files left out (e.g. files still being rewritten, queued later)
+        """
+        skipped = set(os.path.abspath(path) for path in list(exclude) + [self.path])
+        queued = []
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                if os.path.abspath(source) in skipped or name.endswith(('.partial', '.tmp')):
+                    continue
+                queued.append(self.add(source, os.path.join(destination, os.path.relpath(source, folder))))
+        return queued
+
+    def pending(self):
+        with self._lock:
+            return [job for job in self.jobs if job['status'] == 'pending']
+
+    def update(self, job, **values):
+        with self._lock:
+            job.update(values)
+            self._save()
+
+    def _save(self):
+        with atomic_write(self.path, 'w') as f:
+            json.dump({'jobs': self.jobs}, f, indent=2)
+
+
+def run_job(queue, job):
+    """
+    Perform one queued copy and record the outcome.
+
+    Returns:
+        bool: True if the copy was verified
+    """
+    try:
+        if not os.path.isfile(job['source']):
+            raise IOError("Source missing: %s" % job['source'])
+        size, digest = copy_verified(job['source'], job['destination'])
+        queue.update(job, status='done', bytes=size, md5=digest, error=None, attempts=job['attempts'] + 1,
+                     finished=datetime.datetime.now().isoformat())
+        logging.info("Backed up %s to %s (%d bytes, verified)" % (job['source'], job['destination'], size))
+        return True
+    except Exception as e:
+        queue.update(job, attempts=job['attempts'] + 1, error=str(e))
+        logging.warning("Backup of %s to %s failed (attempt %d): %s" % (
+            job['source'], job['destination'], job['attempts'], e))
+        return False
+
+
+def process_queue(queue, max_attempts=5, retry_delay=2.0, max_delay=60.0, stop_event=None):
+    """
+    Copy every pending job, retrying failures with exponential backoff.
+
+    Each job gets up to max_attempts tries in this call; jobs that still fail
+    stay pending in the queue file for a later resume.
+
+    Returns:
+        int: Number of jobs still pending
+    """
+    for job in queue.pending():
+        delay = retry_delay
+        for attempt in range(max_attempts):
+            if run_job(queue, job):
+                break
+            if attempt + 1 < max_attempts:
+                if stop_event is not None and stop_event.wait(delay):
+                    return len(queue.pending())
+                elif stop_event is None:
+                    time.sleep(delay)
+                delay = min(delay * 2, max_delay)
+    remaining = len(queue.pending())
+    if remaining:
+        logging.error("%d backup copies still pending in %s; finish them with: python backup_queue.py %s" % (
+            remaining, queue.path, os.path.dirname(queue.path)))
+    return remaining
+
+
+class BackupWorker(object):
+    """
+    Background thread draining a BackupQueue.
+
+    Args:
+        queue (BackupQueue): Jobs to copy
+        max_attempts (int): Tries per job before leaving it for resume
+        retry_delay (float): First retry delay in seconds (doubled up to 60 s)
+    """
+
+    def __init__(self, queue, max_attempts=5, retry_delay=2.0):
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.remaining = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='BackupWorker')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.remaining = process_queue(self.queue, self.max_attempts, self.retry_delay, stop_event=self._stop)
+        except Exception as e:
+            logging.exception("Backup worker failed: %s" % e)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the copies to finish.
+
+        Returns:
+            bool: True if the queue was drained
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return False
+        return not self.queue.pending()
+
+    def stop(self):
+        """Stop retrying (pending jobs stay in the queue file)."""
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Finish pending backup copies of session folders')
+    parser.add_argument('session_folders', nargs='+', help='Session folders holding %s' % QUEUE_NAME)
+    parser.add_argument('--max-attempts', type=int, default=5, help='Tries per copy')
+    parser.add_argument('--retry-delay', type=float, default=2.0, help='First retry delay (s)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    remaining = 0
+    for folder in args.session_folders:
+        path = os.path.join(folder, QUEUE_NAME)
+        if not os.path.isfile(path):
+            logging.info("No backup queue in %s" % folder)
+            continue
+        queue = BackupQueue(path)
+        logging.info("%s: %d pending copies" % (folder, len(queue.pending())))
+        remaining += process_queue(queue, args.max_attempts, args.retry_delay)
+    return 1 if remaining else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
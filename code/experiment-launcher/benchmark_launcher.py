@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Benchmark of the launcher's post-processing path on synthetic sessions.
+
+Writes a synthetic session (see synthetic_session.py) and times each stage of
+BonsaiExperiment.save_output on it, recording the peak memory growth of every
+stage:
+
+    _build_logger_index               logger CSV -> LoggerIndex
+    _create_timing_map                LoggerIndex -> TimingMap
+    _load_and_process_bonsai_data     stimulus objects and raw tables
+    _reconstruct_encoder_from_logger  wheel events -> encoder arrays
+    _calculate_intervalsms            frame intervals
+    save_output                       everything above plus the pkl write
+
+Peak memory is the highest process RSS seen while the stage runs, minus the RSS
+when it started (sampled by a background thread every few milliseconds).
+Runs headless: mpeconfig and the win32 modules are stubbed out.
+
+Run (Python 2.7 env):
+    python benchmark_launcher.py --session-type visual_mismatch --minutes 70 --repeat 3
+    python benchmark_launcher.py --minutes 10 --json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import datetime
+import tempfile
+
+from launcher_profile import PeakMemorySampler
+from launcher_stubs import install_launcher_stubs
+from synthetic_session import write_synthetic_session
+
+STAGES = [
+    '_build_logger_index', '_create_timing_map', '_load_and_process_bonsai_data',
+    '_reconstruct_encoder_from_logger', '_calculate_intervalsms', 'save_output',
+]
+
+
+def _new_experiment(launcher, session_folder, output_path):
+    experiment = launcher.BonsaiExperiment()
+    experiment.session_folder = session_folder
+    experiment.session_output_path = output_path
+    experiment.params['output_path'] = output_path
+    experiment.params['bonsai_path'] = ''
+    experiment.mouse_id = 'benchmark_mouse'
+    experiment.user_id = 'benchmark'
+    experiment.start_time = datetime.datetime.now()
+    return experiment
+
+
+def _measure(results, stage, func, *args):
+    with PeakMemorySampler(interval=0.002) as sampler:
+        start = time.time()
+        value = func(*args)
+        seconds = time.time() - start
+    results.setdefault(stage, []).append({'seconds': seconds, 'peak_bytes': sampler.peak_increase})
+    return value
+
+
+def run_benchmark(session_folder, repeat=1):
+    """
+    Time every post-processing stage on an existing session folder.
+
+    Args:
+        session_folder (str): Folder with orientations_*.csv files
+        repeat (int): Number of runs of every stage
+
+    Returns:
+        dict: Stage name -> list of {'seconds', 'peak_bytes'}, one per run
+    """
+    install_launcher_stubs()
+    import bonsai_experiment_launcher as launcher
+
+    output_path = os.path.join(session_folder, 'benchmark.pkl')
+    results = {}
+    for _ in range(repeat):
+        experiment = _new_experiment(launcher, session_folder, output_path)
+        csv_files = experiment._find_bonsai_csv_files()
+        logger_index = _measure(results, '_build_logger_index', experiment._build_logger_index, csv_files[1])
+        timing_map = _measure(results, '_create_timing_map', experiment._create_timing_map, logger_index)
+        _measure(results, '_load_and_process_bonsai_data', experiment._load_and_process_bonsai_data,
+                 csv_files, logger_index, timing_map)
+        total_frames = experiment._get_total_frames_from_logger(logger_index)
+        _measure(results, '_reconstruct_encoder_from_logger', experiment._reconstruct_encoder_from_logger,
+                 logger_index, total_frames)
+        _measure(results, '_calculate_intervalsms', experiment._calculate_intervalsms, logger_index)
+        del logger_index, timing_map
+
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+        _measure(results, 'save_output', experiment.save_output)
+        if not os.path.isfile(output_path):
+            raise IOError("save_output did not write %s" % output_path)
+        results.setdefault('pkl_bytes', []).append(os.path.getsize(output_path))
+        os.remove(output_path)
+        for companion in (experiment.arrays_path, experiment.profile_path):
+            if companion and os.path.isfile(companion):
+                os.remove(companion)
+    return results
+
+
+def summarize(results):
+    """Best time and largest peak memory of every stage."""
+    summary = {}
+    for stage in STAGES:
+        runs = results.get(stage, [])
+        if runs:
+            summary[stage] = {
+                'best_seconds': min(r['seconds'] for r in runs),
+                'mean_seconds': sum(r['seconds'] for r in runs) / len(runs),
+                'peak_mb': max(r['peak_bytes'] for r in runs) / 1024.0 / 1024.0,
+            }
+    return summary
+
+
+def print_summary(summary, info):
+    print("Session: %d trials, %d frames, %d logger rows" % (info['trials'], info['frames'], info['logger_rows']))
+    print("%-34s %10s %10s %12s" % ('Stage', 'best s', 'mean s', 'peak MB'))
+    for stage in STAGES:
+        if stage in summary:
+            s = summary[stage]
+            print("%-34s %10.3f %10.3f %12.1f" % (stage, s['best_seconds'], s['mean_seconds'], s['peak_mb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the launcher post-processing path')
+    parser.add_argument('--session-type', default='visual_mismatch', help='Session type from generate_experiment_csv')
+    parser.add_argument('--minutes', type=float, default=None, help='Stimulus duration (default: whole session)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic session')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs of every stage')
+    parser.add_argument('--session-folder', default=None,
+                        help='Write the synthetic session here and keep it (default: temporary folder)')
+    parser.add_argument('--json', default=None, help='Write the results to this JSON file')
+    parser.add_argument('--verbose', action='store_true', help='Show the launcher log')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    session_folder = args.session_folder or tempfile.mkdtemp(suffix='_bonsai')
+    try:
+        info = write_synthetic_session(session_folder, args.session_type, args.minutes, args.seed)
+        results = run_benchmark(session_folder, args.repeat)
+    finally:
+        if not args.session_folder:
+            shutil.rmtree(session_folder, ignore_errors=True)
+
+    summary = summarize(results)
+    print_summary(summary, info)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'session_type': args.session_type, 'minutes': args.minutes, 'seed': args.seed,
+                'session': dict((k, info[k]) for k in ('trials', 'frames', 'logger_rows')),
+                'pkl_bytes': results.get('pkl_bytes', []),
+                'summary': summary, 'runs': dict((s, results[s]) for s in STAGES if s in results),
+            }, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,220 +19,113 @@ import logging
 import datetime
 import platform
 import subprocess
-import yaml  
+import types
 import uuid
-import cPickle as pickle
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 import io
 import hashlib
 import atexit
-import psutil
+import importlib
 import threading
 import shutil  # Added for directory operations
 import argparse
-import mpeconfig
 import json
 from copy import deepcopy  # for opto params mirroring reference.py usage
-import numpy as np  # needed for inlined reference opto-tagging code
-import pickle as pkl  # alias required by reference optotagging() implementation
 import re
+import stat
+import csv
 
-# Inlined opto-tagging helpers (previously from opto_tagging.py) to avoid external file dependency on rigs
-# These provide optional end-of-session optogenetic stimulation when run_opto_tagging param is true.
-# All code is Python 2.7 compatible; hardware modules are imported lazily.
-
-def run_optotagging(levels, conditions, waveforms, isis, sampleRate = 10000.):
-
-    from toolbox.IO.nidaq import AnalogOutput
-    from toolbox.IO.nidaq import DigitalOutput
-
-    sweep_on = np.array([0,0,1,0,0,0,0,0], dtype=np.uint8)
-    stim_on = np.array([0,0,1,1,0,0,0,0], dtype=np.uint8)
-    stim_off = np.array([0,0,1,0,0,0,0,0], dtype=np.uint8)
-    sweep_off = np.array([0,0,0,0,0,0,0,0], dtype=np.uint8)
-
-    ao = AnalogOutput('Dev1', channels=[1])
-    ao.cfg_sample_clock(sampleRate)
-
-    do = DigitalOutput('Dev1', 2)
-
-    do.start()
-    ao.start()
-
-    do.write(sweep_on)
-    time.sleep(5)
-
-    for i, level in enumerate(levels):
-
-        print(level)
-
-        data = waveforms[conditions[i]]
-
-        do.write(stim_on)
-        ao.write(data * level)
-        do.write(stim_off)
-        time.sleep(isis[i])
-
-    do.write(sweep_off)
-    do.clear()
-    ao.clear()
-
-def generatePulseTrain(pulseWidth, pulseInterval, numRepeats, riseTime, sampleRate = 10000.):
-
-    data = np.zeros((int(sampleRate),), dtype=np.float64)
-   # rise_samples =
-
-    rise_and_fall = (((1 - np.cos(np.arange(sampleRate*riseTime/1000., dtype=np.float64)*2*np.pi/10))+1)-1)/2
-    half_length = int(rise_and_fall.size / 2)
-    rise = rise_and_fall[:half_length]
-    fall = rise_and_fall[half_length:]
-
-    peak_samples = int(sampleRate*(pulseWidth-riseTime*2)/1000)
-    peak = np.ones((peak_samples,))
-
-    pulse = np.concatenate((rise, \
-                           peak, \
-                           fall))
-
-    interval = int(pulseInterval*sampleRate/1000.)
-
-    for i in range(0, numRepeats):
-        data[i*interval:i*interval+pulse.size] = pulse
-
-    return data
-
-def optotagging(mouse_id, operation_mode='experiment', level_list = [1.15, 1.28, 1.345], output_dir = 'C:/ProgramData/camstim/output/'):
-
-    sampleRate = 10000
-
-    # 1 s cosine ramp:
-    data_cosine = (((1 - np.cos(np.arange(sampleRate, dtype=np.float64)
-                                * 2*np.pi/sampleRate)) + 1) - 1)/2  # create raised cosine waveform
-
-    # 1 ms cosine ramp:
-    rise_and_fall = (
-        ((1 - np.cos(np.arange(sampleRate*0.001, dtype=np.float64)*2*np.pi/10))+1)-1)/2
-    half_length = int(rise_and_fall.size / 2)
-
-    # pulses with cosine ramp:
-    pulse_2ms = np.concatenate((rise_and_fall[:half_length], np.ones(
-        (int(sampleRate*0.001),)), rise_and_fall[half_length:]))
-    pulse_5ms = np.concatenate((rise_and_fall[:half_length], np.ones(
-        (int(sampleRate*0.004),)), rise_and_fall[half_length:]))
-    pulse_10ms = np.concatenate((rise_and_fall[:half_length], np.ones(
-        (int(sampleRate*0.009),)), rise_and_fall[half_length:]))
-
-    data_2ms_10Hz = np.zeros((sampleRate,), dtype=np.float64)
-
-    for i in range(0, 10):
-        interval = int(sampleRate / 10)
-        data_2ms_10Hz[i*interval:i*interval+pulse_2ms.size] = pulse_2ms
-
-    data_5ms = np.zeros((sampleRate,), dtype=np.float64)
-    data_5ms[:pulse_5ms.size] = pulse_5ms
-
-    data_10ms = np.zeros((sampleRate,), dtype=np.float64)
-    data_10ms[:pulse_10ms.size] = pulse_10ms
-
-    data_10s = np.zeros((sampleRate*10,), dtype=np.float64)
-    data_10s[:-2] = 1
-
-    ##### THESE STIMULI ADDED FOR OPENSCOPE GLO PROJECT #####
-    data_10ms_5Hz = generatePulseTrain(10, 200, 5, 1) # 1 second of 5Hz pulse train. Each pulse is 10 ms wide
-    data_6ms_40Hz = generatePulseTrain(6, 25, 40, 1)  # 1 second of 40 Hz pulse train. Each pulse is 6 ms wide
-    #########################################################
-
-    # for experiment
-
-    isi = 1.5
-    isi_rand = 0.5
-    numRepeats = 50
-
-    condition_list = [3, 4, 5]
-    waveforms = [data_2ms_10Hz, data_5ms, data_10ms, data_cosine, data_10ms_5Hz, data_6ms_40Hz]
-
-    opto_levels = np.array(level_list*numRepeats*len(condition_list)) #     BLUE
-    opto_conditions = condition_list*numRepeats*len(level_list)
-    opto_conditions = np.sort(opto_conditions)
-    opto_isis = np.random.random(opto_levels.shape) * isi_rand + isi
-
-    p = np.random.permutation(len(opto_levels))
-
-    # implement shuffle?
-    opto_levels = opto_levels[p]
-    opto_conditions = opto_conditions[p]
-
-    # for testing
-
-    if operation_mode=='test_levels':
-        isi = 2.0
-        isi_rand = 0.0
-
-        numRepeats = 2
+from bonsai_output import StreamCapture, OutputLogQueue
+from preflight import PreflightScheduler
+from launcher_profile import LauncherProfile, sidecar_path
 
-        condition_list = [0]
-        waveforms = [data_10s, data_10s]
 
-        opto_levels = np.array(level_list*numRepeats*len(condition_list)) #     BLUE
-        opto_conditions = condition_list*numRepeats*len(level_list)
-        opto_conditions = np.sort(opto_conditions)
-        opto_isis = np.random.random(opto_levels.shape) * isi_rand + isi
+class LazyModule(types.ModuleType):
+    """
+    Module placeholder that imports the real module on first attribute access.
+    
+    Keeps numpy, yaml, psutil and the numpy-based launcher modules out of the
+    import of this file; code uses them as usual (np.zeros, yaml.load, ...).
+    """
+    
+    def __init__(self, name):
+        types.ModuleType.__init__(self, name)
+    
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+np = LazyModule('numpy')
+yaml = LazyModule('yaml')
+psutil = LazyModule('psutil')
+bonsai_tables = LazyModule('bonsai_tables')
+bonsai_logger = LazyModule('bonsai_logger')
+process_telemetry = LazyModule('process_telemetry')
+frame_dashboard = LazyModule('frame_dashboard')
+stimulus_cache = LazyModule('stimulus_cache')
+session_pickle = LazyModule('session_pickle')
+checksum_cache = LazyModule('checksum_cache')
+backup_queue = LazyModule('backup_queue')
+session_arrays = LazyModule('session_arrays')
 
-    elif operation_mode=='pretest':
-        numRepeats = 1
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-        condition_list = [0]
-        data_2s = data_10s[-sampleRate*2:]
-        waveforms = [data_2s]
+_camstim_config = None
+_camstim_config_lock = threading.Lock()
 
-        opto_levels = np.array(level_list*numRepeats*len(condition_list)) #     BLUE
-        opto_conditions = condition_list*numRepeats*len(level_list)
-        opto_conditions = np.sort(opto_conditions)
-        opto_isis = [1]*len(opto_conditions)
-    #
 
-    outputDirectory = output_dir
-    fileDate = str(datetime.datetime.now()).replace(':', '').replace(
-        '.', '').replace('-', '').replace(' ', '')[2:14]
-    fileName = os.path.join(outputDirectory, fileDate + '_'+mouse_id + '.opto.pkl')
+def get_camstim_config():
+    """camstim configuration from mpeconfig, sourced on first use (not at import)"""
+    global _camstim_config
+    with _camstim_config_lock:
+        if _camstim_config is None:
+            import mpeconfig
+            _camstim_config = mpeconfig.source_configuration('camstim', send_start_log=False)
+        return _camstim_config
 
-    print('saving info to: ' + fileName)
-    fl = open(fileName, 'wb')
-    output = {}
 
-    output['opto_levels'] = opto_levels
-    output['opto_conditions'] = opto_conditions
-    output['opto_ISIs'] = opto_isis
-    output['opto_waveforms'] = waveforms
+def use_simulation_backend(root=None):
+    """
+    Simulate mpeconfig, the win32 modules and camstim (see simulation) and
+    source the camstim configuration from the simulated rig.
+    
+    Args:
+        root (str, optional): Simulation folder
+    
+    Returns:
+        str: The simulation folder
+    """
+    global _camstim_config
+    import simulation
+    with _camstim_config_lock:
+        root = simulation.install_backend(root)
+        _camstim_config = None
+    return root
 
-    pkl.dump(output, fl)
-    fl.close()
-    print('saved.')
 
-    #
-    run_optotagging(opto_levels, opto_conditions,
-                    waveforms, opto_isis, float(sampleRate))
-"""
-end of optotagging section
-"""
+def get_camstim_dir():
+    """camstim root data path (root_datapath of the camstim configuration)"""
+    return get_camstim_config()['root_datapath']
 
-import stat
-import csv
-import numpy as np
-import pickle  # used by inlined opto protocol writer
 
-import win32job
-import win32api
-import win32con
+def get_output_dir():
+    """Default folder of the session folders"""
+    return os.path.join(get_camstim_dir(), "data")
 
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-CAMSTIM_DIR = "C:/ProgramData/AIBS_MPE/camstim/"
-CAMSTIM_CONFIG = mpeconfig.source_configuration('camstim', send_start_log=False)
-CAMSTIM_DIR = CAMSTIM_CONFIG['root_datapath']
-OUTPUT_DIR = os.path.join(CAMSTIM_DIR, "data")
+# Kill Bonsai when system memory use rises more than this many percentage points
+# over its level before launch (same meaning as in the camstim agent)
 KILL_THRESHOLD = float(os.getenv('CAMSTIM_VMEM_THRESHOLD', 90))
+# Kill Bonsai when its process tree alone uses more than this share of physical memory
+BONSAI_MEMORY_PERCENT = float(os.getenv('CAMSTIM_BONSAI_MEMORY_PERCENT', 90))
+FULL_SHA_PATTERN = re.compile(r'^[0-9a-fA-F]{40}$')
 
 class BonsaiExperiment(object):
     """
@@ -240,8 +133,18 @@ class BonsaiExperiment(object):
     saving experiment data
     """
     
-    def __init__(self):
-        """Initialize the experiment with configuration data"""
+    def __init__(self, simulate=False):
+        """
+        Initialize the experiment with configuration data
+        
+        Args:
+            simulate (bool): Run on the simulated rig (see simulation) instead of the rig software
+        """
+        # The simulated rig must be in place before mpeconfig and win32job are used
+        self.simulate = simulate
+        self.simulation_speedup = None
+        if simulate:
+            use_simulation_backend()
         self.platform_info = self.get_platform_info()
         self.output_path = None
         self.params = {}
@@ -249,7 +152,7 @@ class BonsaiExperiment(object):
         self.start_time = None
         self.stop_time = None
         self.config = {}
-        self.config_path = os.path.join(CAMSTIM_DIR, "config/camstim.yml")
+        self.config_path = os.path.join(get_camstim_dir(), "config/camstim.yml")
         
         # Initialize session tracking variables similar to camstim's agent
         self.mouse_id = ""
@@ -260,6 +163,8 @@ class BonsaiExperiment(object):
         self.params_checksum = None
         self._percent_used = None
         self._restarted = False
+        # Set by update_repository when 'git fetch' could not reach the remote
+        self._repository_fetch_failed = False
         
         # Custom output path for -o flag compatibility
         self.custom_output_path = None
@@ -270,12 +175,52 @@ class BonsaiExperiment(object):
         # Session folder for organizing output files
         self.session_folder = None
         
-        # Add variables to capture stdout and stderr
-        self.stdout_data = []
-        self.stderr_data = []
+        # Add variables to capture stdout and stderr (recent lines; full stream in the session folder)
+        self.stdout_data = StreamCapture()
+        self.stderr_data = StreamCapture()
         self._output_threads = []
+        self._output_log = None
+        
+        # Per-key (key, bytes, seconds) report of the last session pkl written
+        self.pkl_report = []
+        
+        # Optional live parsing of the logger CSV while Bonsai runs
+        self._logger_tailer = None
+        self._frame_dashboard = None
+        
+        # Memory/CPU time series of the Bonsai process tree (see process_telemetry)
+        self.bonsai_telemetry = None
+        
+        # Pre-flight setup state and per-step timing (see preflight)
+        self._run_started = None
+        self.preflight_timings = {}
+        self.workflow_path = None
+        self._stimulus_table_ready = False
+        self._first_frame_seen = False
+        
+        # Provenance checksums of the session inputs (see checksum_cache)
+        self.params_file = None
+        self.asset_checksums = {}
+        self.stimulus_table_checksum = None
+        self.input_checksums = None  # set when restored from an earlier pkl
+        self._checksum_cache = None
+        
+        # Verified background copies of the session outputs (see backup_queue)
+        self._backup_worker = None
+        
+        # Timing map of the last packaged logger and the companion .npz (see session_arrays)
+        self.timing_map = None
+        self.arrays_path = None
+        
+        # Wall/CPU time and peak RSS growth of every launcher phase (see launcher_profile)
+        self.profile = LauncherProfile()
+        self.profile_path = None
+        self._backups_phase = None
+        # Backup of the sidecar in session_backup_dir, copied after its last write
+        self._profile_backup_path = None
         
         try:
+            import win32job
             self.hJob = win32job.CreateJobObject(None, "BonsaiJobObject")
             extended_info = win32job.QueryInformationJobObject(self.hJob, win32job.JobObjectExtendedLimitInformation)
             extended_info['BasicLimitInformation']['LimitFlags'] = win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
@@ -314,8 +259,8 @@ class BonsaiExperiment(object):
                     logging.info("Loaded parameters from %s" % param_file)
                     
                     # Generate parameter checksum for provenance tracking, like in camstim agent
-                    with open(param_file, 'rb') as f:
-                        self.params_checksum = hashlib.md5(f.read()).hexdigest()
+                    self.params_file = os.path.abspath(param_file)
+                    self.params_checksum = self.get_checksum_cache().digest(param_file)
                     logging.info("Parameter file checksum: %s" % self.params_checksum)
             else:
                 logging.warning("No parameter file provided, using default parameters. THIS IS NOT THE EXPECTED BEHAVIOR FOR PRODUCTION RUNS")
@@ -379,7 +324,7 @@ class BonsaiExperiment(object):
         logging.info("Loading configuration from %s" % self.config_path)
         
         try:
-            config = CAMSTIM_CONFIG
+            config = get_camstim_config()
             
             # Load all standard sections that are used in camstim
             self.load_config_section("Behavior", config)
@@ -505,11 +450,12 @@ class BonsaiExperiment(object):
             session_folder_name = "%s_%s_bonsai" % (dt_str, mouse_id)
             
             # Create output directory if it doesn't exist
-            if not os.path.isdir(OUTPUT_DIR):
-                os.makedirs(OUTPUT_DIR)
+            output_dir = get_output_dir()
+            if not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
                 
             # Create session folder
-            self.session_folder = os.path.join(OUTPUT_DIR, session_folder_name)
+            self.session_folder = os.path.join(output_dir, session_folder_name)
             if not os.path.isdir(self.session_folder):
                 os.makedirs(self.session_folder)
                 
@@ -530,26 +476,11 @@ class BonsaiExperiment(object):
         Returns:
             list: Command-line arguments for Bonsai
         """
-        bonsai_path = self.params.get('bonsai_path', None)
-        if not bonsai_path:
-            raise ValueError("No Bonsai workflow path specified in parameters")
-            
-        # Convert relative path to absolute path using repository
-        workflow_path = self.get_absolute_path_from_repo(bonsai_path)
-        if not workflow_path:
-            # Fall back to original relative path logic for backward compatibility
-            workflow_path = os.path.abspath(os.path.join(
-                os.path.dirname(__file__),
-                "..", "stimulus-control", "src", bonsai_path
-            ))
+        workflow_path = self.get_workflow_path()
         
-        if not os.path.exists(workflow_path):
-            raise ValueError("Bonsai workflow not found at: %s" % workflow_path)
-        
-        # Generate workflow checksum for provenance tracking, like in camstim agent
-        with open(workflow_path, 'rb') as f:
-            self.script_checksum = hashlib.md5(f.read()).hexdigest()
-        logging.info("Workflow file checksum: %s" % self.script_checksum)
+        # Checksum computed during pre-flight unless the workflow changed since
+        if workflow_path != self.workflow_path or not self.script_checksum:
+            self.compute_workflow_checksum()
             
         # Base arguments - use correct Bonsai CLI syntax:
         # 1. Bonsai executable
@@ -560,6 +491,9 @@ class BonsaiExperiment(object):
             raise ValueError("Bonsai executable not found at: %s" % self.bonsai_exe_path)
             
         args = [self.bonsai_exe_path, workflow_path]
+        if self.simulate:
+            # The simulated Bonsai is a Python script
+            args.insert(0, sys.executable)
         
         # Run in non-interactive application mode with both flags
         args.append("--start")
@@ -568,6 +502,8 @@ class BonsaiExperiment(object):
         # Add the Bonsai arguments that were created from parameters and config
         bonsai_property_args = self.create_bonsai_arguments()
         args.extend(bonsai_property_args)
+        if self.simulate:
+            args.extend(["--speedup", str(self.get_simulation_speedup())])
         
         # Log the complete command
         cmd_str = " ".join(args)
@@ -576,6 +512,230 @@ class BonsaiExperiment(object):
         
         return args
         
+    def get_simulation_speedup(self):
+        """
+        Speed-up of the simulated Bonsai: --speedup, else 'simulation_speedup'
+        (default simulation.DEFAULT_SPEEDUP, a 70 minute session in 30 s).
+        """
+        if self.simulation_speedup:
+            return float(self.simulation_speedup)
+        import simulation
+        return float(self.params.get('simulation_speedup', simulation.DEFAULT_SPEEDUP))
+        
+    def get_workflow_path(self):
+        """
+        Absolute path of the Bonsai workflow named by the 'bonsai_path' parameter.
+        
+        Returns:
+            str: Path of the existing workflow file
+        """
+        bonsai_path = self.params.get('bonsai_path', None)
+        if not bonsai_path:
+            raise ValueError("No Bonsai workflow path specified in parameters")
+            
+        # Convert relative path to absolute path using repository
+        workflow_path = self.get_absolute_path_from_repo(bonsai_path)
+        if not workflow_path:
+            # Fall back to original relative path logic for backward compatibility
+            workflow_path = os.path.abspath(os.path.join(
+                os.path.dirname(__file__),
+                "..", "stimulus-control", "src", bonsai_path
+            ))
+        
+        if not os.path.exists(workflow_path):
+            raise ValueError("Bonsai workflow not found at: %s" % workflow_path)
+        return workflow_path
+    
+    def get_checksum_cache(self):
+        """
+        Digest cache of the rig's input files, kept in 'checksum_cache_path'
+        (default <camstim>/checksum_cache.json).
+        """
+        if self._checksum_cache is None:
+            cache_path = self.params.get('checksum_cache_path',
+                                         os.path.join(get_camstim_dir(), 'checksum_cache.json'))
+            self._checksum_cache = checksum_cache.ChecksumCache(cache_path)
+        return self._checksum_cache
+    
+    def compute_workflow_checksum(self):
+        """
+        Checksum the Bonsai workflow for provenance tracking, like in camstim agent,
+        together with every input file it references (included workflows, movies,
+        tables). Unchanged files are not read again (see checksum_cache).
+        """
+        workflow_path = self.get_workflow_path()
+        checksums = self.get_checksum_cache()
+        self.script_checksum = checksums.digest(workflow_path)
+        self.workflow_path = workflow_path
+        logging.info("Workflow file checksum: %s" % self.script_checksum)
+        
+        start = time.time()
+        misses = checksums.misses
+        assets = checksum_cache.workflow_assets(workflow_path)
+        table = self.params.get('stimulus_table_path')
+        if table and 'session_type' not in self.params:
+            # A fixed stimulus table is an input; generated ones are checksummed when written
+            assets.append(table)
+        self.asset_checksums = checksums.digests(assets)
+        checksums.save()
+        missing = [path for path, digest in self.asset_checksums.items() if digest is None]
+        logging.info("Checksummed %d workflow input files in %.2f s (%d hashed, %d missing)" % (
+            len(assets), time.time() - start, checksums.misses - misses, len(missing)))
+        for path in sorted(missing):
+            logging.warning("Workflow input not found: %s" % path)
+        return True
+    
+    def get_input_checksums(self):
+        """
+        Digests of every session input: parameter file, workflow, the files the
+        workflow references and the stimulus table.
+        
+        Returns:
+            dict: algorithm, workflow and files (path -> digest, None if missing)
+        """
+        if self.input_checksums is not None:
+            return self.input_checksums
+        files = dict(self.asset_checksums)
+        if self.workflow_path:
+            files[self.workflow_path] = self.script_checksum
+        if self.params_file:
+            files[self.params_file] = self.params_checksum
+        table = self.params.get('stimulus_table_path')
+        if table and self.stimulus_table_checksum:
+            files[table] = self.stimulus_table_checksum
+        return {'algorithm': 'md5', 'workflow': self.workflow_path, 'files': files}
+    
+    def prepare_stimulus_table(self):
+        """
+        Generate the stimulus CSV if 'session_type' is specified and point
+        'stimulus_table_path' at it.
+        
+        Returns:
+            bool: False if the table could not be generated
+        """
+        if 'session_type' not in self.params:
+            logging.info("No session_type specified, skipping stimulus CSV generation")
+            return True
+        
+        logging.info("Generating stimulus table...")
+        with self.profile.phase('generate_stimulus_csv'):
+            stimulus_csv_path = self.generate_stimulus_csv()
+        if not stimulus_csv_path:
+            logging.error("Failed to generate stimulus CSV. Experiment cannot continue.")
+            return False
+        
+        # Update the stimulus_table_path parameter to point to generated file
+        self.params['stimulus_table_path'] = stimulus_csv_path
+        self._stimulus_table_ready = True
+        # Session-specific file, so not kept in the checksum cache
+        self.stimulus_table_checksum = checksum_cache.file_digest(stimulus_csv_path)
+        logging.info("Updated stimulus_table_path to: %s" % stimulus_csv_path)
+        return True
+    
+    def _setup_bonsai_executable(self):
+        """Install Bonsai if needed and resolve the executable from 'bonsai_exe_path'."""
+        if self.simulate:
+            import simulation
+            self.bonsai_exe_path = simulation.FAKE_BONSAI
+            logging.info("Using simulated Bonsai: %s" % self.bonsai_exe_path)
+            return True
+        
+        with self.profile.phase('setup_bonsai'):
+            ok = self.setup_bonsai()
+        if not ok:
+            logging.error("Bonsai setup failed")
+            return False
+        
+        bonsai_exe_relative_path = self.params.get('bonsai_exe_path')
+        if not bonsai_exe_relative_path:
+            logging.error("No 'bonsai_exe_path' specified in parameters")
+            return False
+            
+        bonsai_exe_path = self.get_absolute_path_from_repo(bonsai_exe_relative_path)
+        if not bonsai_exe_path or not os.path.exists(bonsai_exe_path):
+            logging.error("Bonsai executable not found at: %s" % bonsai_exe_path)
+            return False
+            
+        self.bonsai_exe_path = bonsai_exe_path
+        logging.info("Using Bonsai executable: %s" % self.bonsai_exe_path)
+        return True
+    
+    def run_preflight(self):
+        """
+        Run the setup steps before Bonsai starts as a dependency graph.
+        
+        The repository must be in place before Bonsai is installed, the
+        workflow is checksummed and the stimulus table is generated (all three
+        live in it); the session folder is created while the repository syncs.
+        'preflight_workers' (default 4) bounds the number of concurrent steps;
+        1 runs them one after another.
+        
+        Returns:
+            bool: True if every step succeeded
+        """
+        def setup_repository():
+            with self.profile.phase('setup_repository'):
+                ok = self.setup_repository()
+            if not ok:
+                logging.error("Repository setup failed")
+                return False
+            return True
+        
+        def setup_output_path():
+            self.setup_output_path(self.params.get("output_path", None))
+            return True
+        
+        scheduler = PreflightScheduler(self.params.get('preflight_workers', 4), t0=self._run_started)
+        scheduler.add('repository', setup_repository)
+        scheduler.add('output_path', setup_output_path)
+        scheduler.add('bonsai', self._setup_bonsai_executable, requires=('repository',))
+        scheduler.add('workflow_checksum', self.compute_workflow_checksum, requires=('repository',))
+        scheduler.add('stimulus_table', self.prepare_stimulus_table, requires=('repository', 'output_path'))
+        if not self.params.get('disable_opto', True):
+            scheduler.add('opto_waveforms', self.prepare_opto_waveforms)
+        
+        ok = scheduler.run()
+        self.preflight_timings = scheduler.timings
+        scheduler.log_summary()
+        if not ok:
+            logging.error("Pre-flight failed: %s" % ", ".join(scheduler.failed_steps()))
+        return ok
+    
+    def get_opto_waveform_cache_dir(self):
+        """Cache directory of the opto-tagging waveform bank ('opto_waveform_cache_dir')."""
+        return self.params.get('opto_waveform_cache_dir', os.path.join(get_camstim_dir(), 'opto_waveforms'))
+    
+    def prepare_opto_waveforms(self):
+        """
+        Build and cache the opto-tagging waveforms before the session (see opto_waveforms).
+        
+        The pulse trains listed in opto_params 'pulse_trains' are cached too, so
+        optotagging() only maps the cached files at the end of the session.
+        
+        Returns:
+            bool: Always True; optotagging() builds whatever could not be cached
+        """
+        try:
+            import opto_waveforms
+            bank = opto_waveforms.WaveformBank(self.get_opto_waveform_cache_dir())
+            for name in ('cosine_1s', '2ms_10Hz', '5ms', '10ms', '10s') + tuple(sorted(opto_waveforms.GLO_PULSE_TRAINS)):
+                bank.standard(name)
+            for train in (self.params.get('opto_params') or {}).get('pulse_trains') or []:
+                bank.pulse_train(*train)
+            logging.info("Opto waveforms ready in %s (%d cached, %d built)" % (bank.cache_dir, bank.hits, bank.misses))
+        except Exception as e:
+            logging.warning("Could not prepare opto waveforms: %s" % e)
+        return True
+    
+    def _log_first_frame(self, logger_index):
+        """LoggerTailer listener: log the time from launcher start to Bonsai's first frame."""
+        if self._first_frame_seen or self._run_started is None:
+            return
+        offset, batch = logger_index.last_batch()
+        if len(batch.get('frame_rows', ())):
+            self._first_frame_seen = True
+            logging.info("First frame logged %.2f s after launcher start" % (time.time() - self._run_started))
+        
     def start_bonsai(self):
         """Start the Bonsai workflow as a subprocess"""
         logging.info("Mouse ID: %s, User ID: %s, Session UUID: %s" % (self.mouse_id, self.user_id, self.session_uuid))
@@ -584,23 +744,13 @@ class BonsaiExperiment(object):
         vmem = psutil.virtual_memory()
         self._percent_used = vmem.percent
         
-        # Ensure output path is set up
-        self.setup_output_path(self.params.get("output_path", None))
+        # Ensure output path is set up (done during pre-flight when started from run)
+        if not self.session_folder:
+            self.setup_output_path(self.params.get("output_path", None))
         
         # Generate stimulus CSV file if session_type is specified
-        if 'session_type' in self.params:
-            logging.info("Step 3.1: Generating stimulus table...")
-            stimulus_csv_path = self.generate_stimulus_csv()
-            
-            if stimulus_csv_path:
-                # Update the stimulus_table_path parameter to point to generated file
-                self.params['stimulus_table_path'] = stimulus_csv_path
-                logging.info("Updated stimulus_table_path to: %s" % stimulus_csv_path)
-            else:
-                logging.error("Failed to generate stimulus CSV. Experiment cannot continue.")
-                raise RuntimeError("Stimulus CSV generation failed")
-        else:
-            logging.info("No session_type specified, skipping stimulus CSV generation")
+        if not self._stimulus_table_ready and not self.prepare_stimulus_table():
+            raise RuntimeError("Stimulus CSV generation failed")
         
         # Get command-line arguments
         args = self.get_bonsai_args()
@@ -619,10 +769,18 @@ class BonsaiExperiment(object):
             
             # Create threads to read output streams in real-time
             self._start_output_readers()
+            self._start_logger_tailer()
+            if self._run_started is not None:
+                logging.info("Bonsai launched %.2f s after launcher start" % (time.time() - self._run_started))
+            if self._logger_tailer is not None:
+                self._logger_tailer.add_listener(self._log_first_frame)
             
             # If Windows modules are available, assign process to job object
             if self.hJob:
                 try:
+                    import win32api
+                    import win32con
+                    import win32job
                     perms = win32con.PROCESS_TERMINATE | win32con.PROCESS_SET_QUOTA
                     hProcess = win32api.OpenProcess(perms, False, self.bonsai_process.pid)
                     win32job.AssignProcessToJobObject(self.hJob, hProcess)
@@ -644,24 +802,44 @@ class BonsaiExperiment(object):
             raise
 
     def _start_output_readers(self):
-        """Start threads to read stdout and stderr in real-time"""
-        # Clear previous data
-        self.stdout_data = []
-        self.stderr_data = []
+        """
+        Start threads to read stdout and stderr in real-time.
         
-        # Define reader functions that append to the data lists
+        Only the last bonsai_output_lines lines (default 10000) of each stream stay
+        in memory; every line is appended to bonsai_stdout.log / bonsai_stderr.log
+        in the session folder. Lines reach the launcher log through a queue so the
+        reader threads never wait on log handlers.
+        """
+        # Clear previous data
+        self._close_output_capture()
+        max_lines = int(self.params.get('bonsai_output_lines', 10000))
+        log_dir = self.session_folder
+        try:
+            self.stdout_data = StreamCapture(log_dir and os.path.join(log_dir, 'bonsai_stdout.log'), max_lines)
+            self.stderr_data = StreamCapture(log_dir and os.path.join(log_dir, 'bonsai_stderr.log'), max_lines)
+        except (IOError, OSError) as e:
+            logging.warning("Could not open Bonsai output logs, keeping output in memory only: %s" % e)
+            self.stdout_data = StreamCapture(None, max_lines)
+            self.stderr_data = StreamCapture(None, max_lines)
+        self._output_log = OutputLogQueue()
+        self._output_log.start()
+        output_logger = self._output_log.logger
+        
+        # Define reader functions that append to the bounded captures
         def stdout_reader():
             for line in iter(self.bonsai_process.stdout.readline, ''):
                 if line:
-                    self.stdout_data.append(line.rstrip())
-                    logging.info("Bonsai output: %s" % line.rstrip())
+                    line = line.rstrip()
+                    self.stdout_data.append(line)
+                    output_logger.info("Bonsai output: %s", line)
             self.bonsai_process.stdout.close()
             
         def stderr_reader():
             for line in iter(self.bonsai_process.stderr.readline, ''):
                 if line:
-                    self.stderr_data.append(line.rstrip())
-                    logging.error("Bonsai error: %s" % line.rstrip())
+                    line = line.rstrip()
+                    self.stderr_data.append(line)
+                    output_logger.error("Bonsai error: %s", line)
             self.bonsai_process.stderr.close()
         
         # Start reader threads
@@ -675,36 +853,82 @@ class BonsaiExperiment(object):
             thread.daemon = True
             thread.start()
 
+    def _start_logger_tailer(self):
+        """
+        Start following the logger CSV in the background if live_logger_tailing
+        or live_frame_dashboard is enabled.
+        
+        The tailer parses rows as Bonsai writes them, so save_output only has the
+        last rows left to parse. save_output falls back to parsing the whole file
+        if the tailer did not follow the logger to the end.
+        """
+        self._logger_tailer = None
+        dashboard = self.params.get('live_frame_dashboard', False)
+        if not (self.params.get('live_logger_tailing', False) or dashboard) or not self.session_folder:
+            return
+        try:
+            self._logger_tailer = bonsai_logger.LoggerTailer(self.session_folder,
+                                               self.params.get('logger_tailing_interval', 0.5))
+            if dashboard:
+                self._start_frame_dashboard(self._logger_tailer)
+            self._logger_tailer.start()
+        except Exception as e:
+            logging.warning("Could not start live logger tailing: %s" % e)
+            self._logger_tailer = None
+    
+    def _start_frame_dashboard(self, tailer):
+        """
+        Serve live frame-timing statistics computed from the tailed logger.
+        
+        Statistics are served as JSON on http://127.0.0.1:<frame_dashboard_port>/
+        (default 8765) and written to frame_dashboard.json in the session folder.
+        
+        Args:
+            tailer (LoggerTailer): Tailer feeding the dashboard
+        """
+        radius = self.get_wheel_radius()
+        self._frame_dashboard = frame_dashboard.FrameDashboard(self.session_folder,
+                                               port=self.params.get('frame_dashboard_port', 8765),
+                                               wheel_radius_cm=radius)
+        self._frame_dashboard.attach(tailer)
+        try:
+            self._frame_dashboard.start()
+        except Exception as e:
+            # Statistics still go to the sidecar JSON
+            logging.warning("Could not start the frame dashboard endpoint: %s" % e)
+    
+    def _stop_frame_dashboard(self):
+        """Write the final frame-timing statistics and close the endpoint."""
+        dashboard = self._frame_dashboard
+        self._frame_dashboard = None
+        if dashboard is not None:
+            dashboard.stop()
+
     def _monitor_bonsai(self):
         """Monitor the Bonsai process until it completes"""
         logging.info("Monitoring Bonsai process...")
         
         try:
-            # Check for process memory usage and kill if it exceeds threshold
+            # Sample Bonsai's own process tree and kill it if its memory runs away
             try:
-                process = psutil.Process(self.bonsai_process.pid)
+                psutil.Process(self.bonsai_process.pid)
             except psutil.NoSuchProcess:
                 logging.warning("Process ended unexpectedly")
                 return
-                
-            # Wait for Bonsai process to complete or check for runaway memory usage
-            while self.bonsai_process.poll() is None:
-                try:
-                    # Check for memory usage every second
-                    vmem = psutil.virtual_memory()
-                    if vmem.percent > float(self._percent_used) + KILL_THRESHOLD:
-                        logging.warning("Detected runaway process, memory usage: %s%% (threshold: %s%%)" % (vmem.percent, float(self._percent_used) + KILL_THRESHOLD))
-                        self.kill_process()
-                        break
-                except Exception as e:
-                    logging.warning("Error checking process status: %s" % e)
-                    
-                # Sleep a bit before checking again
-                time.sleep(0.5)
+            
+            monitor = self._create_process_monitor()
+            try:
+                monitor.run(lambda: self.bonsai_process.poll() is None,
+                            on_runaway=lambda reason: self.kill_process())
+            finally:
+                self.bonsai_telemetry = monitor.to_dict()
+                logging.info("Recorded %d telemetry samples of the Bonsai process tree" %
+                             self.bonsai_telemetry['n_samples'])
                 
             # Wait for output reader threads to finish
             for thread in self._output_threads:
                 thread.join(timeout=2.0)  # Wait up to 2 seconds
+            self._close_output_capture()
                 
             # Check return code
             return_code = self.bonsai_process.returncode
@@ -713,7 +937,7 @@ class BonsaiExperiment(object):
                 
                 # Display all the captured error output
                 if self.stderr_data:
-                    error_msg = "\n".join(self.stderr_data)
+                    error_msg = self.stderr_data.text()
                     logging.error("Complete Bonsai error output:\n%s" % error_msg)
                     
                 # Log error with mouse and user IDs for tracking
@@ -724,7 +948,7 @@ class BonsaiExperiment(object):
                 # Display any errors even if the return code was successful 
                 # (some errors might not affect the return code)
                 if self.stderr_data:
-                    warning_msg = "\n".join(self.stderr_data)
+                    warning_msg = self.stderr_data.text()
                     logging.warning("Bonsai reported warnings or non-fatal errors:\n%s" % warning_msg)
                 
                 # Log completion with mouse and user IDs for tracking
@@ -736,11 +960,59 @@ class BonsaiExperiment(object):
             logging.error("Error monitoring Bonsai process: %s" % e)
             self.stop()
             
+    def get_wheel_radius(self):
+        """
+        Wheel radius from the DigitalEncoder (or Encoder) section loaded by load_config.
+        
+        Returns:
+            float: Radius in cm, or None if not configured
+        """
+        for section in ('DigitalEncoder', 'Encoder'):
+            radius = (self.config.get(section) or {}).get('radius_cm')
+            if radius is not None:
+                return radius
+        return None
+    
+    def _create_process_monitor(self):
+        """
+        Create the telemetry monitor of the Bonsai process tree.
+        
+        Sampling and kill policy come from params:
+            telemetry_interval (s, default 0.5), telemetry_capacity (samples, default 14400),
+            max_memory_percent (share of physical memory used by the Bonsai tree,
+                default CAMSTIM_BONSAI_MEMORY_PERCENT),
+            max_memory_growth_mb_per_min (default None: off), memory_growth_window (s, default 60),
+            memory_growth_warmup (s after launch ignored by the growth rate, default 60).
+        The system memory rise over its pre-launch level is always checked against
+        CAMSTIM_VMEM_THRESHOLD, as in the camstim agent.
+        
+        Returns:
+            ProcessTreeMonitor: Monitor of the running Bonsai process
+        """
+        return process_telemetry.ProcessTreeMonitor(
+            self.bonsai_process.pid,
+            interval=float(self.params.get('telemetry_interval', 0.5)),
+            capacity=int(self.params.get('telemetry_capacity', 14400)),
+            growth_window=float(self.params.get('memory_growth_window', 60.0)),
+            growth_warmup=float(self.params.get('memory_growth_warmup', 60.0)),
+            max_growth_mb_per_min=self.params.get('max_memory_growth_mb_per_min'),
+            max_memory_percent=self.params.get('max_memory_percent', BONSAI_MEMORY_PERCENT),
+            max_system_memory_rise=KILL_THRESHOLD,
+            system_memory_baseline=self._percent_used)
+    
     def get_bonsai_errors(self):
         """Return any errors reported by Bonsai"""
         if not self.stderr_data:
             return "No errors reported by Bonsai."
-        return "\n".join(self.stderr_data)
+        return self.stderr_data.text()
+    
+    def _close_output_capture(self):
+        """Flush the Bonsai output logs and write out queued output records."""
+        self.stdout_data.close()
+        self.stderr_data.close()
+        if self._output_log is not None:
+            self._output_log.stop()
+            self._output_log = None
     
     def kill_process(self):
         """Kill the Bonsai process immediately"""
@@ -805,6 +1077,10 @@ class BonsaiExperiment(object):
         """Clean up resources when the script exits"""
         logging.info("Cleaning up resources...")
         self.stop()
+        if self._logger_tailer:
+            self._logger_tailer.stop()
+        self._stop_frame_dashboard()
+        self._close_output_capture()
     
     def _find_bonsai_csv_files(self):
         """
@@ -852,150 +1128,87 @@ class BonsaiExperiment(object):
         Returns:
             list: List of dictionaries, one per row
         """
+        return self._read_csv_rows(file_path)[0]
+    
+    def _read_csv_rows(self, file_path):
+        """
+        Read a CSV file using built-in csv module, keeping the column order of its header.
+        
+        Args:
+            file_path (str): Path to the CSV file
+            
+        Returns:
+            tuple: (list of dictionaries, one per row; fieldnames in file order)
+        """
         data = []
+        fieldnames = []
         try:
             with open(file_path, 'r') as f:
                 reader = csv.DictReader(f)
                 for row in reader:
                     data.append(row)
+                fieldnames = list(reader.fieldnames or [])
             logging.debug("Read %d rows from %s" % (len(data), file_path))
         except Exception as e:
             logging.error("Error reading CSV file %s: %s" % (file_path, e))
         
-        return data
+        return data, fieldnames
     
-    def _load_bonsai_csv_data(self, orientations_file, logger_file):
+    def _build_logger_index(self, logger_file=None):
         """
-        Load data from Bonsai CSV files.
+        Build the single-pass LoggerIndex shared by all save_output consumers.
         
         Args:
-            orientations_file (str): Path to orientations CSV file
-            logger_file (str): Path to logger CSV file
+            logger_file (str, optional): Path to the logger CSV. Searched in the
+                session folder if not provided.
             
         Returns:
-            tuple: (orientations_data, logger_data) or (None, None) if error
+            LoggerIndex: Index over the logger file, or None if no logger file was found
         """
-        try:
-            logging.info("Loading stimulus data from %s" % orientations_file)
-            orientations_data = self._read_csv_file(orientations_file)
-            
-            logging.info("Loading timing data from %s" % logger_file)
-            logger_data = self._read_csv_file(logger_file)
-            
-            return orientations_data, logger_data
+        if logger_file is None:
+            _, logger_file, _ = self._find_bonsai_csv_files()
+        if not logger_file:
+            return None
+        
+        logging.info("Loading timing data from %s" % logger_file)
+        start = time.time()
+        logger_index = bonsai_logger.LoggerIndex.from_csv(logger_file)
+        logging.info("Indexed %d logger rows in %.2f s" % (len(logger_index), time.time() - start))
+        return logger_index
+
+    def _finish_logger_tailer(self, logger_file):
+        """
+        Collect the logger index and timing map parsed live during the session.
+        
+        Args:
+            logger_file (str): Logger CSV found in the session folder
             
-        except Exception as e:
-            logging.error("Error loading Bonsai CSV files: %s" % e)
+        Returns:
+            tuple: (LoggerIndex, timing_map), or (None, None) if the logger must be parsed in batch
+        """
+        tailer = self._logger_tailer
+        self._logger_tailer = None
+        if tailer is None:
             return None, None
+        
+        start = time.time()
+        logger_index, timing_map = tailer.finish(logger_file)
+        self._stop_frame_dashboard()
+        if logger_index is not None:
+            logging.info("Completed live logger index (%d rows) in %.2f s" % (len(logger_index), time.time() - start))
+        return logger_index, timing_map
 
-    def _create_timing_map(self, logger_data):
+    def _create_timing_map(self, logger_index):
         """
         Create a mapping of stimulus IDs to frame/timestamp information from logger CSV.
         
         Args:
-            logger_data (list): List of logger dictionaries with timing information
+            logger_index (LoggerIndex): Index over the logger rows
             
         Returns:
-            dict: Mapping from stimulus ID to timing info
+            TimingMap: Stimulus and movie frame timing as arrays (see bonsai_logger)
         """
-        timing_map = {}
-
-        try:
-            stim_id = None
-                           
-            for row in logger_data:
-                value = row.get('Value', '')
-                frame = row.get('Frame', '0')
-                timestamp = row.get('Timestamp', '0.0')
-
-                # We create a lookup table for all Frame number that have a Value
-                # This is to assign the end frame/timestamp to each stimulus presentation
-                timing_map['Frames'] = timing_map.get('Frames', {})
-                timing_map['Frames'][int(frame)] = float(timestamp)
-
-                if not value:
-                    continue
-                # We first look for the START marker to set the reference frame number and timestamp
-                # These are registered as 605,18.922494100000002,START in the logger
-                if value.startswith('START'):
-                    try:
-                        ref_frame = int(frame)
-                        ref_timestamp = float(timestamp)
-                        timing_map['START'] = {
-                            'start_frame': ref_frame,
-                            'start_timestamp': ref_timestamp
-                        }
-                        logging.info("Found START marker at frame %d, timestamp %f" % (ref_frame, ref_timestamp))
-                    except Exception as e:
-                        logging.warning("Invalid START marker values: %s" % e)
-
-                if value.startswith('END'):
-                    try:
-                        ref_frame = int(frame)
-                        ref_timestamp = float(timestamp)
-                        timing_map['END'] = {
-                            'start_frame': ref_frame,
-                            'start_timestamp': ref_timestamp,
-                        }
-                        logging.info("Found END marker at frame %d, timestamp %f" % (ref_frame, ref_timestamp))
-                    except Exception as e:
-                        logging.warning("Invalid END marker values: %s" % e)
-
-                # Stimulus start/end markers
-                if value.startswith('StimStart-'):
-                    stim_id = value.replace('StimStart-', '')
-                    timing_map[stim_id] = {
-                        'start_frame': int(frame),
-                        'start_timestamp': float(timestamp)
-                    }
-                elif value.startswith('StimEnd-'):
-                    stim_id = value.replace('StimEnd-', '')
-                    if stim_id in timing_map:
-                        # Bonsai log StimEnd when the frame AFTER the stimulus ends
-                        if int(frame)-1 in timing_map['Frames']:
-                            timing_map[stim_id]['end_frame'] = int(frame)-1
-                            timing_map[stim_id]['end_timestamp'] = timing_map['Frames'][int(frame)-1]
-                        else:
-                            # If something went wrong during logging, fall back to using the current frame and timestamp
-                            timing_map[stim_id]['end_frame'] = int(frame)
-                            timing_map[stim_id]['end_timestamp'] = float(timestamp)
-                            
-                    # if we are closing a movie block, we at end_frame and end_timestamp to the last frame
-                    # Python 2.7: no max(..., default=...), so guard explicitly
-                    if stim_id in timing_map and 'movie' in timing_map[stim_id]:
-                        movie_dict = timing_map[stim_id]['movie']
-                        if movie_dict:
-                            last_frame = max(movie_dict.keys())
-                            if last_frame in movie_dict:
-                                movie_dict[last_frame]['end_frame'] = int(frame)
-                                movie_dict[last_frame]['end_timestamp'] = float(timestamp)    
-                # Movie frame markers: MovieFrame-<number>
-                elif value.startswith('MovieFrame-'):
-                    # Each movie frame is its own timing entry; treat as single-frame duration
-                    fr_int = int(frame)
-                    ts_float = float(timestamp)
-
-                    # We convert value into frame number as int
-                    local_frame_index = int(value.replace('MovieFrame-', ''))
-                    # Ensure we have an active stim_id and a movie dict
-                    if stim_id not in timing_map:
-                        # If a MovieFrame appears before StimStart, skip to avoid KeyError
-                        continue
-                    if 'movie' not in timing_map[stim_id] or timing_map[stim_id]['movie'] is None:
-                        timing_map[stim_id]['movie'] = {}
-                    timing_map[stim_id]['movie'][local_frame_index] = {
-                        'start_frame': fr_int,
-                        'start_timestamp': ts_float,
-                    }
-                    # We fill in end_frame and end_timestamp in local_frame_index - 1 if it exists
-                    if local_frame_index - 1 in timing_map[stim_id]['movie'] and fr_int-1 in timing_map['Frames']:
-                        timing_map[stim_id]['movie'][local_frame_index - 1]['end_frame'] = fr_int-1
-                        timing_map[stim_id]['movie'][local_frame_index - 1]['end_timestamp'] = timing_map['Frames'][fr_int-1]
-
-        except Exception as e:
-            logging.warning("Could not create timing map from logger: %s" % e)
-            
-        return timing_map
+        return bonsai_logger.TimingMapBuilder.from_index(logger_index)
 
     def _group_by_block_label(self, orientations_data):
         """
@@ -1018,6 +1231,50 @@ class BonsaiExperiment(object):
         
         return grouped
 
+    def _typed_param_column(self, values):
+        """
+        Convert one parameter column of a block from CSV strings to typed values.
+        
+        Each value follows the CAMSTIM typing rule: None for empty values, float
+        if it contains '.', int otherwise, and the original string if that
+        conversion fails. The rule is applied once per column: columns that are
+        all-int or all-float are cast in one pass, and other columns (empty
+        values, or e.g. Phase='wheel' next to numeric phases) are typed once per
+        distinct value.
+        
+        Args:
+            values (list): Column values, one per row
+            
+        Returns:
+            list: Typed values
+        """
+        if None not in values and '' not in values:
+            try:
+                n_dots = ''.join(values).count('.')
+                if n_dots == 0:
+                    return list(map(int, values))
+                if n_dots == len(values):
+                    # A float string holds at most one '.', so every value holds exactly one
+                    return list(map(float, values))
+            except (TypeError, ValueError):
+                pass
+        
+        def typed_value(value):
+            if value in (None, ''):
+                return None
+            try:
+                if '.' in str(value):
+                    return float(value)
+                return int(value)
+            except Exception:
+                return value
+        
+        try:
+            lookup = dict((value, typed_value(value)) for value in set(values))
+        except TypeError:
+            return [typed_value(value) for value in values]
+        return [lookup[value] for value in values]
+
     def _create_stimulus_object_from_block(self, block_data, block_type, timing_map):
         """
         Create a CAMSTIM-compatible stimulus object from a block of presentations.
@@ -1025,7 +1282,7 @@ class BonsaiExperiment(object):
         Args:
             block_data (list): List of presentation dictionaries in this block
             block_type (str): Type of the block (e.g., 'motor_oddball')
-            timing_map (dict): Mapping from stimulus IDs to timing info
+            timing_map (TimingMap): Mapping from stimulus IDs to timing info
             
         Returns:
             dict: CAMSTIM-compatible stimulus object
@@ -1046,146 +1303,104 @@ class BonsaiExperiment(object):
                     dimnames.append(col)
 
         # We first extract the global reference frame and timestamp from timing_map 
-        if 'START' in timing_map:
-            ref_frame = timing_map['START'].get('start_frame')
-            ref_timestamp = timing_map['START'].get('start_timestamp')
+        if timing_map.start is not None:
+            ref_frame, ref_timestamp = timing_map.start
             logging.info("Using START marker as reference: frame %d, timestamp %f" % (ref_frame, ref_timestamp))
         else:   
             logging.warning("No START marker found in timing map")
             ref_frame = 0
             ref_timestamp = 0.0
 
-        # Movie block handling using new timing_map structure: timing_map[stim_id]['movie'][frame_idx]
+        # Movie block handling using the per-movie-frame arrays: timing_map.movie(stim_id)
         if block_data and block_data[0].get('BlockType') == 'movie':
             # Guarantee TrialInSequence present
             if 'TrialInSequence' not in dimnames:
                 dimnames.append('TrialInSequence')
-            sweep_frames = []
-            sweep_table = []
-            sweep_order = []
-            # For each movie stimulus row (could be multiple movies in a block)
-            global_frame_entries = []  # collect timestamps for display_sequence
-            trial_index_pos = dimnames.index('TrialInSequence')
-            order_counter = 0
-            
-            for row in block_data:
-                stim_id = row.get('Id', '')
-                timing_info = timing_map.get(stim_id, {})
-                movie_dict = timing_info.get('movie', {}) if isinstance(timing_info, dict) else {}
-                
-                # Build base parameter values for this row (excluding TrialInSequence which we'll overwrite)
-                base_params = []
-                for dn in dimnames:
-                    if dn == 'TrialInSequence':
-                        base_params.append(None)  # placeholder
-                        continue
-                    val = row.get(dn)
-                    if val in (None, ''):
-                        base_params.append(None)
-                    else:
-                        try:
-                            if '.' in str(val):
-                                base_params.append(float(val))
-                            else:
-                                base_params.append(int(val))
-                        except Exception:
-                            base_params.append(val)
-                # Expand frames
-                frame_items = sorted(movie_dict.items(), key=lambda kv: kv[0])  # (frame_idx, info)
-                for frame_idx, finfo in frame_items:
-                    start_frame = finfo.get('start_frame')-ref_frame
-                    end_frame = finfo.get('end_frame', finfo.get('start_frame'))-ref_frame
-                    sweep_frames.append((start_frame, end_frame))
-                    params = list(base_params)
-                    params[trial_index_pos] = frame_idx
-                    sweep_table.append(tuple(params))
-                    sweep_order.append(order_counter)
-                    order_counter += 1
-                    st_ts = finfo.get('start_timestamp')-ref_timestamp
-                    en_ts = finfo.get('end_timestamp', finfo.get('start_timestamp'))-ref_timestamp
-                    if st_ts is not None:
-                        global_frame_entries.append(('start', st_ts))
-                    if en_ts is not None:
-                        global_frame_entries.append(('end', en_ts))
-            # Compute display_sequence over all frames in block
-            if global_frame_entries:
-                start_times = [ts for kind, ts in global_frame_entries if kind == 'start']
-                end_times = [ts for kind, ts in global_frame_entries if kind == 'end']
-                if start_times and end_times:
-                    ds = min(start_times)
-                    de = max(end_times)
-                    display_sequence = np.array([[ds, de]]) if np is not None else [[ds, de]]
+            
+            # Per-frame timing arrays of every movie presentation (row) of the block,
+            # in row order; a movie frame without end falls back to its start
+            movie_rows = []
+            movies = []
+            for row_pos, row in enumerate(block_data):
+                movie = timing_map.movie(row.get('Id', ''))
+                if movie is not None:
+                    movie_rows.append(row_pos)
+                    movies.append(movie)
+            counts = [len(movie) for movie in movies]
+            n_frames = sum(counts)
+            
+            def movie_column(name):
+                if not movies:
+                    return np.zeros(0, dtype=np.float64)
+                return np.concatenate([getattr(movie, name) for movie in movies])
+            
+            local_index = movie_column('index')
+            start_frames = movie_column('start_frame')
+            start_timestamps = movie_column('start_timestamp')
+            has_end = movie_column('end_frame') >= 0
+            end_frames = np.where(has_end, movie_column('end_frame'), start_frames)
+            end_timestamps = np.where(has_end, movie_column('end_timestamp'), start_timestamps)
+            
+            sweep_frames = list(zip((start_frames - ref_frame).tolist(), (end_frames - ref_frame).tolist()))
+            sweep_order = list(range(n_frames))
+            
+            # Row parameters repeated for each of its movie frames, TrialInSequence set to the movie frame
+            columns = []
+            for dn in dimnames:
+                if dn == 'TrialInSequence':
+                    columns.append(local_index.tolist())
                 else:
-                    display_sequence = np.array([[None, None]]) if np is not None else [[None, None]]
+                    column = self._typed_param_column([row.get(dn) for row in block_data])
+                    repeated = []
+                    for row_pos, count in zip(movie_rows, counts):
+                        repeated.extend([column[row_pos]] * count)
+                    columns.append(repeated)
+            sweep_table = list(zip(*columns))
+            
+            # Compute display_sequence over all frames in block
+            if n_frames:
+                ds = (start_timestamps - ref_timestamp).min()
+                de = (end_timestamps - ref_timestamp).max()
+                display_sequence = np.array([[ds, de]])
             else:
-                display_sequence = np.array([[None, None]]) if np is not None else [[None, None]]
+                display_sequence = np.array([[None, None]])
         else:
             # Standard (non-movie) path
             sweep_frames = []
             sweep_table = []
             sweep_order = []
-            for idx, row in enumerate(block_data):
-                stim_id = row.get('Id', '')
-                timing_info = timing_map.get(stim_id)
-                if timing_info:
-                    start_frame = timing_info.get('start_frame')-ref_frame
-                    end_frame = timing_info.get('end_frame')-ref_frame
-                    if start_frame is not None and end_frame is not None:
-                        sweep_frames.append((start_frame, end_frame))
-                    else:
-                        sweep_frames.append((None, None))
+            positions = timing_map.stim_positions([row.get('Id', '') for row in block_data])
+            found = positions >= 0
+            found_positions = positions[found]
+            if np.any(timing_map.stim_end_frame[found_positions] < 0):
+                raise ValueError("StimEnd marker missing for a stimulus of block %s" % block_type)
+            start_frames = np.zeros(len(positions), dtype=np.int64)
+            end_frames = np.zeros(len(positions), dtype=np.int64)
+            start_frames[found] = timing_map.stim_start_frame[found_positions]
+            end_frames[found] = timing_map.stim_end_frame[found_positions]
+            start_frames = start_frames.tolist()
+            end_frames = end_frames.tolist()
+            for idx in range(len(block_data)):
+                if found[idx]:
+                    sweep_frames.append((start_frames[idx]-ref_frame, end_frames[idx]-ref_frame))
                 else:
                     sweep_frames.append((None, None))
-                # Parameter tuple
-                param_values = []
-                for dimname in dimnames:
-                    value = row.get(dimname)
-                    if value in (None, ''):
-                        param_values.append(None)
-                    else:
-                        try:
-                            if '.' in str(value):
-                                param_values.append(float(value))
-                            else:
-                                param_values.append(int(value))
-                        except Exception:
-                            param_values.append(value)
-                sweep_table.append(tuple(param_values))
-                sweep_order.append(idx)
+            # Parameter tuples, typed one column at a time
+            columns = [self._typed_param_column([row.get(dimname) for row in block_data])
+                       for dimname in dimnames]
+            sweep_table = list(zip(*columns)) if columns else [()] * len(block_data)
+            sweep_order = list(range(len(block_data)))
             # Build display_sequence for standard path
             if sweep_frames:
-                start_ts_list = []
-                end_ts_list = []
-                for row in block_data:
-                    tinfo2 = timing_map.get(row.get('Id', ''))
-                    if not tinfo2:
-                        continue
-                    st2 = tinfo2.get('start_timestamp')-ref_timestamp
-                    et2 = tinfo2.get('end_timestamp')-ref_timestamp
-                    if st2 is not None:
-                        start_ts_list.append(st2)
-                    if et2 is not None:
-                        end_ts_list.append(et2)
-                if start_ts_list and end_ts_list:
-                    ds = min(start_ts_list)
-                    de = max(end_ts_list)
+                if len(found_positions):
+                    ds = timing_map.stim_start_timestamp[found_positions].min()-ref_timestamp
+                    de = timing_map.stim_end_timestamp[found_positions].max()-ref_timestamp
                     display_sequence = np.array([[ds, de]])
                 else:
                     display_sequence = np.array([[None, None]]) 
             else:
                 display_sequence = np.array([[None, None]])
         
-        # sweep_frames already ensured tuples above; if any lists slipped through convert defensively
-        sweep_frames_tuples = []
-        for frame_pair in sweep_frames:
-            if isinstance(frame_pair, list):
-                if len(frame_pair) >= 2:
-                    sweep_frames_tuples.append((frame_pair[0], frame_pair[1]))
-                else:
-                    sweep_frames_tuples.append((None, None))
-            else:
-                sweep_frames_tuples.append(frame_pair)
-        
         # Get the Block label for stim_path. We take the first one as representative.
         # This is what is used to label the stimulus in CAMSTIM.
         block_label = block_data[0].get('BlockLabel', 'unknown_block')
@@ -1195,7 +1410,7 @@ class BonsaiExperiment(object):
         stimulus_obj = {
             'stim_path': block_label,
             'stim': block_type,
-            'sweep_frames': sweep_frames_tuples,
+            'sweep_frames': sweep_frames,
             'sweep_order': sweep_order,
             'display_sequence': display_sequence,
             'dimnames': dimnames,
@@ -1224,7 +1439,7 @@ class BonsaiExperiment(object):
 
         return stimulus_obj
 
-    def _load_and_process_bonsai_data(self):
+    def _load_and_process_bonsai_data(self, csv_files=None, logger_index=None, timing_map=None):
         """
         Load and process Bonsai CSV data, returning both processed stimuli and raw data.
         
@@ -1232,6 +1447,11 @@ class BonsaiExperiment(object):
         1. Processed stimulus objects compatible with CAMSTIM
         2. Raw CSV data for traceability
         
+        Args:
+            csv_files (tuple, optional): Result of _find_bonsai_csv_files, searched if not provided
+            logger_index (LoggerIndex, optional): Pre-built logger index, built if not provided
+            timing_map (TimingMap, optional): Timing map built while tailing the logger, created if not provided
+        
         Returns:
             tuple: (stimuli_data, raw_data) where:
                 - stimuli_data is a list of stimulus objects
@@ -1246,23 +1466,26 @@ class BonsaiExperiment(object):
         }
         
         # Find CSV files (shared by both processing paths)
-        orientations_file, logger_file, all_csv_files = self._find_bonsai_csv_files()
+        if csv_files is None:
+            csv_files = self._find_bonsai_csv_files()
+        orientations_file, logger_file, all_csv_files = csv_files
         
         if not orientations_file or not logger_file:
             logging.warning("Could not find required Bonsai CSV files")
             return stimuli_data, raw_data
         
         # Load CSV data (shared by both processing paths)
-        orientations_data, logger_data = self._load_bonsai_csv_data(orientations_file, logger_file)
-        
-        if orientations_data is None or logger_data is None:
-            logging.error("Failed to load CSV data")
-            return stimuli_data, raw_data
+        logging.info("Loading stimulus data from %s" % orientations_file)
+        orientations_data, orientations_fields = self._read_csv_rows(orientations_file)
+        if logger_index is None:
+            logger_index = self._build_logger_index(logger_file)
         
         # Process for stimulus objects (CAMSTIM compatibility)
         try:
             # Create timing map from logger data
-            timing_map = self._create_timing_map(logger_data)
+            if timing_map is None:
+                timing_map = self._create_timing_map(logger_index)
+            self.timing_map = timing_map
             
             # Group presentations by block type to create stimulus objects
             grouped_data = self._group_by_block_label(orientations_data)
@@ -1281,9 +1504,10 @@ class BonsaiExperiment(object):
             logging.error("Error processing Bonsai CSV files for stimulus objects: %s" % e)
             logging.error("No fallback stimulus structure will be created. Returning empty stimuli list.")
         
-        # Prepare raw data for traceability
-        raw_data['orientations'] = orientations_data
-        raw_data['logger'] = logger_data
+        # Prepare raw data for traceability, stored as compact columnar tables
+        # (use bonsai_tables.expand_bonsai_raw_data to get the legacy lists of rows back)
+        raw_data['orientations'] = bonsai_tables.table_from_rows(orientations_data, orientations_fields or None)
+        raw_data['logger'] = logger_index.to_table()
         raw_data['files_found'] = all_csv_files
         
         # Add metadata about the raw data
@@ -1294,62 +1518,33 @@ class BonsaiExperiment(object):
         }
         
         logging.info("Unified Bonsai data loading complete: %d stimulus blocks, %d orientation rows, %d logger rows from %d files" % (
-            len(stimuli_data), len(raw_data['orientations']), len(raw_data['logger']), len(raw_data['files_found'])
+            len(stimuli_data), len(orientations_data), len(logger_index), len(raw_data['files_found'])
         ))
         
         return stimuli_data, raw_data
     
-    def _get_total_frames_from_logger(self):
+    def _get_total_frames_from_logger(self, logger_index=None):
         """
-        Get the total number of frames by reading the last frame from the logger CSV file.
+        Get the total number of frames from the highest frame number in the logger.
+        
+        Args:
+            logger_index (LoggerIndex, optional): Pre-built logger index, built if not provided
         
         Returns:
             int: Total number of frames in the experiment
         """
-        # Look for logger file in the session folder
-        logger_file = None
+        if logger_index is None:
+            logger_index = self._build_logger_index()
         
-        if self.session_folder:
-            output_dir = self.session_folder
-        else:
-            output_dir = os.getcwd()
-        
-        # Search for the logger CSV file in the session folder
-        for root, dirs, files in os.walk(output_dir):
-            for file in files:
-                if file.startswith('orientations_logger') and file.endswith('.csv'):
-                    logger_file = os.path.join(root, file)
-                    break
-            if logger_file:
-                break
-        
-        if not logger_file:
+        if logger_index is None:
             logging.warning("Could not find logger file to determine total_frames")
             return 0
         
-        try:
-            # Read the logger CSV file
-            logger_data = self._read_csv_file(logger_file)
-            
-            # Find the highest frame number in the logger data
-            max_frame = 0
-            for row in logger_data:
-                try:
-                    frame = int(row.get('Frame', '0'))
-                    if frame > max_frame:
-                        max_frame = frame
-                except ValueError:
-                    continue
-                    
-            logging.info("Total frames from logger: %d" % max_frame)
-            return max_frame
-            
-        except Exception as e:
-            logging.warning("Could not read logger file to determine total_frames: %s" % e)
-            return 0
+        logging.info("Total frames from logger: %d" % logger_index.max_frame)
+        return logger_index.max_frame
 
-    def _reconstruct_encoder_from_logger(self, logger_rows, total_frames):
-        """Reconstruct CAMSTIM-style encoder data from Bonsai logger rows.
+    def _reconstruct_encoder_from_logger(self, logger_index, total_frames):
+        """Reconstruct CAMSTIM-style encoder data from the Bonsai logger index.
 
         Wheel event format example Value field:
             'Wheel-Index-42793322-Count-4785-Deg-210.2783203125'
@@ -1357,109 +1552,100 @@ class BonsaiExperiment(object):
         We parse per-frame events, derive per-frame dtheta (dx) using logic similar
         to DigitalBehaviorEncoder, propagate last values for frames without events,
         and compute derived vsig and optional distance.
-        """
-        wheel_pattern = re.compile(
-            r'^Wheel-Index-(\d+)-Count-(-?\d+)-Deg-([-+\d\.eE]+)$'
-        )
-        start_time_pattern = re.compile(r'^START$')
-        end_time_pattern = re.compile(r'^END$')
 
-        events_by_frame = {}
-        max_frame = 0
+        All steps are vectorized: wheel values are parsed once when the logger is
+        indexed (see bonsai_logger.parse_wheel_values), and per-frame propagation uses index
+        arithmetic (forward-fill of the last event) and cumulative sums.
+        """
         global_ref_timestamps = 0 
-
-        for row in logger_rows:
-            try:
-                frame = int(row.get('Frame', '0'))
-                if frame > max_frame:
-                    max_frame = frame
-                val = row.get('Value', '')
-                m = wheel_pattern.match(val)
-                if m:
-                    idx = int(m.group(1))
-                    count = int(m.group(2))
-                    deg = float(m.group(3))
-                    events_by_frame[frame] = {'index': idx, 'count': count, 'deg': deg}
-                elif start_time_pattern.match(val):
-                    # We save the start frame to align timestamps later 
-                    global_ref_timestamps = float(row.get('Timestamp'))
-                    logging.info("Found START marker at frame %d for encoder reconstruction, timestamp %s" % (frame, global_ref_timestamps))
-                elif end_time_pattern.match(val):
-                    logging.info("Found END marker at frame %d for encoder reconstruction" % frame) 
-                    end_session = float(row.get('Timestamp'))
-
-            except Exception:
-                logging.warning("Error parsing logger row for encoder reconstruction: %s" % row)
-                continue
-
+        end_session = None
+
+        start_marker = logger_index.marker('START')
+        if start_marker:
+            # We save the start frame to align timestamps later 
+            global_ref_timestamps = start_marker[1]
+            logging.info("Found START marker at frame %d for encoder reconstruction, timestamp %s" % start_marker)
+        end_marker = logger_index.marker('END')
+        if end_marker:
+            logging.info("Found END marker at frame %d for encoder reconstruction" % end_marker[0])
+            end_session = end_marker[1]
 
         # Determine number of frames to allocate
-        n_frames = int(max_frame) + 1
+        n_frames = int(logger_index.max_frame) + 1
         if total_frames and total_frames > n_frames:
             n_frames = int(total_frames)
 
+        # Parse wheel events; the last event logged on a frame wins
+        ev_frames = logger_index.frames[logger_index.wheel_rows]
+        ev_index = logger_index.wheel_index
+        ev_count = logger_index.wheel_count
+        ev_deg = logger_index.wheel_deg
+        if len(ev_frames):
+            last = len(ev_frames) - 1 - np.unique(ev_frames[::-1], return_index=True)[1]
+            ev_frames = ev_frames[last]
+            ev_index = ev_index[last]
+            ev_count = ev_count[last]
+            ev_deg = ev_deg[last]
+        n_events = len(ev_frames)
+
+        # dtheta per event: 0 for the first event, slope between consecutive events
+        # otherwise, and the previous dtheta reused when the encoder index did not advance
+        ev_dtheta = np.zeros(n_events, dtype=np.float64)
+        if n_events > 1:
+            d_index = np.diff(ev_index)
+            advanced = d_index != 0
+            slopes = np.zeros(n_events - 1, dtype=np.float64)
+            slopes[advanced] = np.diff(ev_deg)[advanced] / d_index[advanced]
+            defined = np.concatenate(([True], advanced))
+            source = np.maximum.accumulate(np.where(defined, np.arange(n_events), 0))
+            ev_dtheta = np.concatenate(([0.0], slopes))[source]
+
+        # Index of the last event at or before every frame (-1 before the first event)
+        last_event = np.full(n_frames, -1, dtype=np.int64)
+        last_event[ev_frames] = np.arange(n_events)
+        last_event = np.maximum.accumulate(last_event)
+        has_event = last_event >= 0
+        safe_event = np.where(has_event, last_event, 0)
+
         dx = np.zeros(n_frames, dtype=np.float32)
-        degrees = np.zeros(n_frames, dtype=np.float64)
         counts = np.zeros(n_frames, dtype=np.float32)
-        timestamps = np.zeros(n_frames, dtype=np.float32)
-
-        last_deg = None
-        last_index = None
-        last_dtheta = 0.0
-
-        # For timestamps, build map first
-        frame_time = {}
-        for row in logger_rows:
-            try:
-                f = int(row.get('Frame', '0'))
-                if f not in frame_time:
-                    frame_time[f] = float(row.get('Timestamp', '0'))
-            except Exception:
-                pass
-
-        for f in range(n_frames):
-            evt = events_by_frame.get(f)
-            if evt:
-                idx = evt['index']
-                deg = evt['deg']
-                if last_deg is None or last_index is None:
-                    dtheta = 0.0
-                else:
-                    if idx == last_index:
-                        dtheta = last_dtheta  # reuse
-                    else:
-                        try:
-                            dtheta = (deg - last_deg) / (idx - last_index)
-                        except ZeroDivisionError:
-                            dtheta = 0.0
-                last_dtheta = dtheta
-                last_deg = deg
-                last_index = idx
-                degrees[f] = deg
-                dx[f] = dtheta
-                counts[f] = evt['count']
-            else:
-                # propagate degree by integrating last_dtheta
-                if f > 0:
-                    degrees[f] = degrees[f-1] + last_dtheta
-                    counts[f] = counts[f-1]
-                else:
-                    degrees[f] = 0.0
-                    counts[f] = 0.0
-                dx[f] = last_dtheta
-            # previous frame timestamp or we substract the last known deltatime
-            timestamps[f] = frame_time.get(f, timestamps[f-1] if f > 0 else timestamps[f]-0.016)
+        if n_events:
+            dx[has_event] = ev_dtheta[safe_event[has_event]]
+            counts[has_event] = ev_count[safe_event[has_event]]
 
-        # If some degrees slots remain zero but we had last_deg set, retroactively fill preceding frames
-        # (Not strictly necessary; we already integrate above.)
+        # Degrees are set on event frames and integrated with the last dtheta in
+        # between. Gaps of equal length are integrated together with a row-wise
+        # cumulative sum so the result matches frame-by-frame accumulation exactly.
+        degrees = np.zeros(n_frames, dtype=np.float64)
+        degrees[ev_frames] = ev_deg
+        gap_lengths = np.diff(np.append(ev_frames, n_frames)) - 1
+        for gap in np.unique(gap_lengths[gap_lengths > 0]).tolist():
+            sel = np.nonzero(gap_lengths == gap)[0]
+            steps = np.empty((len(sel), gap + 1), dtype=np.float64)
+            steps[:, 0] = ev_deg[sel]
+            steps[:, 1:] = ev_dtheta[sel][:, None]
+            degrees[ev_frames[sel][:, None] + np.arange(1, gap + 1)] = np.cumsum(steps, axis=1)[:, 1:]
+
+        # Timestamps: first logged timestamp of each frame, forward-filled from the
+        # previous frame when a frame has no row (frame 0 falls back to -16 ms)
+        valid = (logger_index.frames >= 0) & ~np.isnan(logger_index.timestamps)
+        frame_numbers, first_row = np.unique(logger_index.frames[valid], return_index=True)
+        frame_time = np.zeros(n_frames, dtype=np.float64)
+        known = np.zeros(n_frames, dtype=bool)
+        frame_time[frame_numbers] = logger_index.timestamps[valid][first_row]
+        known[frame_numbers] = True
+        if n_frames and not known[0]:
+            frame_time[0] = -0.016
+            known[0] = True
+        source = np.maximum.accumulate(np.where(known, np.arange(n_frames), 0))
+        timestamps = frame_time[source].astype(np.float32)
 
         # Compute vsig & vin
         vsig = (degrees % 360.0) * (5.0 / 360.0)
         vin = np.full(n_frames, 5.0, dtype=np.float32)
 
         # Distance if radius available
-        radius = self.config.get('digital_encoder', {}).get('radius_cm') \
-            or self.config.get('encoder', {}).get('radius_cm')
+        radius = self.get_wheel_radius()
         if radius is not None:
             try:
                 radius = float(radius)
@@ -1511,15 +1697,28 @@ class BonsaiExperiment(object):
         self.stop_time = datetime.datetime.now()
         dt_str = self.start_time.strftime('%y%m%d%H%M%S')
         
+        # Locate the Bonsai CSV files and index the logger once; every consumer below
+        # reads from this single-pass index instead of re-walking and re-parsing the logger
+        csv_files = self._find_bonsai_csv_files()
+        with self.profile.phase('index_logger'):
+            logger_index, timing_map = self._finish_logger_tailer(csv_files[1])
+            if logger_index is None:
+                logger_index = bonsai_logger.LoggerIndex()
+                if csv_files[1]:
+                    logger_index = self._build_logger_index(csv_files[1])
+        
         # Load and process Bonsai-generated CSV data (both processed and raw)
-        stimuli_data, bonsai_raw_data = self._load_and_process_bonsai_data()
+        with self.profile.phase('load_and_process_bonsai_data'):
+            stimuli_data, bonsai_raw_data = self._load_and_process_bonsai_data(csv_files, logger_index, timing_map)
         
         # Calculate total_frames from logger.csv data (last frame in the experiment)
-        total_frames = self._get_total_frames_from_logger()
+        total_frames = self._get_total_frames_from_logger(logger_index)
 
         # Reconstruct encoder data from logger rows (must come before building output_data)
+        encoder_data = []
         try:
-            encoder_data = self._reconstruct_encoder_from_logger(bonsai_raw_data.get('logger', []), total_frames)
+            with self.profile.phase('reconstruct_encoder'):
+                encoder_data = self._reconstruct_encoder_from_logger(logger_index, total_frames)
         except Exception as e:
             logging.exception("Encoder reconstruction failed: %s" % e)
         
@@ -1540,7 +1739,7 @@ class BonsaiExperiment(object):
         
         # Create structure matching CAMSTIM's output format
         # Include additional fields found in reference CAMSTIM files
-        intervalsms = self._calculate_intervalsms()
+        intervalsms = self._calculate_intervalsms(logger_index)
 
         output_data = {
             # Core fields present in original CAMSTIM session dictionaries
@@ -1576,7 +1775,13 @@ class BonsaiExperiment(object):
             'startdatetime': self.start_time if self.start_time else None,
             
             # Bonsai raw data - store original CSV data for complete traceability
-            'bonsai': bonsai_raw_data
+            'bonsai': bonsai_raw_data,
+            
+            # RSS/CPU/thread/handle time series of the Bonsai process tree
+            'bonsai_telemetry': self.bonsai_telemetry,
+            
+            # md5 of the parameter file, workflow, its input files and the stimulus table
+            'input_checksums': self.get_input_checksums()
         }
         
         # Use the session output path that was set up earlier
@@ -1585,7 +1790,10 @@ class BonsaiExperiment(object):
         # Save output data as pickle file
         try:
             # Process through wecanpicklethat to filter out unpickleable items
-            pickled_data = self.wecanpicklethat(output_data)
+            with self.profile.phase('wecanpicklethat'):
+                pickled_data = self.wecanpicklethat(output_data)
+            # Phases up to the pickle write; the sidecar JSON gets the rest
+            pickled_data['launcher_profile'] = self.profile.to_dict()
             
             # Create output directory if needed
             output_dir = os.path.dirname(output_path)
@@ -1599,70 +1807,180 @@ class BonsaiExperiment(object):
                 output_path = os.path.join(dirname, dt_str + "-" + filename)
                 logging.warning("File path already exists, saving to: %s" % output_path)
                 
-            with open(output_path, 'wb') as f:
-                pickle.dump(pickled_data, f)
+            # Written once with a binary protocol; report size and time per top-level key
+            with self.profile.phase('pickle_write'):
+                with open(output_path, 'wb') as f:
+                    self.pkl_report = session_pickle.dump_session(pickled_data, f)
+            session_pickle.log_report(self.pkl_report)
                 
             logging.info("Experiment data saved to: %s" % output_path)
             self.output_path = output_path
             
-            # After saving, check if we need to create a backup copy
-            backupdir = self.config.get('SweepStim', {}).get('backupdir')
-            mouseid = self.mouse_id if self.mouse_id else "test_mouse"
+            # Typed arrays for analysis tools that should not unpickle the whole session
+            if self.params.get('write_session_arrays', True):
+                with self.profile.phase('session_arrays'):
+                    self._write_session_arrays(output_path, output_data)
             
-            if backupdir:
-                try:
-                    # Create backup directory if it doesn't exist
-                    mouse_dir = os.path.join(backupdir, mouseid + "/output")
-                    if not os.path.isdir(mouse_dir):
-                        os.makedirs(mouse_dir)
-                    
-                    # Create backup file in the mouse's output directory
-                    backup_path = os.path.join(mouse_dir, os.path.basename(output_path))
-                    logging.info("Backing up pkl file at %s" % backup_path)
-                    
-                    # Copy the file
-                    shutil.copy2(output_path, backup_path)
-                    logging.info("Backup complete!")
-                except Exception as e:
-                    logging.warning("Failed to create backup: %s" % e)
+            if self.params.get('write_launcher_profile', True):
+                self.profile_path = sidecar_path(output_path)
+                self.write_launcher_profile()
             
-            # Also save to custom output path if specified (compatibility with behavior experiments)
-            if self.custom_output_path:
-                try:
-                    # Create custom output directory if needed
-                    custom_output_dir = os.path.dirname(self.custom_output_path)
-                    if not os.path.isdir(custom_output_dir):
-                        os.makedirs(custom_output_dir)
-                    
-                    # Copy the file to the custom output path
-                    shutil.copy2(output_path, self.custom_output_path)
-                    logging.info("Custom output saved to: %s" % self.custom_output_path)
-                except Exception as e:
-                    logging.exception("Failed to save to custom output path: %s" % e)
+            # Backup copies are verified and made in the background (see backup_queue)
+            try:
+                self._start_backups(output_path, csv_files[2])
+            except Exception as e:
+                logging.exception("Failed to queue backups: %s" % e)
             
         except Exception as e:
             logging.error("Failed to save experiment data: %s" % e)
     
+    def _write_session_arrays(self, output_path, output_data):
+        """
+        Write the compressed columnar companion file of the pkl (see session_arrays).
+        
+        Args:
+            output_path (str): The pkl written by save_output
+            output_data (dict): The session dictionary that was pickled
+        """
+        arrays_path = session_arrays.companion_path(output_path)
+        try:
+            start = time.time()
+            session_arrays.write_session_arrays(
+                arrays_path,
+                bonsai_raw_data=output_data.get('bonsai'),
+                timing_map=self.timing_map,
+                encoders=output_data['items']['foraging']['encoders'],
+                stimuli=output_data.get('stimuli'),
+                attrs={'pkl': os.path.basename(output_path), 'mouse_id': self.mouse_id,
+                       'session_uuid': self.session_uuid, 'start_time': output_data.get('start_time')},
+                chunk_rows=self.params.get('session_arrays_chunk_rows', session_arrays.CHUNK_ROWS))
+            self.arrays_path = arrays_path
+            logging.info("Session arrays saved to: %s (%.1f KB in %.2f s)" % (
+                arrays_path, os.path.getsize(arrays_path) / 1024.0, time.time() - start))
+        except Exception as e:
+            logging.exception("Failed to write session arrays %s: %s" % (arrays_path, e))
+    
+    def _start_backups(self, output_path, csv_files=()):
+        """
+        Queue verified copies of the session outputs and start copying them in the background.
+        
+        - The pkl goes to <SweepStim backupdir>/<mouse_id>/output/, as camstim does, and
+          to the custom output path (-o). Its .npz companion goes next to the pkl backup.
+        - With 'backup_bonsai_csvs' the Bonsai CSVs go next to the pkl backup, in a
+          folder named after the session folder.
+        - With 'session_backup_dir' the whole session folder is copied there. The
+          launcher profile sidecar is left out here and copied by wait_for_backups
+          once its final timings are written.
+        
+        The queue is kept in backup_queue.json in the session folder, so copies that
+        have not finished when the launcher exits can be completed with
+        "python backup_queue.py <session folder>".
+        
+        Args:
+            output_path (str): The pkl written by save_output
+            csv_files (list): Bonsai CSV files of the session
+        """
+        folder = self.session_folder or os.path.dirname(output_path)
+        queue = backup_queue.BackupQueue(os.path.join(folder, backup_queue.QUEUE_NAME))
+        
+        backupdir = self.config.get('SweepStim', {}).get('backupdir')
+        mouseid = self.mouse_id if self.mouse_id else "test_mouse"
+        if backupdir:
+            mouse_dir = os.path.join(backupdir, mouseid + "/output")
+            backup_path = os.path.join(mouse_dir, os.path.basename(output_path))
+            logging.info("Backing up pkl file at %s" % backup_path)
+            queue.add(output_path, backup_path)
+            if self.arrays_path and os.path.isfile(self.arrays_path):
+                queue.add(self.arrays_path, os.path.join(mouse_dir, os.path.basename(self.arrays_path)))
+            if self.params.get('backup_bonsai_csvs', False):
+                for path in csv_files:
+                    queue.add(path, os.path.join(mouse_dir, os.path.basename(folder), os.path.basename(path)))
+        
+        # Also save to custom output path if specified (compatibility with behavior experiments)
+        if self.custom_output_path:
+            queue.add(output_path, self.custom_output_path)
+        
+        session_backup_dir = self.params.get('session_backup_dir')
+        if session_backup_dir and self.session_folder:
+            session_backup = os.path.join(session_backup_dir, os.path.basename(self.session_folder))
+            exclude = [self.profile_path] if self.profile_path else []
+            queue.add_folder(self.session_folder, session_backup, exclude=exclude)
+            if self.profile_path and os.path.isfile(self.profile_path):
+                self._profile_backup_path = os.path.join(
+                    session_backup, os.path.relpath(self.profile_path, self.session_folder))
+        
+        if not queue.pending():
+            return
+        self._backup_worker = backup_queue.BackupWorker(queue,
+                                                        max_attempts=self.params.get('backup_max_attempts', 5),
+                                                        retry_delay=self.params.get('backup_retry_delay', 2.0))
+        self._backups_phase = self.profile.begin('backups')
+        self._backup_worker.start()
+    
+    def wait_for_backups(self, timeout=None):
+        """
+        Wait for the background backup copies of the session.
+        
+        Args:
+            timeout (float, optional): Seconds to wait; copies left pending stay in backup_queue.json
+            
+        Returns:
+            bool: True if every copy was made and verified
+        """
+        if self._backup_worker is None:
+            return True
+        done = self._backup_worker.wait(timeout)
+        if self._backups_phase is not None:
+            # Until the launcher saw the copies done, not the copy time alone
+            self.profile.end(self._backups_phase, None if done else 'copies still pending')
+            self._backups_phase = None
+            self.write_launcher_profile()
+        if self._profile_backup_path:
+            # The sidecar is final now; copy it last so the backup is not a stale version
+            queue = self._backup_worker.queue
+            job = queue.add(self.profile_path, self._profile_backup_path)
+            self._profile_backup_path = None
+            if done:
+                done = backup_queue.run_job(queue, job)
+        if done:
+            logging.info("All backup copies verified")
+        else:
+            self._backup_worker.stop()
+            logging.warning("Backup copies still pending; finish them with: python backup_queue.py %s" %
+                            os.path.dirname(self._backup_worker.queue.path))
+        return done
+    
+    def write_launcher_profile(self):
+        """
+        Write the phase timings to the JSON sidecar of the pkl (<pkl base>.profile.json).
+        
+        Returns:
+            str: The sidecar path, or None if there is none or it could not be written
+        """
+        if not self.profile_path:
+            return None
+        try:
+            return self.profile.write_json(self.profile_path,
+                                           session_uuid=self.session_uuid,
+                                           mouse_id=self.mouse_id,
+                                           rig_id=self.platform_info.get('rig_id'),
+                                           computer_name=self.platform_info.get('computer_name'),
+                                           pkl=os.path.basename(self.output_path or ''),
+                                           simulate=self.simulate)
+        except Exception as e:
+            logging.warning("Could not write the launcher profile %s: %s" % (self.profile_path, e))
+            return None
+    
     def wecanpicklethat(self, datadict):
         """
         Input is a dictionary.
-            Attempts to pickle every item. If it doesn't pickle it is discarded
-            and its key is added to the output as "unpickleable"
+            Screens every item by type (see session_pickle.is_pickleable). If it
+            doesn't pickle it is discarded and its key is added to the output as "unpickleable"
             
-        This is a direct reimplementation of CAMSTIM's wecanpicklethat function.
+        Same contract as CAMSTIM's wecanpicklethat function, without serializing
+        every value only to test it.
         """
-        pickleable = {}
-        unpickleable = []
-        for k, v in datadict.iteritems():
-            try:
-                if k[0] != "_":  # we don't want private counters and such
-                    test = v
-                    _ = pickle.dumps(test)
-                    pickleable[k] = v
-            except:
-                unpickleable.append(k)
-        pickleable['unpickleable'] = unpickleable
-        return pickleable
+        return session_pickle.wecanpicklethat(datadict)
     
     def run(self, param_file=None):
         """
@@ -1676,40 +1994,26 @@ class BonsaiExperiment(object):
         """
         # Set up signal handler
         signal.signal(signal.SIGINT, self.signal_handler)
+        self._run_started = time.time()
+        self.profile = LauncherProfile(self._run_started)
         
         try:
             # Load parameters
-            self.load_parameters(param_file)
-            
-            # Step 1: Set up repository (clone or update if needed)
-            logging.info("Step 1: Setting up repository...")
-            if not self.setup_repository():
-                logging.error("Repository setup failed")
+            with self.profile.phase('load_parameters'):
+                self.load_parameters(param_file)
+            
+            # Steps 1-3: Repository, Bonsai installation, session folder, stimulus
+            # table and workflow checksum, overlapping where they are independent
+            logging.info("Steps 1-3: Pre-flight setup...")
+            with self.profile.phase('preflight'):
+                ok = self.run_preflight()
+            if not ok:
                 return False
             
-            # Step 2: Set up Bonsai installation (install if needed)
-            logging.info("Step 2: Setting up Bonsai installation...")
-            if not self.setup_bonsai():
-                logging.error("Bonsai setup failed")
-                return False
-            
-            # Step 3: Set Bonsai executable path from parameters
-            bonsai_exe_relative_path = self.params.get('bonsai_exe_path')
-            if not bonsai_exe_relative_path:
-                logging.error("No 'bonsai_exe_path' specified in parameters")
-                return False
-                
-            bonsai_exe_path = self.get_absolute_path_from_repo(bonsai_exe_relative_path)
-            if not bonsai_exe_path or not os.path.exists(bonsai_exe_path):
-                logging.error("Bonsai executable not found at: %s" % bonsai_exe_path)
-                return False
-                
-            self.bonsai_exe_path = bonsai_exe_path
-            logging.info("Using Bonsai executable: %s" % self.bonsai_exe_path)
-            
-            # Step 5: Start Bonsai
+            # Step 4: Start Bonsai
             logging.info("Step 4: Starting Bonsai experiment...")
-            self.start_bonsai()
+            with self.profile.phase('bonsai'):
+                self.start_bonsai()
             
             # Check for errors
             if self.bonsai_process.returncode != 0:
@@ -1718,7 +2022,8 @@ class BonsaiExperiment(object):
                 print("================================\n")
                 
                 # Save output even if there was an error
-                self.save_output()
+                with self.profile.phase('save_output'):
+                    self.save_output()
                 return False
 
             if not(self.params.get('disable_opto', True)):
@@ -1736,16 +2041,24 @@ class BonsaiExperiment(object):
                     opto_params['mouse_id'] = self.params.get('mouse_id')
                     opto_params['output_dir'] = agent.OUTPUT_DIR
                     opto_params['level_list'] = get_config('Optogenetics')['level_list']
+                    opto_params.setdefault('waveform_cache_dir', self.get_opto_waveform_cache_dir())
+                    if self.simulate:
+                        # Simulated NI-DAQ; one buffered write finishes without waiting out the protocol
+                        opto_params['simulate'] = True
+                        opto_params.setdefault('execution_mode', 'buffered')
 
                     # Log summary then execute
                     logging.info('Opto-tagging params: mode=%s levels=%s out=%s' % (
                         opto_params.get('operation_mode'), opto_params.get('level_list'), opto_params.get('output_dir')))
    
-                    optotagging(**opto_params)
+                    from opto_tagging import optotagging
+                    with self.profile.phase('opto_tagging'):
+                        optotagging(**opto_params)
                     logging.info('Opto-tagging completed.')
 
             # Save experiment data
-            self.save_output()            
+            with self.profile.phase('save_output'):
+                self.save_output()
             
             # Check if there were any warnings/errors even with successful return code
             if self.stderr_data:
@@ -1761,6 +2074,8 @@ class BonsaiExperiment(object):
         finally:
             # Make sure Bonsai is stopped
             self.stop()
+            self.write_launcher_profile()
+            self.profile.log_summary()
     
     def signal_handler(self, sig, frame):
         """Handle Ctrl+C and other signals"""
@@ -1780,33 +2095,27 @@ class BonsaiExperiment(object):
     def get_current_commit_hash(self, repo_path):
         """Get the current commit hash of a Git repository"""
         try:
-            original_dir = os.getcwd()
-            os.chdir(repo_path)
-            commit_hash = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).strip()
-            return commit_hash
+            commit_hash = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=repo_path,
+                                                  stderr=subprocess.STDOUT)
+            # bytes on Python 3; str on both so it compares with the commit_hash parameter
+            return str(commit_hash.decode('ascii').strip())
         except (subprocess.CalledProcessError, OSError) as e:
             logging.warning("Failed to get current commit hash: %s" % e)
             return None
-        finally:
-            os.chdir(original_dir)
     
     def get_remote_commit_hash(self, repo_path, branch='main'):
         """Get the latest commit hash from the remote repository for a specific branch"""
         try:
-            original_dir = os.getcwd()
-            os.chdir(repo_path)
-            
             # Fetch latest changes from remote
-            subprocess.check_call(['git', 'fetch', 'origin'], stderr=subprocess.STDOUT)
+            subprocess.check_call(['git', 'fetch', 'origin'], cwd=repo_path, stderr=subprocess.STDOUT)
             
             # Get the commit hash of the remote branch
-            remote_commit = subprocess.check_output(['git', 'rev-parse', 'origin/%s' % branch], stderr=subprocess.STDOUT).strip()
-            return remote_commit
+            remote_commit = subprocess.check_output(['git', 'rev-parse', 'origin/%s' % branch], cwd=repo_path,
+                                                    stderr=subprocess.STDOUT)
+            return str(remote_commit.decode('ascii').strip())
         except (subprocess.CalledProcessError, OSError) as e:
             logging.warning("Failed to get remote commit hash for %s: %s" % (branch, e))
             return None
-        finally:
-            os.chdir(original_dir)
     
     def is_on_latest_commit(self, repo_path, target_commit):
         """Check if the repository is on the latest commit for the specified target"""
@@ -1837,8 +2146,64 @@ class BonsaiExperiment(object):
                 logging.info("Current: %s, Required: %s" % (current_hash[:8] if current_hash else "unknown", target_commit))
                 return False
     
-    def clone_repository(self, repo_url, local_path):
-        """Clone a Git repository to the specified local path"""
+    def is_pinned_commit(self, commit_hash):
+        """Check if a commit target is a full SHA (immutable, so it never needs a fetch once present)"""
+        return bool(commit_hash) and FULL_SHA_PATTERN.match(commit_hash) is not None
+    
+    def has_local_commit(self, repo_path, commit_hash):
+        """Check if a commit object is present in a local repository, without using the network"""
+        # Partial clones would otherwise fetch a missing object from the remote to answer
+        env = dict(os.environ, GIT_NO_LAZY_FETCH='1')
+        try:
+            with open(os.devnull, 'w') as devnull:
+                return subprocess.call(['git', 'cat-file', '-e', '%s^{commit}' % commit_hash],
+                                       cwd=repo_path, env=env, stdout=devnull, stderr=devnull) == 0
+        except OSError:
+            return False
+    
+    def update_mirror(self, repo_url, commit_hash=None):
+        """
+        Create or refresh the local mirror cache of the repository ('repository_mirror_path').
+        
+        The mirror is a bare 'git clone --mirror' shared by all working trees on the rig.
+        It is only fetched when commit_hash is not a pinned commit it already holds.
+        
+        Args:
+            repo_url (str): Remote repository URL
+            commit_hash (str, optional): Commit the mirror must contain
+            
+        Returns:
+            str: Path of the mirror, or None if no usable mirror is configured
+        """
+        mirror_path = self.params.get('repository_mirror_path')
+        if not mirror_path:
+            return None
+        try:
+            if not os.path.isdir(mirror_path):
+                logging.info("Creating repository mirror %s" % mirror_path)
+                subprocess.check_call(['git', 'clone', '--mirror', repo_url, mirror_path], stderr=subprocess.STDOUT)
+            elif self.is_pinned_commit(commit_hash) and self.has_local_commit(mirror_path, commit_hash):
+                logging.info("Repository mirror already holds commit %s" % commit_hash)
+            else:
+                logging.info("Updating repository mirror %s" % mirror_path)
+                subprocess.check_call(['git', 'fetch', '--prune', 'origin'], cwd=mirror_path, stderr=subprocess.STDOUT)
+            return mirror_path
+        except (subprocess.CalledProcessError, OSError) as e:
+            if os.path.isdir(mirror_path):
+                # A stale mirror still serves the commits it has (e.g. while offline)
+                logging.warning("Failed to update repository mirror, using it as is: %s" % e)
+                return mirror_path
+            logging.warning("Failed to create repository mirror: %s" % e)
+            return None
+    
+    def clone_repository(self, repo_url, local_path, commit_hash=None):
+        """
+        Clone a Git repository to the specified local path.
+        
+        With 'repository_mirror_path' the clone is made from the local mirror (then
+        pointed back at repo_url). Otherwise 'repository_clone_depth' makes a shallow
+        clone and 'repository_partial_clone' a blobless one (--filter=blob:none).
+        """
         try:
             logging.info("Cloning repository %s to %s" % (repo_url, local_path))
             
@@ -1847,9 +2212,23 @@ class BonsaiExperiment(object):
             if not os.path.exists(parent_dir):
                 os.makedirs(parent_dir)
             
+            mirror_path = self.update_mirror(repo_url, commit_hash)
+            if mirror_path:
+                # Local clone: objects are hard-linked, no network needed
+                subprocess.check_call(['git', 'clone', mirror_path, local_path], stderr=subprocess.STDOUT)
+                subprocess.check_call(['git', 'remote', 'set-url', 'origin', repo_url], cwd=local_path,
+                                      stderr=subprocess.STDOUT)
+                logging.info("Repository cloned from mirror %s" % mirror_path)
+                return True
+            
             # Clone the repository
-            subprocess.check_call(['git', 'clone', repo_url, local_path], 
-                                stderr=subprocess.STDOUT)
+            args = ['git', 'clone']
+            depth = self.params.get('repository_clone_depth')
+            if depth:
+                args += ['--depth', str(int(depth)), '--no-single-branch']
+            if self.params.get('repository_partial_clone', False):
+                args.append('--filter=blob:none')
+            subprocess.check_call(args + [repo_url, local_path], stderr=subprocess.STDOUT)
             logging.info("Repository cloned successfully")
             return True
         except subprocess.CalledProcessError as e:
@@ -1859,19 +2238,57 @@ class BonsaiExperiment(object):
             logging.error("Git command failed: %s" % e)
             return False
     
+    def fetch_commit(self, repo_path, commit_hash):
+        """
+        Fetch a pinned commit that is missing from a local repository.
+        
+        Tries the mirror first, then the commit alone from origin (honouring
+        'repository_clone_depth' for shallow clones), then a full fetch.
+        
+        Returns:
+            bool: True if the commit is present afterwards
+        """
+        repo_url = self.params.get('repository_url')
+        mirror_path = self.update_mirror(repo_url, commit_hash) if repo_url else None
+        attempts = []
+        if mirror_path:
+            attempts.append(['git', 'fetch', mirror_path, '+refs/heads/*:refs/remotes/origin/*'])
+        depth = self.params.get('repository_clone_depth')
+        attempts.append(['git', 'fetch', 'origin', commit_hash] + (['--depth', str(int(depth))] if depth else []))
+        attempts.append(['git', 'fetch', 'origin'] + (['--unshallow'] if depth else []))
+        for args in attempts:
+            try:
+                logging.info("Fetching commit %s: %s" % (commit_hash, " ".join(args[1:])))
+                subprocess.check_call(args, cwd=repo_path, stderr=subprocess.STDOUT)
+            except (subprocess.CalledProcessError, OSError) as e:
+                logging.warning("Fetch failed: %s" % e)
+            if self.has_local_commit(repo_path, commit_hash):
+                return True
+        return False
+    
     def checkout_commit(self, repo_path, commit_hash):
-        """Checkout a specific commit in the repository"""
+        """
+        Checkout a specific commit in the repository.
+        
+        A pinned commit (full SHA) that is already present is checked out
+        without fetching.
+        """
         try:
-            original_dir = os.getcwd()
-            os.chdir(repo_path)
-            
             logging.info("Checking out commit %s" % commit_hash)
             
-            # Fetch latest changes first
-            subprocess.check_call(['git', 'fetch'], stderr=subprocess.STDOUT)
-            
-            # Checkout the specific commit
-            subprocess.check_call(['git', 'checkout', commit_hash], stderr=subprocess.STDOUT)
+            if self.is_pinned_commit(commit_hash):
+                if not self.has_local_commit(repo_path, commit_hash) and not self.fetch_commit(repo_path, commit_hash):
+                    logging.error("Commit %s is not available locally or from the remote" % commit_hash)
+                    return False
+                # Discards local changes, like update_repository's reset
+                subprocess.check_call(['git', 'checkout', '--force', commit_hash], cwd=repo_path,
+                                      stderr=subprocess.STDOUT)
+            else:
+                # Fetch latest changes first
+                subprocess.check_call(['git', 'fetch'], cwd=repo_path, stderr=subprocess.STDOUT)
+                
+                # Checkout the specific commit
+                subprocess.check_call(['git', 'checkout', commit_hash], cwd=repo_path, stderr=subprocess.STDOUT)
             
             logging.info("Successfully checked out commit %s" % commit_hash)
             return True
@@ -1882,8 +2299,6 @@ class BonsaiExperiment(object):
         except OSError as e:
             logging.error("Git command failed: %s" % e)
             return False
-        finally:
-            os.chdir(original_dir)
     
     def setup_repository(self):
         """Set up the repository based on parameters in the JSON file"""
@@ -1891,6 +2306,11 @@ class BonsaiExperiment(object):
         commit_hash = self.params.get('repository_commit_hash', 'main')
         local_repo_path = self.params.get('local_repository_path')
         
+        if self.simulate:
+            import simulation
+            simulation.stage_repository(get_camstim_dir())
+            return True
+        
         if not repo_url or not local_repo_path:
             logging.info("No repository configuration found, skipping repository setup")
             return True
@@ -1910,6 +2330,16 @@ class BonsaiExperiment(object):
             if os.path.exists(os.path.join(repo_full_path, '.git')):
                 logging.info("Repository already exists, checking commit hash")
                 
+                # Offline fast path: a full SHA already present needs no fetch
+                if self.is_pinned_commit(commit_hash) and self.has_local_commit(repo_full_path, commit_hash):
+                    if self.get_current_commit_hash(repo_full_path) == commit_hash.lower():
+                        logging.info("Repository is already at the pinned commit")
+                        return True
+                    if self.checkout_commit(repo_full_path, commit_hash):
+                        logging.info("Repository checked out at the pinned commit without fetching")
+                        return True
+                    logging.warning("Checkout of local commit %s failed, updating repository" % commit_hash)
+                
                 # Use the new commit checking logic
                 if self.is_on_latest_commit(repo_full_path, commit_hash):
                     logging.info("Repository is already at the correct commit")
@@ -1921,6 +2351,12 @@ class BonsaiExperiment(object):
                     if self.update_repository(repo_full_path, commit_hash):
                         logging.info("Repository updated successfully")
                         return True
+                    elif self.get_current_commit_hash(repo_full_path) and (
+                            self.is_pinned_commit(commit_hash) or self._repository_fetch_failed):
+                        # The working tree is intact; the target is just unreachable (e.g. offline).
+                        # A fresh clone would need the same network access, so keep the tree.
+                        logging.error("Failed to update repository to %s" % commit_hash)
+                        return False
                     else:
                         logging.warning("Failed to update repository, will try fresh clone")
                         # Only try to remove if update failed
@@ -1934,7 +2370,7 @@ class BonsaiExperiment(object):
                     return False
         
         # Clone the repository
-        if not self.clone_repository(repo_url, repo_full_path):
+        if not self.clone_repository(repo_url, repo_full_path, commit_hash):
             return False
         
         # Checkout specific commit if not 'main'
@@ -1947,24 +2383,28 @@ class BonsaiExperiment(object):
     
     def update_repository(self, repo_path, commit_hash):
         """Update an existing repository to the specified commit using Git operations"""
+        self._repository_fetch_failed = False
+        if self.is_pinned_commit(commit_hash):
+            return self.checkout_commit(repo_path, commit_hash)
         try:
-            original_dir = os.getcwd()
-            os.chdir(repo_path)
-            
             logging.info("Updating existing repository to commit %s" % commit_hash)
             
             # Reset any local changes
-            subprocess.check_call(['git', 'reset', '--hard'], stderr=subprocess.STDOUT)
+            subprocess.check_call(['git', 'reset', '--hard'], cwd=repo_path, stderr=subprocess.STDOUT)
             
             # Fetch latest changes
-            subprocess.check_call(['git', 'fetch', 'origin'], stderr=subprocess.STDOUT)
+            try:
+                subprocess.check_call(['git', 'fetch', 'origin'], cwd=repo_path, stderr=subprocess.STDOUT)
+            except subprocess.CalledProcessError:
+                self._repository_fetch_failed = True
+                raise
             
             # Checkout the target commit/branch
             if commit_hash == 'main':
-                subprocess.check_call(['git', 'checkout', 'main'], stderr=subprocess.STDOUT)
-                subprocess.check_call(['git', 'pull', 'origin', 'main'], stderr=subprocess.STDOUT)
+                subprocess.check_call(['git', 'checkout', 'main'], cwd=repo_path, stderr=subprocess.STDOUT)
+                subprocess.check_call(['git', 'pull', 'origin', 'main'], cwd=repo_path, stderr=subprocess.STDOUT)
             else:
-                subprocess.check_call(['git', 'checkout', commit_hash], stderr=subprocess.STDOUT)
+                subprocess.check_call(['git', 'checkout', commit_hash], cwd=repo_path, stderr=subprocess.STDOUT)
             
             logging.info("Repository updated successfully")
             return True
@@ -1975,8 +2415,6 @@ class BonsaiExperiment(object):
         except OSError as e:
             logging.error("Git command failed: %s" % e)
             return False
-        finally:
-            os.chdir(original_dir)
     
     def force_remove_directory(self, path):
         """Force remove a directory, handling Windows file locks"""
@@ -2037,10 +2475,9 @@ class BonsaiExperiment(object):
         logging.info("Installing Bonsai using setup script: %s" % setup_script_path)
         
         try:
-            # Change to the directory containing the setup script
+            # Run from the directory containing the setup script (cwd only applies to
+            # the child, so pre-flight steps on other threads are unaffected)
             script_dir = os.path.dirname(setup_script_path)
-            original_dir = os.getcwd()
-            os.chdir(script_dir)
             
             # Execute the setup script
             process = subprocess.Popen(
@@ -2048,7 +2485,8 @@ class BonsaiExperiment(object):
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 universal_newlines=True,
-                shell=True
+                shell=True,
+                cwd=script_dir
             )
             
             # Monitor the installation process
@@ -2093,8 +2531,6 @@ class BonsaiExperiment(object):
         except Exception as e:
             logging.error("Failed to execute Bonsai setup script: %s" % e)
             return False
-        finally:
-            os.chdir(original_dir)
     
     def setup_bonsai(self):
         """Set up Bonsai installation if needed"""
@@ -2112,6 +2548,9 @@ class BonsaiExperiment(object):
 
     def get_repository_path(self):
         """Get the full path to the cloned repository"""
+        if self.simulate:
+            import simulation
+            return simulation.repository_path(get_camstim_dir())
         local_repo_path = self.params.get('local_repository_path')
         if not local_repo_path:
             return None
@@ -2224,8 +2663,15 @@ class BonsaiExperiment(object):
     
     def generate_stimulus_csv(self):
         """
-        Generate a stimulus CSV file for the current session using the generator script.
-        The CSV will be created in the session folder with a session-specific random seed.
+        Generate a stimulus CSV file for the current session using the generator module.
+        The CSV will be created in the session folder with a session-specific random seed
+        (or the 'stimulus_seed' parameter, if set).
+        
+        Tables are generated in-process. With a pinned 'stimulus_seed' they are kept
+        in a cache keyed by session type, seed and generator source hash
+        ('stimulus_cache_dir', default <camstim>/stimulus_cache), so a pre-staged or
+        repeated seed is a file copy; session-specific seeds never repeat, so their
+        tables are written straight to the session folder.
         
         Returns:
             str: Path to the generated CSV file, or None if generation failed
@@ -2259,67 +2705,35 @@ class BonsaiExperiment(object):
         logging.info("Output CSV path: %s" % output_csv_path)
         
         try:
-            # Create a session-specific seed based on session UUID and current time
-            # This ensures different stimuli for each session run
-            import time
-            import hashlib
-            seed_string = "%s_%s_%d" % (self.session_uuid, session_type, int(time.time() * 1000000))
-            session_seed = int(hashlib.md5(seed_string.encode()).hexdigest()[:8], 16)
+            pinned_seed = self.params.get('stimulus_seed') is not None
+            if pinned_seed:
+                session_seed = int(self.params['stimulus_seed'])
+            else:
+                # Create a session-specific seed based on session UUID and current time
+                # This ensures different stimuli for each session run
+                seed_string = "%s_%s_%d" % (self.session_uuid, session_type, int(time.time() * 1000000))
+                session_seed = int(hashlib.md5(seed_string.encode()).hexdigest()[:8], 16)
             logging.info("Using session-specific random seed: %d" % session_seed)
             
-            # Construct command to run the generator
-            python_cmd = [
-                'python', generator_script_path,
-                '--session-type', session_type,
-                '--output-path', output_csv_path,
-                '--seed', str(session_seed)
-            ]
-            
-            logging.info("Running stimulus generator: %s" % ' '.join(python_cmd))
-            
-            # Execute the generator script (Python 2.7 compatible)
-            process = subprocess.Popen(
-                python_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=os.path.dirname(generator_script_path)
-            )
-            
-            # Wait for process to complete (Python 2.7 doesn't have timeout in communicate)
-            stdout, stderr = process.communicate()
-            return_code = process.returncode
-            
-            if return_code == 0:
-                # Check if output file was created
-                if os.path.exists(output_csv_path):
-                    # Count lines in the generated CSV (excluding header)
-                    with open(output_csv_path, 'r') as f:
-                        line_count = sum(1 for _ in f) - 1  # Subtract header
-                    
-                    logging.info("Stimulus CSV generated successfully: %s" % output_csv_path)
-                    logging.info("Generated %d stimulus trials" % line_count)
-                    if stdout.strip():
-                        logging.info("Generator output: %s" % stdout.strip())
-                    
-                    return output_csv_path
-                else:
-                    logging.error("Generator completed but output file not found: %s" % output_csv_path)
-                    if stderr:
-                        logging.error("Generator stderr: %s" % stderr)
-                    return None
+            start = time.time()
+            if pinned_seed:
+                cache = stimulus_cache.StimulusTableCache(self.params.get('stimulus_cache_dir', os.path.join(get_camstim_dir(), 'stimulus_cache')),
+                                           generator_script_path)
+                line_count, cache_hit = cache.copy_to(session_type, session_seed, output_csv_path)
             else:
-                logging.error("Stimulus generator failed with return code: %d" % return_code)
-                if stdout:
-                    logging.error("Generator stdout: %s" % stdout)
-                if stderr:
-                    logging.error("Generator stderr: %s" % stderr)
-                return None
+                line_count = stimulus_cache.generate_table(session_type, session_seed, output_csv_path, generator_script_path)
+                cache_hit = False
+            
+            logging.info("Stimulus CSV %s in %.2f s: %s" % ('copied from cache' if cache_hit else 'generated',
+                                                            time.time() - start, output_csv_path))
+            logging.info("Generated %d stimulus trials" % line_count)
+            return output_csv_path
                 
         except Exception as e:
             logging.error("Failed to run stimulus generator: %s" % e)
             return None
         
-    def _calculate_intervalsms(self):
+    def _calculate_intervalsms(self, logger_index=None):
         """
         Calculate frame intervals in milliseconds from the logger data.
         
@@ -2329,51 +2743,37 @@ class BonsaiExperiment(object):
         The logger CSV contains multiple entries per frame (Frame events, StimStart/StimEnd events).
         We only use the 'Frame' events to calculate true frame intervals.
         
+        Args:
+            logger_index (LoggerIndex, optional): Pre-built logger index, built if not provided
+        
         Returns:
             numpy.array: Array of frame intervals in milliseconds, or empty array if no data
         """
         try:
-            # Find logger file to get frame timing data
-            _, logger_file, _ = self._find_bonsai_csv_files()
+            if logger_index is None:
+                logger_index = self._build_logger_index()
             
-            if not logger_file:
+            if logger_index is None:
                 logging.warning("No logger file found for intervalsms calculation")
                 return np.array([])
             
-            # Load logger data
-            logger_data = self._read_csv_file(logger_file)
-            
-            if not logger_data:
+            if not len(logger_index):
                 logging.warning("No logger data found for intervalsms calculation")
                 return np.array([])
             
             # Extract timestamps only from 'Frame' events (ignore StimStart/StimEnd events)
-            frame_timestamps = []
-            for row in logger_data:
-                value = row.get('Value', '')
-                if value == 'Frame':  # Only process Frame events
-                    try:
-                        timestamp = float(row.get('Timestamp', '0.0'))
-                        frame_timestamps.append(timestamp)
-                    except (ValueError, TypeError):
-                        continue
-                # We extract START and END events to restrict intervals
-                elif value.startswith('START'):
-                    start_session = float(row.get('Timestamp'))
-                elif value.startswith('END'):
-                    end_session = float(row.get('Timestamp'))
+            frame_timestamps = logger_index.frame_timestamps()
             
             if len(frame_timestamps) < 2:
                 logging.warning("Not enough frame timestamps for intervalsms calculation")
                 return np.array([])
             
-            # Convert to numpy array for efficient calculation
-            frame_timestamps = np.array(frame_timestamps)
-            
             # We restrict to frames between START and END events if available
-            if 'start_session' in locals() and 'end_session' in locals():
+            start_marker = logger_index.marker('START')
+            end_marker = logger_index.marker('END')
+            if start_marker and end_marker:
                 frame_timestamps = frame_timestamps[
-                    (frame_timestamps >= start_session) & (frame_timestamps <= end_session)
+                    (frame_timestamps >= start_marker[1]) & (frame_timestamps <= end_marker[1])
                 ]
 
             # Calculate intervals between successive frame timestamps (in seconds)
@@ -2398,6 +2798,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Bonsai Experiment Launcher')
     parser.add_argument("json_path", nargs="?", type=str, default="")
     parser.add_argument("-o", "--output", type=str, help="Custom output path for saving pkl file")
+    parser.add_argument("--simulate", action="store_true",
+                        help="Run on a simulated rig: no mpeconfig, camstim, job objects or Bonsai.exe needed")
+    parser.add_argument("--speedup", type=float, help="Speed-up of the simulated Bonsai session")
     args = parser.parse_known_args()[0]
 
     start_time = time.time()
@@ -2409,15 +2812,21 @@ if __name__ == "__main__":
     print("Using parameter file: {0}".format(args.json_path))
     if args.output:
         print("Custom output path: {0}".format(args.output))
+    if args.simulate:
+        print("Simulated rig (no rig software or Bonsai.exe)")
   
     # Create an instance of BonsaiExperiment and run the experiment
-    experiment = BonsaiExperiment()
+    experiment = BonsaiExperiment(simulate=args.simulate)
+    experiment.simulation_speedup = args.speedup
     
     # Set custom output path if provided
     if args.output:
         experiment.custom_output_path = args.output
     
     experiment.run(args.json_path)
+    
+    # Give the background backups a chance to finish before exiting
+    experiment.wait_for_backups(experiment.params.get('backup_wait_seconds', 120))
 
     # Calculate elapsed time
     elapsed_time = time.time() - start_time
@@ -0,0 +1,878 @@
+#!/usr/bin/env python
+"""
+Parsing of the Bonsai orientations_logger CSV.
+
+The logger is the largest file of a session: one 'Frame' row per frame plus
+START/END markers, StimStart-/StimEnd- and MovieFrame- events and one Wheel
+event per encoder sample. This module turns it into:
+
+    LoggerIndex       typed columns (int32 frames, float64 timestamps, Value
+                      category codes) plus row indices of every event type and
+                      the parsed wheel samples
+    TimingMap         stimulus id -> frame/timestamp arrays used to build the
+                      CAMSTIM sweep tables (built by TimingMapBuilder), with
+                      a dense frame -> timestamp table (FrameTable)
+    LoggerTailer      background thread following the growing logger during the
+                      session, so save_output only has the last rows left to parse
+
+Both structures are built incrementally from batches of csv rows, so the batch
+path (LoggerIndex.from_csv at the end of the session) and the live path
+(LoggerTailer) run exactly the same code on the same rows in the same order.
+
+Only depends on numpy and the standard library. Python 2.7 compatible.
+"""
+
+import io
+import os
+import re
+import csv
+import logging
+import threading
+
+import numpy as np
+
+from bonsai_tables import CategoryEncoder, make_table, iter_rows
+
+# Bonsai wheel event, e.g. 'Wheel-Index-42793322-Count-4785-Deg-210.2783203125'
+WHEEL_EVENT_PATTERN = re.compile(r'^Wheel-Index-(\d+)-Count-(-?\d+)-Deg-([-+\d\.eE]+)$')
+
+# Number of csv rows parsed per batch when reading a whole logger file
+LOGGER_CHUNK_ROWS = 65536
+
+
+def parse_wheel_values(values):
+    """
+    Parse Wheel-Index-<i>-Count-<c>-Deg-<d> strings in one vectorized pass.
+
+    The strings are joined and their field labels replaced by separators so numpy
+    parses every number at once. If any string does not follow the expected
+    format, the strings are matched one by one with WHEEL_EVENT_PATTERN instead.
+
+    Args:
+        values (list): Wheel event strings
+
+    Returns:
+        tuple: (kept, index, count, deg) where kept holds the positions in values
+               that parsed, and index/count/deg are numpy arrays aligned with kept
+    """
+    n_values = len(values)
+    text = '\n'.join(values)
+    parsed = None
+    if (text.count('Wheel-Index-') == n_values and text.count('-Count-') == n_values
+            and text.count('-Deg-') == n_values):
+        numbers = text.replace('Wheel-Index-', '').replace('-Count-', ' ').replace('-Deg-', ' ')
+        parsed = np.fromstring(numbers, dtype=np.float64, sep=' ') if n_values else np.zeros(0)
+        if parsed.size != 3 * n_values:
+            parsed = None
+    kept = np.arange(n_values, dtype=np.int64)
+
+    if parsed is None:
+        # Some rows are malformed: match them individually to keep frames aligned
+        matches = []
+        positions = []
+        for position, value in enumerate(values):
+            m = WHEEL_EVENT_PATTERN.match(value)
+            if m:
+                matches.append([float(v) for v in m.groups()])
+                positions.append(position)
+            else:
+                logging.warning("Error parsing logger row for encoder reconstruction: %s" % value)
+        kept = np.array(positions, dtype=np.int64)
+        parsed = np.array(matches, dtype=np.float64)
+
+    parsed = parsed.reshape(-1, 3)
+    return kept, parsed[:, 0].astype(np.int64), parsed[:, 1].astype(np.int64), parsed[:, 2].copy()
+
+
+class LoggerIndex(object):
+    """
+    Index over a Bonsai orientations_logger CSV built in a single streaming pass.
+
+    Rows are kept in columnar, typed form (see bonsai_tables): int32 frames,
+    float64 timestamps and category codes into a string table for Value. Rows are
+    added in batches with append_rows(); freeze() materializes the arrays below.
+
+    Attributes:
+        path (str): Path of the logger CSV
+        fieldnames (list): CSV header
+        frames (numpy.array): Frame number of every row (-1 if unparsable)
+        timestamps (numpy.array): Timestamp of every row (NaN if unparsable)
+        value_codes (numpy.array): Code of every row's Value in value_table (-1 if missing)
+        value_table (list): Distinct Value strings
+        frame_rows (numpy.array): Row indices of 'Frame' events
+        stim_rows (numpy.array): Row indices of StimStart-/StimEnd- events
+        movie_rows (numpy.array): Row indices of MovieFrame- events
+        marker_rows (numpy.array): Row indices of START/END markers
+        wheel_rows (numpy.array): Row indices of parsed Wheel- events
+        wheel_index, wheel_count, wheel_deg (numpy.array): Parsed wheel samples,
+            aligned with wheel_rows
+        start_row (int): Row index of the START marker, or None
+        end_row (int): Row index of the END marker, or None
+        max_frame (int): Highest frame number found in the logger
+    """
+
+    _ARRAYS = (
+        ('frames', np.int32), ('timestamps', np.float64), ('value_codes', np.int32),
+        ('frame_rows', np.int64), ('stim_rows', np.int64), ('movie_rows', np.int64),
+        ('marker_rows', np.int64), ('wheel_rows', np.int64), ('wheel_index', np.int64),
+        ('wheel_count', np.int64), ('wheel_deg', np.float64),
+    )
+
+    def __init__(self, path=None):
+        self.path = path
+        self.fieldnames = ['Frame', 'Timestamp', 'Value']
+        self._columns = (0, 1, 2)
+        self._values = CategoryEncoder()
+        self.value_table = self._values.categories
+        self._chunks = dict((name, []) for name, _ in self._ARRAYS)
+        for name, dtype in self._ARRAYS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self._n_rows = 0
+        self._batch_offset = 0
+        self.start_row = None
+        self.end_row = None
+        self.max_frame = 0
+
+    @classmethod
+    def from_csv(cls, file_path):
+        """
+        Build the index by streaming through the logger CSV once.
+
+        Args:
+            file_path (str): Path to the orientations_logger CSV file
+
+        Returns:
+            LoggerIndex: Populated index (empty if the file could not be read)
+        """
+        index = cls(file_path)
+        try:
+            with open(file_path, 'r') as f:
+                reader = csv.reader(f)
+                index.set_header(next(reader, None))
+                chunk = []
+                for row in reader:
+                    chunk.append(row)
+                    if len(chunk) >= LOGGER_CHUNK_ROWS:
+                        index.append_rows(chunk)
+                        chunk = []
+                index.append_rows(chunk)
+            logging.debug("Indexed %d logger rows from %s" % (len(index), file_path))
+        except Exception as e:
+            logging.error("Error reading CSV file %s: %s" % (file_path, e))
+        index.freeze()
+        return index
+
+    def set_header(self, header):
+        """Set the CSV header (keeps the default Frame,Timestamp,Value if empty)."""
+        if header:
+            self.fieldnames = list(header)
+        width = len(self.fieldnames)
+        self._columns = tuple(self.fieldnames.index(name) if name in self.fieldnames else width
+                              for name in ('Frame', 'Timestamp', 'Value'))
+
+    def append_rows(self, rows):
+        """
+        Parse a batch of csv.reader rows (lists of strings) into the index.
+
+        Args:
+            rows (list): Rows following the header, in file order
+
+        Returns:
+            tuple: (frames, timestamps, event_rows, event_values) for the rows that
+                   were added: frame and timestamp arrays, then the positions (within
+                   the batch) and Value strings of the START/END, StimStart-/StimEnd-
+                   and MovieFrame- rows, as TimingMapBuilder.add_rows() expects them
+        """
+        frame_col, time_col, value_col = self._columns
+        encode = self._values.encode
+        offset = self._n_rows
+        nan = float('nan')
+        frames = []
+        timestamps = []
+        values = []
+        frame_rows = []
+        stim_rows = []
+        movie_rows = []
+        marker_rows = []
+        wheel_rows = []
+        wheel_values = []
+        event_rows = []
+
+        for row in rows:
+            n = len(row)
+            if not n:
+                # csv.DictReader skips blank lines as well
+                continue
+            i = offset + len(values)
+            try:
+                frame = int(row[frame_col]) if frame_col < n else -1
+            except ValueError:
+                frame = -1
+            frames.append(frame)
+            try:
+                timestamps.append(float(row[time_col]) if time_col < n else nan)
+            except ValueError:
+                timestamps.append(nan)
+
+            value = row[value_col] if value_col < n else None
+            values.append(value)
+            if not value:
+                continue
+            if value == 'Frame':
+                frame_rows.append(i)
+            elif value.startswith('Wheel-'):
+                if frame >= 0:
+                    wheel_rows.append(i)
+                    wheel_values.append(value)
+            elif value.startswith('MovieFrame-'):
+                movie_rows.append(i)
+                event_rows.append(i - offset)
+            elif value.startswith('StimStart-') or value.startswith('StimEnd-'):
+                stim_rows.append(i)
+                event_rows.append(i - offset)
+            elif value.startswith('START'):
+                self.start_row = i
+                marker_rows.append(i)
+                event_rows.append(i - offset)
+            elif value.startswith('END'):
+                self.end_row = i
+                marker_rows.append(i)
+                event_rows.append(i - offset)
+
+        kept, wheel_index, wheel_count, wheel_deg = parse_wheel_values(wheel_values)
+        new_arrays = {
+            'frames': frames, 'timestamps': timestamps,
+            'value_codes': [encode(v) for v in values],
+            'frame_rows': frame_rows, 'stim_rows': stim_rows, 'movie_rows': movie_rows,
+            'marker_rows': marker_rows,
+            'wheel_rows': np.array(wheel_rows, dtype=np.int64)[kept],
+            'wheel_index': wheel_index, 'wheel_count': wheel_count, 'wheel_deg': wheel_deg,
+        }
+        for name, dtype in self._ARRAYS:
+            self._chunks[name].append(np.asarray(new_arrays[name], dtype=dtype))
+        if frames:
+            self.max_frame = max(self.max_frame, max(frames))
+        self._batch_offset = self._n_rows
+        self._n_rows += len(values)
+        return (self._chunks['frames'][-1], self._chunks['timestamps'][-1],
+                event_rows, [values[j] for j in event_rows])
+
+    def last_batch(self):
+        """
+        Arrays of the rows added by the last append_rows() call (before freeze()).
+
+        Returns:
+            tuple: (offset, arrays) where offset is the index of the batch's first row
+                   and arrays maps every name in _ARRAYS to the batch's values
+        """
+        return self._batch_offset, dict((name, chunks[-1]) for name, chunks in self._chunks.items() if chunks)
+
+    def freeze(self):
+        """Materialize the typed arrays from the batches appended so far."""
+        for name, dtype in self._ARRAYS:
+            chunks = self._chunks[name]
+            if len(chunks) > 1:
+                chunks[:] = [np.concatenate(chunks)]
+            setattr(self, name, chunks[0] if chunks else np.zeros(0, dtype=dtype))
+        return self
+
+    def __len__(self):
+        return self._n_rows
+
+    def value(self, row_index):
+        """Return the Value string of a row (None if missing)."""
+        code = self.value_codes[row_index]
+        return self.value_table[code] if code >= 0 else None
+
+    def values_at(self, row_indices):
+        """Return the Value strings of several rows."""
+        table = self.value_table
+        return [table[c] if c >= 0 else None for c in self.value_codes[row_indices].tolist()]
+
+    def marker(self, name):
+        """
+        Return (frame, timestamp) of the START or END marker, or None if absent.
+        """
+        row_index = self.start_row if name == 'START' else self.end_row
+        if row_index is None:
+            return None
+        return int(self.frames[row_index]), float(self.timestamps[row_index])
+
+    def frame_timestamps(self):
+        """Timestamps of the 'Frame' events, skipping unparsable values."""
+        ts = self.timestamps[self.frame_rows]
+        return ts[~np.isnan(ts)]
+
+    def to_table(self):
+        """Return the logger as a columnar table (see bonsai_tables) for the pkl."""
+        columns = {
+            'Frame': {'type': 'int', 'values': self.frames},
+            'Timestamp': {'type': 'float', 'values': self.timestamps},
+            'Value': {'type': 'category', 'codes': self.value_codes, 'categories': self.value_table},
+        }
+        return make_table(['Frame', 'Timestamp', 'Value'], columns, len(self))
+
+    def iter_rows(self):
+        """Yield logger rows one at a time as legacy dictionaries of strings."""
+        return iter_rows(self.to_table())
+
+
+class FrameTable(object):
+    """
+    Frame number -> timestamp of the last logger row logged on that frame.
+
+    Timestamps are kept in a dense float64 array indexed by frame number, NaN
+    marking frames without a row (dropped frames). If frame numbers are too
+    sparse for a dense array, the table switches to sorted frame/timestamp arrays
+    searched with numpy.searchsorted.
+    """
+
+    # Stay dense while the frame range is at most this many times the number of entries
+    DENSE_RATIO = 4
+    DENSE_MIN_SIZE = 65536
+
+    def __init__(self):
+        self._dense = np.zeros(0, dtype=np.float64)
+        self._frames = None
+        self._timestamps = None
+        self.n_entries = 0
+
+    def __len__(self):
+        return self.n_entries
+
+    def update(self, frames, timestamps):
+        """
+        Add logger rows; later rows overwrite earlier rows on the same frame.
+
+        Args:
+            frames (numpy.array): Frame numbers (>= 0)
+            timestamps (numpy.array): Timestamps aligned with frames
+        """
+        if not len(frames):
+            return
+        # Last row logged on each frame
+        steps = np.diff(frames)
+        if np.all(steps >= 0):
+            last = np.append(steps != 0, True)
+            unique_frames = frames[last]
+            unique_timestamps = timestamps[last]
+        else:
+            unique_frames, last = np.unique(frames[::-1], return_index=True)
+            unique_timestamps = timestamps[::-1][last]
+
+        if self._frames is None:
+            size = int(unique_frames[-1]) + 1
+            if size <= max(self.DENSE_MIN_SIZE, self.DENSE_RATIO * (self.n_entries + len(unique_frames))):
+                if size > len(self._dense):
+                    grown = np.empty(max(size, 2 * len(self._dense)), dtype=np.float64)
+                    grown[:len(self._dense)] = self._dense
+                    grown[len(self._dense):] = np.nan
+                    self._dense = grown
+                self.n_entries += int(np.count_nonzero(np.isnan(self._dense[unique_frames])))
+                self._dense[unique_frames] = unique_timestamps
+                return
+            # Too sparse for a dense array: switch to sorted arrays
+            self._frames, self._timestamps = self.items()
+            self._dense = np.zeros(0, dtype=np.float64)
+
+        frames = np.concatenate((self._frames, unique_frames))
+        timestamps = np.concatenate((self._timestamps, unique_timestamps))
+        self._frames, last = np.unique(frames[::-1], return_index=True)
+        self._timestamps = timestamps[::-1][last]
+        self.n_entries = len(self._frames)
+
+    def lookup(self, frames):
+        """
+        Return the timestamps of several frames (NaN for frames without a row).
+
+        Args:
+            frames (numpy.array): Frame numbers (any value, negative allowed)
+
+        Returns:
+            numpy.array: float64 timestamps
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        found = np.empty(len(frames), dtype=np.float64)
+        found[:] = np.nan
+        if self._frames is None:
+            inside = (frames >= 0) & (frames < len(self._dense))
+            found[inside] = self._dense[frames[inside]]
+        elif len(self._frames):
+            position = np.minimum(np.searchsorted(self._frames, frames), len(self._frames) - 1)
+            inside = self._frames[position] == frames
+            found[inside] = self._timestamps[position[inside]]
+        return found
+
+    def items(self):
+        """Return (frames, timestamps) arrays of the frames present in the table."""
+        if self._frames is not None:
+            return self._frames, self._timestamps
+        frames = np.flatnonzero(~np.isnan(self._dense))
+        return frames, self._dense[frames]
+
+
+class MovieTiming(object):
+    """
+    Per-movie-frame timing of one movie stimulus, as parallel arrays sorted by
+    local movie frame index. Missing end values are -1 (frames) and NaN (timestamps).
+    """
+
+    def __init__(self, index, start_frame, start_timestamp, end_frame, end_timestamp):
+        self.index = index
+        self.start_frame = start_frame
+        self.start_timestamp = start_timestamp
+        self.end_frame = end_frame
+        self.end_timestamp = end_timestamp
+
+    def __len__(self):
+        return len(self.index)
+
+
+class TimingMap(object):
+    """
+    Mapping of stimulus IDs to frame/timestamp information from the logger.
+
+    Attributes:
+        frames (FrameTable): Frame number -> timestamp for every logger row
+        start (tuple): (frame, timestamp) of the START marker, or None
+        end (tuple): (frame, timestamp) of the END marker, or None
+        stim_ids (list): Stimulus IDs, in order of first StimStart
+        stim_start_frame, stim_start_timestamp (numpy.array): StimStart timing per stimulus
+        stim_end_frame, stim_end_timestamp (numpy.array): Last frame shown per stimulus,
+            -1 and NaN if no StimEnd was logged
+        movies (dict): Stimulus ID -> MovieTiming for movie stimuli
+    """
+
+    def __init__(self):
+        self.frames = FrameTable()
+        self.has_rows = False
+        self.start = None
+        self.end = None
+        self.stim_ids = []
+        self.stim_start_frame = np.zeros(0, dtype=np.int64)
+        self.stim_start_timestamp = np.zeros(0, dtype=np.float64)
+        self.stim_end_frame = np.zeros(0, dtype=np.int64)
+        self.stim_end_timestamp = np.zeros(0, dtype=np.float64)
+        self.movies = {}
+        self._positions = {}
+
+    def __contains__(self, stim_id):
+        return stim_id in self._positions
+
+    def stim_positions(self, stim_ids):
+        """Return the position of each stimulus ID in the stim_* arrays (-1 if unknown)."""
+        positions = self._positions
+        return np.array([positions.get(stim_id, -1) for stim_id in stim_ids], dtype=np.int64)
+
+    def movie(self, stim_id):
+        """Return the MovieTiming of a stimulus, or None if it has no movie frames."""
+        return self.movies.get(stim_id)
+
+    def as_dict(self):
+        """
+        Return the map in the nested dictionary layout used by earlier launcher versions.
+
+        Returns:
+            dict: {'Frames': {frame: timestamp}, 'START': {...}, 'END': {...},
+                   stim_id: {'start_frame', 'start_timestamp', 'end_frame', 'end_timestamp', 'movie'}}
+        """
+        timing_map = {}
+        if self.has_rows:
+            frames, timestamps = self.frames.items()
+            timing_map['Frames'] = dict(zip(frames.tolist(), timestamps.tolist()))
+        for name, marker in (('START', self.start), ('END', self.end)):
+            if marker is not None:
+                timing_map[name] = {'start_frame': marker[0], 'start_timestamp': marker[1]}
+
+        def timing_dict(start_frame, start_timestamp, end_frame, end_timestamp):
+            entry = {'start_frame': start_frame, 'start_timestamp': start_timestamp}
+            if end_frame >= 0:
+                entry['end_frame'] = end_frame
+                entry['end_timestamp'] = end_timestamp
+            return entry
+
+        for stim_id, columns in zip(self.stim_ids, zip(
+                self.stim_start_frame.tolist(), self.stim_start_timestamp.tolist(),
+                self.stim_end_frame.tolist(), self.stim_end_timestamp.tolist())):
+            timing_map[stim_id] = timing_dict(*columns)
+            movie = self.movies.get(stim_id)
+            if movie is not None:
+                timing_map[stim_id]['movie'] = dict(
+                    (index, timing_dict(*columns)) for index, columns in zip(
+                        movie.index.tolist(), zip(movie.start_frame.tolist(), movie.start_timestamp.tolist(),
+                                                  movie.end_frame.tolist(), movie.end_timestamp.tolist())))
+        return timing_map
+
+
+# Kinds of timing events, see TimingMapBuilder._classify
+_START, _END, _STIM_START, _STIM_END, _MOVIE_FRAME = range(5)
+
+
+class TimingMapBuilder(object):
+    """
+    Incrementally build a TimingMap from batches of logger rows.
+
+    The frame table is updated with array operations for every batch; only the
+    START/END, StimStart-/StimEnd- and MovieFrame- rows go through a Python loop.
+    A row with an unparsable Frame or Timestamp (or MovieFrame index) stops the
+    map where it is, as the original single loop over all rows did.
+    """
+
+    def __init__(self):
+        self.timing_map = TimingMap()
+        self.failed = False
+        self._stims = {}
+        self._stim_ids = []
+        self._stim_id = None
+        self._max_frame = -1
+        self._event_kinds = {}
+
+    def _classify(self, value):
+        """
+        Return (kind, payload) of an event Value: the stimulus ID for StimStart-/StimEnd-,
+        the local frame index for MovieFrame-. Raises ValueError for a bad MovieFrame index.
+        """
+        event = self._event_kinds.get(value)
+        if event is None:
+            if value.startswith('START'):
+                event = (_START, None)
+            elif value.startswith('END'):
+                event = (_END, None)
+            elif value.startswith('StimStart-'):
+                event = (_STIM_START, value.replace('StimStart-', ''))
+            elif value.startswith('StimEnd-'):
+                event = (_STIM_END, value.replace('StimEnd-', ''))
+            else:
+                event = (_MOVIE_FRAME, int(value.replace('MovieFrame-', '')))
+            self._event_kinds[value] = event
+        return event
+
+    def add_rows(self, frames, timestamps, event_rows, event_values):
+        """
+        Add a batch of logger rows, in file order.
+
+        Args:
+            frames (numpy.array): Frame numbers (-1 if unparsable)
+            timestamps (numpy.array): Timestamps (NaN if unparsable)
+            event_rows (list): Positions (within the batch) of START/END,
+                StimStart-/StimEnd- and MovieFrame- rows, ascending
+            event_values (list): Value strings of those rows
+        """
+        if self.failed or not len(frames):
+            return
+        self.timing_map.has_rows = True
+        frames = np.asarray(frames, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        error = None
+
+        # Rows up to the first invalid one are kept
+        invalid = np.flatnonzero((frames < 0) | np.isnan(timestamps))
+        n_valid = len(frames)
+        if len(invalid):
+            n_valid = int(invalid[0])
+            error = "invalid Frame/Timestamp on logger row with frame %d" % frames[n_valid]
+
+        events = []
+        classify = self._classify
+        for row, value in zip(event_rows, event_values):
+            if row >= n_valid:
+                break
+            try:
+                events.append((row,) + classify(value))
+            except ValueError as e:
+                # The frame of this row was recorded before the value failed to parse
+                n_valid = row + 1
+                error = e
+                break
+
+        frames = frames[:n_valid]
+        timestamps = timestamps[:n_valid]
+        rows = np.array([event[0] for event in events], dtype=np.int64)
+        previous = self._previous_frame_timestamps(frames, timestamps, rows)
+        self._max_frame = max(self._max_frame, int(frames.max()) if n_valid else -1)
+
+        self._add_events(events, frames[rows].tolist(), timestamps[rows].tolist(), previous.tolist())
+
+        if error is not None:
+            logging.warning("Could not create timing map from logger: %s" % error)
+            self.failed = True
+
+    def _previous_frame_timestamps(self, frames, timestamps, rows):
+        """
+        Update the frame table and return, for each event row on frame f, the
+        timestamp the table held for frame f-1 when that row was logged (NaN if none).
+        """
+        table = self.timing_map.frames
+        monotonic = not len(frames) or (frames[0] >= self._max_frame and np.all(np.diff(frames) >= 0))
+        if monotonic:
+            # Rows on frame f-1 all come before a row on frame f: the updated table is exact
+            table.update(frames, timestamps)
+            return table.lookup(frames[rows] - 1)
+
+        # Frames going backwards: look for frame f-1 among the earlier rows of the
+        # batch first, then in the table as it was before the batch
+        previous = table.lookup(frames[rows] - 1)
+        n_rows = len(frames)
+        keys = np.sort(frames * n_rows + np.arange(n_rows))
+        queries = (frames[rows] - 1) * n_rows + rows
+        position = np.searchsorted(keys, queries) - 1
+        matched = position >= 0
+        matched[matched] = keys[position[matched]] // n_rows == frames[rows][matched] - 1
+        previous[matched] = timestamps[keys[position[matched]] % n_rows]
+        table.update(frames, timestamps)
+        return previous
+
+    def _add_events(self, events, frames, timestamps, previous):
+        timing_map = self.timing_map
+        stims = self._stims
+        stim_id = self._stim_id
+
+        for (row, kind, payload), frame, timestamp, previous_timestamp in zip(
+                events, frames, timestamps, previous):
+            # We first look for the START marker to set the reference frame number and timestamp
+            # These are registered as 605,18.922494100000002,START in the logger
+            if kind == _START:
+                timing_map.start = (frame, timestamp)
+                logging.info("Found START marker at frame %d, timestamp %f" % (frame, timestamp))
+            elif kind == _END:
+                timing_map.end = (frame, timestamp)
+                logging.info("Found END marker at frame %d, timestamp %f" % (frame, timestamp))
+
+            # Stimulus start/end markers: [start_frame, start_timestamp, end_frame, end_timestamp, movie]
+            elif kind == _STIM_START:
+                stim_id = payload
+                if stim_id not in stims:
+                    self._stim_ids.append(stim_id)
+                stims[stim_id] = [frame, timestamp, -1, np.nan, None]
+            elif kind == _STIM_END:
+                stim_id = payload
+                entry = stims.get(stim_id)
+                if entry is not None:
+                    # Bonsai log StimEnd when the frame AFTER the stimulus ends
+                    # (previous_timestamp is NaN if frame-1 was not logged)
+                    if previous_timestamp == previous_timestamp:
+                        entry[2] = frame - 1
+                        entry[3] = previous_timestamp
+                    else:
+                        # If something went wrong during logging, fall back to using the current frame and timestamp
+                        entry[2] = frame
+                        entry[3] = timestamp
+
+                    # if we are closing a movie block, we add end_frame and end_timestamp to the last frame
+                    movie = entry[4]
+                    if movie:
+                        last_frame = max(movie)
+                        movie[last_frame][2] = frame
+                        movie[last_frame][3] = timestamp
+            # Movie frame markers: MovieFrame-<number>
+            else:
+                entry = stims.get(stim_id)
+                if entry is None:
+                    # If a MovieFrame appears before StimStart, skip it
+                    continue
+                if entry[4] is None:
+                    entry[4] = {}
+                movie = entry[4]
+                # Each movie frame is its own timing entry; treat as single-frame duration
+                movie[payload] = [frame, timestamp, -1, np.nan]
+                # We fill in end_frame and end_timestamp in payload - 1 if it exists
+                if payload - 1 in movie and previous_timestamp == previous_timestamp:
+                    movie[payload - 1][2] = frame - 1
+                    movie[payload - 1][3] = previous_timestamp
+
+        self._stim_id = stim_id
+
+    def build(self):
+        """
+        Return the TimingMap of the rows added so far, with stimulus and movie
+        timing converted to parallel arrays.
+        """
+        timing_map = self.timing_map
+        stim_ids = self._stim_ids
+        entries = [self._stims[stim_id] for stim_id in stim_ids]
+        timing_map.stim_ids = list(stim_ids)
+        timing_map._positions = dict((stim_id, i) for i, stim_id in enumerate(stim_ids))
+        timing_map.stim_start_frame = np.array([e[0] for e in entries], dtype=np.int64)
+        timing_map.stim_start_timestamp = np.array([e[1] for e in entries], dtype=np.float64)
+        timing_map.stim_end_frame = np.array([e[2] for e in entries], dtype=np.int64)
+        timing_map.stim_end_timestamp = np.array([e[3] for e in entries], dtype=np.float64)
+
+        timing_map.movies = {}
+        for stim_id, entry in zip(stim_ids, entries):
+            movie = entry[4]
+            if movie is None:
+                continue
+            index = np.array(sorted(movie), dtype=np.int64)
+            columns = np.array([movie[i] for i in index.tolist()], dtype=np.float64).reshape(-1, 4)
+            timing_map.movies[stim_id] = MovieTiming(
+                index, columns[:, 0].astype(np.int64), columns[:, 1],
+                columns[:, 2].astype(np.int64), columns[:, 3])
+        return timing_map
+
+    @classmethod
+    def from_index(cls, logger_index):
+        """Build the TimingMap from all rows of a LoggerIndex."""
+        builder = cls()
+        event_rows = np.sort(np.concatenate((logger_index.stim_rows, logger_index.movie_rows,
+                                             logger_index.marker_rows)))
+        builder.add_rows(logger_index.frames, logger_index.timestamps,
+                         event_rows.tolist(), logger_index.values_at(event_rows))
+        return builder.build()
+
+
+class LoggerTailer(object):
+    """
+    Follow the orientations_logger CSV while Bonsai is writing it.
+
+    A daemon thread polls the session folder for the logger file, reads the
+    newly written complete lines and feeds them to a LoggerIndex and a
+    TimingMapBuilder. When Bonsai has exited, finish() parses the remaining
+    rows and returns both, so packaging only pays for the last few seconds of
+    the session. finish() returns (None, None) whenever the live result cannot
+    be trusted (read error, different logger file, file rewritten), in which
+    case the caller falls back to parsing the whole file.
+    """
+
+    def __init__(self, session_folder, poll_interval=0.5):
+        self.session_folder = session_folder
+        self.poll_interval = poll_interval
+        self.path = None
+        self.logger_index = None
+        self.timing_builder = TimingMapBuilder()
+        self.error = None
+        self.rows_read = 0
+        self._file = None
+        self._partial = b''
+        self._bytes_read = 0
+        self._header_seen = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Call listener(logger_index) from the polling thread after every batch of new rows.
+
+        The batch is available from logger_index.last_batch(). A listener that raises
+        is logged and removed; tailing goes on.
+        """
+        self._listeners.append(listener)
+
+    def start(self):
+        """Start following the logger in a daemon thread."""
+        self._thread = threading.Thread(target=self._run, name='LoggerTailer')
+        self._thread.daemon = True
+        self._thread.start()
+        logging.info("Live logger tailing started in %s" % self.session_folder)
+
+    def stop(self):
+        """Stop the polling thread (rows already read are kept)."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def _run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.error = e
+                logging.warning("Live logger tailing stopped: %s" % e)
+                break
+
+    def _find_logger_file(self):
+        for root, dirs, files in os.walk(self.session_folder):
+            for name in sorted(files):
+                if name.startswith('orientations_logger') and name.endswith('.csv'):
+                    return os.path.join(root, name)
+        return None
+
+    def poll(self, final=False):
+        """
+        Read and parse the complete lines written since the last poll.
+
+        Args:
+            final (bool): Also parse a trailing line without newline (writer has exited)
+
+        Returns:
+            int: Number of rows added
+        """
+        with self._lock:
+            if self._file is None:
+                path = self._find_logger_file()
+                if not path:
+                    return 0
+                self._file = io.open(path, 'rb')
+                self.path = path
+                self.logger_index = LoggerIndex(path)
+
+            data = self._file.read()
+            self._bytes_read += len(data)
+            lines = (self._partial + data).split(b'\n')
+            self._partial = lines.pop()
+            if final and self._partial:
+                lines.append(self._partial)
+                self._partial = b''
+            if not lines:
+                return 0
+
+            lines = [line.rstrip(b'\r') for line in lines]
+            if not isinstance('', bytes):
+                # Python 3: the csv module parses text
+                lines = [line.decode('utf-8') for line in lines]
+            rows = list(csv.reader(lines))
+            if not self._header_seen:
+                while rows and not rows[0]:
+                    rows.pop(0)
+                if not rows:
+                    return 0
+                self.logger_index.set_header(rows.pop(0))
+                self._header_seen = True
+
+            n_rows = len(self.logger_index)
+            self.timing_builder.add_rows(*self.logger_index.append_rows(rows))
+            n_rows = len(self.logger_index) - n_rows
+            self.rows_read += n_rows
+            for listener in list(self._listeners):
+                try:
+                    listener(self.logger_index)
+                except Exception as e:
+                    logging.warning("Removing logger tailing listener %r: %s" % (listener, e))
+                    self._listeners.remove(listener)
+            return n_rows
+
+    def finish(self, logger_file):
+        """
+        Stop tailing, parse the rows left in the logger and return the results.
+
+        Args:
+            logger_file (str): Logger file found by the batch search at the end of the session
+
+        Returns:
+            tuple: (LoggerIndex, TimingMap), or (None, None) to fall back to batch parsing
+        """
+        self.stop()
+        try:
+            if self.error is None:
+                self.poll(final=True)
+        except Exception as e:
+            self.error = e
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+        if self.error is not None:
+            logging.warning("Live logger tailing failed (%s), parsing the logger in batch" % self.error)
+            return None, None
+        if not self.path or not logger_file or \
+                os.path.normcase(os.path.abspath(self.path)) != os.path.normcase(os.path.abspath(logger_file)):
+            logging.warning("Live logger tailing followed %s instead of %s, parsing the logger in batch" % (
+                self.path, logger_file))
+            return None, None
+        if self._bytes_read != os.path.getsize(self.path):
+            logging.warning("Logger file changed while tailing, parsing the logger in batch")
+            return None, None
+
+        logging.info("Live logger tailing read %d rows from %s" % (self.rows_read, self.path))
+        return self.logger_index.freeze(), self.timing_builder.build()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+Bounded capture of Bonsai's stdout/stderr.
+
+StreamCapture keeps the most recent lines of one stream in a fixed-size deque
+and appends every line to a buffered log file in the session folder, so a
+chatty workflow cannot grow launcher memory while the full stream is still on
+disk. text() returns the whole stream, reading it back from the log file when
+older lines were dropped from memory.
+
+OutputLogQueue forwards the lines to the launcher log through a queue: reader
+threads only enqueue records and a single listener thread formats and writes
+them with the root logger's handlers.
+
+Python 2.7 compatible (logging.handlers has no QueueHandler/QueueListener
+before Python 3.2; minimal equivalents are defined below).
+"""
+
+import io
+import logging
+import threading
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    class QueueHandler(logging.Handler):
+        """Put log records on a queue (subset of the Python 3 class)."""
+
+        def __init__(self, record_queue):
+            logging.Handler.__init__(self)
+            self.queue = record_queue
+
+        def prepare(self, record):
+            # Format now so the record no longer references the caller's objects
+            record.msg = self.format(record)
+            record.args = None
+            record.exc_info = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.queue.put_nowait(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        """Hand queued records to handlers from a background thread (subset of the Python 3 class)."""
+        _sentinel = None
+
+        def __init__(self, record_queue, *handlers, **kwargs):
+            self.queue = record_queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get('respect_handler_level', False)
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor)
+            self._thread.daemon = True
+            self._thread.start()
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    break
+                for handler in self.handlers:
+                    if not self.respect_handler_level or record.levelno >= handler.level:
+                        handler.handle(record)
+
+        def stop(self):
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+DEFAULT_MAX_LINES = 10000
+LOG_BUFFER_SIZE = 64 * 1024
+
+
+class StreamCapture(object):
+    """
+    Recent lines of one output stream, plus an append-only log of the whole stream.
+
+    Args:
+        log_path (str, optional): Log file for every line (memory only if None)
+        max_lines (int): Lines kept in memory
+    """
+
+    def __init__(self, log_path=None, max_lines=DEFAULT_MAX_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self.n_lines = 0
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._file = None
+        self._start_offset = 0
+        if log_path:
+            # Appended to (restarted sessions keep the earlier output); this stream starts at the current end
+            self._file = io.open(log_path, 'ab', buffering=LOG_BUFFER_SIZE)
+            self._start_offset = self._file.tell()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(list(self.lines))
+
+    def append(self, line):
+        data = line if isinstance(line, bytes) else line.encode('utf-8', 'replace')
+        with self._lock:
+            self.lines.append(line)
+            self.n_lines += 1
+            if self._file is not None:
+                self._file.write(data + b'\n')
+
+    @property
+    def dropped(self):
+        """Number of lines no longer held in memory."""
+        return self.n_lines - len(self.lines)
+
+    def text(self):
+        """All lines of the stream joined by newlines."""
+        with self._lock:
+            if not self.dropped:
+                return "\n".join(self.lines)
+            if self._file is not None:
+                self._file.flush()
+        if not self.log_path:
+            return "\n".join(self.lines)
+        with io.open(self.log_path, 'rb') as f:
+            f.seek(self._start_offset)
+            data = f.read()
+        if data.endswith(b'\n'):
+            data = data[:-1]
+        return data if isinstance(self.lines[0], bytes) else data.decode('utf-8', 'replace')
+
+    def close(self):
+        """Flush and close the log file; text() keeps working."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class OutputLogQueue(object):
+    """
+    Logger whose records are written by a background listener thread.
+
+    Args:
+        name (str): Logger name
+    """
+
+    def __init__(self, name='bonsai_output'):
+        self.logger = logging.getLogger(name)
+        self.logger.propagate = False
+        self._queue = queue.Queue()
+        self._handler = QueueHandler(self._queue)
+        self._listener = None
+
+    def start(self):
+        """Route the logger through the queue to the current root handlers."""
+        if self._listener is not None:
+            return
+        self.logger.addHandler(self._handler)
+        self._listener = QueueListener(self._queue, *logging.getLogger().handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def stop(self):
+        """Write the queued records and stop the listener thread."""
+        if self._listener is None:
+            return
+        self.logger.removeHandler(self._handler)
+        self._listener.stop()
+        self._listener = None
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Columnar, typed in-memory tables for Bonsai CSV outputs.
+
+The launcher used to keep every row of orientations_logger*.csv and
+orientations_orientations*.csv as a csv.DictReader dictionary of strings, and
+stored those lists verbatim in the session pkl. A table here keeps one numpy
+array per column instead:
+
+    {
+        'format': 'columnar-v1',
+        'n_rows': 1234,
+        'fieldnames': ['Frame', 'Timestamp', 'Value'],
+        'columns': {
+            'Frame':     {'type': 'int', 'values': int32 array},
+            'Timestamp': {'type': 'float', 'values': float64 array},
+            'Value':     {'type': 'category', 'codes': int32 array, 'categories': [str, ...]},
+        }
+    }
+
+Category codes index into the small 'categories' string table; code -1 stands
+for a missing value (None). expand_table() turns a table back into the legacy
+list of dictionaries for older consumers.
+
+Only depends on numpy so analysis scripts can import it without the rig
+configuration modules required by bonsai_experiment_launcher.
+
+Python 2.7 compatible.
+"""
+
+import numpy as np
+
+TABLE_FORMAT = 'columnar-v1'
+
+
+def format_float(value):
+    """Format a float the way Bonsai writes doubles: shortest repr, no trailing '.0'."""
+    text = repr(float(value))
+    if text.endswith('.0'):
+        text = text[:-2]
+    return text
+
+
+class CategoryEncoder(object):
+    """Incrementally assign integer codes to string values."""
+
+    def __init__(self):
+        self.categories = []
+        self._codes = {}
+
+    def encode(self, value):
+        """Return the code of value, adding it to the string table if new (-1 for None)."""
+        if value is None:
+            return -1
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.categories)
+            self._codes[value] = code
+            self.categories.append(value)
+        return code
+
+
+def category_column(values):
+    """Build a category column from a list of strings (None allowed)."""
+    encoder = CategoryEncoder()
+    codes = np.array([encoder.encode(v) for v in values], dtype=np.int32)
+    return {'type': 'category', 'codes': codes, 'categories': encoder.categories}
+
+
+def infer_column(values):
+    """
+    Build the most compact lossless column for a list of CSV strings.
+
+    A column is typed as int or float only if every value formats back to the
+    exact same string, so expand_table() reproduces the original rows; any other
+    column (labels, ids, mixed values such as Phase='wheel') is stored as categories.
+
+    Args:
+        values (list): Column values as read by csv.DictReader
+
+    Returns:
+        dict: Column description (see module docstring)
+    """
+    try:
+        ints = [int(v) for v in values]
+        if all(str(i) == v for i, v in zip(ints, values)):
+            return {'type': 'int', 'values': np.array(ints, dtype=np.int64)}
+    except (ValueError, TypeError):
+        pass
+    try:
+        floats = [float(v) for v in values]
+        if all(format_float(x) == v for x, v in zip(floats, values)):
+            return {'type': 'float', 'values': np.array(floats, dtype=np.float64)}
+    except (ValueError, TypeError):
+        pass
+    return category_column(values)
+
+
+def make_table(fieldnames, columns, n_rows):
+    """Assemble a table dictionary from already built columns."""
+    return {
+        'format': TABLE_FORMAT,
+        'n_rows': int(n_rows),
+        'fieldnames': list(fieldnames),
+        'columns': columns,
+    }
+
+
+def table_from_rows(rows, fieldnames=None):
+    """
+    Convert a list of csv.DictReader rows to a typed columnar table.
+
+    Args:
+        rows (list): List of dictionaries, one per CSV row
+        fieldnames (list, optional): Column order, e.g. csv.DictReader.fieldnames;
+            the sorted keys of the first row if omitted (rows do not keep the file order)
+
+    Returns:
+        dict: Columnar table
+    """
+    if fieldnames is None:
+        fieldnames = sorted(k for k in rows[0].keys() if k is not None) if rows else []
+    columns = {}
+    for name in fieldnames:
+        columns[name] = infer_column([row.get(name) for row in rows])
+    return make_table(fieldnames, columns, len(rows))
+
+
+def is_table(obj):
+    """Return True if obj is a columnar table produced by this module."""
+    return isinstance(obj, dict) and obj.get('format') == TABLE_FORMAT
+
+
+def column_values(table, name):
+    """
+    Return a column decoded to its natural Python/numpy form.
+
+    int and float columns are returned as numpy arrays, category columns as a
+    list of strings (None for missing values).
+    """
+    column = table['columns'][name]
+    if column['type'] == 'category':
+        categories = column['categories']
+        return [categories[c] if c >= 0 else None for c in column['codes'].tolist()]
+    return column['values']
+
+
+def column_strings(table, name):
+    """Return a column as the list of strings csv.DictReader would have produced."""
+    column = table['columns'][name]
+    if column['type'] == 'int':
+        return [str(v) for v in column['values'].tolist()]
+    if column['type'] == 'float':
+        return [format_float(v) for v in column['values'].tolist()]
+    return column_values(table, name)
+
+
+def iter_rows(table):
+    """Yield the table rows one at a time as legacy dictionaries of strings."""
+    names = table['fieldnames']
+    columns = [column_strings(table, name) for name in names]
+    for values in zip(*columns):
+        yield dict(zip(names, values))
+
+
+def expand_table(table):
+    """
+    Expand a columnar table to the legacy list of csv.DictReader dictionaries.
+
+    Legacy lists are returned unchanged so callers can use this on pkl files
+    written before and after the columnar format. Float columns written from
+    non-shortest strings (logger timestamps) expand to the shortest string of
+    the same value.
+    """
+    if not is_table(table):
+        return table
+    return list(iter_rows(table))
+
+
+def expand_bonsai_raw_data(bonsai_raw_data):
+    """
+    Return a copy of a session pkl 'bonsai' entry with legacy list-of-dict tables.
+
+    Args:
+        bonsai_raw_data (dict): data['bonsai'] from a session pkl
+
+    Returns:
+        dict: Copy where 'orientations' and 'logger' are lists of dictionaries
+    """
+    expanded = dict(bonsai_raw_data)
+    for key in ('orientations', 'logger'):
+        if key in expanded:
+            expanded[key] = expand_table(expanded[key])
+    return expanded
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Streaming file checksums with a persistent (path, size, mtime) cache.
+
+Provenance checksums of the workflow, parameter file, stimulus table and the
+movies and tables a workflow reads are computed in 1 MB chunks, so large
+assets are never held in memory. Digests are kept in a JSON cache keyed by
+absolute path and reused while the file's size and modification time are
+unchanged, so a rig re-running the same workflow only hashes what changed.
+
+workflow_assets() lists the input files a Bonsai workflow references:
+included workflows (followed recursively) and FileName properties, except
+those of writers and loggers (session outputs). Package references such as
+"BonVision:Logging.LogEvent.bonsai" are not files and are skipped.
+
+Python 2.7 compatible.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import xml.etree.ElementTree as ElementTree
+
+from atomic_file import atomic_write
+
+CHUNK_SIZE = 1024 * 1024
+XSI_TYPE = '{http://www.w3.org/2001/XMLSchema-instance}type'
+_WINDOWS_ABSOLUTE = re.compile(r'^[A-Za-z]:[\\/]')
+_PACKAGE_REFERENCE = re.compile(r'^[A-Za-z][\w.]*:[^\\/]')
+
+
+def file_digest(path, algorithm='md5', chunk_size=CHUNK_SIZE):
+    """Hex digest of a file, read in chunks."""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(chunk_size)
+    return digest.hexdigest()
+
+
+class ChecksumCache(object):
+    """
+    File digests cached by (absolute path, size, mtime).
+
+    Args:
+        cache_path (str, optional): JSON file the cache is loaded from and saved to
+        algorithm (str): hashlib algorithm name
+    """
+
+    def __init__(self, cache_path=None, algorithm='md5'):
+        self.cache_path = cache_path
+        self.algorithm = algorithm
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'r') as f:
+                    data = json.load(f)
+                if data.get('algorithm') == algorithm:
+                    self._entries = data.get('files', {})
+            except (IOError, OSError, ValueError) as e:
+                logging.warning("Ignoring unreadable checksum cache %s: %s" % (cache_path, e))
+
+    def digest(self, path):
+        """
+        Digest of a file, hashed only if it changed since it was cached.
+
+        Returns:
+            str: Hex digest, or None if the file does not exist
+        """
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                self.hits += 1
+                return entry['digest']
+        value = file_digest(path, self.algorithm)
+        with self._lock:
+            self.misses += 1
+            self._entries[path] = {'size': st.st_size, 'mtime': st.st_mtime, 'digest': value}
+            self._dirty = True
+        return value
+
+    def digests(self, paths):
+        """Map of path -> digest (None for missing files)."""
+        return dict((path, self.digest(path)) for path in paths)
+
+    def save(self):
+        """Write the cache if it changed (through a temporary file, see atomic_file)."""
+        if not self.cache_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'algorithm': self.algorithm, 'files': dict(self._entries)}
+            self._dirty = False
+        try:
+            folder = os.path.dirname(self.cache_path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with atomic_write(self.cache_path, 'w') as f:
+                json.dump(data, f)
+        except (IOError, OSError) as e:
+            logging.warning("Could not save checksum cache %s: %s" % (self.cache_path, e))
+
+
+def _resolve(reference, folders):
+    """Path of a workflow file reference, tried against each folder in turn."""
+    reference = reference.strip()
+    if _WINDOWS_ABSOLUTE.match(reference) or os.path.isabs(reference):
+        return os.path.normpath(reference) if os.path.exists(reference) else reference
+    relative = reference.replace('\\', os.sep).replace('/', os.sep)
+    candidates = [os.path.normpath(os.path.join(folder, relative)) for folder in folders]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return candidates[0]
+
+
+def workflow_assets(workflow_path):
+    """
+    Input files referenced by a Bonsai workflow and the workflows it includes.
+
+    Relative references are resolved against the top-level workflow's folder
+    (Bonsai's working directory), then against the including workflow's folder.
+
+    Returns:
+        list: Paths (sorted; missing files included so they show up in provenance)
+    """
+    top_folder = os.path.dirname(os.path.abspath(workflow_path))
+    assets = set()
+    visited = set()
+    pending = [os.path.abspath(workflow_path)]
+    while pending:
+        path = pending.pop()
+        if path in visited:
+            continue
+        visited.add(path)
+        try:
+            root = ElementTree.parse(path).getroot()
+        except (IOError, OSError, ElementTree.ParseError) as e:
+            logging.warning("Could not read workflow %s: %s" % (path, e))
+            continue
+        folders = [top_folder, os.path.dirname(path)]
+        parents = dict((child, parent) for parent in root.iter() for child in parent)
+        for element in root.iter():
+            if element.tag.split('}')[-1] != 'Expression':
+                continue
+            include = element.get('Path')
+            if element.get(XSI_TYPE) == 'IncludeWorkflow' and include and not _PACKAGE_REFERENCE.match(include):
+                included = _resolve(include, folders)
+                assets.add(included)
+                if os.path.isfile(included):
+                    pending.append(included)
+        for element in root.iter():
+            if element.tag.split('}')[-1] != 'FileName' or not (element.text or '').strip():
+                continue
+            # Skip outputs: file names of writers and of logging workflows
+            node, output = parents.get(element), False
+            while node is not None:
+                kind = (node.get(XSI_TYPE) or '') + ' ' + (node.get('Path') or '')
+                if 'Writer' in kind or 'Log' in kind:
+                    output = True
+                    break
+                if node.tag.split('}')[-1] == 'Expression':
+                    break
+                node = parents.get(node)
+            if not output:
+                assets.add(_resolve(element.text, folders))
+    assets.discard(os.path.abspath(workflow_path))
+    return sorted(assets)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+Live frame-timing statistics while Bonsai runs.
+
+FrameTimingStats listens to a LoggerTailer (see bonsai_logger) and keeps the
+last 60 s of 'Frame' timestamps. After every batch of logger rows it computes,
+over 1, 10 and 60 s windows of the logger clock, the mean, 99th percentile and
+maximum frame interval and the number of dropped frames (intervals longer
+than 1.5 refresh periods count one dropped frame per missing refresh). It also
+tracks the current stimulus, its block label (read from the
+orientations_orientations CSV) and the wheel speed over the last second.
+
+FrameDashboard serves the latest statistics as JSON from a small HTTP server
+bound to localhost and writes them to frame_dashboard.json in the session
+folder. The JSON is rendered once per logger batch, so requests cost nothing
+but a socket write:
+
+    curl http://127.0.0.1:8765/
+
+Python 2.7 compatible.
+"""
+
+import os
+import io
+import csv
+import json
+import math
+import time
+import logging
+import datetime
+import threading
+
+import numpy as np
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from atomic_file import atomic_write
+
+WINDOWS = (1, 10, 60)
+NOMINAL_FRAME_INTERVAL = 1.0 / 60
+DROPPED_FRAME_FACTOR = 1.5
+WHEEL_SPEED_WINDOW = 1.0
+SIDECAR_NAME = 'frame_dashboard.json'
+
+
+def dropped_frames(intervals, nominal=NOMINAL_FRAME_INTERVAL):
+    """Refreshes missed in a series of frame intervals (seconds)."""
+    late = intervals[intervals > DROPPED_FRAME_FACTOR * nominal]
+    return int(np.sum(np.round(late / nominal) - 1))
+
+
+class FrameTimingStats(object):
+    """
+    Rolling frame-interval, block and wheel statistics of a logger being tailed.
+
+    Args:
+        session_folder (str): Folder holding the orientations_orientations CSV (block labels)
+        wheel_radius_cm (float, optional): Wheel radius to report the speed in cm/s as well
+    """
+
+    def __init__(self, session_folder=None, wheel_radius_cm=None):
+        self.session_folder = session_folder
+        self.wheel_radius_cm = wheel_radius_cm
+        self.frame_times = np.zeros(0, dtype=np.float64)
+        self.n_frames = 0
+        self.total_dropped = 0
+        self.started = False
+        self.ended = False
+        self.stim_id = None
+        self.block_label = None
+        self.wheel_samples = np.zeros((0, 2), dtype=np.float64)
+        self.snapshot = self._compute()
+        self._labels = {}
+        self._orientations_path = None
+        self._orientations_offset = 0
+        self._orientations_header = None
+        self._orientations_partial = b''
+
+    def update(self, logger_index):
+        """Add the last batch of logger_index (LoggerTailer listener)."""
+        offset, batch = logger_index.last_batch()
+        timestamps = batch.get('timestamps')
+        if timestamps is None or not len(timestamps):
+            return
+
+        new_times = timestamps[batch['frame_rows'] - offset]
+        new_times = new_times[~np.isnan(new_times)]
+        if len(new_times):
+            joined = np.concatenate((self.frame_times[-1:], new_times))
+            self.total_dropped += dropped_frames(np.diff(joined))
+            self.n_frames += len(new_times)
+            times = np.concatenate((self.frame_times, new_times))
+            self.frame_times = times[times >= times[-1] - max(WINDOWS)]
+
+        if logger_index.start_row is not None:
+            self.started = True
+        if logger_index.end_row is not None:
+            self.ended = True
+        stim_rows = batch['stim_rows']
+        if len(stim_rows):
+            table = logger_index.value_table
+            values = [table[code] for code in batch['value_codes'][stim_rows - offset].tolist()]
+            starts = [value for value in values if value.startswith('StimStart-')]
+            if starts:
+                self.block_label = self._block_label(starts[-1][len('StimStart-'):])
+            # No stimulus on screen once the last one has ended
+            last = values[-1]
+            self.stim_id = last[len('StimStart-'):] if last.startswith('StimStart-') else None
+
+        wheel_rows = batch['wheel_rows']
+        if len(wheel_rows):
+            samples = np.column_stack((timestamps[wheel_rows - offset], batch['wheel_deg']))
+            samples = np.concatenate((self.wheel_samples, samples))
+            self.wheel_samples = samples[samples[:, 0] >= samples[-1, 0] - WHEEL_SPEED_WINDOW]
+
+        self.snapshot = self._compute()
+
+    def _block_label(self, stim_id):
+        if stim_id not in self._labels:
+            self._read_orientations()
+        return self._labels.get(stim_id, self.block_label)
+
+    def _read_orientations(self):
+        """Read the orientation rows written since the last call (Id -> BlockLabel)."""
+        if not self.session_folder:
+            return
+        if self._orientations_path is None:
+            for root, dirs, files in os.walk(self.session_folder):
+                for name in sorted(files):
+                    if name.startswith('orientations_orientations') and name.endswith('.csv'):
+                        self._orientations_path = os.path.join(root, name)
+                        break
+                if self._orientations_path:
+                    break
+            if self._orientations_path is None:
+                return
+        with io.open(self._orientations_path, 'rb') as f:
+            f.seek(self._orientations_offset)
+            data = f.read()
+        self._orientations_offset += len(data)
+        lines = (self._orientations_partial + data).split(b'\n')
+        self._orientations_partial = lines.pop()
+        lines = [line.rstrip(b'\r') for line in lines]
+        if not isinstance('', bytes):
+            lines = [line.decode('utf-8') for line in lines]
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            if self._orientations_header is None:
+                self._orientations_header = row
+                continue
+            record = dict(zip(self._orientations_header, row))
+            if 'Id' in record:
+                self._labels[record['Id']] = record.get('BlockLabel')
+
+    def _window_stats(self, seconds):
+        times = self.frame_times
+        if len(times):
+            times = times[times >= times[-1] - seconds]
+        intervals = np.diff(times)
+        if not len(intervals):
+            return {'frames': int(len(times)), 'mean_interval_ms': None, 'p99_interval_ms': None,
+                    'max_interval_ms': None, 'dropped_frames': 0}
+        return {
+            'frames': int(len(times)),
+            'mean_interval_ms': float(np.mean(intervals) * 1000.0),
+            'p99_interval_ms': float(np.percentile(intervals, 99) * 1000.0),
+            'max_interval_ms': float(np.max(intervals) * 1000.0),
+            'dropped_frames': dropped_frames(intervals),
+        }
+
+    def _compute(self):
+        speed = None
+        if len(self.wheel_samples) > 1:
+            dt = self.wheel_samples[-1, 0] - self.wheel_samples[0, 0]
+            if dt > 0:
+                speed = float((self.wheel_samples[-1, 1] - self.wheel_samples[0, 1]) / dt)
+        speed_cm = None
+        if speed is not None and self.wheel_radius_cm:
+            speed_cm = speed * math.pi / 180.0 * float(self.wheel_radius_cm)
+        return {
+            'updated': datetime.datetime.now().isoformat(),
+            'logger_time': float(self.frame_times[-1]) if len(self.frame_times) else None,
+            'frames': self.n_frames,
+            'total_dropped_frames': self.total_dropped,
+            'started': self.started,
+            'ended': self.ended,
+            'windows': dict(('%ds' % w, self._window_stats(w)) for w in WINDOWS),
+            'stim_id': self.stim_id,
+            'block_label': self.block_label,
+            'wheel_speed_deg_per_s': speed,
+            'wheel_speed_cm_per_s': speed_cm,
+        }
+
+
+class _StatsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.dashboard.json_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FrameDashboard(object):
+    """
+    Serve FrameTimingStats over HTTP and mirror them to a sidecar JSON file.
+
+    Args:
+        session_folder (str): Session folder (orientation CSV and frame_dashboard.json)
+        port (int): Local port of the JSON endpoint (0 picks a free port, None disables it)
+        wheel_radius_cm (float, optional): Wheel radius for the speed in cm/s
+        write_interval (float): Minimum seconds between sidecar writes
+    """
+
+    def __init__(self, session_folder, port=8765, wheel_radius_cm=None, write_interval=1.0):
+        self.stats = FrameTimingStats(session_folder, wheel_radius_cm)
+        self.sidecar_path = os.path.join(session_folder, SIDECAR_NAME) if session_folder else None
+        self.port = port
+        self.write_interval = write_interval
+        self.server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._json = json.dumps(self.stats.snapshot, sort_keys=True).encode('utf-8')
+        self._last_write = 0.0
+
+    @property
+    def url(self):
+        if self.server is None:
+            return None
+        return 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def attach(self, tailer):
+        """Update from every batch of rows read by a LoggerTailer."""
+        tailer.add_listener(self.update)
+
+    def start(self):
+        """Start the HTTP endpoint in a daemon thread."""
+        if self.port is None:
+            return
+        self.server = HTTPServer(('127.0.0.1', int(self.port)), _StatsRequestHandler)
+        self.server.dashboard = self
+        self._thread = threading.Thread(target=self.server.serve_forever, name='FrameDashboard')
+        self._thread.daemon = True
+        self._thread.start()
+        logging.info("Frame timing dashboard at %s" % self.url)
+
+    def update(self, logger_index):
+        self.stats.update(logger_index)
+        data = json.dumps(self.stats.snapshot, sort_keys=True).encode('utf-8')
+        with self._lock:
+            self._json = data
+        if time.time() - self._last_write >= self.write_interval:
+            self.write_sidecar()
+
+    def json_bytes(self):
+        with self._lock:
+            return self._json
+
+    def write_sidecar(self):
+        """Write the latest statistics to frame_dashboard.json (through a temporary file, see atomic_file)."""
+        if not self.sidecar_path:
+            return
+        self._last_write = time.time()
+        try:
+            with atomic_write(self.sidecar_path, 'wb') as f:
+                f.write(self.json_bytes())
+        except (IOError, OSError) as e:
+            logging.warning("Could not write %s: %s" % (self.sidecar_path, e))
+
+    def stop(self):
+        """Write the final statistics and shut the endpoint down."""
+        self.write_sidecar()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self._thread.join(timeout=5.0)
+            self.server = None
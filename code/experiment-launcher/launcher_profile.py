@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Phase-level timing of a launcher run.
+
+Each phase of BonsaiExperiment.run (parameter loading, repository sync,
+Bonsai setup, stimulus table generation, the Bonsai session, packaging,
+pickle write, backups, ...) is timed with
+
+    with self.profile.phase('generate_stimulus_csv'):
+        ...
+
+or begin()/end() for phases that span methods. Every phase records:
+
+    start                 seconds from t0 (launcher start)
+    wall_seconds          elapsed time
+    cpu_seconds           user + system CPU time of the launcher process
+    rss_start_bytes       launcher RSS when the phase began
+    peak_rss_delta_bytes  highest RSS seen during the phase minus rss_start_bytes
+    error                 exception message, if the phase raised
+
+Peaks come from a PeakMemorySampler: one background thread that samples the
+RSS (psutil) every `interval` seconds while any phase is open. Phases may nest
+and may run on several threads (pre-flight); CPU time is that of the whole
+process, so concurrent phases each count the CPU used by the others.
+benchmark_launcher measures its stages with the same sampler.
+
+to_dict() is stored under 'launcher_profile' in the session pkl and
+written to the <pkl base>.profile.json sidecar for fleet-wide aggregation.
+
+Python 2.7 compatible.
+"""
+
+import os
+import gc
+import json
+import time
+import logging
+import datetime
+import threading
+import contextlib
+
+from atomic_file import atomic_write
+
+PROFILE_VERSION = 1
+
+
+def sidecar_path(pkl_path):
+    """JSON sidecar of a session pkl: <pkl base>.profile.json"""
+    return os.path.splitext(pkl_path)[0] + '.profile.json'
+
+
+def cpu_time():
+    """User + system CPU seconds of this process."""
+    times = os.times()
+    return times[0] + times[1]
+
+
+class PeakMemorySampler(object):
+    """
+    Peak RSS of this process while watched blocks run.
+
+    watch() opens a watch and release() closes it; one background thread samples
+    the RSS every `interval` seconds while any watch is open, so overlapping
+    watches (nested or on other threads) share it. As a context manager it
+    watches the enclosed block, after a garbage collection:
+
+        with PeakMemorySampler(0.002) as sampler:
+            ...
+        sampler.peak_increase
+
+    Args:
+        interval (float): Seconds between RSS samples
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self._watches = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._process = None
+        self._block = None
+
+    def rss(self):
+        """RSS of this process in bytes, or None without psutil."""
+        if self._process is None:
+            try:
+                import psutil
+                self._process = psutil.Process(os.getpid())
+            except Exception as e:
+                logging.warning("Peak RSS not recorded: %s" % e)
+                self._process = False
+        if not self._process:
+            return None
+        try:
+            return self._process.memory_info().rss
+        except Exception:
+            return None
+
+    def _sample(self):
+        while True:
+            rss = self.rss()
+            with self._lock:
+                if not self._watches:
+                    self._thread = None
+                    return
+                if rss is not None:
+                    for watch in self._watches:
+                        watch['peak'] = max(watch['peak'], rss)
+            time.sleep(self.interval)
+
+    def watch(self):
+        """
+        Start watching the RSS.
+
+        Returns:
+            dict: The watch ('start': RSS now or None, 'peak'), to pass to release()
+        """
+        rss = self.rss()
+        watch = {'start': rss, 'peak': rss or 0}
+        with self._lock:
+            self._watches.append(watch)
+            if self._thread is None and rss is not None:
+                self._thread = threading.Thread(target=self._sample, name='peak-memory-sampler')
+                self._thread.daemon = True
+                self._thread.start()
+        return watch
+
+    def release(self, watch):
+        """
+        Stop a watch opened with watch().
+
+        Returns:
+            int: Highest RSS seen during the watch minus its start, or None without RSS
+        """
+        rss = self.rss()
+        with self._lock:
+            self._watches = [other for other in self._watches if other is not watch]
+            if rss is not None:
+                watch['peak'] = max(watch['peak'], rss)
+        if watch['start'] is None or rss is None:
+            return None
+        return watch['peak'] - watch['start']
+
+    def __enter__(self):
+        gc.collect()
+        self._block = self.watch()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release(self._block)
+        return False
+
+    @property
+    def start_rss(self):
+        return self._block['start'] or 0
+
+    @property
+    def peak_rss(self):
+        return self._block['peak']
+
+    @property
+    def peak_increase(self):
+        return self.peak_rss - self.start_rss
+
+
+class LauncherProfile(object):
+    """
+    Wall time, CPU time and peak RSS growth of named phases.
+
+    Args:
+        t0 (float, optional): Reference time.time() of the phase starts (default: now)
+        interval (float): Seconds between RSS samples while a phase is open
+    """
+
+    def __init__(self, t0=None, interval=0.05):
+        self.t0 = time.time() if t0 is None else t0
+        self.interval = interval
+        self.phases = []
+        self._open = []
+        self._lock = threading.Lock()
+        self._sampler = PeakMemorySampler(interval)
+
+    def begin(self, name):
+        """
+        Open a phase.
+
+        Returns:
+            dict: The phase record, to pass to end()
+        """
+        watch = self._sampler.watch()
+        record = {'name': name, 'start': time.time() - self.t0, 'wall_seconds': None, 'cpu_seconds': None,
+                  'rss_start_bytes': watch['start'], 'peak_rss_delta_bytes': None, 'error': None,
+                  '_watch': watch, '_wall': time.time(), '_cpu': cpu_time()}
+        with self._lock:
+            self._open.append(record)
+        return record
+
+    def end(self, record, error=None):
+        """
+        Close a phase opened with begin() (closing it again does nothing).
+
+        Args:
+            record (dict): The record returned by begin()
+            error (str, optional): Why the phase failed
+        """
+        wall = time.time() - record['_wall']
+        cpu = cpu_time() - record['_cpu']
+        with self._lock:
+            if not any(other is record for other in self._open):
+                return
+            self._open = [other for other in self._open if other is not record]
+        record['wall_seconds'] = wall
+        record['cpu_seconds'] = cpu
+        record['error'] = error
+        record['peak_rss_delta_bytes'] = self._sampler.release(record['_watch'])
+        with self._lock:
+            self.phases.append(record)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed block as a phase; exceptions are recorded and re-raised."""
+        record = self.begin(name)
+        error = None
+        try:
+            yield record
+        except BaseException as e:
+            error = '%s: %s' % (type(e).__name__, e)
+            raise
+        finally:
+            self.end(record, error)
+
+    def to_dict(self):
+        """
+        Finished phases (in start order) and the names of those still open.
+
+        Returns:
+            dict: version, t0 (ISO time), pid, phases, open and totals
+                  (per phase name: count, wall_seconds, cpu_seconds, peak_rss_delta_bytes)
+        """
+        with self._lock:
+            phases = sorted((dict((k, v) for k, v in record.items() if not k.startswith('_'))
+                             for record in self.phases), key=lambda record: record['start'])
+            still_open = [record['name'] for record in self._open]
+        totals = {}
+        for record in phases:
+            total = totals.setdefault(record['name'], {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                       'peak_rss_delta_bytes': None})
+            total['count'] += 1
+            total['wall_seconds'] += record['wall_seconds']
+            total['cpu_seconds'] += record['cpu_seconds']
+            if record['peak_rss_delta_bytes'] is not None:
+                total['peak_rss_delta_bytes'] = max(total['peak_rss_delta_bytes'] or 0,
+                                                    record['peak_rss_delta_bytes'])
+        return {
+            'version': PROFILE_VERSION,
+            't0': datetime.datetime.fromtimestamp(self.t0).isoformat(),
+            'pid': os.getpid(),
+            'phases': phases,
+            'open': still_open,
+            'totals': totals,
+        }
+
+    def write_json(self, path, **extra):
+        """
+        Write to_dict() (plus extra top-level keys) as JSON through a temporary file.
+
+        Returns:
+            str: The path written
+        """
+        data = self.to_dict()
+        data.update(extra)
+        with atomic_write(path, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True, default=str)
+        return path
+
+    def summary_lines(self):
+        """One line per finished phase, in start order."""
+        phases = self.to_dict()['phases']
+        width = max([len(record['name']) for record in phases] + [5])
+        lines = []
+        for record in phases:
+            peak = record['peak_rss_delta_bytes']
+            lines.append("  %-*s %8.2f s  wall %8.2f s  cpu %7.2f s  peak RSS +%s%s" % (
+                width, record['name'], record['start'], record['wall_seconds'], record['cpu_seconds'],
+                '?' if peak is None else '%.1f MB' % (peak / 1048576.0),
+                '  (%s)' % record['error'] if record['error'] else ''))
+        return lines
+
+    def log_summary(self):
+        logging.info("Launcher phases (start from launcher start):\n%s" % "\n".join(self.summary_lines()))
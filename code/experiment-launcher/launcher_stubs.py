@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Stand-ins for the rig modules the launcher imports, to run it off the rig.
+
+bonsai_experiment_launcher sources its configuration from mpeconfig (on first
+use) and manages the Bonsai process with the win32 modules. The launcher's
+users off the rig install replacements first:
+
+    repackage_sessions, benchmark_launcher   install_launcher_stubs()
+    simulation.py                            install_launcher_stubs(config, modules)
+                                             with the simulated rig's modules
+    tests                                    launcher = headless_launcher()
+
+Python 2.7 compatible.
+"""
+
+import os
+import sys
+import types
+import tempfile
+
+LAUNCHER_DIR = os.path.dirname(os.path.abspath(__file__))
+RIG_DATA_PATH = 'C:/ProgramData/AIBS_MPE/camstim/'
+WIN32_MODULES = ('win32job', 'win32api', 'win32con')
+
+
+def headless_config(root_datapath=RIG_DATA_PATH):
+    """camstim configuration with the sections the launcher reads and no backup folder."""
+    return {
+        'root_datapath': root_datapath,
+        'Behavior': {}, 'Encoder': {'radius_cm': 6.0}, 'Reward': {}, 'Licksensing': {},
+        'Sync': {}, 'Stim': {}, 'LIMS': {}, 'SweepStim': {'backupdir': None}, 'Display': {},
+        'Datastream': {}, 'DigitalEncoder': {'radius_cm': 6.0}, 'shared': {}
+    }
+
+
+def install_launcher_stubs(config=None, modules=None, replace=True):
+    """
+    Install mpeconfig and the win32 modules before the launcher is imported.
+
+    Args:
+        config (dict, optional): Configuration mpeconfig.source_configuration returns
+                                 (default: headless_config())
+        modules (dict, optional): Further modules by name (e.g. simulated win32 modules);
+                                  win32 modules not given are stubbed only when they cannot be imported
+        replace (bool): Replace an mpeconfig that is already installed
+    """
+    if replace or 'mpeconfig' not in sys.modules:
+        config = headless_config() if config is None else config
+        mpeconfig = types.ModuleType('mpeconfig')
+        mpeconfig.source_configuration = lambda name, send_start_log=False: dict(config)
+        sys.modules['mpeconfig'] = mpeconfig
+    modules = dict(modules or {})
+    for name in WIN32_MODULES:
+        if name in modules or name in sys.modules:
+            continue
+        try:
+            __import__(name)
+        except ImportError:
+            modules[name] = types.ModuleType(name)
+    sys.modules.update(modules)
+    if LAUNCHER_DIR not in sys.path:
+        sys.path.insert(0, LAUNCHER_DIR)
+
+
+def headless_launcher():
+    """
+    Import bonsai_experiment_launcher for tests, keeping rig modules already installed.
+
+    Returns:
+        module: bonsai_experiment_launcher
+    """
+    install_launcher_stubs(headless_config(tempfile.gettempdir()), replace=False)
+    import bonsai_experiment_launcher
+    return bonsai_experiment_launcher
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Hardware-timed execution of an opto-tagging protocol.
+
+run_optotagging's trial loop writes the digital lines, writes the scaled
+waveform and sleeps for the inter-stimulus interval, so the ISIs depend on OS
+scheduling and Python overhead. In 'buffered' mode the whole protocol is
+compiled instead into one analog buffer and one digital buffer, with the
+ISIs embedded as samples, and both are played by a single finite,
+sample-clocked write (the digital task runs on the analog sample clock):
+
+    [ lead-in | w0 * level0 | isi0 | w1 * level1 | isi1 | ... | end ]
+      sweep     sweep+stim    sweep  sweep+stim    sweep         off
+
+The digital buffer holds the states of the 8 port lines for every sample,
+shape (n_samples, 8) with 0/1 values (line 2: sweep, line 3: stimulus on):
+each row is what the trial loop passes to DigitalOutput.write, which takes
+one element per line. Each ISI runs from the end of a waveform to the onset
+of the next one and is rounded to whole samples.
+
+Python 2.7 compatible.
+"""
+
+import time
+import logging
+import datetime
+
+import numpy as np
+
+from opto_timing import perf_counter
+
+N_LINES = 8
+SWEEP_LINE = 2
+STIM_LINE = 3
+
+
+def compile_protocol(levels, conditions, waveforms, isis, sampleRate=10000., lead_in=5.0, tail_samples=1):
+    """
+    Compile a protocol to contiguous analog and digital sample buffers.
+
+    Args:
+        levels (list): Amplitude of each trial
+        conditions (list): Waveform index of each trial
+        waveforms (list): Waveform arrays
+        isis (list): Seconds from the end of each waveform to the next onset (or to the end)
+        sampleRate (float): Samples per second
+        lead_in (float): Seconds of sweep line before the first trial (the trial loop's 5 s sleep)
+        tail_samples (int): Samples with every line low at the end
+
+    Returns:
+        tuple: (analog float64 array, digital uint8 (n_samples, N_LINES) line states,
+                schedule dict with 'onset_samples', 'offset_samples', 'onset_times', 'duration')
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    conditions = np.asarray(conditions, dtype=np.int64)
+    isi_samples = np.round(np.asarray(isis, dtype=np.float64) * sampleRate).astype(np.int64)
+    lengths = np.array([len(waveforms[c]) for c in range(len(waveforms))], dtype=np.int64)
+    trial_samples = lengths[conditions] if len(conditions) else np.zeros(0, dtype=np.int64)
+    lead_samples = int(round(lead_in * sampleRate))
+    onsets = lead_samples + np.concatenate(([0], np.cumsum(trial_samples + isi_samples)[:-1])).astype(np.int64) \
+        if len(conditions) else np.zeros(0, dtype=np.int64)
+    offsets = onsets + trial_samples
+    n_samples = lead_samples + int((trial_samples + isi_samples).sum()) + int(tail_samples)
+
+    analog = np.zeros(n_samples, dtype=np.float64)
+    digital = np.zeros((n_samples, N_LINES), dtype=np.uint8)
+    digital[:n_samples - int(tail_samples), SWEEP_LINE] = 1
+    # One fancy-indexed assignment per waveform
+    for condition in np.unique(conditions).tolist():
+        trials = np.flatnonzero(conditions == condition)
+        waveform = np.asarray(waveforms[condition], dtype=np.float64)
+        index = onsets[trials][:, None] + np.arange(len(waveform))
+        analog[index] = levels[trials][:, None] * waveform
+        digital[index, STIM_LINE] = 1
+    schedule = {
+        'onset_samples': onsets,
+        'offset_samples': offsets,
+        'onset_times': onsets / float(sampleRate),
+        'duration': n_samples / float(sampleRate),
+    }
+    return analog, digital, schedule
+
+
+def run_buffered(levels, conditions, waveforms, isis, ao, do, sampleRate=10000., lead_in=5.0,
+                 clock_source='/Dev1/ao/SampleClock'):
+    """
+    Play a compiled protocol with one clocked write per task.
+
+    The digital task is started first and waits for the analog sample clock,
+    so both buffers start on the same sample.
+
+    Args:
+        ao, do: Analog and digital output tasks (toolbox.IO.nidaq or simulated_nidaq)
+        clock_source (str): Terminal of the analog sample clock
+
+    Returns:
+        dict: The protocol schedule (see compile_protocol), with 'write_seconds'
+              (time spent writing the buffers) and 'started' (wall-clock start)
+    """
+    analog, digital, schedule = compile_protocol(levels, conditions, waveforms, isis, sampleRate, lead_in)
+    n_samples = len(analog)
+    logging.info("Opto protocol compiled: %d trials, %d samples (%.1f s)" % (
+        len(schedule['onset_samples']), n_samples, schedule['duration']))
+    ao.cfg_sample_clock(sampleRate, mode='finite', buffer_size=n_samples)
+    do.cfg_sample_clock(sampleRate, source=clock_source, mode='finite', buffer_size=n_samples)
+    write_start = perf_counter()
+    do.write(digital)
+    ao.write(analog)
+    schedule['write_seconds'] = perf_counter() - write_start
+    do.start()
+    ao.start()
+    schedule['started'] = datetime.datetime.now()
+    try:
+        timeout = schedule['duration'] + 10.0
+        if hasattr(ao, 'wait_until_done'):
+            ao.wait_until_done(timeout)
+            do.wait_until_done(timeout)
+        else:
+            time.sleep(schedule['duration'])
+    finally:
+        do.clear()
+        ao.clear()
+    return schedule
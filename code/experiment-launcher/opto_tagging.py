@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Optional end-of-session optogenetic tagging.
+
+Imported by bonsai_experiment_launcher only when opto-tagging is enabled
+('disable_opto': false), so launcher start-up does not pay for it. The NI-DAQ
+toolbox is imported only when the stimulation runs.
+
+Waveforms come from the cached bank of opto_waveforms: they are loaded
+memory-mapped from 'waveform_cache_dir' instead of being rebuilt before every
+stimulation (built in memory when no cache directory is given).
+
+Every run is timed (see opto_timing): the measured write times and their
+jitter statistics are added to the .opto.pkl as 'opto_timing' after the
+stimulation.
+
+execution_mode='buffered' plays the whole protocol as one hardware-timed
+write (see opto_protocol) instead of the per-trial loop; simulate=True uses
+the stand-in devices of simulated_nidaq instead of the NI-DAQ.
+
+Python 2.7 compatible.
+"""
+
+import os
+import time
+import datetime
+
+import numpy as np
+import pickle as pkl
+
+from atomic_file import atomic_write
+from opto_waveforms import WaveformBank, pulse_train
+from opto_timing import perf_counter, trial_stamps, trial_timing, buffered_timing, log_lines
+
+
+def open_devices(simulate=False):
+    """Analog (Dev1/ao1) and digital (Dev1 port 2) output tasks, real or simulated."""
+    if simulate:
+        from simulated_nidaq import SimulatedAnalogOutput as AnalogOutput
+        from simulated_nidaq import SimulatedDigitalOutput as DigitalOutput
+    else:
+        from toolbox.IO.nidaq import AnalogOutput
+        from toolbox.IO.nidaq import DigitalOutput
+    return AnalogOutput('Dev1', channels=[1]), DigitalOutput('Dev1', 2)
+
+
+def run_optotagging(levels, conditions, waveforms, isis, sampleRate = 10000., execution_mode='trials',
+                    simulate=False, devices=None, lead_in=5.0):
+
+    ao, do = devices or open_devices(simulate)
+
+    if execution_mode == 'buffered':
+        from opto_protocol import run_buffered
+        schedule = run_buffered(levels, conditions, waveforms, isis, ao, do, sampleRate, lead_in)
+        return buffered_timing(schedule, conditions, waveforms, isis, sampleRate,
+                               schedule['write_seconds'], schedule['started'])
+
+    sweep_on = np.array([0,0,1,0,0,0,0,0], dtype=np.uint8)
+    stim_on = np.array([0,0,1,1,0,0,0,0], dtype=np.uint8)
+    stim_off = np.array([0,0,1,0,0,0,0,0], dtype=np.uint8)
+    sweep_off = np.array([0,0,0,0,0,0,0,0], dtype=np.uint8)
+
+    ao.cfg_sample_clock(sampleRate)
+
+    do.start()
+    ao.start()
+
+    # Measured time of every write, from the sweep-on write (see opto_timing)
+    stamps = trial_stamps(len(levels))
+    started = datetime.datetime.now()
+    t0 = perf_counter()
+
+    do.write(sweep_on)
+    time.sleep(lead_in)
+
+    for i, level in enumerate(levels):
+
+        print(level)
+
+        data = waveforms[conditions[i]]
+
+        stamps[i, 0] = perf_counter() - t0
+        do.write(stim_on)
+        stamps[i, 1] = perf_counter() - t0
+        ao.write(data * level)
+        stamps[i, 2] = perf_counter() - t0
+        do.write(stim_off)
+        stamps[i, 3] = perf_counter() - t0
+        time.sleep(isis[i])
+
+    sweep_off_time = perf_counter() - t0
+    do.write(sweep_off)
+    do.clear()
+    ao.clear()
+
+    return trial_timing(stamps, conditions, waveforms, isis, sampleRate, sweep_off_time, started)
+
+def generatePulseTrain(pulseWidth, pulseInterval, numRepeats, riseTime, sampleRate = 10000.):
+
+    return pulse_train(pulseWidth, pulseInterval, numRepeats, riseTime, sampleRate)
+
+def optotagging(mouse_id, operation_mode='experiment', level_list = [1.15, 1.28, 1.345], output_dir = 'C:/ProgramData/camstim/output/',
+                waveform_cache_dir=None, pulse_trains=None, condition_list=None, execution_mode='trials',
+                simulate=False):
+
+    sampleRate = 10000
+    bank = WaveformBank(waveform_cache_dir, sampleRate)
+
+    data_cosine = bank.standard('cosine_1s')  # 1 s raised cosine
+    data_2ms_10Hz = bank.standard('2ms_10Hz')  # 1 ms cosine ramp around each pulse
+    data_5ms = bank.standard('5ms')
+    data_10ms = bank.standard('10ms')
+    data_10s = bank.standard('10s')
+
+    ##### THESE STIMULI ADDED FOR OPENSCOPE GLO PROJECT #####
+    data_10ms_5Hz = bank.standard('10ms_5Hz') # 1 second of 5Hz pulse train. Each pulse is 10 ms wide
+    data_6ms_40Hz = bank.standard('6ms_40Hz')  # 1 second of 40 Hz pulse train. Each pulse is 6 ms wide
+    #########################################################
+
+    # Extra pulse trains from the opto params, [pulseWidth, pulseInterval, numRepeats, riseTime] each,
+    # are waveforms 6, 7, ... (selected through condition_list)
+    extra_trains = [bank.pulse_train(*train) for train in (pulse_trains or [])]
+
+    # for experiment
+
+    isi = 1.5
+    isi_rand = 0.5
+    numRepeats = 50
+
+    condition_list = condition_list or [3, 4, 5]
+    waveforms = [data_2ms_10Hz, data_5ms, data_10ms, data_cosine, data_10ms_5Hz, data_6ms_40Hz] + extra_trains
+
+    opto_levels = np.array(level_list*numRepeats*len(condition_list)) #     BLUE
+    opto_conditions = condition_list*numRepeats*len(level_list)
+    opto_conditions = np.sort(opto_conditions)
+    opto_isis = np.random.random(opto_levels.shape) * isi_rand + isi
+
+    p = np.random.permutation(len(opto_levels))
+
+    # implement shuffle?
+    opto_levels = opto_levels[p]
+    opto_conditions = opto_conditions[p]
+
+    # for testing
+
+    if operation_mode=='test_levels':
+        isi = 2.0
+        isi_rand = 0.0
+
+        numRepeats = 2
+
+        condition_list = [0]
+        waveforms = [data_10s, data_10s]
+
+        opto_levels = np.array(level_list*numRepeats*len(condition_list)) #     BLUE
+        opto_conditions = condition_list*numRepeats*len(level_list)
+        opto_conditions = np.sort(opto_conditions)
+        opto_isis = np.random.random(opto_levels.shape) * isi_rand + isi
+
+    elif operation_mode=='pretest':
+        numRepeats = 1
+
+        condition_list = [0]
+        data_2s = data_10s[-sampleRate*2:]
+        waveforms = [data_2s]
+
+        opto_levels = np.array(level_list*numRepeats*len(condition_list)) #     BLUE
+        opto_conditions = condition_list*numRepeats*len(level_list)
+        opto_conditions = np.sort(opto_conditions)
+        opto_isis = [1]*len(opto_conditions)
+    #
+
+    outputDirectory = output_dir
+    fileDate = str(datetime.datetime.now()).replace(':', '').replace(
+        '.', '').replace('-', '').replace(' ', '')[2:14]
+    fileName = os.path.join(outputDirectory, fileDate + '_'+mouse_id + '.opto.pkl')
+
+    print('saving info to: ' + fileName)
+    fl = open(fileName, 'wb')
+    output = {}
+
+    output['opto_levels'] = opto_levels
+    output['opto_conditions'] = opto_conditions
+    output['opto_ISIs'] = opto_isis
+    output['opto_waveforms'] = [np.asarray(waveform) for waveform in waveforms]
+    output['opto_execution_mode'] = execution_mode
+
+    pkl.dump(output, fl)
+    fl.close()
+    print('saved.')
+
+    #
+    timing = run_optotagging(opto_levels, opto_conditions,
+                             waveforms, opto_isis, float(sampleRate), execution_mode, simulate)
+
+    # Measured write times and jitter, added to the pkl saved before the stimulation
+    for line in log_lines(timing):
+        print(line)
+    output['opto_timing'] = timing
+    with atomic_write(fileName, 'wb') as fl:
+        pkl.dump(output, fl)
+    return timing
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Measured timing of opto-tagging protocols.
+
+run_optotagging stamps every trial of the trial loop with a high-resolution
+clock into a preallocated array, one row per trial:
+
+    stim_on    before the DO write that raises the stimulus line
+    ao_write   before the AO write of the scaled waveform
+    stim_off   before the DO write that lowers the stimulus line
+    done       after that write, when the ISI sleep starts
+
+Times are seconds from the sweep-on write. trial_timing() turns the stamps
+into the 'opto_timing' entry of the .opto.pkl, with jitter statistics of the
+write latencies, of the ISIs actually slept and of the onset intervals against
+the intended ones (waveform duration + ISI). buffered_timing() gives the same
+statistics for the hardware-timed mode of opto_protocol, where onsets are
+sample positions, so both modes can be compared.
+
+The clock is time.perf_counter; Python 2.7 has none, so time.clock
+(QueryPerformanceCounter) is used on Windows and time.time elsewhere.
+
+Python 2.7 compatible.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+try:
+    from time import perf_counter
+    CLOCK_NAME = 'perf_counter'
+except ImportError:
+    if sys.platform == 'win32':
+        perf_counter = time.clock
+        CLOCK_NAME = 'clock'
+    else:
+        perf_counter = time.time
+        CLOCK_NAME = 'time'
+
+TRIAL_STAMPS = ('stim_on', 'ao_write', 'stim_off', 'done')
+
+
+def trial_stamps(n_trials):
+    """Preallocated (n_trials, 4) array of trial timestamps (NaN until stamped)."""
+    stamps = np.empty((n_trials, len(TRIAL_STAMPS)), dtype=np.float64)
+    stamps[:] = np.nan
+    return stamps
+
+
+def summarize(values):
+    """Mean, standard deviation, extremes and 95th percentile of absolute values, in seconds."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'n': 0, 'mean': None, 'std': None, 'min': None, 'max': None, 'p95_abs': None}
+    return {'n': int(len(values)), 'mean': float(values.mean()), 'std': float(values.std()),
+            'min': float(values.min()), 'max': float(values.max()),
+            'p95_abs': float(np.percentile(np.abs(values), 95))}
+
+
+def _intended_intervals(conditions, waveforms, isis, sampleRate):
+    lengths = np.array([len(waveform) for waveform in waveforms], dtype=np.float64)
+    return lengths[np.asarray(conditions, dtype=np.int64)] / float(sampleRate) + np.asarray(isis, dtype=np.float64)
+
+
+def trial_timing(stamps, conditions, waveforms, isis, sampleRate, sweep_off=None, started=None):
+    """
+    Timing entry of a trial-loop run.
+
+    Args:
+        stamps (numpy.array): (n_trials, 4) timestamps (see TRIAL_STAMPS), seconds from sweep on
+        conditions, waveforms, isis: The protocol that was run
+        sampleRate (float): AO sample rate
+        sweep_off (float, optional): Time of the sweep-off write
+        started (datetime, optional): Wall-clock time of the sweep-on write
+
+    Returns:
+        dict: mode, clock, stamps, onset_times and jitter statistics
+    """
+    onsets = stamps[:, TRIAL_STAMPS.index('ao_write')]
+    isis = np.asarray(isis, dtype=np.float64)
+    stats = {
+        'stim_on_write': summarize(stamps[:, 1] - stamps[:, 0]),
+        'ao_write': summarize(stamps[:, 2] - stamps[:, 1]),
+        'stim_off_write': summarize(stamps[:, 3] - stamps[:, 2]),
+        'isi_error': summarize(stamps[1:, 0] - stamps[:-1, 3] - isis[:-1]),
+        'onset_interval_error': summarize(np.diff(onsets) -
+                                          _intended_intervals(conditions, waveforms, isis, sampleRate)[:-1]),
+    }
+    return {'mode': 'trials', 'clock': CLOCK_NAME, 'started': started, 'stamp_names': list(TRIAL_STAMPS),
+            'stamps': stamps, 'onset_times': onsets, 'sweep_off': sweep_off, 'stats': stats}
+
+
+def buffered_timing(schedule, conditions, waveforms, isis, sampleRate, write_seconds=None, started=None):
+    """
+    Timing entry of a hardware-timed run (see opto_protocol.compile_protocol).
+
+    Onsets are the sample positions of the compiled buffer, so the errors only
+    reflect rounding the ISIs to whole samples.
+
+    Args:
+        schedule (dict): Schedule returned by compile_protocol/run_buffered
+        write_seconds (float, optional): Time spent writing the buffers to the tasks
+        started (datetime, optional): Wall-clock time the tasks were started
+    """
+    onsets = schedule['onset_times']
+    offsets = schedule['offset_samples'] / float(sampleRate)
+    isis = np.asarray(isis, dtype=np.float64)
+    stats = {
+        'buffer_write': summarize([] if write_seconds is None else [write_seconds]),
+        'isi_error': summarize(onsets[1:] - offsets[:-1] - isis[:-1]),
+        'onset_interval_error': summarize(np.diff(onsets) -
+                                          _intended_intervals(conditions, waveforms, isis, sampleRate)[:-1]),
+    }
+    return {'mode': 'buffered', 'clock': 'sample_clock', 'started': started, 'onset_times': onsets,
+            'duration': schedule['duration'], 'stats': stats}
+
+
+def log_lines(timing):
+    """Human-readable jitter summary (milliseconds)."""
+    lines = ["Opto timing (%s mode, %s clock):" % (timing['mode'], timing['clock'])]
+    for name, stat in sorted(timing['stats'].items()):
+        if stat['n']:
+            lines.append("  %-22s mean %8.3f ms  std %7.3f ms  max %8.3f ms  p95|x| %7.3f ms" % (
+                name, stat['mean'] * 1000, stat['std'] * 1000, stat['max'] * 1000, stat['p95_abs'] * 1000))
+    return lines
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+Cached bank of opto-tagging waveforms.
+
+optotagging() used to rebuild every waveform right before stimulation: the
+1 s raised cosine, the 2/5/10 ms cosine-ramped pulses, the 10 Hz train and the
+pulse trains of generatePulseTrain, which placed pulses in a Python loop.
+Here every waveform is built with array operations and saved as .npy in a
+cache directory, under a name derived from
+
+    (waveform name, sample rate, hash of its parameters and BANK_VERSION)
+
+and later sessions load it memory-mapped (read-only), so only the pages the
+DAQ writes are read. Pulse trains defined in the opto params are cached the
+same way. Bump BANK_VERSION when a waveform definition changes.
+
+The waveforms are identical, sample for sample, to the original definitions.
+
+Python 2.7 compatible.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from atomic_file import atomic_write
+
+BANK_VERSION = 1
+SAMPLE_RATE = 10000
+
+# Pulse trains added for the OpenScope GLO project: (pulseWidth, pulseInterval, numRepeats, riseTime)
+GLO_PULSE_TRAINS = {
+    '10ms_5Hz': (10, 200, 5, 1),  # 1 second of 5 Hz pulse train, each pulse 10 ms wide
+    '6ms_40Hz': (6, 25, 40, 1),  # 1 second of 40 Hz pulse train, each pulse 6 ms wide
+}
+
+
+def cosine_ramp(n_samples, period):
+    """Raised cosine (0 -> 1 -> 0) over n_samples, one cycle every period samples."""
+    return (((1 - np.cos(np.arange(n_samples, dtype=np.float64) * 2 * np.pi / period)) + 1) - 1) / 2
+
+
+def ramped_pulse(ramp_samples, peak_samples):
+    """A pulse of peak_samples ones between the two halves of a 10-sample-period cosine ramp."""
+    rise_and_fall = cosine_ramp(ramp_samples, 10)
+    half_length = int(rise_and_fall.size / 2)
+    return np.concatenate((rise_and_fall[:half_length], np.ones((peak_samples,)), rise_and_fall[half_length:]))
+
+
+def place_pulses(pulse, interval, num_repeats, n_samples):
+    """
+    Place num_repeats copies of pulse every interval samples in a zero buffer.
+
+    Raises:
+        ValueError: If a pulse does not fit in the buffer
+    """
+    data = np.zeros((int(n_samples),), dtype=np.float64)
+    if num_repeats <= 0 or not pulse.size:
+        return data
+    starts = np.arange(num_repeats, dtype=np.int64) * int(interval)
+    if starts[-1] + pulse.size > data.size:
+        raise ValueError("Pulse train of %d pulses every %d samples does not fit in %d samples" % (
+            num_repeats, interval, data.size))
+    # Later pulses win where pulses overlap, as with sequential slice assignment
+    if interval >= pulse.size:
+        data[(starts[:, None] + np.arange(pulse.size)).ravel()] = np.tile(pulse, num_repeats)
+    else:
+        for start in starts.tolist():
+            data[start:start + pulse.size] = pulse
+    return data
+
+
+def pulse_train(pulseWidth, pulseInterval, numRepeats, riseTime, sampleRate=SAMPLE_RATE):
+    """1 s of numRepeats cosine-ramped pulses (widths and times in ms), as generatePulseTrain."""
+    sampleRate = float(sampleRate)
+    pulse = ramped_pulse(sampleRate * riseTime / 1000., int(sampleRate * (pulseWidth - riseTime * 2) / 1000))
+    return place_pulses(pulse, int(pulseInterval * sampleRate / 1000.), numRepeats, int(sampleRate))
+
+
+def standard_waveform(name, sampleRate=SAMPLE_RATE):
+    """
+    Build one of the waveforms of the standard opto-tagging protocol.
+
+    Args:
+        name (str): 'cosine_1s', '2ms_10Hz', '5ms', '10ms', '10s', or a GLO_PULSE_TRAINS name
+        sampleRate (int): Samples per second
+
+    Returns:
+        numpy.array: float64 waveform
+    """
+    if name in GLO_PULSE_TRAINS:
+        return pulse_train(*GLO_PULSE_TRAINS[name], sampleRate=sampleRate)
+    if name == 'cosine_1s':
+        return cosine_ramp(sampleRate, sampleRate)
+    if name == '10s':
+        data = np.zeros((sampleRate * 10,), dtype=np.float64)
+        data[:-2] = 1
+        return data
+    # 1 ms cosine ramp around a (width - 1 ms) plateau
+    peak_ms = {'2ms_10Hz': 1, '5ms': 4, '10ms': 9}[name]
+    pulse = ramped_pulse(sampleRate * 0.001, int(sampleRate * 0.001 * peak_ms))
+    if name == '2ms_10Hz':
+        return place_pulses(pulse, int(sampleRate / 10), 10, sampleRate)
+    return place_pulses(pulse, sampleRate, 1, sampleRate)
+
+
+class WaveformBank(object):
+    """
+    Opto-tagging waveforms cached as .npy files and loaded memory-mapped.
+
+    Without a cache directory waveforms are built in memory on every call.
+
+    Args:
+        cache_dir (str, optional): Directory of the cached .npy files (created on first use)
+        sample_rate (int): Samples per second of every waveform
+    """
+
+    def __init__(self, cache_dir=None, sample_rate=SAMPLE_RATE):
+        self.cache_dir = cache_dir
+        self.sample_rate = int(sample_rate)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def entry_path(self, name, params):
+        """Cache file of a waveform for the bank's sample rate."""
+        key = json.dumps({'version': BANK_VERSION, 'name': name, 'params': params}, sort_keys=True)
+        return os.path.join(self.cache_dir, '%s_sr%d_%s.npy' % (
+            name, self.sample_rate, hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]))
+
+    def get(self, name, builder, params=None):
+        """
+        Return a cached waveform, building and caching it first if needed.
+
+        Args:
+            name (str): Waveform name (part of the file name)
+            builder (callable): Returns the waveform array when called without arguments
+            params (object, optional): JSON-serializable parameters that define the waveform
+
+        Returns:
+            numpy.array: The waveform (a read-only memory map when cached)
+        """
+        if not self.cache_dir:
+            return builder()
+        path = self.entry_path(name, params)
+        with self._lock:
+            if os.path.isfile(path):
+                try:
+                    waveform = np.load(path, mmap_mode='r')
+                    self.hits += 1
+                    return waveform
+                except (IOError, OSError, ValueError) as e:
+                    logging.warning("Rebuilding unreadable opto waveform %s: %s" % (path, e))
+            self.misses += 1
+            waveform = builder()
+            try:
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                with atomic_write(path, 'wb') as f:
+                    np.save(f, waveform)
+                return np.load(path, mmap_mode='r')
+            except (IOError, OSError) as e:
+                logging.warning("Could not cache opto waveform %s: %s" % (path, e))
+                return waveform
+
+    def standard(self, name):
+        """A waveform of the standard protocol (see standard_waveform)."""
+        return self.get(name, lambda: standard_waveform(name, self.sample_rate))
+
+    def pulse_train(self, pulseWidth, pulseInterval, numRepeats, riseTime):
+        """A 1 s pulse train (see pulse_train), cached by its parameters."""
+        params = [pulseWidth, pulseInterval, numRepeats, riseTime]
+        return self.get('pulse_train', lambda: pulse_train(pulseWidth, pulseInterval, numRepeats, riseTime,
+                                                           self.sample_rate), params)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Concurrent pre-flight setup for the Bonsai launcher.
+
+The launcher's setup steps (repository sync, Bonsai installation, session
+folder, stimulus table, workflow checksum) are registered with their
+dependencies and run as a graph on a small thread pool: every step starts as
+soon as the steps it requires have succeeded, so independent work overlaps
+(e.g. the session folder is created while git fetches, and the stimulus table
+is generated while setup.cmd runs).
+
+Steps return True on success, like the launcher's setup methods. A step that
+returns False or raises fails the pre-flight; steps depending on it are
+skipped, steps already running are allowed to finish.
+
+Each step's start offset and duration are kept (relative to a reference
+time, normally when the launcher was started) and logged as a breakdown:
+
+    Pre-flight timing (t=0 at launcher start):
+      repository          0.01 s ->   3.42 s   (3.41 s) ok
+      output_path         0.01 s ->   0.02 s   (0.01 s) ok
+      ...
+
+Python 2.7 compatible.
+"""
+
+import time
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class PreflightScheduler(object):
+    """
+    Run named setup steps as a dependency graph on a thread pool.
+
+    Args:
+        max_workers (int): Number of steps run at the same time (1 runs them in order)
+        t0 (float, optional): Reference time.time() of the timing breakdown (default: run() call)
+    """
+
+    def __init__(self, max_workers=4, t0=None):
+        self.max_workers = max(1, int(max_workers))
+        self.t0 = t0
+        self.steps = []
+        self.timings = {}
+        self._funcs = {}
+        self._requires = {}
+
+    def add(self, name, func, requires=()):
+        """
+        Register a step.
+
+        Args:
+            name (str): Step name (unique)
+            func (callable): Called without arguments; returns True on success
+            requires (tuple): Names of steps that must succeed first
+        """
+        if name in self._funcs:
+            raise ValueError("Duplicate pre-flight step '%s'" % name)
+        for required in requires:
+            if required not in self._funcs:
+                raise ValueError("Pre-flight step '%s' requires unknown step '%s'" % (name, required))
+        self.steps.append(name)
+        self._funcs[name] = func
+        self._requires[name] = tuple(requires)
+
+    def _run_step(self, name, done):
+        start = time.time()
+        try:
+            ok = bool(self._funcs[name]())
+            error = None
+        except Exception as e:
+            logging.exception("Pre-flight step '%s' failed: %s" % (name, e))
+            ok = False
+            error = str(e)
+        done.put((name, start, time.time(), ok, error))
+
+    def run(self):
+        """
+        Run every step once its requirements have succeeded.
+
+        Returns:
+            bool: True if all steps succeeded
+        """
+        if self.t0 is None:
+            self.t0 = time.time()
+        status = dict((name, 'pending') for name in self.steps)
+        done = queue.Queue()
+        running = 0
+        while True:
+            for name in self.steps:
+                if status[name] != 'pending':
+                    continue
+                required = [status[r] for r in self._requires[name]]
+                if any(s in ('failed', 'skipped') for s in required):
+                    status[name] = 'skipped'
+                    self.timings[name] = {'start': None, 'end': None, 'seconds': 0.0,
+                                          'status': 'skipped', 'error': None}
+                    logging.warning("Pre-flight step '%s' skipped" % name)
+                elif all(s == 'ok' for s in required) and running < self.max_workers:
+                    status[name] = 'running'
+                    running += 1
+                    thread = threading.Thread(target=self._run_step, args=(name, done),
+                                              name='preflight-%s' % name)
+                    thread.daemon = True
+                    thread.start()
+            if not running:
+                break
+            # Poll with a timeout so signal handlers still run on Python 2
+            while True:
+                try:
+                    name, start, end, ok, error = done.get(timeout=0.2)
+                    break
+                except queue.Empty:
+                    pass
+            running -= 1
+            status[name] = 'ok' if ok else 'failed'
+            self.timings[name] = {'start': start - self.t0, 'end': end - self.t0, 'seconds': end - start,
+                                  'status': status[name], 'error': error}
+        return all(status[name] == 'ok' for name in self.steps)
+
+    def failed_steps(self):
+        """Names of the steps that failed (not those skipped because of them)."""
+        return [name for name in self.steps if self.timings.get(name, {}).get('status') == 'failed']
+
+    def summary_lines(self):
+        """Lines of the per-step timing breakdown, in the order steps were added."""
+        lines = []
+        width = max([len(name) for name in self.steps] + [4])
+        for name in self.steps:
+            timing = self.timings.get(name)
+            if timing is None:
+                continue
+            if timing['start'] is None:
+                lines.append("  %-*s %31s" % (width, name, timing['status']))
+                continue
+            lines.append("  %-*s %7.2f s -> %7.2f s  (%6.2f s) %s" % (
+                width, name, timing['start'], timing['end'], timing['seconds'], timing['status']))
+        ran = [t for t in self.timings.values() if t['start'] is not None]
+        if ran:
+            wall = max(t['end'] for t in ran) - min(t['start'] for t in ran)
+            lines.append("  %-*s %7.2f s wall, %.2f s of step time" % (
+                width, 'total', wall, sum(t['seconds'] for t in ran)))
+        return lines
+
+    def log_summary(self):
+        logging.info("Pre-flight timing (t=0 at launcher start):\n%s" % "\n".join(self.summary_lines()))
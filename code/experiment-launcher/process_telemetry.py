@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+Memory and CPU telemetry of the Bonsai process tree.
+
+ProcessTreeMonitor samples the Bonsai process and all of its children at a
+fixed rate and keeps the samples in a preallocated ring buffer:
+
+    time         float64  seconds since monitoring started
+    rss          int64    resident memory of the whole tree (bytes)
+    cpu_percent  float32  CPU use of the whole tree (100 = one core)
+    num_threads  int32    threads in the tree
+    num_handles  int32    Windows handles (open file descriptors elsewhere)
+    num_procs    int16    processes in the tree
+
+to_dict() returns the samples in chronological order as numpy arrays, compact
+enough to store in the session pkl next to the frame intervals, so memory
+pressure can be lined up with dropped frames.
+
+The kill policy reports the tree as runaway when any enabled rule triggers:
+
+    max_system_memory_rise  system memory use (percent) rose by more than this
+                            over its level before launch (camstim's rule)
+    max_memory_percent      the tree uses more than this share of physical memory
+    max_growth_mb_per_min   the tree's RSS grows faster than this over the last
+                            growth_window seconds (least-squares slope); samples
+                            of the first growth_warmup seconds are ignored, so
+                            the startup and movie preloads do not count
+
+Python 2.7 compatible.
+"""
+
+import time
+import logging
+
+import numpy as np
+import psutil
+
+TELEMETRY_FORMAT = 'telemetry-v1'
+
+TELEMETRY_FIELDS = [
+    ('time', np.float64),
+    ('rss', np.int64),
+    ('cpu_percent', np.float32),
+    ('num_threads', np.int32),
+    ('num_handles', np.int32),
+    ('num_procs', np.int16),
+]
+
+
+class TelemetryRingBuffer(object):
+    """Fixed-size ring buffer with one preallocated array per telemetry field."""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self.arrays = dict((name, np.zeros(self.capacity, dtype=dtype)) for name, dtype in TELEMETRY_FIELDS)
+        self.n_written = 0
+
+    def __len__(self):
+        return min(self.n_written, self.capacity)
+
+    @property
+    def dropped(self):
+        """Number of oldest samples overwritten."""
+        return max(0, self.n_written - self.capacity)
+
+    def append(self, **values):
+        position = self.n_written % self.capacity
+        for name, _ in TELEMETRY_FIELDS:
+            self.arrays[name][position] = values.get(name, 0)
+        self.n_written += 1
+
+    def field(self, name):
+        """Samples of one field in chronological order."""
+        array = self.arrays[name]
+        if self.n_written <= self.capacity:
+            return array[:self.n_written].copy()
+        position = self.n_written % self.capacity
+        return np.concatenate((array[position:], array[:position]))
+
+    def latest(self, name):
+        """Most recent sample of one field."""
+        return self.arrays[name][(self.n_written - 1) % self.capacity]
+
+    def last(self, name, seconds):
+        """(time, values) of one field over the last seconds of samples."""
+        times = self.field('time')
+        values = self.field(name)
+        if not len(times):
+            return times, values
+        keep = times >= times[-1] - seconds
+        return times[keep], values[keep]
+
+
+class ProcessTreeMonitor(object):
+    """
+    Sample RSS, CPU, threads and handles of a process and its children.
+
+    Args:
+        pid (int): Root process (Bonsai)
+        interval (float): Seconds between samples
+        capacity (int): Samples kept; the oldest are overwritten
+        growth_window (float): Seconds of history used for the RSS growth rate
+        max_growth_mb_per_min (float): Growth rate above which the tree is runaway (None to disable)
+        max_memory_percent (float): Share of physical memory above which the tree is runaway (None to disable)
+        growth_warmup (float): Seconds after the start of monitoring left out of the growth rate
+        max_system_memory_rise (float): Rise of system memory use (percent) over system_memory_baseline
+            above which the tree is runaway (None to disable)
+        system_memory_baseline (float, optional): System memory use (percent) before launch (default: now)
+    """
+
+    def __init__(self, pid, interval=0.5, capacity=14400, growth_window=60.0,
+                 max_growth_mb_per_min=None, max_memory_percent=None, growth_warmup=0.0,
+                 max_system_memory_rise=None, system_memory_baseline=None):
+        self.pid = pid
+        self.interval = interval
+        self.growth_window = growth_window
+        self.growth_warmup = growth_warmup
+        self.max_growth_mb_per_min = max_growth_mb_per_min
+        self.max_memory_percent = max_memory_percent
+        self.max_system_memory_rise = max_system_memory_rise
+        if system_memory_baseline is None:
+            system_memory_baseline = psutil.virtual_memory().percent
+        self.system_memory_baseline = float(system_memory_baseline)
+        self.buffer = TelemetryRingBuffer(capacity)
+        self.start_time = time.time()
+        self.kill_reason = None
+        self._processes = {}
+        self._total_memory = psutil.virtual_memory().total
+
+    def _tree(self):
+        """Processes of the tree, reusing Process objects so cpu_percent has a previous sample."""
+        root = self._processes.get(self.pid)
+        if root is None:
+            root = psutil.Process(self.pid)
+            root.cpu_percent(None)
+        tree = {self.pid: root}
+        try:
+            children = root.children(recursive=True)
+        except psutil.Error:
+            children = []
+        for child in children:
+            process = self._processes.get(child.pid, child)
+            if process is child:
+                try:
+                    child.cpu_percent(None)
+                except psutil.Error:
+                    continue
+            tree[child.pid] = process
+        self._processes = tree
+        return tree
+
+    def sample(self):
+        """
+        Record one sample of the tree.
+
+        Returns:
+            bool: False if the root process is gone
+        """
+        try:
+            tree = self._tree()
+        except psutil.Error:
+            return False
+        rss = cpu = threads = handles = procs = 0
+        for process in tree.values():
+            try:
+                with process.oneshot():
+                    rss += process.memory_info().rss
+                    cpu += process.cpu_percent(None)
+                    threads += process.num_threads()
+                    if hasattr(process, 'num_handles'):
+                        handles += process.num_handles()
+                    elif hasattr(process, 'num_fds'):
+                        handles += process.num_fds()
+                procs += 1
+            except psutil.Error:
+                continue
+        if not procs:
+            return False
+        self.buffer.append(time=time.time() - self.start_time, rss=rss, cpu_percent=cpu,
+                           num_threads=threads, num_handles=handles, num_procs=procs)
+        return True
+
+    def growth_rate(self):
+        """
+        RSS growth of the tree in MB per minute over the growth window.
+
+        Returns:
+            float: Least-squares slope, or None until the window is covered (after the warm-up)
+        """
+        times, rss = self.buffer.last('rss', self.growth_window)
+        after_warmup = times >= self.growth_warmup
+        times, rss = times[after_warmup], rss[after_warmup]
+        if len(times) < 3 or times[-1] - times[0] < 0.9 * self.growth_window:
+            return None
+        slope = np.polyfit(times - times[0], rss.astype(np.float64), 1)[0]
+        return slope * 60.0 / (1024.0 * 1024.0)
+
+    def check_runaway(self):
+        """
+        Apply the kill policy to the latest samples.
+
+        Returns:
+            str: Reason the tree is considered runaway, or None
+        """
+        if not len(self.buffer):
+            return None
+        if self.max_system_memory_rise is not None:
+            percent = psutil.virtual_memory().percent
+            limit = self.system_memory_baseline + self.max_system_memory_rise
+            if percent > limit:
+                return "System memory use %.1f%% exceeds %.1f%% (%.1f%% before launch + %.1f%%)" % (
+                    percent, limit, self.system_memory_baseline, self.max_system_memory_rise)
+        if self.max_memory_percent is not None:
+            rss = self.buffer.latest('rss')
+            percent = 100.0 * rss / self._total_memory
+            if percent > self.max_memory_percent:
+                return "Bonsai uses %.1f%% of physical memory (limit %.1f%%)" % (percent, self.max_memory_percent)
+        if self.max_growth_mb_per_min is not None:
+            rate = self.growth_rate()
+            if rate is not None and rate > self.max_growth_mb_per_min:
+                return "Bonsai memory grows %.1f MB/min over %.0f s (limit %.1f MB/min)" % (
+                    rate, self.growth_window, self.max_growth_mb_per_min)
+        return None
+
+    def run(self, is_running, on_runaway=None):
+        """
+        Sample until is_running() returns False or the tree is runaway.
+
+        Args:
+            is_running (callable): Returns True while the process should be monitored
+            on_runaway (callable, optional): Called with the reason when the kill policy triggers
+        """
+        next_sample = time.time()
+        while is_running():
+            try:
+                if self.sample():
+                    reason = self.check_runaway()
+                    if reason:
+                        self.kill_reason = reason
+                        logging.warning("Detected runaway process: %s" % reason)
+                        if on_runaway:
+                            on_runaway(reason)
+                        break
+            except Exception as e:
+                logging.warning("Error sampling Bonsai process telemetry: %s" % e)
+            next_sample += self.interval
+            time.sleep(max(0.0, next_sample - time.time()))
+
+    def to_dict(self):
+        """Chronological samples and monitor settings for the session pkl."""
+        return {
+            'format': TELEMETRY_FORMAT,
+            'pid': self.pid,
+            'start_time': self.start_time,
+            'interval': self.interval,
+            'capacity': self.buffer.capacity,
+            'n_samples': len(self.buffer),
+            'dropped': self.buffer.dropped,
+            'growth_window': self.growth_window,
+            'growth_warmup': self.growth_warmup,
+            'max_growth_mb_per_min': self.max_growth_mb_per_min,
+            'max_memory_percent': self.max_memory_percent,
+            'max_system_memory_rise': self.max_system_memory_rise,
+            'system_memory_baseline': self.system_memory_baseline,
+            'kill_reason': self.kill_reason,
+            'fields': dict((name, self.buffer.field(name)) for name, _ in TELEMETRY_FIELDS),
+        }
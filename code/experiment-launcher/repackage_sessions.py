@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+"""
+Re-package archived Bonsai session folders into CAMSTIM-style pkl files.
+
+Finds every *_bonsai session folder under the given roots and runs
+BonsaiExperiment.save_output on it in a pool of worker processes. The params,
+config and mouse/user/session ids are taken from the session's original pkl
+when one is found in the folder, so the rebuilt pkl only differs by what the
+packaging code computes.
+
+A folder is skipped when the SHA-256 of its inputs (Bonsai CSV files, original
+pkl and packaging code) matches the previous run recorded in the manifest and
+its output still exists. Use --force to rebuild everything.
+
+The manifest (JSON) records, for every session: status (packaged, skipped or
+failed), input hash, input/output sizes, packaging time and the error, if any.
+
+Run (Python 2.7 env):
+    python repackage_sessions.py D:/archive/sessions --workers 8
+    python repackage_sessions.py D:/archive/sessions --output-dir D:/repackaged --force
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import datetime
+import traceback
+import multiprocessing
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from atomic_file import atomic_write
+from launcher_stubs import install_launcher_stubs
+
+LAUNCHER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Source files whose changes must trigger a re-package
+PACKAGING_SOURCES = ['bonsai_experiment_launcher.py', 'bonsai_logger.py', 'bonsai_tables.py', 'session_pickle.py',
+                     'session_arrays.py', 'launcher_profile.py']
+
+SESSION_SUFFIX = '_bonsai'
+OUTPUT_NAME = 'repackaged.pkl'
+MANIFEST_NAME = 'repackage_manifest.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# pkl files in a session folder that are not the original session pkl
+NON_SESSION_PKLS = (OUTPUT_NAME, 'dry_run.pkl')
+
+
+def find_session_folders(roots):
+    """
+    Find Bonsai session folders (named *_bonsai) under the given roots.
+
+    Args:
+        roots (list): Directories to search; a root may itself be a session folder
+
+    Returns:
+        list: Absolute session folder paths, sorted
+    """
+    folders = set()
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            if os.path.basename(os.path.normpath(dirpath)).endswith(SESSION_SUFFIX):
+                folders.add(os.path.abspath(dirpath))
+                # CSV files may sit in subfolders of the session folder
+                dirnames[:] = []
+    return sorted(folders)
+
+
+def find_session_inputs(session_folder):
+    """
+    List the files packaging reads from a session folder.
+
+    Returns:
+        tuple: (csv_files, reference_pkl) where csv_files are the Bonsai
+               orientations_*.csv files (sorted) and reference_pkl is the most
+               recent original session pkl, or None
+    """
+    csv_files = []
+    pkl_files = []
+    for dirpath, dirnames, filenames in os.walk(session_folder):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if name.startswith('orientations_') and name.endswith('.csv'):
+                csv_files.append(path)
+            elif (dirpath == session_folder and name.endswith('.pkl') and not name.endswith('.opto.pkl')
+                  and name not in NON_SESSION_PKLS):
+                pkl_files.append(path)
+    reference_pkl = max(pkl_files, key=os.path.getmtime) if pkl_files else None
+    return sorted(csv_files), reference_pkl
+
+
+def hash_files(paths, base_folder, digest=None):
+    """
+    Update a SHA-256 digest with the relative names and contents of files.
+
+    Returns:
+        hashlib object: The updated digest
+    """
+    digest = digest or hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, base_folder).replace('\\', '/').encode('utf-8'))
+        digest.update(str(os.path.getsize(path)).encode('ascii'))
+        with open(path, 'rb') as f:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            while chunk:
+                digest.update(chunk)
+                chunk = f.read(HASH_CHUNK_SIZE)
+    return digest
+
+
+def packaging_code_hash():
+    """SHA-256 of the packaging source files."""
+    paths = [os.path.join(LAUNCHER_DIR, name) for name in PACKAGING_SOURCES]
+    return hash_files([p for p in paths if os.path.isfile(p)], LAUNCHER_DIR).hexdigest()
+
+
+def output_path_for(session_folder, output_dir=None):
+    """Output pkl of a session: inside the folder, or <output_dir>/<folder name>.pkl."""
+    if output_dir:
+        return os.path.join(output_dir, os.path.basename(session_folder) + '.pkl')
+    return os.path.join(session_folder, OUTPUT_NAME)
+
+
+def _init_worker(log_level):
+    # The session config comes from the original session pkl, not from the
+    # machine doing the re-packaging, so mpeconfig is always replaced
+    install_launcher_stubs()
+    import bonsai_experiment_launcher
+    logging.getLogger().setLevel(log_level)
+
+
+def _disable_backups(experiment):
+    """Keep save_output from queuing copies of re-packaged files to the rig backup folders."""
+    for name in ('session_backup_dir', 'backup_bonsai_csvs'):
+        experiment.params.pop(name, None)
+    config = dict(experiment.config or {})
+    for section in ('SweepStim', 'sweepstim'):
+        if section in config:
+            config[section] = dict(config[section], backupdir=None)
+    experiment.config = config
+    experiment.custom_output_path = None
+
+
+def _restore_session_state(experiment, reference_pkl):
+    """Copy params, config and ids of the original session pkl onto the experiment (backups off)."""
+    with open(reference_pkl, 'rb') as f:
+        original = pickle.load(f)
+    experiment.params = dict(original.get('params') or {})
+    experiment.config = dict(original.get('config') or {})
+    _disable_backups(experiment)
+    experiment.mouse_id = original.get('mouse_id', '')
+    experiment.user_id = original.get('user_id', '')
+    experiment.session_uuid = original.get('session_uuid', experiment.session_uuid)
+    if isinstance(original.get('startdatetime'), datetime.datetime):
+        experiment.start_time = original['startdatetime']
+    # Provenance of the inputs used during the session, not of this machine's files
+    experiment.input_checksums = original.get('input_checksums')
+
+
+def package_session(task):
+    """
+    Re-package one session folder (runs in a worker process).
+
+    Args:
+        task (dict): session_folder, output_path, code_hash, previous_hash, force
+
+    Returns:
+        dict: Manifest entry for the session
+    """
+    start = time.time()
+    session_folder = task['session_folder']
+    output_path = task['output_path']
+    entry = {
+        'session_folder': session_folder,
+        'output_path': output_path,
+        'status': 'failed',
+        'input_hash': None,
+        'input_bytes': 0,
+        'output_bytes': 0,
+        'seconds': 0.0,
+        'error': None,
+        'finished': None,
+    }
+    try:
+        csv_files, reference_pkl = find_session_inputs(session_folder)
+        inputs = csv_files + ([reference_pkl] if reference_pkl else [])
+        entry['input_bytes'] = sum(os.path.getsize(p) for p in inputs)
+        digest = hashlib.sha256(task['code_hash'].encode('ascii'))
+        entry['input_hash'] = hash_files(inputs, session_folder, digest).hexdigest()
+
+        if (not task['force'] and entry['input_hash'] == task['previous_hash']
+                and os.path.isfile(output_path)):
+            entry['status'] = 'skipped'
+            entry['output_bytes'] = os.path.getsize(output_path)
+            return entry
+        if not any(os.path.basename(p).startswith('orientations_logger') for p in csv_files):
+            raise IOError("No orientations_logger*.csv in %s" % session_folder)
+
+        from bonsai_experiment_launcher import BonsaiExperiment
+        experiment = BonsaiExperiment()
+        experiment.session_folder = session_folder
+        experiment.start_time = datetime.datetime.fromtimestamp(os.path.getmtime(csv_files[0]))
+        if reference_pkl:
+            _restore_session_state(experiment, reference_pkl)
+        else:
+            _disable_backups(experiment)
+        # Avoid path lookups by leaving bonsai_path blank
+        experiment.params['bonsai_path'] = ''
+        experiment.params['output_path'] = output_path
+        experiment.session_output_path = output_path
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        # save_output renames the file instead of replacing an existing one
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+        experiment.save_output()
+        if experiment.output_path != output_path or not os.path.isfile(output_path):
+            raise IOError("save_output did not write %s" % output_path)
+        if experiment._backup_worker is not None:
+            # Should not happen with backups disabled; do not leave copies racing the pool
+            experiment.wait_for_backups()
+            raise IOError("save_output queued backups of %s" % session_folder)
+
+        entry['status'] = 'packaged'
+        entry['output_bytes'] = os.path.getsize(output_path)
+    except Exception as e:
+        entry['error'] = '%s: %s\n%s' % (type(e).__name__, e, traceback.format_exc())
+    finally:
+        entry['seconds'] = round(time.time() - start, 3)
+        entry['finished'] = datetime.datetime.now().isoformat()
+    return entry
+
+
+def load_manifest(manifest_path):
+    """Load a previous manifest (empty if missing or unreadable)."""
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest_path, manifest):
+    """Write the manifest through a temporary file (see atomic_file)."""
+    with atomic_write(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def repackage(roots, output_dir=None, workers=None, force=False, manifest_path=None, log_level=logging.WARNING):
+    """
+    Re-package all session folders found under roots.
+
+    Args:
+        roots (list): Directories to search for *_bonsai session folders
+        output_dir (str, optional): Folder for the rebuilt pkl files (default: inside each session folder)
+        workers (int, optional): Worker processes (default: number of CPUs)
+        force (bool): Rebuild sessions whose inputs did not change
+        manifest_path (str, optional): Manifest file (default: in output_dir, or the first root)
+        log_level (int): Logging level inside the workers
+
+    Returns:
+        dict: The manifest written
+    """
+    manifest_path = manifest_path or os.path.join(output_dir or roots[0], MANIFEST_NAME)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if not os.path.isdir(manifest_dir):
+        os.makedirs(manifest_dir)
+    previous = load_manifest(manifest_path).get('sessions', {})
+    code_hash = packaging_code_hash()
+
+    tasks = []
+    for session_folder in find_session_folders(roots):
+        tasks.append({
+            'session_folder': session_folder,
+            'output_path': output_path_for(session_folder, output_dir),
+            'code_hash': code_hash,
+            'previous_hash': previous.get(session_folder, {}).get('input_hash'),
+            'force': force,
+        })
+    logging.info("Found %d session folders" % len(tasks))
+
+    sessions = dict(previous)
+    start = time.time()
+    workers = max(1, min(workers or multiprocessing.cpu_count(), len(tasks) or 1))
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(log_level,))
+    try:
+        for entry in pool.imap_unordered(package_session, tasks):
+            sessions[entry['session_folder']] = entry
+            logging.info("%s %s (%.1f s)" % (entry['status'], entry['session_folder'], entry['seconds']))
+            if entry['error']:
+                logging.error("Failed to package %s: %s" % (entry['session_folder'], entry['error']))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    current = [sessions[t['session_folder']] for t in tasks]
+    summary = {
+        'roots': [os.path.abspath(r) for r in roots],
+        'code_hash': code_hash,
+        'workers': workers,
+        'seconds': round(time.time() - start, 3),
+        'finished': datetime.datetime.now().isoformat(),
+    }
+    for status in ('packaged', 'skipped', 'failed'):
+        summary[status] = sum(1 for e in current if e['status'] == status)
+    summary['output_bytes'] = sum(e['output_bytes'] for e in current)
+
+    manifest = {'summary': summary, 'sessions': sessions}
+    write_manifest(manifest_path, manifest)
+    logging.info("Packaged %d, skipped %d, failed %d session(s) in %.1f s; manifest: %s" % (
+        summary['packaged'], summary['skipped'], summary['failed'], summary['seconds'], manifest_path))
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-package archived Bonsai session folders')
+    parser.add_argument('roots', nargs='+', help='Folders to search for *_bonsai session folders')
+    parser.add_argument('--output-dir', default=None,
+                        help='Folder for the rebuilt pkl files (default: %s inside each session folder)' % OUTPUT_NAME)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true', help='Rebuild sessions whose inputs did not change')
+    parser.add_argument('--manifest', default=None, help='Manifest path (default: %s in the output folder)' % MANIFEST_NAME)
+    parser.add_argument('--verbose', action='store_true', help='Show the packaging log of every session')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    manifest = repackage(args.roots, args.output_dir, args.workers, args.force, args.manifest,
+                         logging.INFO if args.verbose else logging.WARNING)
+    return 1 if manifest['summary']['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+Compressed columnar companion file of a session pkl.
+
+save_output writes, next to <session>.pkl, a <session>.npz holding the typed
+arrays analysis tools need, so they can read a few columns without unpickling
+the whole session:
+
+    logger/Frame, logger/Timestamp, logger/Value          logger table (bonsai_tables)
+    orientations/<column>                                  orientations table
+    timing/frames, timing/timestamps                       frame table of the timing map
+    timing/stim_ids, timing/stim_start_frame, ...          StimStart/StimEnd timing per stimulus
+    timing/movie_ids, timing/movie_offsets, timing/movie_* per-movie-frame timing, concatenated
+    encoders/<i>/<name>                                    encoder arrays (dx, vsig, vin, ...)
+    stimuli/<i>/sweep_frames, .../sweep_table/<dimname>    per-block sweep tables
+
+Category columns hold int32 codes (-1 for None); their strings are in the
+"<name>.categories" dataset. Sweep frames are float64 with NaN for None.
+
+Every dataset is split along its first axis into chunks of chunk_rows rows,
+each a separate compressed member of the archive, and a JSON manifest
+("__meta__") records dtypes, shapes, chunk counts and group attributes. numpy
+only decompresses the members that are accessed, so SessionArrays reads the
+manifest on open and a row range only inflates the chunks it overlaps.
+
+Only depends on numpy (like bonsai_tables). Python 2.7 compatible.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from atomic_file import atomic_write
+
+ARRAYS_FORMAT = 'session-arrays-v1'
+CHUNK_ROWS = 65536
+META_KEY = '__meta__'
+
+
+def companion_path(pkl_path):
+    """Path of the companion file of a session pkl."""
+    return os.path.splitext(pkl_path)[0] + '.npz'
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, type(u'')):
+        value = str(value)
+    return value.encode('utf-8')
+
+
+def _decode(value):
+    # Python 2 keeps byte strings, as csv.DictReader returned them
+    return value if str is bytes else value.decode('utf-8')
+
+
+def _jsonable(value):
+    """Convert numpy values and tuples in group attributes to JSON types."""
+    if isinstance(value, dict):
+        return dict((str(k), _jsonable(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+class SessionArraysWriter(object):
+    """
+    Collect datasets and group attributes, then write them as one compressed npz.
+
+    Args:
+        chunk_rows (int): Rows per compressed chunk
+    """
+
+    def __init__(self, chunk_rows=CHUNK_ROWS):
+        self.chunk_rows = int(chunk_rows)
+        self.datasets = {}
+        self.groups = {}
+        self._arrays = {}
+
+    def add(self, name, values, kind=None, **info):
+        """Add a numeric dataset (split into chunks when written)."""
+        values = np.asarray(values)
+        self._arrays[name] = values
+        entry = {'dtype': values.dtype.str, 'shape': list(values.shape), 'kind': kind or 'array'}
+        entry.update(info)
+        self.datasets[name] = entry
+
+    def add_strings(self, name, values):
+        """Add a list of strings (stored as UTF-8 bytes)."""
+        encoded = [_encode(v) for v in values]
+        self.add(name, np.array(encoded, dtype='S%d' % max([len(v) for v in encoded] + [1])), kind='strings')
+
+    def add_category(self, name, codes, categories):
+        """Add a category column: int32 codes plus its string table."""
+        self.add_strings(name + '.categories', categories)
+        self.add(name, np.asarray(codes, dtype=np.int32), kind='category', categories=name + '.categories')
+
+    def add_values(self, name, values):
+        """
+        Add a column of typed Python values (sweep table parameters).
+
+        All-int columns become int64, all-number columns float64, and anything
+        else (strings, None) a category column of the values' strings.
+        """
+        numbers = [v for v in values if isinstance(v, (int, float, np.number)) and not isinstance(v, bool)]
+        if len(numbers) == len(values) and values:
+            if all(isinstance(v, (int, np.integer)) for v in values):
+                self.add(name, np.array(values, dtype=np.int64), kind='int')
+            else:
+                self.add(name, np.array(values, dtype=np.float64), kind='float')
+            return
+        codes, categories, index = [], [], {}
+        for value in values:
+            if value is None:
+                codes.append(-1)
+                continue
+            text = value if isinstance(value, (bytes, type(u''))) else str(value)
+            if text not in index:
+                index[text] = len(categories)
+                categories.append(text)
+            codes.append(index[text])
+        self.add_category(name, codes, categories)
+
+    def add_table(self, group, table):
+        """Add a bonsai_tables columnar table as one dataset per column."""
+        self.groups[group] = {'fieldnames': list(table['fieldnames']), 'n_rows': table['n_rows']}
+        for field in table['fieldnames']:
+            column = table['columns'][field]
+            name = '%s/%s' % (group, field)
+            if column['type'] == 'category':
+                self.add_category(name, column['codes'], column['categories'])
+            else:
+                self.add(name, column['values'], kind=column['type'])
+
+    def set_attrs(self, group, **attrs):
+        self.groups.setdefault(group, {}).update(_jsonable(attrs))
+
+    def _members(self):
+        members = {}
+        for name, values in self._arrays.items():
+            n_rows = values.shape[0] if values.ndim else 1
+            n_chunks = max(1, (n_rows + self.chunk_rows - 1) // self.chunk_rows) if values.ndim else 1
+            self.datasets[name]['n_chunks'] = n_chunks
+            for k in range(n_chunks):
+                part = values[k * self.chunk_rows:(k + 1) * self.chunk_rows] if values.ndim else values
+                members['%s/%05d' % (name, k)] = part
+        meta = {'format': ARRAYS_FORMAT, 'chunk_rows': self.chunk_rows,
+                'datasets': self.datasets, 'groups': self.groups}
+        members[META_KEY] = np.frombuffer(json.dumps(meta, sort_keys=True).encode('utf-8'), dtype=np.uint8)
+        return members
+
+    def write(self, path):
+        """Write the archive (through a temporary file, see atomic_file)."""
+        members = self._members()
+        with atomic_write(path, 'wb') as f:
+            np.savez_compressed(f, **members)
+        return path
+
+
+def _add_timing_map(writer, timing_map):
+    frames, timestamps = timing_map.frames.items()
+    writer.add('timing/frames', frames.astype(np.int64))
+    writer.add('timing/timestamps', timestamps.astype(np.float64))
+    writer.add_strings('timing/stim_ids', timing_map.stim_ids)
+    for name in ('stim_start_frame', 'stim_start_timestamp', 'stim_end_frame', 'stim_end_timestamp'):
+        writer.add('timing/' + name, getattr(timing_map, name))
+    movie_ids = [stim_id for stim_id in timing_map.stim_ids if stim_id in timing_map.movies]
+    movies = [timing_map.movies[stim_id] for stim_id in movie_ids]
+    writer.add_strings('timing/movie_ids', movie_ids)
+    writer.add('timing/movie_offsets', np.cumsum([0] + [len(movie) for movie in movies]).astype(np.int64))
+    for name, dtype in (('index', np.int64), ('start_frame', np.int64), ('start_timestamp', np.float64),
+                        ('end_frame', np.int64), ('end_timestamp', np.float64)):
+        values = [np.asarray(getattr(movie, name), dtype=dtype) for movie in movies]
+        writer.add('timing/movie_' + name, np.concatenate(values) if values else np.zeros(0, dtype=dtype))
+    writer.set_attrs('timing', start=timing_map.start, end=timing_map.end)
+
+
+def _sweep_frames(sweep_frames):
+    return np.array([[np.nan if v is None else v for v in pair] for pair in sweep_frames],
+                    dtype=np.float64).reshape(-1, 2)
+
+
+def write_session_arrays(path, bonsai_raw_data=None, timing_map=None, encoders=None, stimuli=None,
+                         attrs=None, chunk_rows=CHUNK_ROWS):
+    """
+    Write the companion file of a session.
+
+    Args:
+        path (str): Output .npz path (see companion_path)
+        bonsai_raw_data (dict, optional): The pkl's 'bonsai' entry (columnar logger/orientations tables)
+        timing_map (TimingMap, optional): Timing map of the logger (see bonsai_logger)
+        encoders (list, optional): The pkl's items/foraging/encoders dictionaries
+        stimuli (list, optional): The pkl's stimulus objects
+        attrs (dict, optional): Session attributes stored in the manifest (mouse_id, session_uuid, ...)
+        chunk_rows (int): Rows per compressed chunk
+
+    Returns:
+        str: path
+    """
+    writer = SessionArraysWriter(chunk_rows)
+    writer.set_attrs('session', **(attrs or {}))
+    for group in ('logger', 'orientations'):
+        table = (bonsai_raw_data or {}).get(group)
+        if isinstance(table, dict) and 'columns' in table:
+            writer.add_table(group, table)
+    if timing_map is not None:
+        _add_timing_map(writer, timing_map)
+    for i, encoder in enumerate(encoders or []):
+        group = 'encoders/%d' % i
+        scalars = {}
+        for name, value in sorted(encoder.items()):
+            if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+                writer.add('%s/%s' % (group, name), value)
+            elif isinstance(value, (bool, int, float, np.number)):
+                scalars[name] = value
+        writer.set_attrs(group, **scalars)
+    for i, stimulus in enumerate(stimuli or []):
+        group = 'stimuli/%d' % i
+        dimnames = list(stimulus.get('dimnames', []))
+        writer.set_attrs(group, stim=stimulus.get('stim'), stim_path=stimulus.get('stim_path'), dimnames=dimnames,
+                         display_sequence=stimulus.get('display_sequence'),
+                         bonsai_display_sequence=stimulus.get('bonsai_display_sequence'))
+        writer.add(group + '/sweep_frames', _sweep_frames(stimulus.get('sweep_frames', [])))
+        if 'bonsai_sweep_frames' in stimulus:
+            writer.add(group + '/bonsai_sweep_frames', _sweep_frames(stimulus['bonsai_sweep_frames']))
+        writer.add(group + '/sweep_order', np.asarray(stimulus.get('sweep_order', []), dtype=np.int64))
+        sweep_table = stimulus.get('sweep_table', [])
+        for k, dimname in enumerate(dimnames):
+            writer.add_values('%s/sweep_table/%s' % (group, dimname), [row[k] for row in sweep_table])
+    return writer.write(path)
+
+
+class SessionArrays(object):
+    """
+    Lazy reader of a companion file.
+
+    Only the manifest is read on open; datasets are decompressed chunk by chunk
+    when read. Use as a context manager or call close().
+
+    Args:
+        path (str): The .npz file, or the session pkl next to it
+    """
+
+    def __init__(self, path):
+        if path.endswith('.pkl'):
+            path = companion_path(path)
+        self.path = path
+        self._npz = np.load(path, allow_pickle=False)
+        meta = json.loads(self._npz[META_KEY].tobytes().decode('utf-8'))
+        if meta.get('format') != ARRAYS_FORMAT:
+            raise ValueError("Unknown session arrays format in %s: %s" % (path, meta.get('format')))
+        self.chunk_rows = meta['chunk_rows']
+        self.datasets = meta['datasets']
+        self.groups = meta['groups']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._npz.close()
+
+    def __contains__(self, name):
+        return name in self.datasets
+
+    def names(self, group=None):
+        """Dataset names, or the names of the datasets directly in group."""
+        if group is None:
+            return sorted(self.datasets)
+        return sorted(name for name in self.datasets if name.rsplit('/', 1)[0] == group)
+
+    def attrs(self, group):
+        """Attributes of a group ({} if it has none)."""
+        return self.groups.get(group, {})
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def shape(self, name):
+        return tuple(self.datasets[name]['shape'])
+
+    def read(self, name, start=None, stop=None):
+        """
+        Read a dataset, or rows [start, stop) of it, inflating only the chunks needed.
+
+        Category columns are returned as their int32 codes (see strings()).
+        """
+        info = self.datasets[name]
+        if not info['shape']:
+            return self._npz['%s/%05d' % (name, 0)]
+        start, stop, _ = slice(start, stop).indices(info['shape'][0])
+        if stop <= start:
+            return np.zeros((0,) + tuple(info['shape'][1:]), dtype=np.dtype(info['dtype']))
+        first, last = start // self.chunk_rows, (stop - 1) // self.chunk_rows
+        parts = [self._npz['%s/%05d' % (name, k)] for k in range(first, last + 1)]
+        values = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        offset = first * self.chunk_rows
+        return values[start - offset:stop - offset]
+
+    __getitem__ = read
+
+    def strings(self, name, start=None, stop=None):
+        """Read a category or string dataset as a list of strings (None for missing values)."""
+        info = self.datasets[name]
+        if info['kind'] == 'strings':
+            return [_decode(v) for v in self.read(name, start, stop).tolist()]
+        codes = self.read(name, start, stop)
+        used = codes[codes >= 0]
+        if not len(used):
+            return [None] * len(codes)
+        # Only the part of the string table these codes refer to
+        low, high = int(used.min()), int(used.max()) + 1
+        categories = [_decode(v) for v in self.read(info['categories'], low, high).tolist()]
+        return [categories[c - low] if c >= 0 else None for c in codes.tolist()]
+
+    def column(self, name, start=None, stop=None):
+        """Read a column in its natural form: numpy array, or list of strings for categories."""
+        if self.datasets[name]['kind'] in ('category', 'strings'):
+            return self.strings(name, start, stop)
+        return self.read(name, start, stop)
+
+    def group(self, group, start=None, stop=None):
+        """Read the datasets directly in a group as {basename: column}."""
+        return dict((name.rsplit('/', 1)[1], self.column(name, start, stop))
+                    for name in self.names(group) if not name.endswith('.categories'))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Single-pass writer for CAMSTIM-style session pkl files.
+
+CAMSTIM's wecanpicklethat() pickles every top-level value once only to test that
+it pickles, and the session dictionary is then pickled a second time to disk.
+Here values are screened by type without serializing them, and the file is
+written once, one top-level key at a time, so the bytes and time spent on each
+key can be reported.
+
+The file is a regular pickle of a dict. Every top-level value is serialized by
+cPickle on its own and the pieces are joined with the dict opcodes, so
+pickle.load() returns the same dictionary as before. Objects shared between two
+top-level values are written once per value.
+
+Python 2.7 compatible (also imports under Python 3).
+"""
+
+import time
+import types
+import logging
+import datetime
+
+import numpy as np
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Highest protocol readable by CAMSTIM/mtrain tools running Python 2.7
+PICKLE_PROTOCOL = 2
+
+_PROTO = b'\x80'
+_SETITEM = b's'
+_STOP = b'.'
+
+try:
+    _SCALAR_TYPES = (type(None), bool, int, long, float, complex, str, unicode)
+except NameError:
+    _SCALAR_TYPES = (type(None), bool, int, float, complex, str, bytes)
+_SCALAR_TYPES += (datetime.datetime, datetime.date, datetime.time, datetime.timedelta, np.generic, np.dtype)
+_CONTAINER_TYPES = (list, tuple, set, frozenset)
+
+
+def is_pickleable(value):
+    """
+    Check that a value can be pickled, by type and without serializing it.
+
+    Builtin scalars, strings, dates, numpy scalars and numeric arrays are
+    accepted as is; containers and object arrays are screened recursively. Values
+    of any other type are test-pickled on their own, as CAMSTIM did.
+
+    Args:
+        value: Value to check
+
+    Returns:
+        bool: True if pickle.dumps(value) is expected to succeed
+    """
+    stack = [value]
+    seen = set()
+    while stack:
+        item = stack.pop()
+        item_type = type(item)
+        if item_type in _SCALAR_TYPES or isinstance(item, _SCALAR_TYPES):
+            continue
+        if isinstance(item, (dict, np.ndarray) + _CONTAINER_TYPES):
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            if isinstance(item, dict):
+                stack.extend(item.keys())
+                stack.extend(item.values())
+            elif isinstance(item, np.ndarray):
+                if item.dtype.hasobject:
+                    stack.extend(item.ravel().tolist())
+            else:
+                stack.extend(item)
+            continue
+        if isinstance(item, (types.GeneratorType, types.ModuleType)):
+            return False
+        try:
+            pickle.dumps(item, PICKLE_PROTOCOL)
+        except Exception:
+            return False
+    return True
+
+
+def wecanpicklethat(datadict):
+    """
+    Input is a dictionary.
+        Screens every item by type. If it doesn't pickle it is discarded
+        and its key is added to the output as "unpickleable"
+
+    Same contract as CAMSTIM's wecanpicklethat function.
+    """
+    pickleable = {}
+    unpickleable = []
+    for k, v in datadict.items():
+        try:
+            if k[0] == "_":  # we don't want private counters and such
+                continue
+        except Exception:
+            # Empty or non-string keys, listed like values that do not pickle
+            unpickleable.append(k)
+            continue
+        if is_pickleable(v):
+            pickleable[k] = v
+        else:
+            unpickleable.append(k)
+    pickleable['unpickleable'] = unpickleable
+    return pickleable
+
+
+def _pickle_body(value):
+    """Pickle a value and strip the protocol header and STOP opcode."""
+    data = pickle.dumps(value, PICKLE_PROTOCOL)
+    if data[:1] == _PROTO:
+        data = data[2:]
+    return data[:-1]
+
+
+def dump_session(datadict, f):
+    """
+    Write a session dictionary to an open binary file in one pass.
+
+    Values that fail to pickle are left out and their keys are appended to the
+    'unpickleable' list, which is written last.
+
+    Args:
+        datadict (dict): Session dictionary, usually the output of wecanpicklethat()
+        f (file): File opened in binary mode
+
+    Returns:
+        list: (key, n_bytes, seconds) for every top-level key, in write order
+    """
+    report = []
+    unpickleable = list(datadict.get('unpickleable', []))
+    # Protocol header and EMPTY_DICT opcode
+    f.write(pickle.dumps({}, PICKLE_PROTOCOL)[:-1])
+    for key, value in datadict.items():
+        if key == 'unpickleable':
+            continue
+        start = time.time()
+        try:
+            body = _pickle_body(key) + _pickle_body(value) + _SETITEM
+        except Exception as e:
+            logging.warning("Could not pickle '%s': %s" % (key, e))
+            unpickleable.append(key)
+            continue
+        f.write(body)
+        report.append((key, len(body), time.time() - start))
+
+    start = time.time()
+    body = _pickle_body('unpickleable') + _pickle_body(unpickleable) + _SETITEM
+    f.write(body + _STOP)
+    report.append(('unpickleable', len(body), time.time() - start))
+    return report
+
+
+def log_report(report):
+    """Log the size and serialization time of every top-level key, largest first."""
+    total_bytes = sum(r[1] for r in report)
+    total_time = sum(r[2] for r in report)
+    logging.info("Session pkl: %d bytes written in %.2f s" % (total_bytes, total_time))
+    for key, n_bytes, seconds in sorted(report, key=lambda r: -r[1]):
+        logging.info("  %-20s %12d bytes %8.3f s" % (key, n_bytes, seconds))
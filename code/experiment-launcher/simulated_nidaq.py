@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Simulated stand-ins for toolbox.IO.nidaq AnalogOutput and DigitalOutput.
+
+They accept the calls the opto-tagging code makes (cfg_sample_clock, start,
+write, wait_until_done, stop, clear) and record them instead of driving an
+NI-DAQ, so protocols can be built and timed on a machine without the device
+or its drivers:
+
+    writes      (time.time() of the call, copy of the data) for every write
+    buffer      the data preloaded into a finite, sample-clocked task
+    clock       the last cfg_sample_clock arguments
+    events      ('start' | 'write' | 'stop' | 'clear', time) in call order
+
+With realtime=True a clocked task takes as long as its buffer would play:
+wait_until_done() returns len(buffer) / rate seconds after start().
+
+SimulatedDigitalOutput only accepts what DigitalOutput.write reads as line
+states: one 0/1 element per line of the port, as an (n_lines,) array for
+an on-demand write or an (n_samples, n_lines) array for a clocked buffer.
+Packed port values (one integer per sample) raise ValueError.
+
+Python 2.7 compatible.
+"""
+
+import time
+
+import numpy as np
+
+
+class SimulatedTask(object):
+    """Common part of the simulated output tasks."""
+
+    def __init__(self, device, realtime=False):
+        self.device = device
+        self.realtime = realtime
+        self.clock = None
+        self.buffer = None
+        self.writes = []
+        self.events = []
+        self.started_at = None
+        self.cleared = False
+
+    def _event(self, name):
+        if self.cleared:
+            raise RuntimeError("%s: task used after clear()" % self.device)
+        now = time.time()
+        self.events.append((name, now))
+        return now
+
+    def cfg_sample_clock(self, rate, source='', edge='rising', mode='continuous', buffer_size=1000):
+        self._event('cfg_sample_clock')
+        self.clock = {'rate': float(rate), 'source': source, 'edge': edge, 'mode': mode,
+                      'buffer_size': int(buffer_size)}
+
+    def start(self):
+        self.started_at = self._event('start')
+
+    def write(self, data):
+        now = self._event('write')
+        data = np.array(data, copy=True)
+        self.writes.append((now, data))
+        # Data written to a finite clocked task before start() is its buffer
+        if self.clock is not None and self.clock['mode'] == 'finite' and self.started_at is None:
+            if len(data) > self.clock['buffer_size']:
+                raise ValueError("%s: %d samples written to a %d sample buffer" % (
+                    self.device, len(data), self.clock['buffer_size']))
+            self.buffer = data
+        return len(data)
+
+    @property
+    def duration(self):
+        """Seconds the preloaded buffer plays at the configured sample rate."""
+        if self.buffer is None or self.clock is None:
+            return 0.0
+        return len(self.buffer) / self.clock['rate']
+
+    def wait_until_done(self, timeout=10.0):
+        if self.started_at is None:
+            raise RuntimeError("%s: wait_until_done() before start()" % self.device)
+        if self.realtime:
+            remaining = self.started_at + self.duration - time.time()
+            if remaining > timeout:
+                raise RuntimeError("%s: not done within %.1f s" % (self.device, timeout))
+            if remaining > 0:
+                time.sleep(remaining)
+        self._event('done')
+
+    def stop(self):
+        self._event('stop')
+
+    def clear(self):
+        self._event('clear')
+        self.cleared = True
+
+
+class SimulatedAnalogOutput(SimulatedTask):
+    """Stand-in for toolbox.IO.nidaq.AnalogOutput(device, channels=[...])."""
+
+    def __init__(self, device, channels=(0,), realtime=False, **kwargs):
+        SimulatedTask.__init__(self, device, realtime)
+        self.channels = list(channels)
+
+
+class SimulatedDigitalOutput(SimulatedTask):
+    """Stand-in for toolbox.IO.nidaq.DigitalOutput(device, port)."""
+
+    def __init__(self, device, port=0, realtime=False, n_lines=8, **kwargs):
+        SimulatedTask.__init__(self, device, realtime)
+        self.port = port
+        self.n_lines = n_lines
+
+    def write(self, data):
+        data = np.asarray(data)
+        if data.ndim not in (1, 2) or data.shape[-1] != self.n_lines:
+            raise ValueError("%s port %s: expected %d line states per sample, got shape %s" % (
+                self.device, self.port, self.n_lines, data.shape))
+        if not ((data == 0) | (data == 1)).all():
+            raise ValueError("%s port %s: line states must be 0 or 1" % (self.device, self.port))
+        return SimulatedTask.write(self, data)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+"""
+Hardware-free simulation of the rig the launcher runs on.
+
+BonsaiExperiment(simulate=True) (or "bonsai_experiment_launcher.py --simulate")
+runs the whole pipeline - pre-flight, stimulus table generation, Bonsai
+monitoring, packaging, opto-tagging and backups - on a machine without the
+rig software. Four pieces are simulated:
+
+    mpeconfig       source_configuration() returns a rig configuration rooted
+                    at the simulation folder, with a backup folder
+    win32job/api    job objects that record the processes assigned to them and
+                    kill them when closed (at exit, like KILL_ON_JOB_CLOSE)
+    camstim         camstim.misc.get_config and camstim.zro.agent.OUTPUT_DIR;
+                    opto-tagging plays on simulated_nidaq devices
+    Bonsai.exe      this script: it reads the generated stimulus table and
+                    writes orientations_orientations/logger CSVs as the
+                    trials are shown, at --speedup times real time
+
+The repository step stages code/stimulus-control/src of this checkout into
+the simulation folder instead of cloning it. The running_phases recordings
+are not in the repository; when there are none, a synthetic phase trace is
+written so open loop blocks can be generated.
+
+The simulation folder is $CAMSTIM_SIMULATION_ROOT, default
+<temp>/camstim_simulation. Sessions go to <folder>/data, backups to
+<folder>/backup, opto-tagging pkls to <folder>/output.
+
+Run:
+    python bonsai_experiment_launcher.py params.json --simulate --speedup 140
+    python simulation.py <workflow> --start --property RootFolder=<session folder>
+        --property stimulus_table_path=<table> --speedup 140
+
+Python 2.7 compatible.
+"""
+
+import os
+import sys
+import csv
+import math
+import time
+import types
+import atexit
+import random
+import shutil
+import logging
+import argparse
+import datetime
+import tempfile
+
+from launcher_stubs import install_launcher_stubs
+
+LAUNCHER_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(LAUNCHER_DIR))
+REPOSITORY_NAME = 'openscope-community-predictive-processing'
+STIMULUS_SOURCE = os.path.join('code', 'stimulus-control', 'src')
+PHASES_DIR = os.path.join(STIMULUS_SOURCE, 'Mindscope', 'running_phases')
+
+# The fake Bonsai executable (this file, not its .pyc)
+FAKE_BONSAI = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+# A 70 minute session in 30 s
+DEFAULT_SPEEDUP = 140.0
+
+SIMULATED_MODULES = ('mpeconfig', 'win32job', 'win32api', 'win32con',
+                     'camstim', 'camstim.misc', 'camstim.zro', 'camstim.zro.agent')
+
+JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE = 0x2000
+_jobs = []
+
+
+def simulation_root(root=None):
+    """Simulation folder: root, $CAMSTIM_SIMULATION_ROOT or <temp>/camstim_simulation."""
+    return os.path.abspath(root or os.environ.get('CAMSTIM_SIMULATION_ROOT') or
+                           os.path.join(tempfile.gettempdir(), 'camstim_simulation'))
+
+
+def simulated_config(root):
+    """camstim configuration of the simulated rig."""
+    return {
+        'root_datapath': root,
+        'Behavior': {'mouse_id': 'sim_mouse', 'user_id': 'simulation'},
+        'Encoder': {'radius_cm': 6.0}, 'Reward': {}, 'Licksensing': {},
+        'Sync': {'acq_on_pulse': ('Dev1', 1, 4), 'frame_pulse': ('Dev1', 1, 7), 'sync_sqr': True},
+        'Stim': {}, 'LIMS': {},
+        'SweepStim': {'backupdir': os.path.join(root, 'backup')},
+        'Display': {}, 'Datastream': {},
+        'DigitalEncoder': {'radius_cm': 6.0, 'serial_device': 'COM6'},
+        'Optogenetics': {'level_list': [1.15, 1.28, 1.345]},
+        'shared': {},
+    }
+
+
+class SimulatedJobObject(object):
+    """Job object that records the processes assigned to it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.pids = []
+        self.closed = False
+        self.info = {'BasicLimitInformation': {'LimitFlags': 0}}
+
+    def close(self):
+        """Close the job; with KILL_ON_JOB_CLOSE, kill the processes still running."""
+        if self.closed:
+            return
+        self.closed = True
+        if not self.info['BasicLimitInformation']['LimitFlags'] & JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE:
+            return
+        import psutil
+        for pid in self.pids:
+            try:
+                psutil.Process(pid).kill()
+                logging.info("Simulated job object %s killed process %s" % (self.name, pid))
+            except psutil.Error:
+                pass
+
+
+class SimulatedProcessHandle(object):
+    """Handle returned by the simulated win32api.OpenProcess."""
+
+    def __init__(self, pid, access):
+        self.pid = pid
+        self.access = access
+
+
+def _close_jobs():
+    for job in _jobs:
+        job.close()
+
+
+def _win32_modules():
+    win32con = types.ModuleType('win32con')
+    win32con.PROCESS_TERMINATE = 0x0001
+    win32con.PROCESS_SET_QUOTA = 0x0100
+
+    win32api = types.ModuleType('win32api')
+    win32api.OpenProcess = lambda access, inherit, pid: SimulatedProcessHandle(pid, access)
+
+    def close_handle(handle):
+        if isinstance(handle, SimulatedJobObject):
+            handle.close()
+    win32api.CloseHandle = close_handle
+
+    win32job = types.ModuleType('win32job')
+    win32job.JobObjectExtendedLimitInformation = 9
+    win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE = JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+
+    def create_job_object(security_attributes, name):
+        job = SimulatedJobObject(name)
+        _jobs.append(job)
+        return job
+
+    def set_information(job, info_class, info):
+        job.info = {'BasicLimitInformation': dict(info['BasicLimitInformation'])}
+
+    def assign_process(job, handle):
+        if job.closed:
+            raise RuntimeError("Job object %s is closed" % job.name)
+        job.pids.append(handle.pid)
+
+    win32job.CreateJobObject = create_job_object
+    win32job.QueryInformationJobObject = lambda job, info_class: {
+        'BasicLimitInformation': dict(job.info['BasicLimitInformation'])}
+    win32job.SetInformationJobObject = set_information
+    win32job.AssignProcessToJobObject = assign_process
+    win32job.TerminateJobObject = lambda job, exit_code: job.close()
+    return {'win32con': win32con, 'win32api': win32api, 'win32job': win32job}
+
+
+def _camstim_modules(config, output_dir):
+    camstim = types.ModuleType('camstim')
+    misc = types.ModuleType('camstim.misc')
+    misc.get_config = lambda section, *args, **kwargs: dict(config.get(section, {}))
+    zro = types.ModuleType('camstim.zro')
+    agent = types.ModuleType('camstim.zro.agent')
+    agent.OUTPUT_DIR = output_dir
+    camstim.misc = misc
+    camstim.zro = zro
+    zro.agent = agent
+    return {'camstim': camstim, 'camstim.misc': misc, 'camstim.zro': zro, 'camstim.zro.agent': agent}
+
+
+def install_backend(root=None):
+    """
+    Replace mpeconfig, the win32 modules and camstim with their simulations.
+
+    Args:
+        root (str, optional): Simulation folder (see simulation_root)
+
+    Returns:
+        str: The simulation folder
+    """
+    root = simulation_root(root)
+    config = simulated_config(root)
+    output_dir = os.path.join(root, 'output')
+    for folder in (root, os.path.join(root, 'data'), config['SweepStim']['backupdir'], output_dir):
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    modules = _win32_modules()
+    modules.update(_camstim_modules(config, output_dir))
+    install_launcher_stubs(config, modules)
+    if not _jobs:
+        atexit.register(_close_jobs)
+    logging.info("Simulated rig in %s" % root)
+    return root
+
+
+def repository_path(root=None):
+    """Staged repository of the simulated rig."""
+    return os.path.join(simulation_root(root), 'repository', REPOSITORY_NAME)
+
+
+def write_running_phases(path, minutes=30, seed=0):
+    """
+    Write a smooth random wheel phase trace at 30 Hz, in the recordings' format.
+
+    Args:
+        path (str): CSV file to write
+        minutes (float): Length of the trace
+        seed (int): Random seed
+    """
+    rnd = random.Random(seed)
+    phase = speed = 0.0
+    with open(path, 'w') as f:
+        f.write('Time,Phase_Radians\n')
+        for k in range(int(minutes * 60 * 30)):
+            speed = 0.95 * speed + rnd.gauss(0, 0.02)
+            phase = (phase + speed) % (2 * math.pi)
+            f.write('%r,%r\n' % (k / 30.0, phase))
+
+
+def stage_repository(root=None):
+    """
+    Copy the stimulus sources of this checkout to the simulated repository.
+
+    Files are copied when their size or modification time differ, so staging
+    again is quick. Synthetic running phases are written when the checkout
+    has no recordings.
+
+    Returns:
+        str: The staged repository path
+    """
+    repo = repository_path(root)
+    source = os.path.join(REPOSITORY_ROOT, STIMULUS_SOURCE)
+    copied = 0
+    for dirpath, dirnames, filenames in os.walk(source):
+        target_dir = os.path.join(repo, STIMULUS_SOURCE, os.path.relpath(dirpath, source))
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        for name in filenames:
+            src = os.path.join(dirpath, name)
+            dst = os.path.join(target_dir, name)
+            if os.path.isfile(dst):
+                src_stat, dst_stat = os.stat(src), os.stat(dst)
+                if src_stat.st_size == dst_stat.st_size and int(src_stat.st_mtime) == int(dst_stat.st_mtime):
+                    continue
+            shutil.copy2(src, dst)
+            copied += 1
+    phases_dir = os.path.join(repo, PHASES_DIR)
+    if not [name for name in os.listdir(phases_dir) if name.endswith('.csv')]:
+        write_running_phases(os.path.join(phases_dir, 'simulated_phases.csv'))
+        logging.info("Wrote synthetic running phases to %s" % phases_dir)
+    logging.info("Staged repository in %s (%d files copied)" % (repo, copied))
+    return repo
+
+
+def play_session(root_folder, table_path, speedup=DEFAULT_SPEEDUP, seed=0, out=None):
+    """
+    Show the trials of a stimulus table like Bonsai, writing its CSV files.
+
+    Frames are written in one-second batches of session time; each batch is
+    flushed and the player then sleeps until the batch is due at the speed-up.
+
+    Args:
+        root_folder (str): Session folder (Bonsai's RootFolder)
+        table_path (str): Stimulus table written by generate_experiment_csv
+        speedup (float): Session seconds per wall-clock second
+        seed (int): Seed of the trial Ids, frame jitter and wheel
+        out (file, optional): Stream for progress messages (default stdout)
+
+    Returns:
+        dict: logger_path, orientations_path, frames, trials and seconds (wall clock)
+    """
+    from synthetic_session import (FRAME_RATE, ORIENTATION_COLUMNS, read_trial_table,
+                                   schedule_trials, logger_frames)
+    out = out or sys.stdout
+    rnd = random.Random(seed)
+    schedule, end_frame, n_frames = schedule_trials(read_trial_table(table_path), rnd)
+    stamp = datetime.datetime.now().strftime('%Y-%m-%dT%H_%M_%S')
+    logger_path = os.path.join(root_folder, 'orientations_logger%s.csv' % stamp)
+    orientations_path = os.path.join(root_folder, 'orientations_orientations%s.csv' % stamp)
+    out.write("Simulated Bonsai: %d trials, %d frames (%.1f min) at %gx\n" % (
+        len(schedule), n_frames, n_frames / FRAME_RATE / 60, speedup))
+    out.flush()
+
+    batch = int(FRAME_RATE)
+    start = time.time()
+    with open(logger_path, 'w') as logger, open(orientations_path, 'w') as orientations:
+        writer = csv.writer(orientations, lineterminator='\n')
+        writer.writerow(ORIENTATION_COLUMNS)
+        lines = ['Frame,Timestamp,Value']
+        for frame, started, frame_lines in logger_frames(schedule, end_frame, n_frames, rnd):
+            lines.extend(frame_lines)
+            if started is not None:
+                writer.writerow([started.get(name, '') for name in ORIENTATION_COLUMNS])
+            if (frame + 1) % batch == 0 or frame == n_frames - 1:
+                logger.write('\n'.join(lines) + '\n')
+                lines = []
+                logger.flush()
+                orientations.flush()
+                delay = start + (frame + 1) / FRAME_RATE / speedup - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            if (frame + 1) % (batch * 60) == 0:
+                out.write("Frame %d\n" % (frame + 1))
+                out.flush()
+    seconds = time.time() - start
+    out.write("Simulated Bonsai finished in %.1f s\n" % seconds)
+    out.flush()
+    return {'logger_path': logger_path, 'orientations_path': orientations_path,
+            'frames': n_frames, 'trials': len(schedule), 'seconds': seconds}
+
+
+def main(argv=None):
+    """Fake Bonsai.exe command line: <workflow> [--start] [--no-editor] --property Name=Value ..."""
+    parser = argparse.ArgumentParser(description='Simulated Bonsai')
+    parser.add_argument('workflow', help='Bonsai workflow (must exist)')
+    parser.add_argument('--start', action='store_true')
+    parser.add_argument('--no-editor', action='store_true')
+    parser.add_argument('--property', action='append', default=[], help='Workflow property Name=Value')
+    parser.add_argument('--speedup', type=float, default=DEFAULT_SPEEDUP, help='Session seconds per second')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the simulated display')
+    args = parser.parse_args(argv)
+    properties = dict(item.split('=', 1) for item in args.property if '=' in item)
+    if not os.path.isfile(args.workflow):
+        sys.stderr.write("Workflow not found: %s\n" % args.workflow)
+        return 1
+    root_folder = properties.get('RootFolder')
+    table_path = properties.get('stimulus_table_path')
+    if not root_folder or not os.path.isdir(root_folder):
+        sys.stderr.write("RootFolder is not a folder: %s\n" % root_folder)
+        return 1
+    if not table_path or not os.path.isfile(table_path):
+        sys.stderr.write("Stimulus table not found: %s\n" % table_path)
+        return 1
+    play_session(root_folder, table_path, args.speedup, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
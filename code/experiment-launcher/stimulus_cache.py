@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Content-addressed cache of generated stimulus tables.
+
+The launcher calls generate_experiment_csv.build_session_trials in-process
+instead of starting a Python subprocess (older generators without it, such as
+pinned repository commits, go through generate_single_session_csv). Tables of
+a pinned 'stimulus_seed' are kept in a cache directory under a name derived from
+
+    (session_type, seed, hash of the generator source and its running_phases data)
+
+so a table that was pre-staged, or a repeated seed, costs a file copy. A
+changed generator (or phase recording) gives new cache keys; stale entries are
+never reused. Per-session seeds never repeat, so their tables are written
+straight to the session folder and not cached.
+
+Each cache entry is the CSV plus a small JSON file with its trial count and key.
+
+Pre-stage tables for known seeds:
+    python stimulus_cache.py --cache-dir C:/ProgramData/AIBS_MPE/camstim/stimulus_cache \
+        --session-type visual_mismatch --seed 1234 --seed 5678
+"""
+
+import os
+import sys
+import csv
+import json
+import random
+import shutil
+import hashlib
+import logging
+import argparse
+import datetime
+
+import numpy as np
+
+from atomic_file import replace_file
+
+LAUNCHER_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATOR_PATH = os.path.normpath(os.path.join(
+    LAUNCHER_DIR, '..', 'stimulus-control', 'src', 'Mindscope', 'generate_experiment_csv.py'))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_modules = {}
+
+
+def load_generator_module(generator_path=GENERATOR_PATH, name='generate_experiment_csv'):
+    """
+    Import the stimulus generator from its file path (loaded again only if the file changed).
+
+    Args:
+        generator_path (str): Path of generate_experiment_csv.py
+        name (str): Module name; use a distinct name for a copy that will be modified
+
+    Returns:
+        module: The generator module
+    """
+    key = (os.path.abspath(generator_path), name, os.path.getmtime(generator_path))
+    if key not in _modules:
+        if sys.version_info[0] < 3:
+            import imp
+            # load_source reuses a module of the same name, keeping attributes of another file
+            sys.modules.pop(name, None)
+            module = imp.load_source(name, key[0])
+        else:
+            import importlib.util
+            spec = importlib.util.spec_from_file_location(name, key[0])
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        _modules[key] = module
+    return _modules[key]
+
+
+def generator_source_hash(generator_path=GENERATOR_PATH):
+    """
+    SHA-256 of the generator source and of the running_phases recordings it reads.
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    phases_dir = os.path.join(os.path.dirname(generator_path), 'running_phases')
+    paths = [generator_path]
+    if os.path.isdir(phases_dir):
+        paths += [os.path.join(phases_dir, name) for name in sorted(os.listdir(phases_dir)) if name.endswith('.csv')]
+    for path in paths:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            while chunk:
+                digest.update(chunk)
+                chunk = f.read(HASH_CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+def _count_rows(path):
+    """Data rows of a CSV table (header excluded)."""
+    with open(path, 'rb' if sys.version_info[0] < 3 else 'r') as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+
+def generate_table(session_type, seed, path, generator_path=GENERATOR_PATH):
+    """
+    Generate a table into path in-process, without disturbing the caller's random state.
+
+    Args:
+        session_type (str): Session type identifier
+        seed (int): Random seed of the table
+        path (str): Output CSV path
+        generator_path (str): Path of generate_experiment_csv.py
+
+    Returns:
+        int: Number of trials
+    """
+    generator = load_generator_module(generator_path)
+    random_state = random.getstate()
+    numpy_state = np.random.get_state()
+    try:
+        if hasattr(generator, 'build_session_trials'):
+            session = generator.build_session_trials(session_type, seed=seed)
+            if session is None:
+                raise ValueError("Unknown session type '%s'" % session_type)
+            fieldnames, trials = session
+            generator.write_session_csv(path, fieldnames, trials)
+            return len(trials)
+        # Generators older than build_session_trials only write the file
+        if not generator.generate_single_session_csv(session_type, path, seed):
+            raise ValueError("Generator failed for session type '%s'" % session_type)
+        return _count_rows(path)
+    finally:
+        random.setstate(random_state)
+        np.random.set_state(numpy_state)
+
+
+class StimulusTableCache(object):
+    """
+    Generate stimulus tables in-process and cache them by content key.
+
+    Args:
+        cache_dir (str): Cache directory (created on first use)
+        generator_path (str): Path of generate_experiment_csv.py
+    """
+
+    def __init__(self, cache_dir, generator_path=GENERATOR_PATH):
+        self.cache_dir = cache_dir
+        self.generator_path = generator_path
+        self._source_hash = None
+
+    @property
+    def source_hash(self):
+        if self._source_hash is None:
+            self._source_hash = generator_source_hash(self.generator_path)
+        return self._source_hash
+
+    def entry_path(self, session_type, seed):
+        """Cache file of a (session_type, seed) table for the current generator."""
+        return os.path.join(self.cache_dir, '%s_seed%d_%s.csv' % (session_type, int(seed), self.source_hash[:16]))
+
+    def get(self, session_type, seed):
+        """
+        Return the cached table of (session_type, seed), generating it if needed.
+
+        Returns:
+            tuple: (cache_path, n_trials, cache_hit)
+        """
+        path = self.entry_path(session_type, seed)
+        meta_path = path[:-len('.csv')] + '.json'
+        if os.path.isfile(path) and os.path.isfile(meta_path):
+            try:
+                with open(meta_path, 'r') as f:
+                    return path, json.load(f)['n_trials'], True
+            except (IOError, OSError, ValueError, KeyError) as e:
+                logging.warning("Ignoring unreadable stimulus cache entry %s: %s" % (meta_path, e))
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # Generate next to the entry and rename, so a crash never leaves a partial table
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            n_trials = generate_table(session_type, seed, tmp_path, self.generator_path)
+            replace_file(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with open(meta_path, 'w') as f:
+            json.dump({'session_type': session_type, 'seed': int(seed), 'source_hash': self.source_hash,
+                       'n_trials': n_trials, 'created': datetime.datetime.now().isoformat()}, f, indent=2)
+        return path, n_trials, False
+
+    def copy_to(self, session_type, seed, output_path):
+        """
+        Write the (session_type, seed) table to output_path.
+
+        Returns:
+            tuple: (n_trials, cache_hit)
+        """
+        path, n_trials, cache_hit = self.get(session_type, seed)
+        shutil.copyfile(path, output_path)
+        return n_trials, cache_hit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-stage stimulus tables in the launcher cache')
+    parser.add_argument('--session-type', required=True, help='Session type identifier')
+    parser.add_argument('--seed', type=int, action='append', required=True, help='Seed to pre-stage (repeatable)')
+    parser.add_argument('--cache-dir', required=True, help='Stimulus cache directory (launcher stimulus_cache_dir)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    cache = StimulusTableCache(args.cache_dir)
+    for seed in args.seed:
+        path, n_trials, cache_hit = cache.get(args.session_type, seed)
+        logging.info("%s: %d trials (%s)" % (path, n_trials, 'cached' if cache_hit else 'generated'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
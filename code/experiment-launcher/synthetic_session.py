@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""
+Synthetic Bonsai session folders for tests and benchmarks.
+
+Plays a session from generate_experiment_csv.py through a simulated 60 Hz
+display and writes the two files the launcher packages:
+
+    orientations_orientations<timestamp>.csv   one row per shown trial (+ Id)
+    orientations_logger<timestamp>.csv         Frame rows, START/END,
+                                               StimStart/StimEnd-<Id>,
+                                               MovieFrame-<n> and Wheel events
+
+Each trial is shown for round(Duration * 60) frames followed by
+round(Delay * 60) blank frames; movies log one MovieFrame every 2 frames
+(30 fps). Trials are replayed in order, wrapping around, until the requested
+duration is filled, so any session type can be scaled to any length.
+
+Sessions with open loop blocks need the running_phases/*.csv recordings next
+to generate_experiment_csv.py. When they are missing (they are not in the
+repository), a smooth random phase trace is used instead.
+
+The logger parsing tests play numbered stimuli ('stim0', 'stim1', ...) through
+the same display instead, with dropped frames and several wheel events per
+frame (synthetic_logger_text / write_synthetic_logger, and
+synthetic_orientations for the matching orientation rows).
+
+Run:
+    python synthetic_session.py /tmp/session_bonsai --session-type visual_mismatch --minutes 70
+"""
+
+import os
+import sys
+import csv
+import math
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+from stimulus_cache import GENERATOR_PATH, load_generator_module
+
+FRAME_RATE = 60.0
+MOVIE_FRAME_STEP = 2
+FILE_TIMESTAMP = '2025-01-01T12_00_00'
+
+# Stimuli of synthetic_logger_lines: 'stim0', 'stim1', ... with every 4th one a movie
+NUMBERED_STIMULUS_FRAMES = 30
+NUMBERED_MOVIE_EVERY = 4
+
+# Bonsai writes the trial parameters without underscores and adds the trial Id
+ORIENTATION_COLUMNS = [
+    'BlockNumber', 'BlockLabel', 'BlockDurationMinutes', 'TrialNumber', 'SequenceNumber', 'TrialInSequence',
+    'Contrast', 'Delay', 'DiameterX', 'DiameterY', 'Duration', 'Orientation', 'SpatialFrequency',
+    'TemporalFrequency', 'X', 'Y', 'Phase', 'TrialType', 'BlockType', 'Id'
+]
+
+_generator = None
+
+
+def load_session_generator():
+    """
+    Import generate_experiment_csv.py from the stimulus-control folder.
+
+    Loaded under its own module name, so the open loop phase fallback below
+    never reaches the generator used by the launcher.
+
+    Returns:
+        module: The generator module (loaded once)
+    """
+    global _generator
+    if _generator is not None:
+        return _generator
+    module = load_generator_module(GENERATOR_PATH, name='synthetic_generate_experiment_csv')
+
+    load_recorded_phases = module._load_pre_recorded_phases_radians
+
+    def load_phases(duration_seconds, variant_seed):
+        try:
+            return load_recorded_phases(duration_seconds, variant_seed)
+        except RuntimeError as e:
+            logging.warning("Using synthetic open loop phases: %s" % e)
+            rnd = random.Random(variant_seed + 1337)
+            phases = []
+            phase = 0.0
+            speed = 0.0
+            for _ in range(int(duration_seconds * 30)):
+                speed = 0.95 * speed + rnd.gauss(0, 0.02)
+                phase = (phase + speed) % (2 * math.pi)
+                phases.append(phase)
+            return phases
+    module._load_pre_recorded_phases_radians = load_phases
+    _generator = module
+    return module
+
+
+def read_trial_table(path):
+    """
+    Read a stimulus table written by generate_experiment_csv.
+
+    Returns:
+        list: Trial dictionaries keyed by the Bonsai column names (strings)
+    """
+    with open(path, 'r') as f:
+        return [dict((name.replace('_', ''), value) for name, value in row.items())
+                for row in csv.DictReader(f)]
+
+
+def generate_session_trials(session_type, seed=0):
+    """
+    Generate the trial rows of a session with generate_single_session_csv.
+
+    Returns:
+        list: Trial dictionaries keyed by the Bonsai column names (strings)
+    """
+    generator = load_session_generator()
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    stdout = sys.stdout
+    try:
+        # The generator prints every block; keep benchmark output readable
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            ok = generator.generate_single_session_csv(session_type, path, seed=seed)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        if not ok:
+            raise ValueError("Could not generate a '%s' session" % session_type)
+        return read_trial_table(path)
+    finally:
+        os.remove(path)
+
+
+def schedule_trials(trials, rnd, minutes=None):
+    """
+    Lay the trials out on display frames.
+
+    Args:
+        trials (list): Trial dictionaries (see read_trial_table)
+        rnd (random.Random): Source of the trial Ids
+        minutes (float, optional): Stimulus duration; default plays every trial once
+
+    Returns:
+        tuple: (schedule, end_frame, n_frames) where schedule lists (start frame,
+               end frame, row) and StimEnd is logged on the end frame
+    """
+    pre_frames = post_frames = int(5 * FRAME_RATE)
+    stim_frames = int(minutes * 60 * FRAME_RATE) if minutes is not None else None
+    schedule = []
+    frame = pre_frames
+    position = 0
+    while trials:
+        trial = trials[position % len(trials)]
+        if stim_frames is None and position == len(trials):
+            break
+        on_frames = max(1, int(round(float(trial.get('Duration') or 0) * FRAME_RATE)))
+        off_frames = max(0, int(round(float(trial.get('Delay') or 0) * FRAME_RATE)))
+        if stim_frames is not None and frame + on_frames > pre_frames + stim_frames:
+            break
+        row = dict(trial, Id='%08x-%04x-%04x-%04x-%012x' % tuple(rnd.getrandbits(b) for b in (32, 16, 16, 16, 48)))
+        row['TrialNumber'] = str(position + 1)
+        schedule.append((frame, frame + on_frames, row))
+        frame += on_frames + off_frames
+        position += 1
+    end_frame = frame if stim_frames is None else pre_frames + stim_frames
+    return schedule, end_frame, end_frame + post_frames
+
+
+def logger_frames(schedule, end_frame, n_frames, rnd, late_frame_probability=0.001, wheel_probability=0.9,
+                  start_frame=None, dropped_frame_probability=0.0, wheel_events=(1,), skip_frame_zero=False):
+    """
+    Play a schedule through the simulated display, one frame at a time.
+
+    Args:
+        schedule (list): (start frame, end frame, row) of each trial (see schedule_trials)
+        end_frame (int): Frame logging END
+        n_frames (int): Frames to play
+        rnd (random.Random): Source of the timing jitter and wheel events
+        late_frame_probability (float): Chance that a frame is shown one refresh late
+        wheel_probability (float): Chance that a wheel event is logged
+        start_frame (int, optional): Frame logging START (default: after 5 s of gray)
+        dropped_frame_probability (float): Chance that a frame logs no rows at all
+        wheel_events (sequence): Number of wheel events drawn per frame, chosen from
+        skip_frame_zero (bool): Log no rows for frame 0
+
+    Yields:
+        tuple: (frame, row of the trial starting on the frame or None, logger lines of the frame)
+    """
+    if start_frame is None:
+        start_frame = int(5 * FRAME_RATE)
+    starts = dict((start, k) for k, (start, _, _) in enumerate(schedule))
+    ends = {}
+    movie = None
+    t = 1.0 + rnd.random()
+    index, count, deg = 42793322, 4785, 210.2783203125
+    for frame in range(n_frames):
+        t += 1.0 / FRAME_RATE + rnd.gauss(0, 0.0003)
+        if rnd.random() < late_frame_probability:
+            t += 1.0 / FRAME_RATE
+        dropped = (skip_frame_zero and frame == 0) or \
+            (dropped_frame_probability and rnd.random() < dropped_frame_probability)
+        ts = repr(t)
+        lines = ['%d,%s,Frame' % (frame, ts)]
+        started = None
+        if frame == start_frame:
+            lines.append('%d,%s,START' % (frame, ts))
+        if frame == end_frame:
+            lines.append('%d,%s,END' % (frame, ts))
+        if frame in ends:
+            lines.append('%d,%s,StimEnd-%s' % (frame, ts, ends.pop(frame)))
+            movie = None
+        if frame in starts:
+            start, stop, started = schedule[starts[frame]]
+            lines.append('%d,%s,StimStart-%s' % (frame, ts, started['Id']))
+            ends[stop] = started['Id']
+            movie = (start, 0) if started.get('BlockType') == 'movie' else None
+        if movie is not None and (frame - movie[0]) % MOVIE_FRAME_STEP == 0:
+            lines.append('%d,%s,MovieFrame-%d' % (frame, ts, movie[1]))
+            movie = (movie[0], movie[1] + 1)
+        for _ in range(rnd.choice(wheel_events)):
+            if rnd.random() < wheel_probability:
+                index += rnd.choice([0, 1, 1, 2])
+                count += rnd.randint(-3, 8)
+                deg += rnd.uniform(-1.0, 5.0)
+                lines.append('%d,%s,Wheel-Index-%d-Count-%d-Deg-%r' % (frame, ts, index, count, deg))
+        yield frame, started, [] if dropped else lines
+
+
+def numbered_schedule(n_frames):
+    """
+    Back-to-back stimuli 'stim0', 'stim1', ... of NUMBERED_STIMULUS_FRAMES frames;
+    every NUMBERED_MOVIE_EVERY-th one, from stim0, is a movie.
+
+    Returns:
+        list: (start frame, end frame, row) of each stimulus starting before n_frames
+    """
+    return [(start, start + NUMBERED_STIMULUS_FRAMES,
+             {'Id': 'stim%d' % k, 'BlockType': 'movie' if k % NUMBERED_MOVIE_EVERY == 0 else 'grating'})
+            for k, start in enumerate(range(0, n_frames, NUMBERED_STIMULUS_FRAMES))]
+
+
+def synthetic_logger_lines(minutes=0.5, seed=0, stimuli=True, skip_frame_zero=False, wheel_probability=0.9):
+    """
+    Logger of numbered stimuli (see numbered_schedule) for the logger parsing tests.
+
+    START and END are logged 2 s from the ends, 1% of the frames log no rows and
+    frames carry up to two wheel events, so the edge cases of the parsers are hit.
+
+    Args:
+        minutes (float): Logger duration
+        seed (int): Seed for the timing jitter, dropped frames and wheel
+        stimuli (bool): Log the numbered stimuli
+        skip_frame_zero (bool): Log no rows for frame 0
+        wheel_probability (float): Chance that a wheel event is logged
+
+    Yields:
+        str: Logger lines, header first, without line endings
+    """
+    rnd = random.Random(seed)
+    n_frames = int(minutes * 60 * FRAME_RATE)
+    schedule = numbered_schedule(n_frames) if stimuli else []
+    yield 'Frame,Timestamp,Value'
+    for _, _, frame_lines in logger_frames(schedule, n_frames - 120, n_frames, rnd, late_frame_probability=0,
+                                           wheel_probability=wheel_probability, start_frame=120,
+                                           dropped_frame_probability=0.01, wheel_events=(1, 1, 1, 2),
+                                           skip_frame_zero=skip_frame_zero):
+        for line in frame_lines:
+            yield line
+
+
+def synthetic_logger_text(minutes=0.5, seed=0, **kwargs):
+    """synthetic_logger_lines as text with Bonsai's '\\r\\n' line endings."""
+    return '\r\n'.join(synthetic_logger_lines(minutes, seed, **kwargs)) + '\r\n'
+
+
+def write_synthetic_logger(path, minutes=0.5, seed=0, **kwargs):
+    """
+    Write synthetic_logger_lines to a CSV file (with '\\r\\n' line endings, in batches).
+
+    Returns:
+        str: path
+    """
+    with open(path, 'wb') as f:
+        lines = []
+        for line in synthetic_logger_lines(minutes, seed, **kwargs):
+            lines.append(line + '\r\n')
+            if len(lines) >= 65536:
+                f.write(''.join(lines).encode('ascii'))
+                lines = []
+        f.write(''.join(lines).encode('ascii'))
+    return path
+
+
+def synthetic_orientations(stim_ids, seed=0):
+    """
+    Orientation rows for the numbered stimuli of synthetic_logger_lines.
+
+    Movies, motor and grating blocks take turns; two extra rows are never shown.
+
+    Args:
+        stim_ids (list): Ids of the stimuli shown, in order
+        seed (int): Seed for the trial parameters
+
+    Returns:
+        list: Orientation row dictionaries (strings)
+    """
+    rnd = random.Random(seed)
+    rows = []
+    for k, stim_id in enumerate(stim_ids):
+        movie = k % NUMBERED_MOVIE_EVERY == 0
+        motor = k % NUMBERED_MOVIE_EVERY == 1
+        rows.append({
+            'BlockNumber': str(k % 4), 'TrialNumber': str(k),
+            'BlockLabel': 'Movie block' if movie else ('Motor block' if motor else 'Grating block'),
+            'BlockType': 'movie' if movie else 'grating',
+            'BlockDurationMinutes': '2.5',
+            'Orientation': rnd.choice(['0', '45', '90', '135.5']),
+            'Contrast': rnd.choice(['1.0', '0.8', '0.25']),
+            'Phase': 'wheel' if motor and rnd.random() < 0.5 else repr(rnd.random()),
+            'SpatialFrequency': '0.04', 'TemporalFrequency': rnd.choice(['2', '']),
+            'Delay': rnd.choice(['0', '1e3', '0.5']) if k > 20 else '0',
+            'DiameterX': '360', 'DiameterY': '360', 'X': '0', 'Y': '-0.0',
+            'Duration': '0.25', 'TrialType': rnd.choice(['standard', 'oddball']),
+            'SequenceNumber': str(k // 10), 'TrialInSequence': str(k % 10),
+            'Id': stim_id,
+        })
+    # Rows without a logged stimulus get no timing
+    rows.append(dict(rows[1], Id='never-shown'))
+    rows.insert(1, dict(rows[0], Id='never-shown-movie'))
+    return rows
+
+
+def write_in_pieces(path, text, seed=0):
+    """
+    Write text in random pieces of up to 4 kB (often cutting lines), flushing each,
+    as Bonsai does while a LoggerTailer follows the file.
+    """
+    rnd = random.Random(seed)
+    position = 0
+    with open(path, 'wb') as f:
+        while position < len(text):
+            size = rnd.randint(1, 4096)
+            f.write(text[position:position + size].encode('ascii'))
+            f.flush()
+            position += size
+            time.sleep(rnd.choice([0, 0, 0.001]))
+    return path
+
+
+def write_synthetic_session(folder, session_type='short_test', minutes=None, seed=0,
+                            late_frame_probability=0.001, wheel_probability=0.9):
+    """
+    Write a synthetic orientations/logger CSV pair into a session folder.
+
+    Args:
+        folder (str): Session folder (created if needed)
+        session_type (str): Session type understood by generate_experiment_csv
+        minutes (float, optional): Stimulus duration; default plays every trial once
+        seed (int): Seed for the trial list, timing jitter and wheel
+        late_frame_probability (float): Chance that a frame is shown one refresh late
+        wheel_probability (float): Chance that a frame carries a wheel event
+
+    Returns:
+        dict: logger_path, orientations_path, frames, trials and logger_rows
+    """
+    rnd = random.Random(seed)
+    trials = generate_session_trials(session_type, seed)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    logger_path = os.path.join(folder, 'orientations_logger%s.csv' % FILE_TIMESTAMP)
+    orientations_path = os.path.join(folder, 'orientations_orientations%s.csv' % FILE_TIMESTAMP)
+
+    schedule, end_frame, n_frames = schedule_trials(trials, rnd, minutes)
+
+    with open(orientations_path, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(ORIENTATION_COLUMNS)
+        for _, _, row in schedule:
+            writer.writerow([row.get(name, '') for name in ORIENTATION_COLUMNS])
+
+    logger_rows = 0
+    with open(logger_path, 'w') as f:
+        lines = ['Frame,Timestamp,Value']
+        for _, _, frame_lines in logger_frames(schedule, end_frame, n_frames, rnd,
+                                               late_frame_probability, wheel_probability):
+            lines.extend(frame_lines)
+            if len(lines) >= 65536:
+                logger_rows += len(lines)
+                f.write('\n'.join(lines) + '\n')
+                lines = []
+        logger_rows += len(lines)
+        f.write('\n'.join(lines) + '\n')
+
+    return {
+        'logger_path': logger_path,
+        'orientations_path': orientations_path,
+        'frames': n_frames,
+        'trials': len(schedule),
+        'logger_rows': logger_rows - 1,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic Bonsai session folder')
+    parser.add_argument('folder', help='Session folder to write')
+    parser.add_argument('--session-type', default='short_test', help='Session type from generate_experiment_csv')
+    parser.add_argument('--minutes', type=float, default=None, help='Stimulus duration (default: whole session once)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    info = write_synthetic_session(args.folder, args.session_type, args.minutes, args.seed)
+    print("Wrote %d trials, %d frames, %d logger rows to %s" % (
+        info['trials'], info['frames'], info['logger_rows'], args.folder))
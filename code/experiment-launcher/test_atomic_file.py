@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Test for the temporary-file replacement of outputs (see atomic_file.py).
+
+Run (Python 2.7 env):
+    python -m pytest test_atomic_file.py
+"""
+import os
+import shutil
+import tempfile
+
+from atomic_file import atomic_write, replace_file
+
+
+def test_atomic_write_replaces_only_on_success():
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'table.json')
+        with atomic_write(path) as f:
+            f.write('first')
+        with atomic_write(path, 'wb') as f:
+            f.write(b'second')
+        with open(path) as f:
+            assert f.read() == 'second'
+
+        try:
+            with atomic_write(path) as f:
+                f.write('partial')
+                raise ValueError('writer failed')
+        except ValueError:
+            pass
+        with open(path) as f:
+            assert f.read() == 'second'
+        # No temporary files are left behind
+        assert os.listdir(folder) == ['table.json']
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_replace_file_overwrites_destination():
+    folder = tempfile.mkdtemp()
+    try:
+        source, destination = os.path.join(folder, 'new.partial'), os.path.join(folder, 'old')
+        for path, text in ((source, 'new'), (destination, 'old')):
+            with open(path, 'w') as f:
+                f.write(text)
+        replace_file(source, destination)
+        with open(destination) as f:
+            assert f.read() == 'new'
+        assert not os.path.exists(source)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_atomic_write_replaces_only_on_success()
+    test_replace_file_overwrites_destination()
+    print("Outputs are replaced through temporary files.")
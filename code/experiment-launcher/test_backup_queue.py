@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""Test for the verified background backups and their persistent retry queue.
+
+Run (Python 2.7 env):
+    python -m pytest test_backup_queue.py
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+from launcher_stubs import headless_launcher
+import backup_queue
+from backup_queue import BackupQueue, BackupWorker, QUEUE_NAME, copy_verified, process_queue
+
+launcher = headless_launcher()
+
+
+def _write(path, data):
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_copy_is_verified_and_atomic():
+    folder = tempfile.mkdtemp()
+    try:
+        source = os.path.join(folder, 'session.pkl')
+        data = b'pickle' * 200000
+        _write(source, data)
+        destination = os.path.join(folder, 'backup', 'mouse', 'output', 'session.pkl')
+        assert copy_verified(source, destination) == (len(data), hashlib.md5(data).hexdigest())
+        assert _read(destination) == data and not os.path.exists(destination + '.partial')
+
+        # A copy that does not match the expected checksum is never put in place
+        try:
+            copy_verified(source, destination + '2', source_digest='0' * 32)
+            assert False, "Checksum mismatch not detected"
+        except IOError:
+            pass
+        assert not os.path.exists(destination + '2') and not os.path.exists(destination + '2.partial')
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_failed_copies_stay_queued_for_resume():
+    folder = tempfile.mkdtemp()
+    try:
+        session = os.path.join(folder, 'session_bonsai')
+        _write(os.path.join(session, 'session.pkl'), b'pkl')
+        _write(os.path.join(session, 'logs', 'orientations_logger.csv'), b'Frame,Time\n')
+        queue = BackupQueue(os.path.join(session, QUEUE_NAME))
+        # The share is not reachable yet: its parent is a file, so the folder cannot be created
+        blocked = os.path.join(folder, 'share')
+        _write(blocked, b'not a folder')
+        jobs = queue.add_folder(session, os.path.join(blocked, 'session_bonsai'))
+        assert sorted(os.path.relpath(job['source'], session) for job in jobs) == [
+            'logs' + os.sep + 'orientations_logger.csv', 'session.pkl']
+        assert queue.add(jobs[0]['source'], jobs[0]['destination']) is jobs[0]
+
+        assert process_queue(queue, max_attempts=3, retry_delay=0.01) == 2
+        with open(queue.path, 'r') as f:
+            saved = json.load(f)['jobs']
+        assert [(job['status'], job['attempts']) for job in saved] == [('pending', 3), ('pending', 3)]
+        assert all(job['error'] for job in saved)
+
+        # Once the share is back, the resume command finishes the copies
+        os.remove(blocked)
+        assert backup_queue.main([session, '--retry-delay', '0.01']) == 0
+        assert _read(os.path.join(blocked, 'session_bonsai', 'session.pkl')) == b'pkl'
+        assert os.path.isfile(os.path.join(blocked, 'session_bonsai', 'logs', 'orientations_logger.csv'))
+        assert not os.path.exists(os.path.join(blocked, 'session_bonsai', QUEUE_NAME))
+        done = BackupQueue(queue.path).jobs
+        assert [job['status'] for job in done] == ['done', 'done'] and done[0]['md5'] == hashlib.md5(b'pkl').hexdigest()
+        assert backup_queue.main([session]) == 0
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_launcher_backs_up_in_background():
+    folder = tempfile.mkdtemp()
+    try:
+        session = os.path.join(folder, 'data', '250101120000_mouse_bonsai')
+        output_path = os.path.join(session, '250101120000_mouse.pkl')
+        csv_path = os.path.join(session, 'orientations_logger.csv')
+        _write(output_path, b'session pickle')
+        _write(csv_path, b'Frame,Time\n0,0.0\n')
+
+        experiment = launcher.BonsaiExperiment()
+        experiment.mouse_id = 'mouse'
+        experiment.session_folder = session
+        experiment.config = {'SweepStim': {'backupdir': os.path.join(folder, 'backup')}}
+        experiment.custom_output_path = os.path.join(folder, 'custom', 'behavior.pkl')
+        experiment.params.update({'backup_bonsai_csvs': True,
+                                  'session_backup_dir': os.path.join(folder, 'archive')})
+        experiment._start_backups(output_path, [csv_path])
+        assert experiment.wait_for_backups(30)
+
+        mouse_dir = os.path.join(folder, 'backup', 'mouse', 'output')
+        assert _read(os.path.join(mouse_dir, '250101120000_mouse.pkl')) == b'session pickle'
+        assert os.path.isfile(os.path.join(mouse_dir, '250101120000_mouse_bonsai', 'orientations_logger.csv'))
+        assert _read(experiment.custom_output_path) == b'session pickle'
+        assert os.path.isfile(os.path.join(folder, 'archive', '250101120000_mouse_bonsai', 'orientations_logger.csv'))
+        assert not BackupQueue(os.path.join(session, QUEUE_NAME)).pending()
+
+        # Nothing to copy: no worker, nothing to wait for
+        quiet = launcher.BonsaiExperiment()
+        quiet.config = {}
+        quiet._start_backups(output_path)
+        assert quiet._backup_worker is None and quiet.wait_for_backups(0)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_worker_stop_leaves_jobs_pending():
+    folder = tempfile.mkdtemp()
+    try:
+        queue = BackupQueue(os.path.join(folder, QUEUE_NAME))
+        queue.add(os.path.join(folder, 'missing.pkl'), os.path.join(folder, 'backup.pkl'))
+        worker = BackupWorker(queue, max_attempts=100, retry_delay=5.0)
+        worker.start()
+        assert not worker.wait(0.2)
+        worker.stop()
+        assert worker.wait(5) is False and len(BackupQueue(queue.path).pending()) == 1
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_copy_is_verified_and_atomic()
+    test_failed_copies_stay_queued_for_resume()
+    test_launcher_backs_up_in_background()
+    test_worker_stop_leaves_jobs_pending()
+    print("Backups are verified, copied in the background and resumable.")
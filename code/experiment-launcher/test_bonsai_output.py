@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Test for the bounded capture of Bonsai stdout/stderr.
+
+Run (Python 2.7 env):
+    python -m pytest test_bonsai_output.py
+"""
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import subprocess
+
+from launcher_stubs import headless_launcher
+from bonsai_output import StreamCapture, OutputLogQueue
+
+launcher = headless_launcher()
+
+# Stand-in for a chatty Bonsai workflow
+CHATTY_PROCESS = """
+import sys
+for k in range(5000):
+    sys.stdout.write('frame %d\\n' % k)
+    if k % 2:
+        sys.stderr.write('warning %d\\n' % k)
+sys.exit(3)
+"""
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_capture_is_bounded_and_keeps_full_stream_on_disk():
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'bonsai_stderr.log')
+        with open(path, 'w') as f:
+            f.write('output of an earlier run\n')
+        capture = StreamCapture(path, max_lines=10)
+        lines = ['line %d' % k for k in range(25)]
+        for line in lines:
+            capture.append(line)
+        assert len(capture) == 10 and capture.dropped == 15
+        assert list(capture) == lines[-10:]
+        assert capture.text() == "\n".join(lines)
+        capture.close()
+        assert capture.text() == "\n".join(lines)
+        with open(path, 'r') as f:
+            assert f.read().splitlines()[1:] == lines
+
+        memory_only = StreamCapture(None, max_lines=3)
+        assert not memory_only and memory_only.text() == ""
+        for line in lines[:2]:
+            memory_only.append(line)
+        assert memory_only.text() == "\n".join(lines[:2])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_output_log_queue_reaches_root_handlers():
+    handler = _ListHandler()
+    root = logging.getLogger()
+    root.addHandler(handler)
+    output_log = OutputLogQueue('test_bonsai_output_queue')
+    try:
+        output_log.start()
+        for k in range(100):
+            output_log.logger.warning("Bonsai error: %s", k)
+        output_log.stop()
+    finally:
+        root.removeHandler(handler)
+    assert handler.messages == ["Bonsai error: %d" % k for k in range(100)]
+
+
+def test_launcher_errors_match_full_stderr():
+    folder = tempfile.mkdtemp()
+    try:
+        experiment = launcher.BonsaiExperiment()
+        experiment.session_folder = folder
+        experiment.params['bonsai_output_lines'] = 100
+        assert experiment.get_bonsai_errors() == "No errors reported by Bonsai."
+        experiment.bonsai_process = subprocess.Popen(
+            [sys.executable, '-c', CHATTY_PROCESS], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, bufsize=1)
+        experiment._start_output_readers()
+        experiment.bonsai_process.wait()
+        for thread in experiment._output_threads:
+            thread.join()
+        experiment._close_output_capture()
+
+        assert len(experiment.stdout_data) == 100 and experiment.stdout_data.n_lines == 5000
+        assert experiment.get_bonsai_errors() == "\n".join('warning %d' % k for k in range(1, 5000, 2))
+        with open(os.path.join(folder, 'bonsai_stdout.log'), 'r') as f:
+            assert f.read().splitlines() == ['frame %d' % k for k in range(5000)]
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_capture_is_bounded_and_keeps_full_stream_on_disk()
+    test_output_log_queue_reaches_root_handlers()
+    test_launcher_errors_match_full_stderr()
+    print("Bonsai output capture is bounded and complete.")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Round-trip test for the columnar Bonsai tables stored in session pkl files.
+
+Run:
+    python -m pytest test_bonsai_tables.py
+"""
+import os
+import sys
+import pickle
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bonsai_tables
+
+
+ORIENTATION_ROWS = [
+    {'BlockNumber': '0', 'BlockLabel': 'Grating block 1', 'Contrast': '1', 'Delay': '0.343',
+     'Duration': '0.0333333333333333', 'Phase': '3.8467738035971895', 'Id': 'a'},
+    {'BlockNumber': '1', 'BlockLabel': 'Motor block', 'Contrast': '0.5', 'Delay': '0',
+     'Duration': '0.25', 'Phase': 'wheel', 'Id': 'b'},
+    {'BlockNumber': '1', 'BlockLabel': 'Motor block', 'Contrast': '1', 'Delay': '007',
+     'Duration': '0.25', 'Phase': '0', 'Id': 'c'},
+]
+
+
+def test_orientations_round_trip_is_lossless():
+    table = bonsai_tables.table_from_rows(ORIENTATION_ROWS)
+    columns = table['columns']
+    assert columns['BlockNumber']['type'] == 'int'
+    assert columns['Contrast']['type'] == 'float'
+    assert columns['Duration']['type'] == 'float'
+    assert columns['Phase']['type'] == 'category'
+    # '007' would not survive int/float formatting, so the column stays categorical
+    assert columns['Delay']['type'] == 'category'
+    assert columns['BlockLabel']['categories'] == ['Grating block 1', 'Motor block']
+    assert bonsai_tables.expand_table(table) == ORIENTATION_ROWS
+
+
+def test_expand_bonsai_raw_data_accepts_both_formats():
+    logger_columns = {
+        'Frame': {'type': 'int', 'values': np.array([605, 605, 606], dtype=np.int32)},
+        'Timestamp': {'type': 'float', 'values': np.array([18.922494100000002, 18.922494100000002, 18.939])},
+        'Value': {'type': 'category', 'codes': np.array([0, 1, 0], dtype=np.int32),
+                  'categories': ['Frame', 'START']},
+    }
+    raw = {
+        'orientations': bonsai_tables.table_from_rows(ORIENTATION_ROWS),
+        'logger': bonsai_tables.make_table(['Frame', 'Timestamp', 'Value'], logger_columns, 3),
+        'files_found': [],
+    }
+    raw = pickle.loads(pickle.dumps(raw, 2))
+    expanded = bonsai_tables.expand_bonsai_raw_data(raw)
+    assert expanded['orientations'] == ORIENTATION_ROWS
+    start_row = expanded['logger'][1]
+    assert (start_row['Frame'], start_row['Value']) == ('605', 'START')
+    # Timestamps expand to the shortest string of the same value
+    assert float(start_row['Timestamp']) == 18.922494100000002
+    # Legacy lists are passed through untouched
+    assert bonsai_tables.expand_bonsai_raw_data(expanded) == expanded
+
+
+if __name__ == '__main__':
+    test_orientations_round_trip_is_lossless()
+    test_expand_bonsai_raw_data_accepts_both_formats()
+    print("Columnar tables round-trip to the legacy rows.")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Test for the cached streaming checksums of session inputs.
+
+Run (Python 2.7 env):
+    python -m pytest test_checksum_cache.py
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+from launcher_stubs import headless_launcher
+from checksum_cache import ChecksumCache, file_digest, workflow_assets
+
+launcher = headless_launcher()
+
+WORKFLOW = """<?xml version="1.0" encoding="utf-8"?>
+<WorkflowBuilder Version="2.8.1"
+                 xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+                 xmlns:gl="clr-namespace:Bonsai.Shaders.Configuration;assembly=Bonsai.Shaders"
+                 xmlns:io="clr-namespace:Bonsai.IO;assembly=Bonsai.System"
+                 xmlns="https://bonsai-rx.org/2018/workflow">
+  <Workflow>
+    <Nodes>
+      <Expression xsi:type="Combinator">
+        <Combinator xsi:type="gl:TextureResources">
+          <gl:Textures>
+            <gl:TextureConfiguration xsi:type="gl:VideoTexture">
+              <gl:FileName>movies\\zebra.mp4</gl:FileName>
+            </gl:TextureConfiguration>
+          </gl:Textures>
+        </Combinator>
+      </Expression>
+      <Expression xsi:type="IncludeWorkflow" Path="Extensions\\Tag.bonsai" />
+      <Expression xsi:type="IncludeWorkflow" Path="BonVision:Environment.ViewWindow.bonsai" />
+      <Expression xsi:type="IncludeWorkflow" Path="BonVision:Logging.FrameEventLogger.bonsai">
+        <FileName>C:/Data/orientations_logger.csv</FileName>
+      </Expression>
+      <Expression xsi:type="io:CsvWriter">
+        <io:FileName>orientations_orientations.csv</io:FileName>
+      </Expression>
+      <Expression xsi:type="io:CsvReader">
+        <io:FileName>missing_table.csv</io:FileName>
+      </Expression>
+    </Nodes>
+  </Workflow>
+</WorkflowBuilder>
+"""
+
+INCLUDED = """<?xml version="1.0" encoding="utf-8"?>
+<WorkflowBuilder xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+                 xmlns:io="clr-namespace:Bonsai.IO;assembly=Bonsai.System"
+                 xmlns="https://bonsai-rx.org/2018/workflow">
+  <Workflow>
+    <Nodes>
+      <Expression xsi:type="io:CsvReader">
+        <io:FileName>..\\receptive_field.csv</io:FileName>
+      </Expression>
+    </Nodes>
+  </Workflow>
+</WorkflowBuilder>
+"""
+
+
+def _write(path, text):
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _make_workflow(folder):
+    workflow = os.path.join(folder, 'src', 'oddball.bonsai')
+    _write(workflow, WORKFLOW)
+    _write(os.path.join(folder, 'src', 'Extensions', 'Tag.bonsai'), INCLUDED)
+    _write(os.path.join(folder, 'receptive_field.csv'), '0,0\n')
+    _write(os.path.join(folder, 'src', 'movies', 'zebra.mp4'), 'frame' * 300000)
+    return workflow
+
+
+def test_digest_is_cached_by_size_and_mtime():
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'movie.mp4')
+        _write(path, 'x' * (3 * 1024 * 1024 + 17))
+        expected = hashlib.md5(b'x' * (3 * 1024 * 1024 + 17)).hexdigest()
+        assert file_digest(path, chunk_size=4096) == expected
+
+        cache_path = os.path.join(folder, 'cache', 'checksums.json')
+        cache = ChecksumCache(cache_path)
+        assert cache.digest(path) == expected and (cache.hits, cache.misses) == (0, 1)
+        assert cache.digest(path) == expected and (cache.hits, cache.misses) == (1, 1)
+        assert cache.digest(os.path.join(folder, 'missing.mp4')) is None
+        cache.save()
+
+        reloaded = ChecksumCache(cache_path)
+        assert reloaded.digest(path) == expected and reloaded.misses == 0
+        _write(path, 'y' * 10)
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+        assert reloaded.digest(path) == hashlib.md5(b'y' * 10).hexdigest() and reloaded.misses == 1
+
+        with open(cache_path, 'r') as f:
+            assert json.load(f)['algorithm'] == 'md5'
+        assert ChecksumCache(cache_path, algorithm='sha256').digest(path) == hashlib.sha256(b'y' * 10).hexdigest()
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_workflow_assets_are_inputs_only():
+    folder = tempfile.mkdtemp()
+    try:
+        workflow = _make_workflow(folder)
+        src = os.path.join(folder, 'src')
+        assert workflow_assets(workflow) == sorted([
+            os.path.join(src, 'movies', 'zebra.mp4'),
+            os.path.join(src, 'Extensions', 'Tag.bonsai'),
+            os.path.join(folder, 'receptive_field.csv'),
+            os.path.join(src, 'missing_table.csv'),
+        ])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_launcher_records_input_checksums():
+    folder = tempfile.mkdtemp()
+    try:
+        workflow = _make_workflow(os.path.join(folder, 'openscope-community-predictive-processing'))
+        params = {
+            'local_repository_path': folder,
+            'bonsai_path': 'src/oddball.bonsai',
+            'checksum_cache_path': os.path.join(folder, 'checksum_cache.json'),
+        }
+        experiment = launcher.BonsaiExperiment()
+        experiment.params.update(params)
+        assert experiment.compute_workflow_checksum()
+        with open(workflow, 'rb') as f:
+            assert experiment.script_checksum == hashlib.md5(f.read()).hexdigest()
+        inputs = experiment.get_input_checksums()
+        assert inputs['workflow'] == workflow and inputs['files'][workflow] == experiment.script_checksum
+        assert len(inputs['files']) == 5
+        assert [path for path, digest in inputs['files'].items() if digest is None] == [
+            os.path.join(os.path.dirname(workflow), 'missing_table.csv')]
+        assert experiment.get_checksum_cache().misses == 4
+
+        # A second session on the rig reads nothing again
+        repeat = launcher.BonsaiExperiment()
+        repeat.params.update(params)
+        assert repeat.compute_workflow_checksum()
+        assert repeat.get_checksum_cache().misses == 0
+        assert repeat.get_input_checksums() == inputs
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_digest_is_cached_by_size_and_mtime()
+    test_workflow_assets_are_inputs_only()
+    test_launcher_records_input_checksums()
+    print("Input checksums are streamed, cached and recorded.")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""Equivalence test and benchmark for the vectorized encoder reconstruction.
+
+Compares BonsaiExperiment._reconstruct_encoder_from_logger against the original
+frame-by-frame implementation (kept below as reference_reconstruct_encoder) on
+synthetic loggers, including edge cases (repeated encoder index, frames without
+wheel events, several events on one frame, missing frame 0).
+
+Run:
+    python -m pytest test_encoder_reconstruction.py
+    python test_encoder_reconstruction.py --benchmark [--minutes 70]
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from launcher_stubs import headless_launcher
+from bonsai_logger import LoggerIndex
+from synthetic_session import write_synthetic_logger
+
+launcher = headless_launcher()
+
+
+def reference_reconstruct_encoder(logger_rows, total_frames, radius=None):
+    """Original per-row / per-frame implementation, kept as the reference."""
+    wheel_pattern = re.compile(r'^Wheel-Index-(\d+)-Count-(-?\d+)-Deg-([-+\d\.eE]+)$')
+    events_by_frame = {}
+    max_frame = 0
+    global_ref_timestamps = 0
+    end_session = None
+    for row in logger_rows:
+        try:
+            frame = int(row.get('Frame', '0'))
+            if frame > max_frame:
+                max_frame = frame
+            val = row.get('Value', '')
+            m = wheel_pattern.match(val)
+            if m:
+                events_by_frame[frame] = {'index': int(m.group(1)), 'count': int(m.group(2)),
+                                          'deg': float(m.group(3))}
+            elif val == 'START':
+                global_ref_timestamps = float(row.get('Timestamp'))
+            elif val == 'END':
+                end_session = float(row.get('Timestamp'))
+        except Exception:
+            continue
+
+    n_frames = int(max_frame) + 1
+    if total_frames and total_frames > n_frames:
+        n_frames = int(total_frames)
+    dx = np.zeros(n_frames, dtype=np.float32)
+    degrees = np.zeros(n_frames, dtype=np.float64)
+    counts = np.zeros(n_frames, dtype=np.float32)
+    timestamps = np.zeros(n_frames, dtype=np.float32)
+    last_deg = None
+    last_index = None
+    last_dtheta = 0.0
+    frame_time = {}
+    for row in logger_rows:
+        try:
+            f = int(row.get('Frame', '0'))
+            if f not in frame_time:
+                frame_time[f] = float(row.get('Timestamp', '0'))
+        except Exception:
+            pass
+    for f in range(n_frames):
+        evt = events_by_frame.get(f)
+        if evt:
+            idx = evt['index']
+            deg = evt['deg']
+            if last_deg is None or last_index is None:
+                dtheta = 0.0
+            elif idx == last_index:
+                dtheta = last_dtheta
+            else:
+                dtheta = (deg - last_deg) / (idx - last_index)
+            last_dtheta = dtheta
+            last_deg = deg
+            last_index = idx
+            degrees[f] = deg
+            dx[f] = dtheta
+            counts[f] = evt['count']
+        else:
+            if f > 0:
+                degrees[f] = degrees[f-1] + last_dtheta
+                counts[f] = counts[f-1]
+            dx[f] = last_dtheta
+        timestamps[f] = frame_time.get(f, timestamps[f-1] if f > 0 else timestamps[f]-0.016)
+
+    vsig = (degrees % 360.0) * (5.0 / 360.0)
+    distance = dx * (np.pi/180.0) * radius if radius is not None else None
+    if global_ref_timestamps and end_session:
+        kept = ((timestamps.astype(np.float64) >= global_ref_timestamps) &
+                (timestamps.astype(np.float64) <= end_session))
+        dx, vsig, counts, timestamps = dx[kept], vsig[kept], counts[kept], timestamps[kept]
+        distance = distance[kept] if distance is not None else None
+    result = {
+        'dx': dx.astype(np.float32),
+        'vsig': vsig.astype(np.float32),
+        'counts': counts.astype(np.float32),
+        'timestamp': timestamps.astype(np.float32) - global_ref_timestamps,
+    }
+    if distance is not None:
+        result['distance'] = distance.astype(np.float32)
+    return result
+
+
+def _run_both(logger_path, radius=6.0):
+    experiment = launcher.BonsaiExperiment.__new__(launcher.BonsaiExperiment)
+    experiment.config = {'DigitalEncoder': {'radius_cm': radius}}
+    index = LoggerIndex.from_csv(logger_path)
+    new = experiment._reconstruct_encoder_from_logger(index, index.max_frame)[0]
+    ref = reference_reconstruct_encoder(list(index.iter_rows()), index.max_frame, radius)
+    return new, ref
+
+
+def _assert_equivalent(new, ref):
+    for key in ('dx', 'vsig', 'counts', 'distance', 'timestamp'):
+        assert new[key].dtype == ref[key].dtype, key
+        assert np.array_equal(new[key], ref[key]), key
+
+
+def _check(**kwargs):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = write_synthetic_logger(os.path.join(tmp_dir, 'orientations_logger.csv'), **kwargs)
+        new, ref = _run_both(path)
+        _assert_equivalent(new, ref)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_equivalent_dense_wheel():
+    _check(minutes=1.0, seed=1)
+
+
+def test_equivalent_sparse_wheel_and_missing_frame_zero():
+    _check(minutes=0.5, seed=2, skip_frame_zero=True, wheel_probability=0.2)
+
+
+def test_equivalent_without_wheel_events():
+    _check(minutes=0.2, seed=3, wheel_probability=0.0)
+
+
+def test_wheel_radius_comes_from_loaded_config():
+    experiment = launcher.BonsaiExperiment()
+    experiment.load_config()
+    assert experiment.get_wheel_radius() == 6.0
+    experiment.config = {'Encoder': {'radius_cm': 8.0}}
+    assert experiment.get_wheel_radius() == 8.0
+    experiment.config = {'DigitalEncoder': {}, 'Encoder': {}}
+    assert experiment.get_wheel_radius() is None
+    # The distance is only packaged with a radius
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        index = LoggerIndex.from_csv(write_synthetic_logger(os.path.join(tmp_dir, 'orientations_logger.csv'),
+                                                            minutes=0.1, seed=4))
+        assert 'distance' not in experiment._reconstruct_encoder_from_logger(index, index.max_frame)[0]
+        experiment.load_config()
+        assert 'distance' in experiment._reconstruct_encoder_from_logger(index, index.max_frame)[0]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def benchmark(minutes):
+    """Time reference and vectorized reconstruction on a synthetic 60 Hz logger."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = write_synthetic_logger(os.path.join(tmp_dir, 'orientations_logger.csv'), minutes=minutes)
+        index = LoggerIndex.from_csv(path)
+        experiment = launcher.BonsaiExperiment.__new__(launcher.BonsaiExperiment)
+        experiment.config = {'Encoder': {'radius_cm': 6.0}}
+
+        start = time.time()
+        ref = reference_reconstruct_encoder(list(index.iter_rows()), index.max_frame, 6.0)
+        ref_time = time.time() - start
+
+        start = time.time()
+        new = experiment._reconstruct_encoder_from_logger(index, index.max_frame)[0]
+        new_time = time.time() - start
+
+        _assert_equivalent(new, ref)
+        print("Logger rows: %d, frames: %d" % (len(index), index.max_frame + 1))
+        print("Reference:  %.3f s" % ref_time)
+        print("Vectorized: %.3f s (%.1fx)" % (new_time, ref_time / max(new_time, 1e-9)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Encoder reconstruction equivalence test / benchmark')
+    parser.add_argument('--benchmark', action='store_true', help='Run the timing benchmark')
+    parser.add_argument('--minutes', type=float, default=70.0, help='Synthetic session duration')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.minutes)
+    else:
+        test_equivalent_dense_wheel()
+        test_equivalent_sparse_wheel_and_missing_frame_zero()
+        test_equivalent_without_wheel_events()
+        test_wheel_radius_comes_from_loaded_config()
+        print("Encoder reconstruction matches the reference implementation.")
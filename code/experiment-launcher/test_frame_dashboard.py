@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Test for the live frame-timing dashboard.
+
+A synthetic logger (frames dropped at random, see synthetic_session) is
+written in pieces while a LoggerTailer feeds a FrameDashboard; the endpoint is
+queried during the session and the final statistics are checked against the
+finished logger file.
+
+Run:
+    python -m pytest test_frame_dashboard.py
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bonsai_logger import LoggerIndex, LoggerTailer
+from frame_dashboard import FrameDashboard, dropped_frames, SIDECAR_NAME
+from synthetic_session import synthetic_logger_text, write_in_pieces
+
+
+def _write_orientations(folder, n_stims):
+    with open(os.path.join(folder, 'orientations_orientations2025-01-01T00_00_00.csv'), 'w') as f:
+        f.write('BlockLabel,Orientation,Id\r\n')
+        for k in range(n_stims):
+            f.write('Block %d,0,stim%d\r\n' % (k // 10, k))
+
+
+def _expected(path):
+    index = LoggerIndex.from_csv(path)
+    frame_times = index.timestamps[index.frame_rows]
+    window = frame_times[frame_times >= frame_times[-1] - 10]
+    intervals = np.diff(window)
+    frame_numbers = index.frames[index.frame_rows]
+    wheel_times = index.timestamps[index.wheel_rows]
+    recent = wheel_times >= wheel_times[-1] - 1.0
+    deg = index.wheel_deg[recent]
+    return {
+        'frames': len(frame_times),
+        'missing_frames': int(frame_numbers[-1] - frame_numbers[0] + 1 - len(frame_numbers)),
+        'mean_10s': np.mean(intervals) * 1000.0,
+        'p99_10s': np.percentile(intervals, 99) * 1000.0,
+        'dropped_10s': dropped_frames(intervals),
+        'last_stim': index.value(index.stim_rows[-1]),
+        'wheel_speed': (deg[-1] - deg[0]) / (wheel_times[recent][-1] - wheel_times[recent][0]),
+    }
+
+
+def test_dashboard_matches_finished_logger():
+    folder = tempfile.mkdtemp()
+    try:
+        text = synthetic_logger_text(minutes=0.5, seed=7)
+        _write_orientations(folder, 100)
+        dashboard = FrameDashboard(folder, port=0, wheel_radius_cm=6.0, write_interval=0.0)
+        dashboard.start()
+
+        half = len(text) // 2
+        tailer = LoggerTailer(folder, poll_interval=0.002)
+        tailer.add_listener(dashboard.update)
+        tailer.start()
+        path = write_in_pieces(os.path.join(folder, 'orientations_logger2025-01-01T00_00_00.csv'), text[:half], seed=7)
+        with open(path, 'ab') as f:
+            f.write(text[half:].encode('ascii'))
+        time.sleep(0.05)
+        live = json.loads(urlopen(dashboard.url).read().decode('utf-8'))
+        assert sorted(live['windows']) == ['10s', '1s', '60s'] and live['frames'] > 0
+
+        assert tailer.finish(path)[0] is not None
+        dashboard.stop()
+        stats = dashboard.stats.snapshot
+        expected = _expected(path)
+        assert stats['frames'] == expected['frames']
+        assert stats['total_dropped_frames'] == expected['missing_frames'] > 0
+        window = stats['windows']['10s']
+        assert abs(window['mean_interval_ms'] - expected['mean_10s']) < 1e-6
+        assert abs(window['p99_interval_ms'] - expected['p99_10s']) < 1e-6
+        assert window['dropped_frames'] == expected['dropped_10s']
+        assert stats['started'] and stats['ended']
+        if expected['last_stim'].startswith('StimStart-'):
+            stim_id = expected['last_stim'][len('StimStart-'):]
+            assert stats['stim_id'] == stim_id
+            assert stats['block_label'] == 'Block %d' % (int(stim_id[4:]) // 10)
+        assert abs(stats['wheel_speed_deg_per_s'] - expected['wheel_speed']) < 1e-6
+        assert abs(stats['wheel_speed_cm_per_s'] - expected['wheel_speed'] * np.pi / 180 * 6.0) < 1e-6
+        with open(os.path.join(folder, SIDECAR_NAME), 'r') as f:
+            assert json.load(f) == json.loads(json.dumps(stats))
+        assert dashboard.server is None
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_dropped_frames_counts_missing_refreshes():
+    nominal = 1.0 / 60
+    intervals = np.array([1, 1, 2, 1, 3, 1.4, 1.6]) * nominal
+    assert dropped_frames(intervals) == 1 + 2 + 1
+
+
+if __name__ == '__main__':
+    test_dashboard_matches_finished_logger()
+    test_dropped_frames_counts_missing_refreshes()
+    print("Frame dashboard statistics match the finished logger.")
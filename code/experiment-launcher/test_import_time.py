@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Import-time budget for bonsai_experiment_launcher.
+
+The launcher is imported in a fresh interpreter with mpeconfig and the
+pywin32 modules made unimportable (as on a Linux workstation). The import
+must succeed, must not load numpy, yaml, psutil, mpeconfig, the win32
+modules or the opto-tagging code, and must stay within IMPORT_BUDGET_SECONDS
+(best of three runs).
+
+Run:
+    python -m pytest test_import_time.py
+"""
+import os
+import sys
+import json
+import subprocess
+
+LAUNCHER_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_BUDGET_SECONDS = 0.15
+DEFERRED_MODULES = ['numpy', 'yaml', 'psutil', 'mpeconfig', 'win32job', 'win32api', 'win32con',
+                    'opto_tagging', 'opto_waveforms', 'bonsai_logger', 'session_pickle', 'session_arrays',
+                    'simulation']
+
+IMPORT_SCRIPT = """
+import sys, time, json
+for name in ('mpeconfig', 'win32job', 'win32api', 'win32con'):
+    sys.modules[name] = None  # import fails, like on a machine without them
+sys.path.insert(0, %r)
+start = time.time()
+import bonsai_experiment_launcher
+seconds = time.time() - start
+loaded = [name for name in %r if sys.modules.get(name) is not None]
+print(json.dumps({'seconds': seconds, 'loaded': loaded}))
+"""
+
+
+def _import_once():
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT % (LAUNCHER_DIR, DEFERRED_MODULES)],
+                                     stderr=subprocess.STDOUT)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def test_launcher_import_is_lazy_and_fast():
+    runs = [_import_once() for _ in range(3)]
+    assert runs[0]['loaded'] == [], "Loaded at import: %s" % runs[0]['loaded']
+    best = min(run['seconds'] for run in runs)
+    assert best < IMPORT_BUDGET_SECONDS, "Launcher import took %.3f s (budget %.3f s)" % (
+        best, IMPORT_BUDGET_SECONDS)
+
+
+def test_rig_modules_load_on_first_use():
+    sys.path.insert(0, LAUNCHER_DIR)
+    import bonsai_experiment_launcher as launcher
+    import numpy
+    assert launcher.np.zeros is numpy.zeros
+    assert launcher.bonsai_logger.LoggerIndex.__module__ == 'bonsai_logger'
+    from opto_tagging import generatePulseTrain
+    train = generatePulseTrain(10, 200, 5, 1)
+    assert train.shape == (10000,) and train.max() == 1.0
+
+
+if __name__ == '__main__':
+    test_launcher_import_is_lazy_and_fast()
+    test_rig_modules_load_on_first_use()
+    print("Launcher import is lazy and within budget.")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""Test for the phase-level timing of launcher runs (see launcher_profile.py).
+
+Run (Python 2.7 env):
+    python -m pytest test_launcher_profile.py
+"""
+import os
+import json
+import time
+import pickle
+import shutil
+import datetime
+import tempfile
+
+from launcher_stubs import headless_launcher
+from backup_queue import BackupQueue, QUEUE_NAME
+from launcher_profile import LauncherProfile, PeakMemorySampler, sidecar_path
+from synthetic_session import write_synthetic_session
+
+launcher = headless_launcher()
+
+
+def _busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def test_phases_record_wall_cpu_and_peak_rss():
+    profile = LauncherProfile(interval=0.01)
+    with profile.phase('outer'):
+        with profile.phase('allocate'):
+            block = b'x' * (64 * 1024 * 1024)
+            time.sleep(0.1)
+            del block
+        with profile.phase('busy'):
+            _busy(0.2)
+        time.sleep(0.05)
+    try:
+        with profile.phase('fails'):
+            raise ValueError('no table')
+    except ValueError:
+        pass
+    pending = profile.begin('pending')
+
+    data = profile.to_dict()
+    phases = dict((record['name'], record) for record in data['phases'])
+    assert [record['name'] for record in data['phases']] == ['outer', 'allocate', 'busy', 'fails']
+    assert data['open'] == ['pending']
+    # The allocation was freed before the phase ended; the sampler saw the peak
+    assert phases['allocate']['peak_rss_delta_bytes'] > 32 * 1024 * 1024
+    assert phases['busy']['cpu_seconds'] > 0.1 and phases['allocate']['cpu_seconds'] < 0.1
+    assert phases['outer']['wall_seconds'] >= phases['allocate']['wall_seconds'] + phases['busy']['wall_seconds']
+    assert phases['outer']['peak_rss_delta_bytes'] >= phases['allocate']['peak_rss_delta_bytes']
+    assert phases['fails']['error'] == 'ValueError: no table' and phases['busy']['error'] is None
+    assert data['totals']['busy']['count'] == 1
+
+    profile.end(pending)
+    profile.end(pending)
+    assert profile.to_dict()['totals']['pending']['count'] == 1 and not profile.to_dict()['open']
+    assert len(profile.summary_lines()) == 5
+
+
+def test_sampler_measures_a_block():
+    with PeakMemorySampler(interval=0.002) as sampler:
+        block = b'x' * (64 * 1024 * 1024)
+        time.sleep(0.05)
+        del block
+    assert sampler.peak_increase > 32 * 1024 * 1024
+    assert sampler.peak_rss - sampler.start_rss == sampler.peak_increase
+    # The sampling thread stops with the last watch
+    time.sleep(0.05)
+    assert sampler._thread is None
+
+
+def test_save_output_records_profile():
+    folder = tempfile.mkdtemp(suffix='_bonsai')
+    try:
+        write_synthetic_session(folder, 'short_test', minutes=0.5, seed=2)
+        experiment = launcher.BonsaiExperiment()
+        experiment.session_folder = folder
+        experiment.session_output_path = os.path.join(folder, 'session.pkl')
+        experiment.params.update({'bonsai_path': '', 'session_backup_dir': os.path.join(folder, 'backup')})
+        experiment.mouse_id = 'mouse'
+        experiment.start_time = datetime.datetime.now()
+        experiment.save_output()
+        assert experiment.wait_for_backups(30)
+
+        with open(experiment.output_path, 'rb') as f:
+            profile = pickle.load(f)['launcher_profile']
+        names = [record['name'] for record in profile['phases']]
+        assert names == ['index_logger', 'load_and_process_bonsai_data', 'reconstruct_encoder', 'wecanpicklethat']
+        assert all(record['wall_seconds'] >= 0 and record['peak_rss_delta_bytes'] >= 0 for record in profile['phases'])
+
+        assert experiment.profile_path == sidecar_path(experiment.output_path) == os.path.join(folder, 'session.profile.json')
+        with open(experiment.profile_path) as f:
+            sidecar = json.load(f)
+        assert [record['name'] for record in sidecar['phases']][-3:] == ['pickle_write', 'session_arrays', 'backups']
+        assert sidecar['session_uuid'] == experiment.session_uuid and sidecar['pkl'] == 'session.pkl'
+        assert sidecar['totals']['backups']['count'] == 1 and not sidecar['open']
+        # The session backup holds the final sidecar, copied once after its last write
+        with open(os.path.join(folder, 'backup', os.path.basename(folder), 'session.profile.json')) as f:
+            assert json.load(f) == sidecar
+        queue = BackupQueue(os.path.join(folder, QUEUE_NAME))
+        sidecar_jobs = [job for job in queue.jobs if job['source'] == experiment.profile_path]
+        assert len(sidecar_jobs) == 1 and sidecar_jobs[0]['attempts'] == 1 and not queue.pending()
+
+        # Turned off by parameter
+        experiment = launcher.BonsaiExperiment()
+        experiment.session_folder = folder
+        experiment.session_output_path = os.path.join(folder, 'plain.pkl')
+        experiment.params.update({'bonsai_path': '', 'write_launcher_profile': False})
+        experiment.start_time = datetime.datetime.now()
+        experiment.save_output()
+        assert experiment.profile_path is None and not os.path.exists(os.path.join(folder, 'plain.profile.json'))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_phases_record_wall_cpu_and_peak_rss()
+    test_sampler_measures_a_block()
+    test_save_output_records_profile()
+    print("Launcher phases are timed into the pkl and the JSON sidecar.")
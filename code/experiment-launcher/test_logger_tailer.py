@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Equivalence test for live logger tailing.
+
+Writes a synthetic orientations_logger CSV in random-sized pieces (often cut in
+the middle of a line) while a LoggerTailer follows it, then checks that the
+live index and timing map are identical to parsing the finished file in batch.
+
+Run:
+    python -m pytest test_logger_tailer.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bonsai_logger import LoggerIndex, TimingMapBuilder, LoggerTailer
+from synthetic_session import synthetic_logger_text, write_in_pieces
+
+
+def _write_while_tailing(folder, text, seed=0):
+    path = os.path.join(folder, 'orientations_logger2025-01-01T00_00_00.csv')
+    tailer = LoggerTailer(folder, poll_interval=0.002)
+    tailer.start()
+    return write_in_pieces(path, text, seed), tailer
+
+
+def _assert_same(live_index, live_map, batch_index, batch_map):
+    for name, _ in LoggerIndex._ARRAYS:
+        assert np.array_equal(getattr(live_index, name), getattr(batch_index, name)), name
+    assert live_index.value_table == batch_index.value_table
+    assert (live_index.start_row, live_index.end_row, live_index.max_frame) == \
+        (batch_index.start_row, batch_index.end_row, batch_index.max_frame)
+    assert live_map.as_dict() == batch_map.as_dict()
+
+
+def test_live_tailing_matches_batch():
+    folder = tempfile.mkdtemp()
+    try:
+        path, tailer = _write_while_tailing(folder, synthetic_logger_text(seed=1), seed=1)
+        live_index, live_map = tailer.finish(path)
+        batch_index = LoggerIndex.from_csv(path)
+        batch_map = TimingMapBuilder.from_index(batch_index)
+        assert live_index is not None
+        assert len(batch_index) > 0 and len(batch_map.stim_ids) > 10 and batch_map.movies
+        _assert_same(live_index, live_map, batch_index, batch_map)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_unterminated_last_line_is_parsed():
+    folder = tempfile.mkdtemp()
+    try:
+        text = synthetic_logger_text(minutes=0.05, seed=2).rstrip('\r\n')
+        path, tailer = _write_while_tailing(folder, text, seed=2)
+        live_index, live_map = tailer.finish(path)
+        batch_index = LoggerIndex.from_csv(path)
+        _assert_same(live_index, live_map, batch_index, TimingMapBuilder.from_index(batch_index))
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_falls_back_to_batch_on_other_file():
+    folder = tempfile.mkdtemp()
+    try:
+        path, tailer = _write_while_tailing(folder, synthetic_logger_text(minutes=0.05), seed=3)
+        assert tailer.finish(path + '.other') == (None, None)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_live_tailing_matches_batch()
+    test_unterminated_last_line_is_parsed()
+    test_falls_back_to_batch_on_other_file()
+    print("Live logger tailing matches batch parsing.")
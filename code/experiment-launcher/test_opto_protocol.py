@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Test for the single-buffer, hardware-timed opto-tagging protocol on simulated devices.
+
+Run (Python 2.7 env):
+    python -m pytest test_opto_protocol.py
+"""
+import os
+import glob
+import time
+import shutil
+import pickle
+import tempfile
+
+import numpy as np
+
+import opto_tagging
+from opto_protocol import compile_protocol, run_buffered, N_LINES, SWEEP_LINE, STIM_LINE
+from simulated_nidaq import SimulatedAnalogOutput, SimulatedDigitalOutput
+
+
+def test_protocol_compiles_to_one_buffer():
+    waveforms = [np.array([0.5, 1.0, 0.5]), np.ones(5)]
+    levels = [2.0, 1.0, 3.0]
+    conditions = [1, 0, 1]
+    isis = [0.0004, 0.00021, 0.0002]
+    analog, digital, schedule = compile_protocol(levels, conditions, waveforms, isis, sampleRate=10000., lead_in=0.001)
+
+    # 10 samples lead-in, trials of 5 + 4, 3 + 2 and 5 + 2 samples, 1 sample with every line low
+    assert schedule['onset_samples'].tolist() == [10, 19, 24]
+    assert schedule['offset_samples'].tolist() == [15, 22, 29]
+    assert len(analog) == len(digital) == 32 and schedule['duration'] == 32 / 10000.
+    assert np.allclose(schedule['onset_times'], [0.001, 0.0019, 0.0024])
+    expected = np.zeros(32)
+    expected[10:15] = 2.0
+    expected[19:22] = [0.5, 1.0, 0.5]
+    expected[24:29] = 3.0
+    assert np.array_equal(analog, expected)
+    stim = np.zeros(32, dtype=bool)
+    stim[10:15] = stim[19:22] = stim[24:29] = True
+    assert digital.shape == (32, N_LINES) and digital.dtype == np.uint8
+    assert np.array_equal(digital[:, STIM_LINE] == 1, stim)
+    assert (digital[:31, SWEEP_LINE] == 1).all() and not digital[31].any()
+    # Only the sweep and stimulus lines are ever high, as in the trial loop's writes
+    others = [line for line in range(N_LINES) if line not in (SWEEP_LINE, STIM_LINE)]
+    assert not digital[:, others].any()
+
+
+def test_buffered_run_is_one_clocked_write():
+    ao = SimulatedAnalogOutput('Dev1', channels=[1], realtime=True)
+    do = SimulatedDigitalOutput('Dev1', 2, realtime=True)
+    waveforms = [np.ones(100), np.linspace(0, 1, 200)]
+    levels = np.array([1.15, 1.28, 1.345] * 4)
+    conditions = np.array([0, 1] * 6)
+    isis = np.random.RandomState(0).random_sample(12) * 0.005 + 0.01
+    start = time.time()
+    schedule = run_buffered(levels, conditions, waveforms, isis, ao, do, sampleRate=10000., lead_in=0.05)
+    elapsed = time.time() - start
+
+    assert len(ao.writes) == len(do.writes) == 1
+    assert do.buffer.shape == (len(ao.buffer), N_LINES)
+    assert ao.clock['mode'] == do.clock['mode'] == 'finite'
+    assert do.clock['source'] == '/Dev1/ao/SampleClock' and do.clock['buffer_size'] == len(ao.buffer)
+    # The digital task is armed before the analog task starts the clock
+    assert do.started_at <= ao.started_at
+    assert ao.cleared and do.cleared
+    assert elapsed >= schedule['duration'] * 0.95
+    onsets = schedule['onset_samples']
+    assert np.allclose(ao.buffer[onsets], levels * np.array([1.0, 0.0] * 6))
+    assert np.allclose(ao.buffer[onsets + 99], levels * np.array([1.0, 99 / 199.] * 6))
+    # ISIs are embedded as whole samples between waveform end and the next onset
+    assert (onsets[1:] - schedule['offset_samples'][:-1]).tolist() == np.round(isis[:-1] * 10000).astype(int).tolist()
+
+
+def test_optotagging_buffered_on_simulated_devices():
+    folder = tempfile.mkdtemp()
+    try:
+        devices = []
+        open_devices = opto_tagging.open_devices
+
+        def recording_devices(simulate=False):
+            devices.extend(open_devices(simulate))
+            return devices
+
+        opto_tagging.open_devices = recording_devices
+        try:
+            timing = opto_tagging.optotagging('mouse', operation_mode='pretest', level_list=[1.0, 2.0],
+                                              output_dir=folder, execution_mode='buffered', simulate=True)
+        finally:
+            opto_tagging.open_devices = open_devices
+        ao, do = devices
+        assert isinstance(ao, SimulatedAnalogOutput) and len(ao.writes) == 1
+        # pretest: two 2 s steps with 1 s ISIs after the 5 s lead-in
+        assert timing['mode'] == 'buffered' and timing['onset_times'].tolist() == [5.0, 8.0]
+        assert ao.buffer.max() == 2.0 and len(ao.buffer) == 110001
+        with open(glob.glob(os.path.join(folder, '*_mouse.opto.pkl'))[0], 'rb') as f:
+            saved = pickle.load(f)
+        assert saved['opto_execution_mode'] == 'buffered'
+        assert saved['opto_timing']['stats']['onset_interval_error']['max'] == 0.0
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_simulated_digital_output_rejects_port_values():
+    do = SimulatedDigitalOutput('Dev1', 2)
+    do.start()
+    do.write(np.array([0, 0, 1, 1, 0, 0, 0, 0], dtype=np.uint8))
+    for data in (np.array([12], dtype=np.uint8), np.array([4, 12, 4], dtype=np.uint8),
+                 np.zeros((3, 4), dtype=np.uint8), np.array([0, 0, 4, 0, 0, 0, 0, 0], dtype=np.uint8)):
+        try:
+            do.write(data)
+            assert False, 'accepted data the toolbox would misread: %r' % data
+        except ValueError:
+            pass
+    assert len(do.writes) == 1
+
+
+if __name__ == '__main__':
+    test_protocol_compiles_to_one_buffer()
+    test_simulated_digital_output_rejects_port_values()
+    test_buffered_run_is_one_clocked_write()
+    test_optotagging_buffered_on_simulated_devices()
+    print("Opto protocols compile to one hardware-timed buffer.")
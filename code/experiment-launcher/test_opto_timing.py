@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Test for the measured opto-tagging timing log, on simulated devices.
+
+Run (Python 2.7 env):
+    python -m pytest test_opto_timing.py
+"""
+import numpy as np
+
+import opto_tagging
+from opto_timing import TRIAL_STAMPS, perf_counter, summarize, log_lines
+from simulated_nidaq import SimulatedAnalogOutput, SimulatedDigitalOutput
+
+
+def _protocol():
+    waveforms = [np.ones(20), np.ones(50)]
+    levels = np.array([1.0, 2.0, 3.0, 1.5, 2.5, 0.5])
+    conditions = np.array([0, 1, 0, 1, 0, 1])
+    isis = np.array([0.004, 0.006, 0.005, 0.003, 0.004, 0.002])
+    return levels, conditions, waveforms, isis
+
+
+def test_summary_statistics():
+    stats = summarize([0.001, -0.003, 0.002, np.nan])
+    assert stats['n'] == 3 and abs(stats['mean']) < 1e-12 and stats['min'] == -0.003 and stats['max'] == 0.002
+    assert 0.002 < stats['p95_abs'] <= 0.003
+    assert summarize([])['mean'] is None
+    start = perf_counter()
+    assert perf_counter() >= start
+
+
+def test_trial_loop_is_timed():
+    levels, conditions, waveforms, isis = _protocol()
+    ao = SimulatedAnalogOutput('Dev1', channels=[1])
+    do = SimulatedDigitalOutput('Dev1', 2)
+    timing = opto_tagging.run_optotagging(levels, conditions, waveforms, isis, 10000., devices=(ao, do),
+                                          lead_in=0.01)
+    stamps = timing['stamps']
+    assert timing['mode'] == 'trials' and timing['stamp_names'] == list(TRIAL_STAMPS)
+    assert stamps.shape == (6, 4) and not np.isnan(stamps).any()
+    # Stamps increase within and across trials, after the lead-in
+    assert (np.diff(stamps.ravel()) >= 0).all() and stamps[0, 0] >= 0.01
+    assert timing['sweep_off'] >= stamps[-1, 3] + isis[-1]
+    # Every trial wrote stim on, the scaled waveform and stim off
+    assert len(do.writes) == 2 + 2 * 6 and len(ao.writes) == 6
+    assert [w.max() for t, w in ao.writes] == levels.tolist()
+
+    stats = timing['stats']
+    assert sorted(stats) == ['ao_write', 'isi_error', 'onset_interval_error', 'stim_off_write', 'stim_on_write']
+    assert stats['isi_error']['n'] == 5 and stats['isi_error']['min'] > -0.001
+    assert stats['onset_interval_error']['n'] == 5
+    assert len(log_lines(timing)) == 6
+
+
+def test_buffered_mode_has_sample_exact_timing():
+    levels, conditions, waveforms, isis = _protocol()
+    devices = (SimulatedAnalogOutput('Dev1', channels=[1]), SimulatedDigitalOutput('Dev1', 2))
+    timing = opto_tagging.run_optotagging(levels, conditions, waveforms, isis, 10000., execution_mode='buffered',
+                                          devices=devices, lead_in=0.01)
+    assert timing['mode'] == 'buffered' and timing['stats']['buffer_write']['n'] == 1
+    assert timing['stats']['isi_error']['p95_abs'] < 1e-9
+    assert timing['stats']['onset_interval_error']['p95_abs'] < 1e-9
+    assert abs(timing['onset_times'][0] - 0.01) < 1e-12
+
+
+if __name__ == '__main__':
+    test_summary_statistics()
+    test_trial_loop_is_timed()
+    test_buffered_mode_has_sample_exact_timing()
+    print("Opto writes are timed and their jitter summarized.")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Test for the cached opto-tagging waveform bank.
+
+The bank must reproduce the original waveform definitions sample for sample;
+LEGACY_* below are those definitions as they were in optotagging().
+
+Run (Python 2.7 env):
+    python -m pytest test_opto_waveforms.py
+"""
+import os
+import glob
+import shutil
+import pickle
+import tempfile
+
+import numpy as np
+
+import opto_tagging
+from opto_waveforms import WaveformBank, pulse_train, standard_waveform, GLO_PULSE_TRAINS
+
+
+def legacy_pulse_train(pulseWidth, pulseInterval, numRepeats, riseTime, sampleRate=10000.):
+    data = np.zeros((int(sampleRate),), dtype=np.float64)
+    rise_and_fall = (((1 - np.cos(np.arange(sampleRate*riseTime/1000., dtype=np.float64)*2*np.pi/10))+1)-1)/2
+    half_length = int(rise_and_fall.size / 2)
+    peak = np.ones((int(sampleRate*(pulseWidth-riseTime*2)/1000),))
+    pulse = np.concatenate((rise_and_fall[:half_length], peak, rise_and_fall[half_length:]))
+    interval = int(pulseInterval*sampleRate/1000.)
+    for i in range(0, numRepeats):
+        data[i*interval:i*interval+pulse.size] = pulse
+    return data
+
+
+def legacy_waveforms(sampleRate=10000):
+    data_cosine = (((1 - np.cos(np.arange(sampleRate, dtype=np.float64) * 2*np.pi/sampleRate)) + 1) - 1)/2
+    rise_and_fall = (((1 - np.cos(np.arange(sampleRate*0.001, dtype=np.float64)*2*np.pi/10))+1)-1)/2
+    half_length = int(rise_and_fall.size / 2)
+
+    def pulse(peak_seconds):
+        return np.concatenate((rise_and_fall[:half_length], np.ones((int(sampleRate*peak_seconds),)),
+                               rise_and_fall[half_length:]))
+    data_2ms_10Hz = np.zeros((sampleRate,), dtype=np.float64)
+    for i in range(0, 10):
+        interval = int(sampleRate / 10)
+        data_2ms_10Hz[i*interval:i*interval+pulse(0.001).size] = pulse(0.001)
+    data_5ms = np.zeros((sampleRate,), dtype=np.float64)
+    data_5ms[:pulse(0.004).size] = pulse(0.004)
+    data_10ms = np.zeros((sampleRate,), dtype=np.float64)
+    data_10ms[:pulse(0.009).size] = pulse(0.009)
+    data_10s = np.zeros((sampleRate*10,), dtype=np.float64)
+    data_10s[:-2] = 1
+    return {'cosine_1s': data_cosine, '2ms_10Hz': data_2ms_10Hz, '5ms': data_5ms, '10ms': data_10ms,
+            '10s': data_10s, '10ms_5Hz': legacy_pulse_train(10, 200, 5, 1),
+            '6ms_40Hz': legacy_pulse_train(6, 25, 40, 1)}
+
+
+def test_waveforms_match_legacy_definitions():
+    for name, expected in legacy_waveforms().items():
+        assert np.array_equal(standard_waveform(name), expected), name
+    assert sorted(GLO_PULSE_TRAINS) == ['10ms_5Hz', '6ms_40Hz']
+    # Overlapping pulses (interval shorter than the pulse) and other sample rates
+    for args in [(10, 200, 5, 1), (6, 25, 40, 1), (3, 1, 50, 1), (20, 100, 10, 2), (4, 50, 1, 0.5)]:
+        assert np.array_equal(pulse_train(*args), legacy_pulse_train(*args)), args
+        assert np.array_equal(pulse_train(*args, sampleRate=20000.), legacy_pulse_train(*args, sampleRate=20000.))
+        assert np.array_equal(opto_tagging.generatePulseTrain(*args), legacy_pulse_train(*args))
+    try:
+        pulse_train(10, 500, 3, 1)
+        assert False, "A pulse train longer than 1 s was accepted"
+    except ValueError:
+        pass
+
+
+def test_bank_caches_memory_mapped_npy():
+    folder = tempfile.mkdtemp()
+    try:
+        cache_dir = os.path.join(folder, 'opto_waveforms')
+        bank = WaveformBank(cache_dir)
+        first = bank.standard('2ms_10Hz')
+        train = bank.pulse_train(8, 50, 20, 1)
+        assert (bank.hits, bank.misses) == (0, 2) and len(glob.glob(os.path.join(cache_dir, '*.npy'))) == 2
+        assert isinstance(first, np.memmap) and not first.flags.writeable
+
+        again = WaveformBank(cache_dir)
+        assert np.array_equal(again.standard('2ms_10Hz'), first)
+        assert np.array_equal(again.pulse_train(8, 50, 20, 1), legacy_pulse_train(8, 50, 20, 1))
+        assert (again.hits, again.misses) == (2, 0)
+        # Parameters and sample rate are part of the key
+        assert again.entry_path('pulse_train', [8, 50, 20, 1]) != again.entry_path('pulse_train', [8, 50, 10, 1])
+        assert WaveformBank(cache_dir, 20000).pulse_train(8, 50, 20, 1).size == 20000
+        # No cache directory: built in memory
+        assert not isinstance(WaveformBank().standard('10s'), np.memmap)
+        assert np.array_equal(train, again.pulse_train(8, 50, 20, 1))
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_optotagging_uses_cached_waveforms():
+    folder = tempfile.mkdtemp()
+    calls = []
+    run_optotagging = opto_tagging.run_optotagging
+
+    def recording_run(*args, **kwargs):
+        calls.append(args)
+        # No NI-DAQ here: play the protocol on simulated devices
+        return run_optotagging(*args[:5], execution_mode='buffered', simulate=True)
+
+    opto_tagging.run_optotagging = recording_run
+    try:
+        cache_dir = os.path.join(folder, 'cache')
+        opto_tagging.optotagging('mouse', output_dir=folder, waveform_cache_dir=cache_dir,
+                                 pulse_trains=[[8, 50, 20, 1]], condition_list=[4, 6], level_list=[1.0])
+        levels, conditions, waveforms, isis, sample_rate = calls[0][:5]
+        assert sorted(set(conditions.tolist())) == [4, 6] and len(levels) == 100
+        assert np.array_equal(waveforms[6], legacy_pulse_train(8, 50, 20, 1))
+        assert all(isinstance(waveform, np.memmap) for waveform in waveforms)
+
+        with open(glob.glob(os.path.join(folder, '*_mouse.opto.pkl'))[0], 'rb') as f:
+            saved = pickle.load(f)
+        expected = legacy_waveforms()
+        assert [np.array_equal(a, b) for a, b in zip(saved['opto_waveforms'], [
+            expected['2ms_10Hz'], expected['5ms'], expected['10ms'], expected['cosine_1s'],
+            expected['10ms_5Hz'], expected['6ms_40Hz']])] == [True] * 6
+        assert type(saved['opto_waveforms'][0]) is np.ndarray
+    finally:
+        opto_tagging.run_optotagging = run_optotagging
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_waveforms_match_legacy_definitions()
+    test_bank_caches_memory_mapped_npy()
+    test_optotagging_uses_cached_waveforms()
+    print("Opto waveforms match the original definitions and are cached.")
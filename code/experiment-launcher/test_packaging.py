@@ -21,7 +21,7 @@ def main():
                 print("Directory not found: %s" % session_dir)
                 return
 
-        # Inject mock mpeconfig before importing launcher to avoid production dependency
+        # Inject mock mpeconfig (sourced when the experiment is created) to avoid production dependency
         mock = types.ModuleType('mpeconfig')
         def source_configuration(name, send_start_log=False):
                 return {
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Test for the concurrent pre-flight setup.
+
+Run (Python 2.7 env):
+    python -m pytest test_preflight.py
+"""
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from launcher_stubs import headless_launcher
+from preflight import PreflightScheduler
+
+launcher = headless_launcher()
+
+
+def test_independent_steps_overlap_and_dependencies_wait():
+    order = []
+    lock = threading.Lock()
+
+    def step(name, seconds):
+        def run():
+            time.sleep(seconds)
+            with lock:
+                order.append(name)
+            return True
+        return run
+
+    scheduler = PreflightScheduler(max_workers=4)
+    scheduler.add('fetch', step('fetch', 0.4))
+    scheduler.add('folder', step('folder', 0.1))
+    scheduler.add('checksum', step('checksum', 0.2), requires=('folder',))
+    scheduler.add('install', step('install', 0.1), requires=('fetch',))
+    start = time.time()
+    assert scheduler.run()
+    elapsed = time.time() - start
+
+    assert order == ['folder', 'checksum', 'fetch', 'install']
+    assert elapsed < 0.45 + 0.1 + 0.2
+    timings = scheduler.timings
+    assert timings['install']['start'] >= timings['fetch']['end']
+    assert timings['checksum']['start'] < timings['fetch']['end']
+    assert all(t['status'] == 'ok' for t in timings.values())
+    lines = scheduler.summary_lines()
+    assert len(lines) == 5 and lines[-1].split()[0] == 'total'
+
+
+def test_failed_step_skips_dependents_only():
+    ran = []
+    scheduler = PreflightScheduler(max_workers=1)
+    scheduler.add('repository', lambda: False)
+    scheduler.add('output_path', lambda: ran.append('output_path') or True)
+    scheduler.add('bonsai', lambda: ran.append('bonsai') or True, requires=('repository',))
+
+    def broken():
+        raise IOError('disk full')
+    scheduler.add('table', broken, requires=('output_path',))
+    assert not scheduler.run()
+    assert ran == ['output_path']
+    assert scheduler.failed_steps() == ['repository', 'table']
+    assert scheduler.timings['bonsai']['status'] == 'skipped'
+    assert scheduler.timings['table']['error'] == 'disk full'
+
+    try:
+        scheduler.add('late', lambda: True, requires=('missing',))
+        assert False, 'unknown requirement accepted'
+    except ValueError:
+        pass
+
+
+def test_launcher_preflight_prepares_session():
+    folder = tempfile.mkdtemp()
+    try:
+        repo = os.path.join(folder, 'openscope-community-predictive-processing')
+        os.makedirs(os.path.join(repo, 'bonsai'))
+        with open(os.path.join(repo, 'bonsai', 'Bonsai.exe'), 'w') as f:
+            f.write('')
+        with open(os.path.join(repo, 'workflow.bonsai'), 'w') as f:
+            f.write('<WorkflowBuilder/>')
+
+        experiment = launcher.BonsaiExperiment()
+        experiment.params.update({
+            'local_repository_path': folder,
+            'bonsai_exe_path': 'bonsai/Bonsai.exe',
+            'bonsai_path': 'workflow.bonsai',
+            'output_path': os.path.join(folder, 'output', 'session.pkl'),
+        })
+        experiment._run_started = time.time()
+        assert experiment.run_preflight()
+
+        assert experiment.bonsai_exe_path == os.path.join(repo, 'bonsai', 'Bonsai.exe')
+        assert experiment.session_folder == os.path.join(folder, 'output', 'session_bonsai')
+        assert os.path.isdir(experiment.session_folder)
+        assert experiment.script_checksum == hashlib.md5(b'<WorkflowBuilder/>').hexdigest()
+        assert sorted(experiment.preflight_timings) == [
+            'bonsai', 'output_path', 'repository', 'stimulus_table', 'workflow_checksum']
+
+        experiment.params['bonsai_exe_path'] = 'bonsai/missing.exe'
+        assert not experiment.run_preflight()
+        assert experiment.preflight_timings['bonsai']['status'] == 'failed'
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_independent_steps_overlap_and_dependencies_wait()
+    test_failed_step_skips_dependents_only()
+    test_launcher_preflight_prepares_session()
+    print("Pre-flight steps overlap and respect their dependencies.")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Test for the Bonsai process tree telemetry and its kill policy.
+
+Run (Python 2.7 env):
+    python -m pytest test_process_telemetry.py
+"""
+import os
+import sys
+import time
+import subprocess
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from process_telemetry import TelemetryRingBuffer, ProcessTreeMonitor, TELEMETRY_FIELDS
+
+# Parent that starts a child growing its memory by 1 MB every 20 ms (up to 400 MB)
+GROWING_TREE = """
+import subprocess, sys, time
+child = subprocess.Popen([sys.executable, '-c',
+    'import time\\nblocks = []\\nfor _ in range(400):\\n    blocks.append(bytearray(1024 * 1024))\\n    time.sleep(0.02)'])
+child.wait()
+"""
+
+
+def _kill_tree(pid):
+    try:
+        parent = psutil.Process(pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+def _feed(monitor, times, rss):
+    for t, r in zip(times, rss):
+        monitor.buffer.append(time=t, rss=r, cpu_percent=1.0, num_threads=4, num_handles=10, num_procs=1)
+
+
+def test_ring_buffer_keeps_latest_samples_in_order():
+    buffer = TelemetryRingBuffer(5)
+    for k in range(3):
+        buffer.append(time=k, rss=10 * k)
+    assert len(buffer) == 3 and buffer.dropped == 0
+    assert buffer.field('rss').tolist() == [0, 10, 20]
+    for k in range(3, 12):
+        buffer.append(time=k, rss=10 * k)
+    assert len(buffer) == 5 and buffer.dropped == 7
+    assert buffer.field('time').tolist() == [7, 8, 9, 10, 11]
+    assert buffer.latest('rss') == 110
+    times, rss = buffer.last('rss', 2)
+    assert times.tolist() == [9, 10, 11] and rss.tolist() == [90, 100, 110]
+    assert sorted(buffer.arrays) == sorted(name for name, _ in TELEMETRY_FIELDS)
+
+
+def test_growth_rate_policy():
+    monitor = ProcessTreeMonitor(os.getpid(), capacity=1000, growth_window=60.0, max_growth_mb_per_min=100.0)
+    times = np.arange(0, 30, 0.5)
+    # Half a window of fast growth is not enough to decide
+    _feed(monitor, times, 200e6 + times * 5e6)
+    assert monitor.growth_rate() is None and monitor.check_runaway() is None
+    times = np.arange(30, 90, 0.5)
+    _feed(monitor, times, 200e6 + times * 5e6)
+    assert abs(monitor.growth_rate() - 5e6 * 60 / 1024.0 ** 2) < 1.0
+    assert 'MB/min' in monitor.check_runaway()
+
+    # A large but stable process is fine; noise around a flat level too
+    monitor = ProcessTreeMonitor(os.getpid(), capacity=1000, growth_window=60.0, max_growth_mb_per_min=100.0)
+    rnd = np.random.RandomState(0)
+    times = np.arange(0, 120, 0.5)
+    _feed(monitor, times, 2e9 + rnd.normal(0, 50e6, len(times)))
+    assert monitor.check_runaway() is None
+
+    monitor.max_memory_percent = 0.0
+    assert 'physical memory' in monitor.check_runaway()
+
+    # Growth during the warm-up (startup, movie preloads) is not counted
+    monitor = ProcessTreeMonitor(os.getpid(), capacity=1000, growth_window=60.0, max_growth_mb_per_min=100.0,
+                                 growth_warmup=60.0)
+    times = np.arange(0, 110, 0.5)
+    _feed(monitor, times, np.where(times < 60, times * 20e6, 1.2e9))
+    assert monitor.growth_rate() is None and monitor.check_runaway() is None
+    _feed(monitor, np.arange(110, 125, 0.5), np.full(30, 1.2e9))
+    assert abs(monitor.growth_rate()) < 1.0 and monitor.check_runaway() is None
+
+
+def test_system_memory_rise_policy():
+    # camstim's rule: system memory use over its level before launch
+    monitor = ProcessTreeMonitor(os.getpid(), max_system_memory_rise=5.0, system_memory_baseline=0.0)
+    _feed(monitor, [0.0], [1e6])
+    assert 'before launch' in monitor.check_runaway()
+    monitor = ProcessTreeMonitor(os.getpid(), max_system_memory_rise=90.0)
+    _feed(monitor, [0.0], [1e6])
+    assert monitor.check_runaway() is None
+    assert monitor.to_dict()['max_system_memory_rise'] == 90.0
+
+
+def test_monitor_samples_and_kills_growing_tree():
+    process = subprocess.Popen([sys.executable, '-c', GROWING_TREE])
+    try:
+        monitor = ProcessTreeMonitor(process.pid, interval=0.05, capacity=40, growth_window=1.0,
+                                     max_growth_mb_per_min=200.0)
+        start = time.time()
+        killed = []
+        monitor.run(lambda: process.poll() is None and time.time() - start < 20,
+                    on_runaway=lambda reason: killed.append(reason) or _kill_tree(process.pid))
+        assert killed and monitor.kill_reason == killed[0]
+        data = monitor.to_dict()
+        assert data['n_samples'] == min(40, monitor.buffer.n_written)
+        fields = data['fields']
+        assert fields['num_procs'].max() == 2 and fields['num_threads'].min() >= 1
+        assert np.all(np.diff(fields['time']) > 0)
+        assert fields['rss'][-1] > fields['rss'][0]
+    finally:
+        _kill_tree(process.pid)
+        process.wait()
+
+
+if __name__ == '__main__':
+    test_ring_buffer_keeps_latest_samples_in_order()
+    test_growth_rate_policy()
+    test_system_memory_rise_policy()
+    test_monitor_samples_and_kills_growing_tree()
+    print("Process telemetry samples the tree and applies the growth-rate policy.")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Test for the batch re-packaging command.
+
+Builds session folders from synthetic logger/orientation CSV files, then checks
+that a first run packages every session, a second run skips them all, a changed
+CSV triggers a re-package and a folder without logger is reported as failed.
+
+Run (Python 2.7 env):
+    python -m pytest test_repackage_sessions.py
+"""
+import os
+import csv
+import shutil
+import tempfile
+
+from launcher_stubs import headless_launcher
+from bonsai_logger import LoggerIndex, TimingMapBuilder
+from synthetic_session import synthetic_logger_text, synthetic_orientations
+import repackage_sessions
+
+launcher = headless_launcher()
+
+
+def _write_session(root, name, seed):
+    folder = os.path.join(root, name + '_bonsai')
+    os.makedirs(folder)
+    logger_path = os.path.join(folder, 'orientations_logger2025-01-01T00_00_00.csv')
+    with open(logger_path, 'w') as f:
+        f.write(synthetic_logger_text(minutes=0.1, seed=seed))
+    timing_map = TimingMapBuilder.from_index(LoggerIndex.from_csv(logger_path))
+    ended = [stim_id for stim_id, end in zip(timing_map.stim_ids, timing_map.stim_end_frame) if end >= 0]
+    rows = synthetic_orientations(ended, seed=seed)
+    with open(os.path.join(folder, 'orientations_orientations2025-01-01T00_00_00.csv'), 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=sorted(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    return folder
+
+
+def _statuses(manifest):
+    return dict((os.path.basename(folder), entry['status']) for folder, entry in manifest['sessions'].items())
+
+
+def test_repackage_skips_unchanged_sessions():
+    root = tempfile.mkdtemp()
+    try:
+        first = _write_session(root, '250101120000_mouse1', seed=1)
+        _write_session(os.path.join(root, 'nested'), '250102120000_mouse2', seed=2)
+        manifest = repackage_sessions.repackage([root], workers=2)
+        assert _statuses(manifest) == {'250101120000_mouse1_bonsai': 'packaged',
+                                       '250102120000_mouse2_bonsai': 'packaged'}
+        entry = manifest['sessions'][first]
+        assert entry['output_bytes'] == os.path.getsize(os.path.join(first, repackage_sessions.OUTPUT_NAME))
+        assert entry['input_bytes'] > 0 and entry['error'] is None
+        output = launcher.pickle.load(open(entry['output_path'], 'rb'))
+        assert len(output['stimuli']) == 3 and output['items']['foraging']['encoders']
+
+        manifest = repackage_sessions.repackage([root], workers=2)
+        assert set(_statuses(manifest).values()) == set(['skipped'])
+        assert manifest['sessions'][first]['input_hash'] == entry['input_hash']
+
+        with open(os.path.join(first, 'orientations_logger2025-01-01T00_00_00.csv'), 'a') as f:
+            f.write('99999,9999.0,Frame\r\n')
+        os.makedirs(os.path.join(root, 'broken_bonsai'))
+        manifest = repackage_sessions.repackage([root], workers=1)
+        assert _statuses(manifest) == {'250101120000_mouse1_bonsai': 'packaged',
+                                       '250102120000_mouse2_bonsai': 'skipped',
+                                       'broken_bonsai': 'failed'}
+        assert 'orientations_logger' in manifest['sessions'][os.path.join(root, 'broken_bonsai')]['error']
+        assert manifest['summary']['failed'] == 1
+        assert repackage_sessions.load_manifest(os.path.join(root, repackage_sessions.MANIFEST_NAME)) == manifest
+    finally:
+        shutil.rmtree(root)
+
+
+def test_output_dir_and_original_pkl():
+    root = tempfile.mkdtemp()
+    try:
+        folder = _write_session(root, '250101120000_mouse1', seed=3)
+        original = {'params': {'stage': 'archived_stage', 'mouse_id': 'mouse1'}, 'mouse_id': 'mouse1',
+                    'user_id': 'someone', 'session_uuid': 'uuid-1', 'config': {'SweepStim': {'backupdir': root}}}
+        with open(os.path.join(folder, '250101120000.pkl'), 'wb') as f:
+            launcher.pickle.dump(original, f, 2)
+        output_dir = os.path.join(root, 'out')
+        manifest = repackage_sessions.repackage([folder], output_dir=output_dir, workers=1)
+        entry = manifest['sessions'][folder]
+        assert entry['status'] == 'packaged'
+        assert entry['output_path'] == os.path.join(output_dir, '250101120000_mouse1_bonsai.pkl')
+        assert os.path.isfile(os.path.join(output_dir, repackage_sessions.MANIFEST_NAME))
+        output = launcher.pickle.load(open(entry['output_path'], 'rb'))
+        assert (output['mouse_id'], output['user_id'], output['session_uuid']) == ('mouse1', 'someone', 'uuid-1')
+        assert output['stage'] == 'archived_stage'
+        # No copy to the rig backup folder
+        assert not os.path.isdir(os.path.join(root, 'mouse1'))
+
+        # Nor to the session backup folder of the original params, and no backup queue left behind
+        backup_dir = os.path.join(root, 'session_backup')
+        original['params'].update({'session_backup_dir': backup_dir, 'backup_bonsai_csvs': True})
+        with open(os.path.join(folder, '250101120000.pkl'), 'wb') as f:
+            launcher.pickle.dump(original, f, 2)
+        manifest = repackage_sessions.repackage([folder], workers=1, force=True)
+        assert manifest['sessions'][folder]['status'] == 'packaged'
+        assert not os.path.exists(backup_dir)
+        assert not os.path.exists(os.path.join(folder, 'backup_queue.json'))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    test_repackage_skips_unchanged_sessions()
+    test_output_dir_and_original_pkl()
+    print("Batch re-packaging packages, skips and reports sessions.")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Test for the offline-first repository sync against a local bare repository.
+
+The "remote" is a bare repository reached through file://, which is moved
+away to check that pinned commits are set up without any network access.
+
+Run (Python 2.7 env):
+    python -m pytest test_repository_sync.py
+"""
+import os
+import shutil
+import tempfile
+import subprocess
+
+from launcher_stubs import headless_launcher
+
+launcher = headless_launcher()
+
+REPO_NAME = 'openscope-community-predictive-processing'
+
+
+def _git(args, cwd=None):
+    return subprocess.check_output(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + args,
+                                   cwd=cwd, stderr=subprocess.STDOUT).decode('utf-8').strip()
+
+
+def _make_remote(folder):
+    """Bare repository with three commits on main; returns (url, [sha1, sha2, sha3])."""
+    work = os.path.join(folder, 'work')
+    bare = os.path.join(folder, 'remote.git')
+    _git(['init', '-q', '-b', 'main', work])
+    shas = []
+    for k in range(3):
+        with open(os.path.join(work, 'version.txt'), 'w') as f:
+            f.write('version %d\n' % k)
+        _git(['add', 'version.txt'], cwd=work)
+        _git(['commit', '-q', '-m', 'version %d' % k], cwd=work)
+        shas.append(_git(['rev-parse', 'HEAD'], cwd=work))
+    _git(['clone', '-q', '--bare', work, bare])
+    _git(['config', 'uploadpack.allowReachableSHA1InWant', 'true'], cwd=bare)
+    _git(['config', 'uploadpack.allowFilter', 'true'], cwd=bare)
+    return 'file://' + bare, shas
+
+
+def _experiment(folder, url, commit, **params):
+    experiment = launcher.BonsaiExperiment()
+    experiment.params.update({
+        'repository_url': url,
+        'repository_commit_hash': commit,
+        'local_repository_path': folder,
+    })
+    experiment.params.update(params)
+    return experiment
+
+
+def _version(folder):
+    with open(os.path.join(folder, REPO_NAME, 'version.txt'), 'r') as f:
+        return f.read().strip()
+
+
+def _go_offline(url):
+    bare = url[len('file://'):]
+    shutil.move(bare, bare + '.offline')
+    return lambda: shutil.move(bare + '.offline', bare)
+
+
+def test_pinned_commit_is_set_up_offline():
+    folder = tempfile.mkdtemp()
+    try:
+        url, shas = _make_remote(folder)
+        local = os.path.join(folder, 'local')
+        assert _experiment(local, url, shas[0]).setup_repository()
+        assert _version(local) == 'version 0'
+
+        back_online = _go_offline(url)
+        # Local edits are discarded, like the reset of update_repository
+        with open(os.path.join(local, REPO_NAME, 'version.txt'), 'w') as f:
+            f.write('edited\n')
+        assert _experiment(local, url, shas[2]).setup_repository()
+        assert _version(local) == 'version 2'
+        experiment = _experiment(local, url, shas[2])
+        assert experiment.get_current_commit_hash(os.path.join(local, REPO_NAME)) == shas[2]
+        assert experiment.setup_repository()
+        # An unreachable commit fails without deleting the working tree
+        assert not _experiment(local, url, 'f' * 40).setup_repository()
+        assert _version(local) == 'version 2'
+        back_online()
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_shallow_partial_clone_fetches_pinned_commit():
+    folder = tempfile.mkdtemp()
+    try:
+        url, shas = _make_remote(folder)
+        local = os.path.join(folder, 'local')
+        experiment = _experiment(local, url, shas[1], repository_clone_depth=1, repository_partial_clone=True)
+        assert experiment.setup_repository()
+        repo = os.path.join(local, REPO_NAME)
+        assert _version(local) == 'version 1'
+        assert _git(['rev-parse', '--is-shallow-repository'], cwd=repo) == 'true'
+        assert _git(['config', 'remote.origin.promisor'], cwd=repo) == 'true'
+        assert not experiment.has_local_commit(repo, shas[0])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_mirror_cache_serves_clones_offline():
+    folder = tempfile.mkdtemp()
+    try:
+        url, shas = _make_remote(folder)
+        mirror = os.path.join(folder, 'mirror.git')
+        first = os.path.join(folder, 'first')
+        assert _experiment(first, url, shas[0], repository_mirror_path=mirror).setup_repository()
+        assert os.path.isdir(mirror) and _version(first) == 'version 0'
+
+        back_online = _go_offline(url)
+        second = os.path.join(folder, 'second')
+        experiment = _experiment(second, url, shas[2], repository_mirror_path=mirror)
+        assert experiment.setup_repository()
+        assert _version(second) == 'version 2'
+        assert _git(['remote', 'get-url', 'origin'], cwd=os.path.join(second, REPO_NAME)) == url
+        back_online()
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_branch_target_reclones_after_force_push():
+    folder = tempfile.mkdtemp()
+    try:
+        url, shas = _make_remote(folder)
+        local = os.path.join(folder, 'local')
+        assert _experiment(local, url, 'main').setup_repository()
+        assert _version(local) == 'version 2'
+
+        # Rewrite main with unrelated history: the pull cannot merge it, a fresh clone can
+        rewrite = os.path.join(folder, 'rewrite')
+        _git(['init', '-q', '-b', 'main', rewrite])
+        with open(os.path.join(rewrite, 'version.txt'), 'w') as f:
+            f.write('rewritten\n')
+        _git(['add', 'version.txt'], cwd=rewrite)
+        _git(['commit', '-q', '-m', 'rewritten'], cwd=rewrite)
+        _git(['push', '-q', '--force', url, 'main'], cwd=rewrite)
+        assert _experiment(local, url, 'main').setup_repository()
+        assert _version(local) == 'rewritten'
+
+        # Offline, a branch target keeps the working tree instead of deleting it for a clone
+        back_online = _go_offline(url)
+        experiment = _experiment(local, url, 'main')
+        assert not experiment.setup_repository() and experiment._repository_fetch_failed
+        assert _version(local) == 'rewritten'
+        back_online()
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_pinned_commit_is_set_up_offline()
+    test_branch_target_reclones_after_force_push()
+    test_shallow_partial_clone_fetches_pinned_commit()
+    test_mirror_cache_serves_clones_offline()
+    print("Pinned commits are set up offline; shallow, partial and mirrored clones work.")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""Test for the compressed columnar companion file of the session pkl.
+
+Run (Python 2.7 env):
+    python -m pytest test_session_arrays.py
+"""
+import os
+import sys
+import shutil
+import pickle
+import zipfile
+import datetime
+import tempfile
+
+import numpy as np
+
+from launcher_stubs import headless_launcher
+from bonsai_tables import column_strings, column_values
+from synthetic_session import write_synthetic_session, ORIENTATION_COLUMNS
+from session_arrays import SessionArrays, SessionArraysWriter
+
+launcher = headless_launcher()
+
+RUNNING_PHASES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'stimulus-control', 'src',
+                                  'Mindscope', 'running_phases')
+
+
+def test_chunked_partial_reads():
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'session.npz')
+        writer = SessionArraysWriter(chunk_rows=100)
+        writer.add('logger/Timestamp', np.arange(1050) * 0.5)
+        writer.add_category('logger/Value', [k % 7 - 1 for k in range(1050)], ['a', 'b', 'c', 'd', 'e', 'f'])
+        writer.add_values('stimuli/0/sweep_table/Phase', [0.25, 'wheel', None, 1])
+        writer.add_values('stimuli/0/sweep_table/TrialNumber', [1, 2, 3, 4])
+        writer.add('empty', np.zeros((0, 2)))
+        writer.set_attrs('session', mouse_id='mouse', start=(np.int64(3), np.float64(0.5)))
+        writer.write(path)
+        with zipfile.ZipFile(path) as archive:
+            assert len([n for n in archive.namelist() if n.startswith('logger/Timestamp/')]) == 11
+
+        with SessionArrays(path) as arrays:
+            assert arrays.attrs('session') == {'mouse_id': 'mouse', 'start': [3, 0.5]}
+            assert arrays.shape('logger/Timestamp') == (1050,)
+            assert (arrays.read('logger/Timestamp', 195, 305) == np.arange(195, 305) * 0.5).all()
+            assert (arrays['logger/Timestamp'] == np.arange(1050) * 0.5).all()
+            assert arrays.strings('logger/Value', 0, 8) == [None, 'a', 'b', 'c', 'd', 'e', 'f', None]
+            sweep_table = arrays.group('stimuli/0/sweep_table')
+            assert sorted(sweep_table) == ['Phase', 'TrialNumber']
+            assert sweep_table['Phase'] == ['0.25', 'wheel', None, '1']
+            assert sweep_table['TrialNumber'].dtype == np.int64 and sweep_table['TrialNumber'].tolist() == [1, 2, 3, 4]
+            assert arrays.read('empty').shape == (0, 2) and arrays.read('logger/Timestamp', 5, 5).shape == (0,)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_save_output_writes_companion():
+    folder = tempfile.mkdtemp(suffix='_bonsai')
+    try:
+        write_synthetic_session(folder, 'short_test', minutes=0.5, seed=2)
+        experiment = launcher.BonsaiExperiment()
+        experiment.session_folder = folder
+        experiment.session_output_path = os.path.join(folder, 'session.pkl')
+        experiment.params.update({'bonsai_path': '', 'session_arrays_chunk_rows': 1000})
+        experiment.mouse_id = 'mouse'
+        experiment.start_time = datetime.datetime.now()
+        experiment.save_output()
+        assert experiment.arrays_path == os.path.join(folder, 'session.npz')
+
+        with open(experiment.output_path, 'rb') as f:
+            data = pickle.load(f)
+        logger = data['bonsai']['logger']
+        encoder = data['items']['foraging']['encoders'][0]
+        with SessionArrays(experiment.output_path) as arrays:
+            assert arrays.attrs('session')['pkl'] == 'session.pkl'
+            assert arrays.shape('logger/Frame')[0] == logger['n_rows'] > 1000
+            assert (arrays.read('logger/Timestamp') == logger['columns']['Timestamp']['values']).all()
+            assert arrays.strings('logger/Value', 1500, 2500) == column_values(logger, 'Value')[1500:2500]
+            orientations = data['bonsai']['orientations']
+            # Columns in the order of the CSV header
+            assert orientations['fieldnames'] == ORIENTATION_COLUMNS
+            assert arrays.attrs('orientations')['fieldnames'] == orientations['fieldnames']
+            assert arrays.strings('orientations/Id') == column_strings(orientations, 'Id')
+            assert arrays.strings('timing/stim_ids') == column_strings(orientations, 'Id')
+            assert (arrays['encoders/0/dx'] == encoder['dx']).all()
+            assert arrays.attrs('encoders/0')['gain'] == 1.0
+
+            for i, stimulus in enumerate(data['stimuli']):
+                group = 'stimuli/%d' % i
+                assert arrays.attrs(group)['dimnames'] == stimulus['dimnames']
+                frames = arrays[group + '/sweep_frames']
+                assert frames.shape == (len(stimulus['sweep_frames']), 2)
+                assert [tuple(int(v) for v in row) for row in frames] == stimulus['sweep_frames']
+                sweep_table = arrays.group(group + '/sweep_table')
+                for k, dimname in enumerate(stimulus['dimnames']):
+                    expected = [row[k] for row in stimulus['sweep_table']]
+                    column = sweep_table[dimname]
+                    if isinstance(column, list):
+                        expected = [None if v is None else str(v) for v in expected]
+                    else:
+                        column = column.tolist()
+                    assert column == expected, dimname
+
+        # extract_running_phase reads the wheel rows from the companion instead of the pkl
+        sys.path.insert(0, RUNNING_PHASES_DIR)
+        import extract_running_phase
+        from_arrays = extract_running_phase.logger_rows_from_arrays(experiment.arrays_path)
+        from_pkl = extract_running_phase.logger_rows_from_session(data['bonsai'])
+        assert extract_running_phase.parse_wheel_rows(from_arrays) == \
+            extract_running_phase.parse_wheel_rows(from_pkl)
+
+        # Turned off by parameter
+        experiment = launcher.BonsaiExperiment()
+        experiment.session_folder = folder
+        experiment.session_output_path = os.path.join(folder, 'plain.pkl')
+        experiment.params.update({'bonsai_path': '', 'write_session_arrays': False})
+        experiment.start_time = datetime.datetime.now()
+        experiment.save_output()
+        assert experiment.arrays_path is None and not os.path.exists(os.path.join(folder, 'plain.npz'))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_chunked_partial_reads()
+    test_save_output_writes_companion()
+    print("Session arrays are written next to the pkl and read lazily.")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Round-trip test for the single-pass session pkl writer.
+
+Run:
+    python -m pytest test_session_pickle.py
+"""
+import io
+import os
+import sys
+import pickle
+import datetime
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import session_pickle
+
+
+def _session():
+    params = {'mouse_id': 'test_mouse', 'levels': [1.15, 1.28]}
+    return {
+        'fps': 60.0,
+        'params': params,
+        'items': {'foraging': {'encoders': [{'dx': np.arange(5, dtype=np.float32)}], 'params': params}},
+        'stimuli': [{'sweep_table': [(0.5, 'wheel'), (1, 2)], 'sweep_order': np.array([0, 1, 1])}],
+        'startdatetime': datetime.datetime(2025, 1, 1, 12, 30),
+        'objects': np.array([1, 'a', None], dtype=object),
+        'lock': threading.Lock(),
+        'callback': lambda x: x,
+        '_private_counter': 3,
+        'unpickleable': [],
+    }
+
+
+def test_screening_matches_trial_pickling():
+    data = _session()
+    for key, value in data.items():
+        try:
+            pickle.dumps(value, 2)
+            expected = True
+        except Exception:
+            expected = False
+        assert session_pickle.is_pickleable(value) == expected, key
+
+
+def test_single_pass_file_loads_as_plain_dict():
+    screened = session_pickle.wecanpicklethat(_session())
+    assert sorted(screened['unpickleable']) == ['callback', 'lock']
+    assert '_private_counter' not in screened
+
+    f = io.BytesIO()
+    report = session_pickle.dump_session(screened, f)
+    loaded = pickle.loads(f.getvalue())
+
+    assert sorted(loaded.keys()) == sorted(screened.keys())
+    assert sorted(r[0] for r in report) == sorted(screened.keys())
+    # Everything but the empty dict header and STOP opcode is accounted to a key
+    empty_dict = session_pickle.pickle.dumps({}, session_pickle.PICKLE_PROTOCOL)
+    assert sum(r[1] for r in report) + len(empty_dict) == len(f.getvalue())
+    assert loaded['params'] == screened['params']
+    assert loaded['startdatetime'] == screened['startdatetime']
+    assert loaded['stimuli'][0]['sweep_table'] == [(0.5, 'wheel'), (1, 2)]
+    assert np.array_equal(loaded['items']['foraging']['encoders'][0]['dx'], np.arange(5, dtype=np.float32))
+    assert list(loaded['objects']) == [1, 'a', None]
+
+
+def test_odd_keys_are_listed_as_unpickleable():
+    screened = session_pickle.wecanpicklethat({'': 1, 3: 2, '_private': 3, 'ok': 4})
+    assert sorted(screened) == ['ok', 'unpickleable']
+    assert sorted(screened['unpickleable'], key=str) == ['', 3]
+
+
+if __name__ == '__main__':
+    test_screening_matches_trial_pickling()
+    test_single_pass_file_loads_as_plain_dict()
+    test_odd_keys_are_listed_as_unpickleable()
+    print("Single-pass session pkl round-trips.")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""Test for the hardware-free simulation of the rig (see simulation.py).
+
+Runs bonsai_experiment_launcher.py --simulate end to end in a subprocess:
+pre-flight, table generation, the simulated Bonsai, monitoring, packaging,
+opto-tagging and backups.
+
+Run (Python 2.7 env):
+    python -m pytest test_simulation.py
+"""
+import os
+import sys
+import glob
+import json
+import time
+import pickle
+import shutil
+import tempfile
+import subprocess
+
+import simulation
+from bonsai_logger import LoggerIndex
+
+LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bonsai_experiment_launcher.py')
+
+
+def _load(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def test_launcher_runs_on_simulated_rig():
+    root = tempfile.mkdtemp()
+    try:
+        params_path = os.path.join(root, 'params.json')
+        with open(params_path, 'w') as f:
+            json.dump({
+                'bonsai_path': 'code/stimulus-control/src/Standard_oddball_slap2.bonsai',
+                'bonsai_exe_path': 'code/stimulus-control/bonsai/Bonsai.exe',
+                'mouse_id': 'sim_mouse', 'user_id': 'simulation',
+                'session_type': 'short_test', 'stimulus_seed': 4,
+                'telemetry_interval': 0.1, 'live_logger_tailing': True,
+                'disable_opto': False, 'opto_params': {'operation_mode': 'pretest'},
+            }, f)
+        env = dict(os.environ, CAMSTIM_SIMULATION_ROOT=root)
+        start = time.time()
+        process = subprocess.Popen([sys.executable, LAUNCHER, params_path, '--simulate', '--speedup', '300'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        output = process.communicate()[0].decode('utf-8', 'replace')
+        elapsed = time.time() - start
+        assert process.returncode == 0, output
+
+        session_folder, = glob.glob(os.path.join(root, 'data', '*_bonsai'))
+        pkl_path, = glob.glob(os.path.join(session_folder, '*.pkl'))
+        data = _load(pkl_path)
+        orientations, = glob.glob(os.path.join(session_folder, 'orientations_orientations*.csv'))
+        logger, = glob.glob(os.path.join(session_folder, 'orientations_logger*.csv'))
+        with open(orientations) as f:
+            n_trials = len(f.readlines()) - 1
+        index = LoggerIndex.from_csv(logger)
+        # The short_test table played once: ~10 minutes of frames in a few seconds
+        assert index.max_frame + 1 > 60 * 60 * 8 and n_trials > 1000
+        assert elapsed < 120, output
+        assert 'with %d total presentations' % n_trials in output
+        assert len(data['stimuli']) == 8
+        assert data['bonsai_telemetry']['n_samples'] > 5
+        assert data['config']['SweepStim']['backupdir'] == os.path.join(root, 'backup')
+        assert os.path.isfile(os.path.splitext(pkl_path)[0] + '.npz')
+        # Backups were verified before the launcher exited
+        backup = os.path.join(root, 'backup', 'sim_mouse', 'output', os.path.basename(pkl_path))
+        assert os.path.isfile(backup) and _load(backup)['session_uuid'] == data['session_uuid']
+        # Opto-tagging ran on simulated NI-DAQ devices into camstim's OUTPUT_DIR
+        opto = _load(glob.glob(os.path.join(root, 'output', '*_sim_mouse.opto.pkl'))[0])
+        assert opto['opto_execution_mode'] == 'buffered' and opto['opto_timing']['mode'] == 'buffered'
+        assert 'Simulated Bonsai finished' in output
+        # Phase timings: up to the pickle write in the pkl, the whole run in the sidecar
+        names = set(record['name'] for record in data['launcher_profile']['phases'])
+        assert names >= set(['load_parameters', 'preflight', 'setup_repository', 'generate_stimulus_csv', 'bonsai',
+                             'opto_tagging', 'load_and_process_bonsai_data', 'wecanpicklethat'])
+        with open(os.path.splitext(pkl_path)[0] + '.profile.json') as f:
+            sidecar = json.load(f)
+        assert sidecar['simulate'] and not sidecar['open']
+        assert set(['save_output', 'pickle_write', 'backups']) <= set(sidecar['totals'])
+        assert sidecar['totals']['bonsai']['wall_seconds'] > 1.0
+    finally:
+        shutil.rmtree(root)
+
+
+def test_fake_bonsai_paces_and_rejects_bad_arguments():
+    folder = tempfile.mkdtemp()
+    try:
+        table = os.path.join(folder, 'table.csv')
+        with open(table, 'w') as f:
+            f.write('Block_Number,Block_Label,Duration,Delay,Orientation,Trial_Type,Block_Type\n')
+            for k in range(20):
+                f.write('1,Std,0.25,0.25,%d,standard,standard_oddball\n' % (k % 2 * 90))
+        with open(os.devnull, 'w') as out:
+            info = simulation.play_session(folder, table, speedup=10, seed=1, out=out)
+        # 5 s before, 20 trials of 0.5 s, 5 s after: 20 s of frames at 10x
+        assert info['frames'] == 1200 and info['trials'] == 20
+        assert 1.9 < info['seconds'] < 5.0
+        with open(info['orientations_path']) as f:
+            assert len(f.readlines()) == 21
+        assert LoggerIndex.from_csv(info['logger_path']).max_frame == 1199
+
+        workflow = os.path.join(folder, 'workflow.bonsai')
+        open(workflow, 'w').close()
+        assert simulation.main([workflow + '.missing', '--property', 'RootFolder=%s' % folder]) == 1
+        assert simulation.main([workflow, '--property', 'RootFolder=%s' % folder]) == 1
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_job_object_kills_assigned_process_on_close():
+    modules = simulation._win32_modules()
+    win32job, win32api = modules['win32job'], modules['win32api']
+    job = win32job.CreateJobObject(None, 'TestJob')
+    info = win32job.QueryInformationJobObject(job, win32job.JobObjectExtendedLimitInformation)
+    info['BasicLimitInformation']['LimitFlags'] = win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+    win32job.SetInformationJobObject(job, win32job.JobObjectExtendedLimitInformation, info)
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        win32job.AssignProcessToJobObject(job, win32api.OpenProcess(1, False, child.pid))
+        win32api.CloseHandle(job)
+        # Killed, not the 60 s sleep running out
+        assert child.wait() != 0
+        assert job.closed and job.pids == [child.pid]
+    finally:
+        if child.poll() is None:
+            child.kill()
+
+
+if __name__ == '__main__':
+    test_launcher_runs_on_simulated_rig()
+    test_fake_bonsai_paces_and_rejects_bad_arguments()
+    test_job_object_kills_assigned_process_on_close()
+    print("The launcher runs end to end on the simulated rig.")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""Test for the in-process stimulus table cache.
+
+The generator is copied to a temporary folder with a synthetic running_phases
+recording, so open loop sessions can be generated and the source hash changed
+without touching the repository.
+
+Run:
+    python -m pytest test_stimulus_cache.py
+"""
+import os
+import sys
+import random
+import shutil
+import tempfile
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stimulus_cache import GENERATOR_PATH, StimulusTableCache, generate_table, load_generator_module
+
+
+def _baseline_generator_source():
+    """Generator source from before build_session_trials (as in pinned repository commits), or None without git."""
+    folder = os.path.dirname(GENERATOR_PATH)
+    try:
+        commits = subprocess.check_output(['git', 'log', '--reverse', '--format=%H', '-S', 'def build_session_trials',
+                                           '--', 'generate_experiment_csv.py'], cwd=folder).split()
+        if not commits:
+            return None
+        return subprocess.check_output(['git', 'show', '%s^:./generate_experiment_csv.py' % commits[0].decode('ascii')],
+                                       cwd=folder)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _generator_copy(folder, source=None):
+    path = os.path.join(folder, 'generate_experiment_csv.py')
+    if source is None:
+        shutil.copyfile(GENERATOR_PATH, path)
+    else:
+        with open(path, 'wb') as f:
+            f.write(source)
+    phases_dir = os.path.join(folder, 'running_phases')
+    os.makedirs(phases_dir)
+    rnd = random.Random(3)
+    with open(os.path.join(phases_dir, 'phases_0.csv'), 'w') as f:
+        f.write('Time,Phase_Radians\n')
+        for k in range(30 * 60 * 20):
+            f.write('%d,%r\n' % (k, rnd.uniform(0, 2 * np.pi)))
+    return path
+
+
+def _read(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def test_cache_hit_matches_generator_output():
+    folder = tempfile.mkdtemp()
+    try:
+        generator_path = _generator_copy(folder)
+        cache = StimulusTableCache(os.path.join(folder, 'cache'), generator_path)
+
+        random.seed(11)
+        np.random.seed(11)
+        expected_random = (random.random(), np.random.random())
+        random.seed(11)
+        np.random.seed(11)
+        first = os.path.join(folder, 'first.csv')
+        n_trials, cache_hit = cache.copy_to('short_test', 5, first)
+        assert not cache_hit and n_trials > 0
+        assert (random.random(), np.random.random()) == expected_random
+
+        second = os.path.join(folder, 'second.csv')
+        assert cache.copy_to('short_test', 5, second) == (n_trials, True)
+        assert _read(first) == _read(second)
+
+        # Same table as the generator script itself writes
+        reference = os.path.join(folder, 'reference.csv')
+        generator = load_generator_module(generator_path, name='reference_generate_experiment_csv')
+        assert generator.generate_single_session_csv('short_test', reference, seed=5)
+        assert _read(reference) == _read(first)
+        assert len(_read(first).splitlines()) == n_trials + 1
+
+        other_seed = cache.entry_path('short_test', 6)
+        assert other_seed != cache.entry_path('short_test', 5)
+        assert cache.get('short_test', 6)[2] is False
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_changed_generator_gives_new_entries():
+    folder = tempfile.mkdtemp()
+    try:
+        generator_path = _generator_copy(folder)
+        cache_dir = os.path.join(folder, 'cache')
+        path, _, _ = StimulusTableCache(cache_dir, generator_path).get('short_test', 1)
+        with open(os.path.join(folder, 'running_phases', 'phases_0.csv'), 'a') as f:
+            f.write('36000,0.5\n')
+        cache = StimulusTableCache(cache_dir, generator_path)
+        assert cache.entry_path('short_test', 1) != path
+        assert cache.get('short_test', 1)[2] is False
+        assert cache.get('short_test', 1)[2] is True
+
+        try:
+            cache.get('no_such_session', 1)
+            assert False, 'unknown session type was cached'
+        except ValueError:
+            pass
+        assert not [name for name in os.listdir(cache_dir) if name.startswith('no_such_session')]
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_generator_without_build_session_trials():
+    source = _baseline_generator_source()
+    if source is None:
+        print("git history unavailable, baseline generator not tested")
+        return
+    folder = tempfile.mkdtemp()
+    try:
+        generator_path = _generator_copy(folder, source)
+        assert not hasattr(load_generator_module(generator_path), 'build_session_trials')
+        cache = StimulusTableCache(os.path.join(folder, 'cache'), generator_path)
+        table = os.path.join(folder, 'table.csv')
+        n_trials, cache_hit = cache.copy_to('short_test', 5, table)
+        assert not cache_hit and n_trials > 100
+        assert len(_read(table).splitlines()) == n_trials + 1
+        assert cache.copy_to('short_test', 5, table) == (n_trials, True)
+
+        direct = os.path.join(folder, 'direct.csv')
+        assert generate_table('short_test', 5, direct, generator_path) == n_trials
+        assert _read(direct) == _read(table)
+        try:
+            generate_table('no_such_session', 1, direct, generator_path)
+            assert False, 'unknown session type was generated'
+        except ValueError:
+            pass
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_launcher_caches_pinned_seeds_only():
+    from launcher_stubs import headless_launcher
+    launcher = headless_launcher()
+    folder = tempfile.mkdtemp()
+    try:
+        generator_path = _generator_copy(folder)
+        cache_dir = os.path.join(folder, 'cache')
+        experiment = launcher.BonsaiExperiment()
+        experiment.get_absolute_path_from_repo = lambda path: generator_path
+        experiment.session_folder = folder
+        experiment.params.update({'session_type': 'short_test', 'stimulus_cache_dir': cache_dir})
+        table = experiment.generate_stimulus_csv()
+        assert table == os.path.join(folder, 'stimulus_table_short_test.csv') and os.path.isfile(table)
+        assert not os.path.exists(cache_dir)
+
+        experiment.params['stimulus_seed'] = 5
+        assert experiment.generate_stimulus_csv() == table
+        assert os.path.isfile(StimulusTableCache(cache_dir, generator_path).entry_path('short_test', 5))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_cache_hit_matches_generator_output()
+    test_changed_generator_gives_new_entries()
+    test_generator_without_build_session_trials()
+    test_launcher_caches_pinned_seeds_only()
+    print("Stimulus table cache matches the generator.")
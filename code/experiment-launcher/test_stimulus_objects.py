@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""Equivalence test for building CAMSTIM stimulus objects from Bonsai blocks.
+
+Compares BonsaiExperiment._create_stimulus_object_from_block (column-wise
+parameter typing, array-backed timing map) with the original per-row
+implementation (kept below as reference_create_stimulus_object, fed with the
+legacy dictionary timing map) on synthetic grating, motor and movie blocks.
+
+Run:
+    python -m pytest test_stimulus_objects.py
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from launcher_stubs import headless_launcher
+from bonsai_logger import LoggerIndex, TimingMapBuilder
+from synthetic_session import synthetic_logger_text, synthetic_orientations
+
+launcher = headless_launcher()
+
+
+def reference_create_stimulus_object(block_data, block_type, timing_map):
+    """Original per-row implementation (dict timing map), kept as the reference."""
+    param_columns = ['Orientation', 'SpatialFrequency', 'TemporalFrequency',
+                        'Contrast', 'Phase', 'DiameterX', 'DiameterY', 'X', 'Y', 'Duration', 'Delay',
+                        'BlockNumber', 'BlockLabel', 'BlockDurationMinutes', 'TrialNumber',
+                        'SequenceNumber','TrialInSequence', 'TrialType', 'BlockType'
+                        ]
+    dimnames = []
+    if block_data:
+        for col in param_columns:
+            if col in block_data[0]:
+                dimnames.append(col)
+    if 'START' in timing_map:
+        ref_frame = timing_map['START'].get('start_frame')
+        ref_timestamp = timing_map['START'].get('start_timestamp')
+    else:
+        ref_frame = 0
+        ref_timestamp = 0.0
+    if block_data and block_data[0].get('BlockType') == 'movie':
+        if 'TrialInSequence' not in dimnames:
+            dimnames.append('TrialInSequence')
+        sweep_frames = []
+        sweep_table = []
+        sweep_order = []
+        global_frame_entries = []
+        trial_index_pos = dimnames.index('TrialInSequence')
+        order_counter = 0
+        for row in block_data:
+            stim_id = row.get('Id', '')
+            timing_info = timing_map.get(stim_id, {})
+            movie_dict = timing_info.get('movie', {}) if isinstance(timing_info, dict) else {}
+            base_params = []
+            for dn in dimnames:
+                if dn == 'TrialInSequence':
+                    base_params.append(None)
+                    continue
+                val = row.get(dn)
+                if val in (None, ''):
+                    base_params.append(None)
+                else:
+                    try:
+                        if '.' in str(val):
+                            base_params.append(float(val))
+                        else:
+                            base_params.append(int(val))
+                    except Exception:
+                        base_params.append(val)
+            frame_items = sorted(movie_dict.items(), key=lambda kv: kv[0])
+            for frame_idx, finfo in frame_items:
+                start_frame = finfo.get('start_frame')-ref_frame
+                end_frame = finfo.get('end_frame', finfo.get('start_frame'))-ref_frame
+                sweep_frames.append((start_frame, end_frame))
+                params = list(base_params)
+                params[trial_index_pos] = frame_idx
+                sweep_table.append(tuple(params))
+                sweep_order.append(order_counter)
+                order_counter += 1
+                st_ts = finfo.get('start_timestamp')-ref_timestamp
+                en_ts = finfo.get('end_timestamp', finfo.get('start_timestamp'))-ref_timestamp
+                if st_ts is not None:
+                    global_frame_entries.append(('start', st_ts))
+                if en_ts is not None:
+                    global_frame_entries.append(('end', en_ts))
+        if global_frame_entries:
+            start_times = [ts for kind, ts in global_frame_entries if kind == 'start']
+            end_times = [ts for kind, ts in global_frame_entries if kind == 'end']
+            if start_times and end_times:
+                ds = min(start_times)
+                de = max(end_times)
+                display_sequence = np.array([[ds, de]]) if np is not None else [[ds, de]]
+            else:
+                display_sequence = np.array([[None, None]]) if np is not None else [[None, None]]
+        else:
+            display_sequence = np.array([[None, None]]) if np is not None else [[None, None]]
+    else:
+        sweep_frames = []
+        sweep_table = []
+        sweep_order = []
+        for idx, row in enumerate(block_data):
+            stim_id = row.get('Id', '')
+            timing_info = timing_map.get(stim_id)
+            if timing_info:
+                start_frame = timing_info.get('start_frame')-ref_frame
+                end_frame = timing_info.get('end_frame')-ref_frame
+                if start_frame is not None and end_frame is not None:
+                    sweep_frames.append((start_frame, end_frame))
+                else:
+                    sweep_frames.append((None, None))
+            else:
+                sweep_frames.append((None, None))
+            param_values = []
+            for dimname in dimnames:
+                value = row.get(dimname)
+                if value in (None, ''):
+                    param_values.append(None)
+                else:
+                    try:
+                        if '.' in str(value):
+                            param_values.append(float(value))
+                        else:
+                            param_values.append(int(value))
+                    except Exception:
+                        param_values.append(value)
+            sweep_table.append(tuple(param_values))
+            sweep_order.append(idx)
+        if sweep_frames:
+            start_ts_list = []
+            end_ts_list = []
+            for row in block_data:
+                tinfo2 = timing_map.get(row.get('Id', ''))
+                if not tinfo2:
+                    continue
+                st2 = tinfo2.get('start_timestamp')-ref_timestamp
+                et2 = tinfo2.get('end_timestamp')-ref_timestamp
+                if st2 is not None:
+                    start_ts_list.append(st2)
+                if et2 is not None:
+                    end_ts_list.append(et2)
+            if start_ts_list and end_ts_list:
+                ds = min(start_ts_list)
+                de = max(end_ts_list)
+                display_sequence = np.array([[ds, de]])
+            else:
+                display_sequence = np.array([[None, None]])
+        else:
+            display_sequence = np.array([[None, None]])
+    sweep_frames_tuples = []
+    for frame_pair in sweep_frames:
+        if isinstance(frame_pair, list):
+            if len(frame_pair) >= 2:
+                sweep_frames_tuples.append((frame_pair[0], frame_pair[1]))
+            else:
+                sweep_frames_tuples.append((None, None))
+        else:
+            sweep_frames_tuples.append(frame_pair)
+    block_label = block_data[0].get('BlockLabel', 'unknown_block')
+    stimulus_obj = {
+        'stim_path': block_label,
+        'stim': block_type,
+        'sweep_frames': sweep_frames_tuples,
+        'sweep_order': sweep_order,
+        'display_sequence': display_sequence,
+        'dimnames': dimnames,
+        'sweep_table': sweep_table
+    }
+    stimulus_obj['bonsai_sweep_frames'] = stimulus_obj['sweep_frames']
+    stimulus_obj['bonsai_display_sequence'] = stimulus_obj['display_sequence']
+    first_frame = min([sf[0] for sf in stimulus_obj['sweep_frames'] if sf[0] is not None])
+    last_frame = max([sf[1] for sf in stimulus_obj['sweep_frames'] if sf[1] is not None])
+    stimulus_obj['sweep_frames'] = [(sf[0]-first_frame if sf[0] is not None else None,
+                                    sf[1]-first_frame if sf[1] is not None else None)
+                                    for sf in stimulus_obj['sweep_frames']]
+    sequence_start_seconds = first_frame / 60.0 if first_frame is not None else None
+    sequence_end_seconds = last_frame / 60.0 if last_frame is not None else None
+    stimulus_obj['display_sequence'] = np.array([[sequence_start_seconds, sequence_end_seconds]])
+    return stimulus_obj
+
+def _assert_same_stimulus(new, ref):
+    assert sorted(new.keys()) == sorted(ref.keys())
+    for key in ref:
+        if isinstance(ref[key], np.ndarray):
+            assert new[key].dtype == ref[key].dtype, key
+            assert new[key].tolist() == ref[key].tolist(), key
+        else:
+            # repr also tells int, float and str values apart
+            assert repr(new[key]) == repr(ref[key]), key
+
+
+def test_stimulus_objects_match_reference():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'orientations_logger.csv')
+        with open(path, 'w') as f:
+            f.write(synthetic_logger_text(minutes=0.5, seed=5))
+        timing_map = TimingMapBuilder.from_index(LoggerIndex.from_csv(path))
+    finally:
+        shutil.rmtree(tmp_dir)
+    legacy_map = timing_map.as_dict()
+
+    experiment = launcher.BonsaiExperiment.__new__(launcher.BonsaiExperiment)
+    # Stimuli without StimEnd (dropped frame, end of logger) fail both implementations
+    ended = [stim_id for stim_id, end in zip(timing_map.stim_ids, timing_map.stim_end_frame) if end >= 0]
+    assert len(ended) < len(timing_map.stim_ids)
+    orientations = synthetic_orientations(ended)
+    grouped = experiment._group_by_block_label(orientations)
+    assert sorted(grouped) == ['Grating block', 'Motor block', 'Movie block']
+    for block_type, block_data in grouped.items():
+        new = experiment._create_stimulus_object_from_block(block_data, block_type, timing_map)
+        ref = reference_create_stimulus_object(block_data, block_type, legacy_map)
+        _assert_same_stimulus(new, ref)
+
+
+def test_param_typing_matches_per_value_rule():
+    experiment = launcher.BonsaiExperiment.__new__(launcher.BonsaiExperiment)
+    columns = [
+        ['1', '2', '-3'], ['1.5', '-0.0', 'nan'], ['0.5', 'wheel', '3'], ['', '2', None],
+        ['1e3', '4'], ['1.2.3', '1.5'], ['.', '1'], [], ['', ''], ['7', '2.5'],
+    ]
+    for values in columns:
+        expected = []
+        for value in values:
+            if value in (None, ''):
+                expected.append(None)
+                continue
+            try:
+                expected.append(float(value) if '.' in str(value) else int(value))
+            except Exception:
+                expected.append(value)
+        typed = experiment._typed_param_column(values)
+        assert repr(typed) == repr(expected), values
+
+
+if __name__ == '__main__':
+    test_stimulus_objects_match_reference()
+    test_param_typing_matches_per_value_rule()
+    print("Stimulus objects match the reference implementation.")
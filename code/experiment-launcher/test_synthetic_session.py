@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Test for the synthetic session generator and the post-processing benchmark.
+
+Run (Python 2.7 env):
+    python -m pytest test_synthetic_session.py
+"""
+import os
+import csv
+import shutil
+import tempfile
+
+from bonsai_logger import LoggerIndex, TimingMapBuilder
+from synthetic_session import write_synthetic_session
+import benchmark_launcher
+
+
+def test_synthetic_session_is_consistent():
+    folder = tempfile.mkdtemp(suffix='_bonsai')
+    try:
+        info = write_synthetic_session(folder, 'short_test', minutes=1.5, seed=3)
+        with open(info['orientations_path'], 'r') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == info['trials'] > 0
+        assert set(r['BlockType'] for r in rows) >= set(['standard_oddball', 'motor_oddball'])
+
+        index = LoggerIndex.from_csv(info['logger_path'])
+        assert len(index) == info['logger_rows'] and index.max_frame == info['frames'] - 1
+        timing_map = TimingMapBuilder.from_index(index)
+        assert timing_map.start is not None and timing_map.end is not None
+        assert list(timing_map.stim_ids) == [r['Id'] for r in rows]
+        # Every trial ends, on or after the frame it started
+        assert (timing_map.stim_end_frame >= timing_map.stim_start_frame).all()
+        assert len(index.wheel_rows) > info['frames'] // 2
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_movies_and_scaling():
+    folder = tempfile.mkdtemp(suffix='_bonsai')
+    try:
+        info = write_synthetic_session(folder, 'short_test', seed=1)
+        timing_map = TimingMapBuilder.from_index(LoggerIndex.from_csv(info['logger_path']))
+        assert len(timing_map.movies) == 2
+        movie = timing_map.movie(sorted(timing_map.movies)[0])
+        # 15 s movie at 30 fps
+        assert len(movie.index) == 450
+        longer = write_synthetic_session(folder, 'short_test', minutes=12, seed=1)
+        assert longer['frames'] == (12 * 60 + 10) * 60 and longer['trials'] > info['trials']
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_benchmark_times_every_stage():
+    folder = tempfile.mkdtemp(suffix='_bonsai')
+    try:
+        write_synthetic_session(folder, 'short_test', minutes=0.5)
+        results = benchmark_launcher.run_benchmark(folder, repeat=2)
+        summary = benchmark_launcher.summarize(results)
+        assert sorted(summary) == sorted(benchmark_launcher.STAGES)
+        assert all(len(results[stage]) == 2 for stage in benchmark_launcher.STAGES)
+        assert results['pkl_bytes'][0] > 0
+        assert not os.path.exists(os.path.join(folder, 'benchmark.pkl'))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    test_synthetic_session_is_consistent()
+    test_movies_and_scaling()
+    test_benchmark_times_every_stage()
+    print("Synthetic sessions package and benchmark.")
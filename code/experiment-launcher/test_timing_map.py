@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""Equivalence test and benchmark for the array-backed timing map.
+
+Compares TimingMapBuilder (dense frame table, event-only loop) with the original
+loop over every logger row (kept below as reference_create_timing_map), on
+synthetic loggers and edge cases: frames going backwards, restarted and
+unterminated stimuli, movie frames outside stimuli, sparse frame numbers,
+unparsable rows and batches of rows.
+
+Run:
+    python -m pytest test_timing_map.py
+    python test_timing_map.py --benchmark [--minutes 70]
+"""
+import os
+import sys
+import csv
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bonsai_logger
+from bonsai_logger import LoggerIndex, TimingMapBuilder
+from synthetic_session import synthetic_logger_text
+
+
+def reference_create_timing_map(logger_data):
+    """Original per-row implementation, kept as the reference."""
+    timing_map = {}
+    try:
+        stim_id = None
+        for row in logger_data:
+            value = row.get('Value', '')
+            frame = row.get('Frame', '0')
+            timestamp = row.get('Timestamp', '0.0')
+            timing_map['Frames'] = timing_map.get('Frames', {})
+            timing_map['Frames'][int(frame)] = float(timestamp)
+            if not value:
+                continue
+            if value.startswith('START'):
+                timing_map['START'] = {'start_frame': int(frame), 'start_timestamp': float(timestamp)}
+            if value.startswith('END'):
+                timing_map['END'] = {'start_frame': int(frame), 'start_timestamp': float(timestamp)}
+            if value.startswith('StimStart-'):
+                stim_id = value.replace('StimStart-', '')
+                timing_map[stim_id] = {'start_frame': int(frame), 'start_timestamp': float(timestamp)}
+            elif value.startswith('StimEnd-'):
+                stim_id = value.replace('StimEnd-', '')
+                if stim_id in timing_map:
+                    if int(frame)-1 in timing_map['Frames']:
+                        timing_map[stim_id]['end_frame'] = int(frame)-1
+                        timing_map[stim_id]['end_timestamp'] = timing_map['Frames'][int(frame)-1]
+                    else:
+                        timing_map[stim_id]['end_frame'] = int(frame)
+                        timing_map[stim_id]['end_timestamp'] = float(timestamp)
+                if stim_id in timing_map and 'movie' in timing_map[stim_id]:
+                    movie_dict = timing_map[stim_id]['movie']
+                    if movie_dict:
+                        last_frame = max(movie_dict.keys())
+                        movie_dict[last_frame]['end_frame'] = int(frame)
+                        movie_dict[last_frame]['end_timestamp'] = float(timestamp)
+            elif value.startswith('MovieFrame-'):
+                fr_int = int(frame)
+                ts_float = float(timestamp)
+                local_frame_index = int(value.replace('MovieFrame-', ''))
+                if stim_id not in timing_map:
+                    continue
+                if 'movie' not in timing_map[stim_id] or timing_map[stim_id]['movie'] is None:
+                    timing_map[stim_id]['movie'] = {}
+                timing_map[stim_id]['movie'][local_frame_index] = {
+                    'start_frame': fr_int, 'start_timestamp': ts_float}
+                if local_frame_index - 1 in timing_map[stim_id]['movie'] and fr_int-1 in timing_map['Frames']:
+                    timing_map[stim_id]['movie'][local_frame_index - 1]['end_frame'] = fr_int-1
+                    timing_map[stim_id]['movie'][local_frame_index - 1]['end_timestamp'] = \
+                        timing_map['Frames'][fr_int-1]
+    except Exception:
+        pass
+    return timing_map
+
+
+EDGE_CASE_ROWS = [
+    (0, 1.0, 'Frame'), (0, 1.0, 'MovieFrame-0'), (1, 1.1, 'START'),
+    (2, 1.2, 'StimStart-a'), (2, 1.2, 'MovieFrame-0'), (3, 1.3, 'MovieFrame-1'),
+    (5, 1.5, 'MovieFrame-2'), (5, 1.5, 'MovieFrame-1'), (6, 1.6, 'StimEnd-a'),
+    (6, 1.6, 'MovieFrame-3'), (4, 1.45, 'Frame'), (5, 1.55, 'StimStart-b'),
+    (4, 1.4, 'StimEnd-b'), (9, 1.9, 'StimStart-c'), (11, 2.1, 'StimEnd-zz'),
+    (12, 2.2, 'StimStart-a'), (13, 2.3, 'StimEnd-a'), (13, 2.3, 'END'),
+    (14, 2.4, 'START'), (15, 2.5, 'Frame'),
+]
+
+
+def _write_rows(path, rows):
+    with open(path, 'w') as f:
+        f.write('Frame,Timestamp,Value\n')
+        for row in rows:
+            f.write('%s,%s,%s\n' % row)
+    return path
+
+
+def _check_file(path, batch_rows=None):
+    with open(path, 'r') as f:
+        expected = reference_create_timing_map(list(csv.DictReader(f)))
+    chunk_rows = bonsai_logger.LOGGER_CHUNK_ROWS
+    try:
+        if batch_rows:
+            bonsai_logger.LOGGER_CHUNK_ROWS = batch_rows
+        index = LoggerIndex.from_csv(path)
+        # Batches of rows fed to the builder as the tailer does
+        builder = TimingMapBuilder()
+        incremental_index = LoggerIndex(path)
+        with open(path, 'r') as f:
+            reader = csv.reader(f)
+            incremental_index.set_header(next(reader))
+            rows = list(reader)
+        step = batch_rows or len(rows) or 1
+        for start in range(0, len(rows), step):
+            builder.add_rows(*incremental_index.append_rows(rows[start:start + step]))
+    finally:
+        bonsai_logger.LOGGER_CHUNK_ROWS = chunk_rows
+    assert TimingMapBuilder.from_index(index).as_dict() == expected
+    assert builder.build().as_dict() == expected
+    return expected
+
+
+def _check_rows(rows, batch_rows=None):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        return _check_file(_write_rows(os.path.join(tmp_dir, 'orientations_logger.csv'), rows), batch_rows)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_synthetic_session_matches_reference():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'orientations_logger.csv')
+        with open(path, 'w') as f:
+            f.write(synthetic_logger_text(minutes=0.5, seed=4))
+        expected = _check_file(path)
+        assert len(expected) > 50
+        _check_file(path, batch_rows=997)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_edge_cases_match_reference():
+    expected = _check_rows(EDGE_CASE_ROWS)
+    assert 'movie' in expected['a'] or 'end_frame' in expected['a']
+    for batch_rows in (1, 2, 3, 7):
+        _check_rows(EDGE_CASE_ROWS, batch_rows)
+
+
+def test_sparse_frame_numbers_match_reference():
+    rows = [(frame, 0.5 * i, 'Frame') for i, frame in enumerate([3, 10 ** 7, 10 ** 7 + 1, 2 * 10 ** 7])]
+    rows.insert(2, (10 ** 7 + 1, 7.0, 'StimStart-s'))
+    rows.append((2 * 10 ** 7 + 1, 9.0, 'StimEnd-s'))
+    _check_rows(rows)
+    _check_rows(rows, batch_rows=2)
+
+
+def test_unparsable_rows_stop_the_map():
+    _check_rows(EDGE_CASE_ROWS[:6] + [('x', 1.0, 'Frame')] + EDGE_CASE_ROWS[6:])
+    _check_rows(EDGE_CASE_ROWS[:6] + [(4, 1.4, 'MovieFrame-x')] + EDGE_CASE_ROWS[6:], batch_rows=4)
+    _check_rows([('', '', 'Frame')] + EDGE_CASE_ROWS)
+
+
+def benchmark(minutes):
+    """Time the reference loop and the array-backed builder on a synthetic logger."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'orientations_logger.csv')
+        with open(path, 'w') as f:
+            f.write(synthetic_logger_text(minutes=minutes))
+        index = LoggerIndex.from_csv(path)
+        rows = list(index.iter_rows())
+
+        start = time.time()
+        reference_create_timing_map(rows)
+        ref_time = time.time() - start
+
+        start = time.time()
+        TimingMapBuilder.from_index(index)
+        new_time = time.time() - start
+
+        print("Logger rows: %d" % len(index))
+        print("Reference:     %.3f s" % ref_time)
+        print("Array-backed:  %.3f s (%.1fx)" % (new_time, ref_time / max(new_time, 1e-9)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Timing map equivalence test / benchmark')
+    parser.add_argument('--benchmark', action='store_true', help='Run the timing benchmark')
+    parser.add_argument('--minutes', type=float, default=70.0, help='Synthetic session duration')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.minutes)
+    else:
+        test_synthetic_session_matches_reference()
+        test_edge_cases_match_reference()
+        test_sparse_frame_numbers_match_reference()
+        test_unparsable_rows_stop_the_map()
+        print("Timing map matches the reference implementation.")
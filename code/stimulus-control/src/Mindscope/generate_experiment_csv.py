@@ -788,17 +788,17 @@ def generate_motor_block_trials(block_type, duration_minutes, oddball_config, va
     
     return trials
 
-def generate_single_session_csv(session_type, output_path, seed=None):
+def build_session_trials(session_type, seed=None):
     """
-    Generate a single session CSV file for the specified session type.
+    Generate the trial rows of a single session for the specified session type.
     
     Args:
         session_type (str): Type of session ('visual_mismatch', 'sensorimotor_mismatch', etc.)
-        output_path (str): Path where the CSV file should be saved
         seed (int, optional): Random seed for reproducibility
         
     Returns:
-        bool: True if successful, False otherwise
+        tuple: (fieldnames, trials) with one dictionary per trial, or None if the
+               session type is unknown
     """
     if seed is not None:
         random.seed(seed)
@@ -1026,7 +1026,7 @@ def generate_single_session_csv(session_type, output_path, seed=None):
     if session_type not in session_configs:
         print("Error: Unknown session type '%s'" % session_type)
         print("Available session types: %s" % ', '.join(session_configs.keys()))
-        return False
+        return None
     
     session_config = session_configs[session_type]
     
@@ -1090,24 +1090,55 @@ def generate_single_session_csv(session_type, output_path, seed=None):
             
             all_trials.append(enriched_trial)
     
-    # Save the CSV file (Python 2.7 + 3.x compatible)
+    return fieldnames, all_trials
+
+
+def write_session_csv(output_path, fieldnames, trials):
+    """
+    Write session trials to a CSV file (Python 2.7 + 3.x compatible).
+    
+    Args:
+        output_path (str): Path where the CSV file should be saved
+        fieldnames (list): Column order
+        trials (list): Trial dictionaries
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Python 2 csv module expects binary mode; Python 3 expects text with newline=''
+    if sys.version_info[0] < 3:
+        fh = open(output_path, 'wb')
+    else:
+        fh = open(output_path, 'w', newline='')  # newline='' prevents blank rows on Windows
     try:
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        writer = csv.DictWriter(fh, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(trials)
+    finally:
+        fh.close()
 
-        import sys
-        # Python 2 csv module expects binary mode; Python 3 expects text with newline=''
-        if sys.version_info[0] < 3:
-            fh = open(output_path, 'wb')
-        else:
-            fh = open(output_path, 'w', newline='')  # newline='' prevents blank rows on Windows
-        try:
-            writer = csv.DictWriter(fh, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(all_trials)
-        finally:
-            fh.close()
+
+def generate_single_session_csv(session_type, output_path, seed=None):
+    """
+    Generate a single session CSV file for the specified session type.
+    
+    Args:
+        session_type (str): Type of session ('visual_mismatch', 'sensorimotor_mismatch', etc.)
+        output_path (str): Path where the CSV file should be saved
+        seed (int, optional): Random seed for reproducibility
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    session = build_session_trials(session_type, seed)
+    if session is None:
+        return False
+    fieldnames, all_trials = session
+    
+    # Save the CSV file (Python 2.7 + 3.x compatible)
+    try:
+        write_session_csv(output_path, fieldnames, all_trials)
 
         print("Successfully generated %d trials" % len(all_trials))
         print("Saved to: %s" % output_path)
@@ -24,6 +24,10 @@ Outputs:
     CSV: Index, Timestamp, Phase  (Phase in radians, 0..2π mapped from 0..360°)
     PNG: Quick static plot (if matplotlib available)
 
+If the launcher wrote a <session>.npz companion next to the pkl (see
+code/experiment-launcher/session_arrays.py), only its logger Timestamp and
+Value columns are read instead of unpickling the whole session.
+
 If no wheel rows are found, exits non‑zero.
 
 Python 2.7 compatible.
@@ -41,11 +45,46 @@ try:
 except ImportError:
     np = None
 
+LAUNCHER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', '..', '..', 'experiment-launcher')
+
+
 def load_session(path):
     with open(path, 'rb') as f:
         return pickle.load(f)
 
 
+def logger_rows_from_session(bonsai):
+    """Return logger rows as dictionaries from a session pkl 'bonsai' entry.
+
+    Newer launchers store the logger as a columnar table (see
+    code/experiment-launcher/bonsai_tables.py); older ones as a list of rows.
+    Only the Timestamp and Value columns are needed here.
+    """
+    logger = bonsai.get('logger', [])
+    if not (isinstance(logger, dict) and logger.get('format') == 'columnar-v1'):
+        return logger
+    columns = logger['columns']
+    timestamps = columns['Timestamp']['values']
+    value_column = columns['Value']
+    categories = value_column['categories']
+    rows = []
+    for ts, code in zip(timestamps, value_column['codes']):
+        rows.append({'Timestamp': ts, 'Value': categories[code] if code >= 0 else ''})
+    return rows
+
+
+def logger_rows_from_arrays(path):
+    """Return logger rows (Timestamp and Value only) from a session .npz companion."""
+    if LAUNCHER_DIR not in sys.path:
+        sys.path.insert(0, LAUNCHER_DIR)
+    import session_arrays
+    with session_arrays.SessionArrays(path) as arrays:
+        timestamps = arrays.read('logger/Timestamp')
+        values = arrays.strings('logger/Value')
+    return [{'Timestamp': ts, 'Value': value or ''} for ts, value in zip(timestamps, values)]
+
+
 def parse_wheel_rows(logger_rows):
     """Return detailed phase lists from wheel logger rows.
 
@@ -129,10 +168,13 @@ def main():
     ap.add_argument('--plot', default='running_phase.png')
     args = ap.parse_args()
 
-    data = load_session(args.input)
-
-    bonsai = data.get('bonsai', {})
-    logger_rows = bonsai.get('logger', [])
+    arrays_path = os.path.splitext(args.input)[0] + '.npz'
+    if os.path.isfile(arrays_path):
+        logger_rows = logger_rows_from_arrays(arrays_path)
+    else:
+        data = load_session(args.input)
+        bonsai = data.get('bonsai', {})
+        logger_rows = logger_rows_from_session(bonsai)
 
     timestamps, wheel_deg, phase_deg, phase_rad = parse_wheel_rows(logger_rows)
     if not phase_rad: